@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import logging
 import json
 import os
@@ -13,27 +14,29 @@ from django import forms
 from django.contrib import admin, messages
 from django.contrib.admin.widgets import RelatedFieldWidgetWrapper
 from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
-from django.contrib.admin.models import LogEntry, CHANGE
 from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from django.contrib.auth.models import User, Group  # Importar os modelos User e Group
-from django.contrib.contenttypes.models import ContentType
 from django.contrib.humanize.templatetags.humanize import intcomma
 from django.core import signing
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.management.color import no_style
 from django.db import connection, models, transaction
-from django.db.models import Count, FloatField, Max, OuterRef, Q, Sum, Subquery, Prefetch, Window
+from django.db.models import Count, FloatField, Max, Q, Sum, Prefetch, Window
 from django.db.models.expressions import RawSQL
 from django.db.models.functions import Abs, Cast, Coalesce, Now, RowNumber
 from django.db.utils import IntegrityError, OperationalError, ProgrammingError
-from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse, QueryDict
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified, HttpResponseRedirect, JsonResponse,
+    QueryDict, StreamingHttpResponse,
+)
 from django.middleware.csrf import get_token
 from django.shortcuts import get_object_or_404, render
 from django.urls import path, reverse
 from django.utils import timezone
 from django.utils.html import format_html
+from django.utils.http import parse_etags, quote_etag
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal, InvalidOperation
@@ -42,8 +45,8 @@ logger = logging.getLogger(__name__)
 
 from .models import (
     AnaliseProcesso, AndamentoProcessual, AdvogadoPassivo, BuscaAtivaConfig,
-    Carteira, CarteiraUsuarioAcesso, Contrato, DemandaAnaliseLoteSalvo, DocumentoModelo, Etiqueta, ListaDeTarefas, OpcaoResposta,
-    KpiGlobalConfig,
+    Carteira, ComboDocumentoPattern, CarteiraCpf, CarteiraUsuarioAcesso, Contrato, DemandaAnaliseLoteSalvo, DocumentoModelo, Etiqueta, ListaDeTarefas, OpcaoResposta,
+    GeracaoDocumento, KpiGlobalConfig, KpiSnapshot, OperacaoLote, ProdutividadeDiaria,
     Parte, ProcessoArquivo, ProcessoJudicial, ProcessoJudicialNumeroCnj, Prazo,
     QuestaoAnalise, StatusProcessual, Tarefa, TarefaLote, TipoAnaliseObjetiva, TipoPeticao, TipoPeticaoAnexoContinua,
     _generate_tipo_peticao_key,
@@ -57,7 +60,11 @@ from .services.demandas import (
     _format_currency,
     _format_cpf,
 )
-from .services.peticao_combo import build_preview, generate_zip, PreviewError
+from .services.peticao_combo import build_preview, PreviewError
+from .services import (
+    exportacao_processos, geracao_documentos, kpi_queries, kpi_snapshots, operacoes_lote, peticoes_lote,
+    previews_arquivos, produtividade, uploads_diretos,
+)
 from .services.online_presence import (
     TOKEN_SALT as ONLINE_PRESENCE_TOKEN_SALT,
     get_presence_settings,
@@ -141,6 +148,23 @@ class CarteiraBulkForm(forms.Form):
     )
 
 
+class PeticoesLoteForm(forms.Form):
+    tipo = forms.ChoiceField(
+        choices=[
+            (value, label) for value, label in GeracaoDocumento.TIPO_CHOICES
+            if value in GeracaoDocumento.TIPOS_PETICAO
+        ],
+        label="Petição",
+    )
+    converter_pdf = forms.BooleanField(required=False, initial=True, label="Converter também para PDF")
+    emitir_extrato = forms.BooleanField(
+        required=False,
+        initial=True,
+        label="Emitir extrato de titularidade",
+        help_text="Monitória e cobrança; ignorado na habilitação.",
+    )
+
+
 # --- Supervisor helpers e admin personalizado -------------------------------
 SUPERVISOR_GROUP_NAME = "Supervisor"
 
@@ -416,6 +440,11 @@ class DocumentoModeloAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.tipos_peticao_generate_view),
                 name='contratos_documentomodelo_tipos_peticao_generate'
             ),
+            path(
+                'tipos-peticao/generate-pdf/',
+                self.admin_site.admin_view(self.tipos_peticao_pdf_view),
+                name='contratos_documentomodelo_tipos_peticao_pdf'
+            ),
             path(
                 'tipos-peticao/anexos/',
                 self.admin_site.admin_view(self.tipos_peticao_anexos_view),
@@ -549,6 +578,12 @@ class DocumentoModeloAdmin(admin.ModelAdmin):
         return JsonResponse({'ok': True, 'preview': preview})
 
     def tipos_peticao_generate_view(self, request):
+        return self._enfileirar_geracao_combo(request, GeracaoDocumento.TIPO_COMBO_ZIP)
+
+    def tipos_peticao_pdf_view(self, request):
+        return self._enfileirar_geracao_combo(request, GeracaoDocumento.TIPO_COMBO_PDF)
+
+    def _enfileirar_geracao_combo(self, request, tipo_geracao):
         if request.method != 'POST':
             return HttpResponseNotAllowed(['POST'])
         try:
@@ -561,13 +596,33 @@ class DocumentoModeloAdmin(admin.ModelAdmin):
         if not tipo_id or not arquivo_base_id:
             return JsonResponse({'ok': False, 'error': 'Tipo e arquivo-base são obrigatórios.'}, status=400)
         try:
-            result = generate_zip(tipo_id, arquivo_base_id, optional_ids)
-        except PreviewError as exc:
-            return JsonResponse({'ok': False, 'error': str(exc)}, status=400)
-        except Exception:
-            logger.exception("Erro ao gerar ZIP para petição")
-            return JsonResponse({'ok': False, 'error': 'Não foi possível gerar o ZIP.'}, status=500)
-        return JsonResponse({'ok': True, 'result': result})
+            tipo_id, arquivo_base_id = int(tipo_id), int(arquivo_base_id)
+        except (TypeError, ValueError):
+            return JsonResponse({'ok': False, 'error': 'Tipo ou arquivo-base inválido.'}, status=400)
+        processo_id = (
+            ProcessoArquivo.objects.filter(pk=arquivo_base_id).values_list('processo_id', flat=True).first()
+        )
+        if not TipoPeticao.objects.filter(pk=tipo_id).exists() or processo_id is None:
+            return JsonResponse({'ok': False, 'error': 'Tipo ou arquivo-base inválido.'}, status=400)
+        geracao, _ = geracao_documentos.enfileirar(
+            tipo_geracao,
+            processo_id,
+            {
+                'tipo_id': tipo_id,
+                'arquivo_base_id': arquivo_base_id,
+                'optional_ids': sorted({str(value) for value in optional_ids or []}),
+            },
+            usuario=request.user,
+        )
+        return JsonResponse(
+            {
+                'ok': True,
+                'status': 'queued',
+                'geracao': geracao_documentos.serializar_geracao(geracao),
+                'status_url': reverse('contratos:geracao_documento_status', args=[geracao.pk]),
+            },
+            status=202,
+        )
 
     def tipos_peticao_anexos_view(self, request):
         if request.method == 'GET':
@@ -2973,9 +3028,9 @@ class LastEditOrderFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == 'recente':
-            return queryset.order_by(models.F('last_edit_time').desc(nulls_last=True), '-pk')
+            return queryset.order_by(models.F('ultima_edicao_em').desc(nulls_last=True), '-pk')
         if self.value() == 'antigo':
-            return queryset.order_by(models.F('last_edit_time').asc(nulls_last=True), 'pk')
+            return queryset.order_by(models.F('ultima_edicao_em').asc(nulls_last=True), 'pk')
         return queryset
 
 
@@ -4189,12 +4244,32 @@ class PrazoInline(NoRelatedLinksMixin, admin.TabularInline):
 class ProcessoArquivoInline(NoRelatedLinksMixin, admin.TabularInline):
     model = ProcessoArquivo
     extra = 0
-    fields = ('nome', 'arquivo', 'enviado_por', 'protocolado_no_tribunal', 'criado_em')
-    readonly_fields = ('criado_em',)
+    # miniatura fica por último: o template esconde colunas pela posição e
+    # move a imagem para a célula do nome.
+    fields = ('nome', 'arquivo', 'enviado_por', 'protocolado_no_tribunal', 'criado_em', 'miniatura')
+    readonly_fields = ('criado_em', 'miniatura')
     autocomplete_fields = ['enviado_por']
     verbose_name = "Arquivo"
     verbose_name_plural = "Arquivos"
 
+    @admin.display(description="Miniatura")
+    def miniatura(self, obj):
+        if not obj or not obj.pk or not previews_arquivos.elegivel(obj):
+            return ''
+        paginas = f"{obj.paginas} pág." if obj.paginas else ''
+        if obj.preview_status == ProcessoArquivo.PREVIEW_INDISPONIVEL and not previews_arquivos.pendente(obj):
+            return format_html('<span class="arquivo-miniatura"><small>{}</small></span>', paginas)
+        url = reverse('contratos:arquivo_preview', args=[obj.pk])
+        if previews_arquivos.pronta(obj):
+            url = f"{url}?v={obj.preview_hash[:16]}"
+        # Pendente: o 404 da view agenda a geração e a imagem some (onerror).
+        return format_html(
+            '<span class="arquivo-miniatura"><img src="{}" alt="" loading="lazy" decoding="async" '
+            'onerror="this.remove()"><small>{}</small></span>',
+            url,
+            paginas,
+        )
+
 # Definir um formulário para AnaliseProcesso para garantir o widget correto
 class AnaliseProcessoAdminForm(forms.ModelForm):
     class Meta:
@@ -4352,6 +4427,29 @@ class CarteiraAdmin(admin.ModelAdmin):
     change_list_template = "admin/contratos/carteira/change_list.html"
     fields = ('nome', 'fonte_alias', 'cor_grafico')
 
+    # Seções do dashboard carregadas pela página via kpi-secao/<secao>/:
+    # seção -> (escopo do KpiSnapshot, chaves do payload; None = payload inteiro).
+    # "presenca" só depende do usuário e não passa por snapshot.
+    KPI_SECOES = {
+        'graficos': (KpiSnapshot.ESCOPO_GRAFICOS, None),
+        'intersecoes': (KpiSnapshot.ESCOPO_INTERSECOES, None),
+        'analises': (KpiSnapshot.ESCOPO_DASHBOARD, ('ufs', 'buckets', 'process_changelist_url')),
+        'peticoes': (KpiSnapshot.ESCOPO_DASHBOARD, ('peticao_types', 'peticao_by_carteira', 'peticao_totals')),
+        'prioridade': (KpiSnapshot.ESCOPO_DASHBOARD, ('priority_kpi',)),
+        'produtividade': (KpiSnapshot.ESCOPO_DASHBOARD, ('productivity_kpi',)),
+        'presenca': (None, None),
+    }
+
+    def _kpi_carteira_id(self, valor):
+        """Carteira pedida para o dashboard (None = geral ou carteira inexistente)."""
+        try:
+            carteira_id = int(valor or 0)
+        except (TypeError, ValueError):
+            return None
+        if carteira_id <= 0 or not Carteira.objects.filter(pk=carteira_id).exists():
+            return None
+        return carteira_id
+
     def _can_edit_carteira(self, request):
         user = getattr(request, "user", None)
         return bool(user and getattr(user, "is_authenticated", False) and (user.is_superuser or is_user_supervisor(user)))
@@ -4379,9 +4477,74 @@ class CarteiraAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.kpi_priority_default_carteira_view),
                 name='contratos_carteira_kpi_priority_default',
             ),
+            path(
+                'kpi-atualizar/',
+                self.admin_site.admin_view(self.kpi_refresh_view),
+                name='contratos_carteira_kpi_refresh',
+            ),
+            path(
+                'kpi-secao/<str:secao>/',
+                self.admin_site.admin_view(self.kpi_section_view),
+                name='contratos_carteira_kpi_section',
+            ),
         ]
         return custom_urls + urls
 
+    def kpi_section_view(self, request, secao):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        if secao not in self.KPI_SECOES:
+            raise Http404('Seção de KPI desconhecida.')
+        escopo, chaves = self.KPI_SECOES[secao]
+
+        user_context = self._apply_kpi_user_context({}, request)
+        if secao == 'prioridade':
+            contexto = user_context['priority_kpi']
+        elif secao == 'presenca':
+            contexto = {'online_presence_kpi': user_context['online_presence_kpi']}
+        else:
+            contexto = {}
+
+        # Gráficos e interseções comparam as carteiras entre si: sempre gerais.
+        carteira_id = None
+        if escopo == KpiSnapshot.ESCOPO_DASHBOARD:
+            carteira_id = self._kpi_carteira_id(request.GET.get('carteira'))
+
+        snapshot = None
+        versao = ''
+        if escopo is not None:
+            snapshot = kpi_snapshots.obter_snapshot_sem_payload(escopo, carteira_id)
+            if snapshot is None:
+                # Primeiro cálculo em andamento em outra requisição (as seções
+                # do dashboard chegam em paralelo): o cliente tenta de novo.
+                response = JsonResponse({'secao': secao, 'pendente': True}, status=202)
+                response['Retry-After'] = '2'
+                return response
+            versao = kpi_snapshots.versao_snapshot(snapshot)
+
+        assinatura = json.dumps([secao, versao, contexto], sort_keys=True, default=str)
+        etag = quote_etag(hashlib.sha1(assinatura.encode('utf-8')).hexdigest())
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            if snapshot is None:
+                dados = contexto
+            else:
+                dados = kpi_snapshots.payload_secao(snapshot, secao, chaves)
+                if secao == 'prioridade':
+                    dados = {'priority_kpi': {**(dados.get('priority_kpi') or {}), **contexto}}
+            response = JsonResponse(
+                {
+                    'secao': secao,
+                    'gerado_em': snapshot.gerado_em.isoformat() if snapshot else timezone.now().isoformat(),
+                    'desatualizado': kpi_snapshots.precisa_atualizar(snapshot) if snapshot else False,
+                    'dados': dados,
+                }
+            )
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
     def kpi_online_presence_view(self, request):
         if request.method != 'GET':
             return JsonResponse({'error': 'Método não permitido.'}, status=405)
@@ -4437,6 +4600,20 @@ class CarteiraAdmin(admin.ModelAdmin):
             }
         )
 
+    def kpi_refresh_view(self, request):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        changelist_url = reverse('admin:contratos_carteira_changelist')
+        carteira_id = self._kpi_carteira_id(request.POST.get('carteira'))
+        if carteira_id:
+            changelist_url += f'?kpi_carteira={carteira_id}'
+        snapshot = kpi_snapshots.atualizar_snapshot(carteira_id=carteira_id, force=True)
+        if snapshot is None:
+            self.message_user(request, "Os KPIs já estão sendo atualizados. Recarregue em instantes.", messages.WARNING)
+        else:
+            self.message_user(request, f"KPIs atualizados ({snapshot.duracao_ms / 1000:.1f}s).", messages.SUCCESS)
+        return HttpResponseRedirect(changelist_url)
+
     def kpi_priority_default_carteira_view(self, request):
         if request.method != 'POST':
             return JsonResponse({'ok': False, 'error': 'Método não permitido.'}, status=405)
@@ -4494,9 +4671,10 @@ class CarteiraAdmin(admin.ModelAdmin):
         )
     
     def get_queryset(self, request):
+        # Totais mantidos em CarteiraStats (signals + reconciliar_carteira_stats).
         return super().get_queryset(request).annotate(
-            total_processos=models.Count('processos_multicarteira', distinct=True),
-            valor_total=models.Sum('processos_multicarteira__valor_causa')
+            total_processos=Coalesce(models.F('stats__processos_vinculados'), 0),
+            valor_total=models.F('stats__valor_causa_total'),
         )
 
     @admin.display(description='📊 Nº de Processos', ordering='total_processos')
@@ -4518,7 +4696,18 @@ class CarteiraAdmin(admin.ModelAdmin):
     @admin.display(description='Ações')
     def ver_processos_link(self, obj):
         url = reverse("admin:contratos_processojudicial_changelist") + f"?carteira={obj.id}"
-        return format_html('<a href="{}">Ver Processos</a>', url)
+        kpi_url = reverse("admin:contratos_carteira_changelist") + f"?kpi_carteira={obj.id}"
+        return format_html('<a href="{}">Ver Processos</a> &middot; <a href="{}">KPIs</a>', url, kpi_url)
+
+    def _build_carteira_chart_data(self):
+        rows = Carteira.objects.annotate(
+            total_processos=Coalesce(models.F('stats__processos_vinculados'), 0),
+            valor_total=models.F('stats__valor_causa_total'),
+        ).values('nome', 'cor_grafico', 'total_processos', 'valor_total')
+        return [
+            {**row, 'valor_total': str(row['valor_total']) if row['valor_total'] is not None else None}
+            for row in rows
+        ]
 
     def _build_carteira_intersections(self):
         carteiras = list(Carteira.objects.order_by('nome').values('id', 'nome', 'cor_grafico'))
@@ -4532,77 +4721,67 @@ class CarteiraAdmin(admin.ModelAdmin):
             }
 
         valid_ids = {c['id'] for c in carteiras}
-        carteira_cpfs = {c['id']: set() for c in carteiras}
+        membros = CarteiraCpf.objects.filter(carteira_id__in=valid_ids)
+        carteira_cpf_totals = {
+            row['carteira_id']: row['total']
+            for row in membros.values('carteira_id').annotate(total=Count('cpf', distinct=True))
+        }
+        total_unique_cpfs = membros.values('cpf').distinct().count()
+
+        # Só os CPFs presentes em 2+ carteiras participam das interseções.
+        cpfs_compartilhados = (
+            membros.values('cpf')
+            .annotate(total_carteiras=Count('carteira', distinct=True))
+            .filter(total_carteiras__gt=1)
+            .values('cpf')
+        )
         cpf_membership = {}
-        processo_carteiras = {}
-
-        processos = (
-            ProcessoJudicial.objects.filter(
-                Q(carteira_id__in=valid_ids) | Q(carteiras_vinculadas__id__in=valid_ids)
-            )
-            .values_list('id', 'carteira_id', 'carteiras_vinculadas__id')
+        for cpf, carteira_id in (
+            membros.filter(cpf__in=cpfs_compartilhados)
+            .values_list('cpf', 'carteira_id')
             .distinct()
-        )
-        for processo_id, carteira_principal_id, carteira_vinculada_id in processos:
-            bucket = processo_carteiras.setdefault(processo_id, set())
-            if carteira_principal_id in valid_ids:
-                bucket.add(carteira_principal_id)
-            if carteira_vinculada_id in valid_ids:
-                bucket.add(carteira_vinculada_id)
-
-        if processo_carteiras:
-            partes = (
-                Parte.objects.filter(tipo_polo='PASSIVO', processo_id__in=processo_carteiras.keys())
-                .exclude(documento__isnull=True)
-                .exclude(documento__exact='')
-                .values_list('processo_id', 'documento')
-                .distinct()
-            )
-        else:
-            partes = []
+        ):
+            cpf_membership.setdefault(cpf, set()).add(carteira_id)
 
-        for processo_id, documento in partes:
-            cpf_digits = re.sub(r'\D', '', str(documento or ''))
-            if not cpf_digits:
-                continue
-            for carteira_id in processo_carteiras.get(processo_id, set()):
-                carteira_cpfs[carteira_id].add(cpf_digits)
-                cpf_membership.setdefault(cpf_digits, set()).add(carteira_id)
+        pair_counts = {}
+        for carteira_ids in cpf_membership.values():
+            ordered = sorted(carteira_ids)
+            for i, carteira_a_id in enumerate(ordered):
+                for carteira_b_id in ordered[i + 1:]:
+                    key = (carteira_a_id, carteira_b_id)
+                    pair_counts[key] = pair_counts.get(key, 0) + 1
 
-        total_unique_cpfs = len(cpf_membership)
         carteira_items = []
         for carteira in carteiras:
-            cpfs = carteira_cpfs.get(carteira['id'], set())
+            cpf_total = carteira_cpf_totals.get(carteira['id'], 0)
             carteira_items.append({
                 "id": carteira['id'],
                 "nome": carteira['nome'],
                 "cor_grafico": carteira.get('cor_grafico') or '#417690',
-                "cpf_total": len(cpfs),
-                "percent_global": round((len(cpfs) * 100.0 / total_unique_cpfs), 2) if total_unique_cpfs else 0.0,
+                "cpf_total": cpf_total,
+                "percent_global": round((cpf_total * 100.0 / total_unique_cpfs), 2) if total_unique_cpfs else 0.0,
             })
 
         pair_items = []
         for i, carteira_a in enumerate(carteiras):
-            cpfs_a = carteira_cpfs.get(carteira_a['id'], set())
+            total_a = carteira_cpf_totals.get(carteira_a['id'], 0)
             for carteira_b in carteiras[i + 1:]:
-                cpfs_b = carteira_cpfs.get(carteira_b['id'], set())
-                if not cpfs_a and not cpfs_b:
+                total_b = carteira_cpf_totals.get(carteira_b['id'], 0)
+                pair_key = tuple(sorted((carteira_a['id'], carteira_b['id'])))
+                count_inter = pair_counts.get(pair_key, 0)
+                if not count_inter:
                     continue
-                intersection = cpfs_a.intersection(cpfs_b)
-                if not intersection:
-                    continue
-                union = cpfs_a.union(cpfs_b)
-                count_inter = len(intersection)
+                union_total = total_a + total_b - count_inter
                 pair_items.append({
                     "a_id": carteira_a['id'],
                     "a_nome": carteira_a['nome'],
                     "b_id": carteira_b['id'],
                     "b_nome": carteira_b['nome'],
-                    "key": f"{min(carteira_a['id'], carteira_b['id'])}-{max(carteira_a['id'], carteira_b['id'])}",
+                    "key": f"{pair_key[0]}-{pair_key[1]}",
                     "count": count_inter,
-                    "pct_a": round((count_inter * 100.0 / len(cpfs_a)), 2) if cpfs_a else 0.0,
-                    "pct_b": round((count_inter * 100.0 / len(cpfs_b)), 2) if cpfs_b else 0.0,
-                    "pct_union": round((count_inter * 100.0 / len(union)), 2) if union else 0.0,
+                    "pct_a": round((count_inter * 100.0 / total_a), 2) if total_a else 0.0,
+                    "pct_b": round((count_inter * 100.0 / total_b), 2) if total_b else 0.0,
+                    "pct_union": round((count_inter * 100.0 / union_total), 2) if union_total else 0.0,
                 })
         pair_items.sort(key=lambda item: (-item['count'], item['a_nome'], item['b_nome']))
         return {
@@ -4612,7 +4791,11 @@ class CarteiraAdmin(admin.ModelAdmin):
             "process_changelist_url": process_changelist_url,
         }
 
-    def _build_carteira_kpi_data(self, request=None):
+    def _build_carteira_kpi_data(self, request=None, carteira_id=None):
+        """
+        Payload do dashboard de KPIs. Com carteira_id, restringe os números aos
+        processos e cards daquela carteira (snapshot por carteira).
+        """
         def _safe_int(value):
             try:
                 return int(value)
@@ -4632,15 +4815,6 @@ class CarteiraAdmin(admin.ModelAdmin):
             text = "".join(ch for ch in text if not unicodedata.combining(ch))
             return re.sub(r"\s+", " ", text).strip()
 
-        def _normalize_filename_text(value):
-            text = _clean_text(value).lower()
-            if not text:
-                return ""
-            text = unicodedata.normalize("NFKD", text)
-            text = "".join(ch for ch in text if not unicodedata.combining(ch))
-            text = text.replace("_", " ").replace("-", " ")
-            return re.sub(r"\s+", " ", text).strip()
-
         def _normalize_type_text(value):
             text = _clean_text(value).lower()
             if not text:
@@ -4650,23 +4824,6 @@ class CarteiraAdmin(admin.ModelAdmin):
             text = text.replace("#", " ").replace("_", " ").replace("-", " ")
             return re.sub(r"\s+", " ", text).strip()
 
-        def _parse_datetime_value(value):
-            if isinstance(value, datetime.datetime):
-                dt = value
-            elif isinstance(value, str):
-                raw = value.strip()
-                if not raw:
-                    return None
-                try:
-                    dt = datetime.datetime.fromisoformat(raw.replace("Z", "+00:00"))
-                except ValueError:
-                    return None
-            else:
-                return None
-            if timezone.is_naive(dt):
-                dt = timezone.make_aware(dt, timezone.get_default_timezone())
-            return timezone.localtime(dt)
-
         def _build_tipo_fallback_meta(nome, slug):
             slug_norm = _normalize_type_text(slug)
             nome_norm = _normalize_type_text(nome)
@@ -4683,71 +4840,8 @@ class CarteiraAdmin(admin.ModelAdmin):
                 "search_text": search_text,
             }
 
-        def _classify_peticao_kind(nome, arquivo_nome):
-            joined = f"{_normalize_filename_text(nome)} {_normalize_filename_text(arquivo_nome)}".strip()
-            if not joined:
-                return ""
-            if "monitoria inicial" in joined:
-                return "monitoria_inicial"
-            if "cobranca judicial" in joined:
-                return "cobranca_judicial"
-            if "habilitacao" in joined:
-                return "habilitacao"
-            return ""
-
-        def _is_yes(value):
-            return _normalize_answer(value) in {"sim", "s", "yes", "y"}
-
-        def _is_no(value):
-            return _normalize_answer(value) in {"nao", "n", "no"}
-
-        def _get_cards_from_respostas(respostas):
-            if not isinstance(respostas, dict):
-                return []
-            saved_cards = respostas.get("saved_processos_vinculados")
-            if isinstance(saved_cards, list) and saved_cards:
-                return saved_cards
-            active_cards = respostas.get("processos_vinculados")
-            if isinstance(active_cards, list) and active_cards:
-                return active_cards
-            return []
-
-        def _is_filled_response_value(value):
-            if value is None:
-                return False
-            if isinstance(value, str):
-                cleaned = value.strip()
-                if not cleaned:
-                    return False
-                if cleaned in {"---", "-", "—"}:
-                    return False
-                return True
-            if isinstance(value, dict):
-                return any(_is_filled_response_value(item) for item in value.values())
-            if isinstance(value, (list, tuple, set)):
-                return any(_is_filled_response_value(item) for item in value)
-            return True
-
-        def _card_has_analysis_content(card):
-            if not isinstance(card, dict):
-                return False
-            if _is_filled_response_value(card.get("observacoes")):
-                return True
-            respostas_obj = card.get("tipo_de_acao_respostas")
-            if not isinstance(respostas_obj, dict):
-                return False
-            return any(_is_filled_response_value(value) for value in respostas_obj.values())
-
-        def _process_has_analysis_content(respostas):
-            cards = _get_cards_from_respostas(respostas)
-            if not cards:
-                return False
-            return any(_card_has_analysis_content(card) for card in cards if isinstance(card, dict))
-
-        technical_response_keys = {
-            "ativar_botao_monitoria",
-            "contratos_para_monitoria",
-        }
+        carteira_filtro = _safe_int(carteira_id)
+        carteira_filtro_ids = [carteira_filtro] if carteira_filtro else None
 
         process_changelist_url = reverse("admin:contratos_processojudicial_changelist")
         carteira_lookup = {
@@ -4765,17 +4859,6 @@ class CarteiraAdmin(admin.ModelAdmin):
         except Exception:
             priority_default_carteira_id = 0
             priority_default_carteira_nome = ""
-        can_configure_priority_default = bool(
-            request
-            and getattr(request, "user", None)
-            and getattr(request.user, "is_authenticated", False)
-            and bool(getattr(request.user, "is_superuser", False))
-        )
-        priority_set_default_url = (
-            reverse("admin:contratos_carteira_kpi_priority_default")
-            if can_configure_priority_default
-            else ""
-        )
         passivas_carteira_id = next(
             (
                 carteira_id
@@ -4971,40 +5054,34 @@ class CarteiraAdmin(admin.ModelAdmin):
                 "opcoes": opcoes_by_chave.get(chave, []),
             }
 
-        processos = (
-            ProcessoJudicial.objects.filter(analise_processo__isnull=False)
-            .select_related("analise_processo", "analise_processo__updated_by")
-            .prefetch_related(Prefetch("carteiras_vinculadas", queryset=Carteira.objects.only("id")))
-            .only(
-                "id",
-                "uf",
-                "carteira_id",
-                "analise_processo__respostas",
-                "analise_processo__updated_at",
-                "analise_processo__updated_by__id",
-                "analise_processo__updated_by__username",
-                "analise_processo__updated_by__first_name",
-                "analise_processo__updated_by__last_name",
-            )
-        )
+        # O tipo de cada card sai da heurística acima, aplicada uma vez por
+        # assinatura distinta; as consultas de análise recebem o resultado.
+        tipo_grupos = {}
+        tipos_por_assinatura = {}
+        for row in kpi_queries.run("analises_assinaturas"):
+            analysis_type = row["analysis_type"] if isinstance(row["analysis_type"], dict) else {}
+            tipo_meta = _resolve_tipo_meta(analysis_type, row["respostas"])
+            tipo_id = int(tipo_meta["id"]) if isinstance(tipo_meta, dict) and tipo_meta.get("id") else None
+            tipo_nome = (tipo_meta or {}).get("nome") or _clean_text(analysis_type.get("nome")) or "[Sem tipo]"
+            tipo_slug = (tipo_meta or {}).get("slug") or _clean_text(analysis_type.get("slug")) or "[sem-slug]"
+            grupo = tipo_grupos.setdefault((tipo_id, tipo_slug, tipo_nome), len(tipo_grupos))
+            carteira_fixa = None
+            if passivas_carteira_id and "passiv" in _normalize_type_text(f"{tipo_slug} {tipo_nome}"):
+                carteira_fixa = passivas_carteira_id
+            tipos_por_assinatura[row["assinatura"]] = (grupo, carteira_fixa)
+        tipo_por_grupo = {grupo: tipo_key for tipo_key, grupo in tipo_grupos.items()}
+        analise_params = {
+            "tipos": tipos_por_assinatura,
+            "carteira_ids": carteira_filtro_ids,
+            "passivas_carteira_id": passivas_carteira_id,
+        }
 
-        process_ids = [processo.id for processo in processos]
-        cpf_by_processo = {}
-        if process_ids:
-            partes = (
-                Parte.objects.filter(tipo_polo="PASSIVO", processo_id__in=process_ids)
-                .exclude(documento__isnull=True)
-                .exclude(documento__exact="")
-                .values_list("processo_id", "documento")
-                .distinct()
+        all_ufs = {
+            row["uf"]
+            for row in kpi_queries.run(
+                "analises_ufs", carteira_ids=carteira_filtro_ids, passivas_carteira_id=passivas_carteira_id
             )
-            for processo_id, documento in partes:
-                cpf_digits = re.sub(r"\D", "", str(documento or ""))
-                if not cpf_digits:
-                    continue
-                cpf_by_processo.setdefault(processo_id, set()).add(cpf_digits)
-
-        all_ufs = set()
+        }
         buckets = {}
         productivity_users = {}
         productivity_daily_all = {}
@@ -5028,16 +5105,10 @@ class CarteiraAdmin(admin.ModelAdmin):
                 )
 
         def _get_bucket(uf_code):
-            bucket = buckets.get(uf_code)
-            if bucket is None:
-                bucket = {
-                    "process_ids": set(),
-                    "cpfs": set(),
-                    "cards_total": 0,
-                    "combos": {},
-                }
-                buckets[uf_code] = bucket
-            return bucket
+            return buckets.setdefault(
+                uf_code,
+                {"cards_total": 0, "processos_total": 0, "cpfs_total": 0, "combos": {}},
+            )
 
         def _resolve_user_display(user_obj):
             if not user_obj:
@@ -5079,7 +5150,7 @@ class CarteiraAdmin(admin.ModelAdmin):
                     bucket["user_label"] = normalized_label
             return bucket
 
-        def _register_productivity_carteira(user_bucket, carteira_id=None, carteira_nome=""):
+        def _register_productivity_carteira(user_bucket, carteira_id=None, carteira_nome="", quantidade=1):
             if not user_bucket:
                 return
             carteira_id_int = _safe_int(carteira_id)
@@ -5089,7 +5160,7 @@ class CarteiraAdmin(admin.ModelAdmin):
                 label = _clean_text(carteira_nome)
             if not label:
                 label = "Sem carteira"
-            user_bucket["carteiras"][label] = int(user_bucket["carteiras"].get(label, 0)) + 1
+            user_bucket["carteiras"][label] = int(user_bucket["carteiras"].get(label, 0)) + int(quantidade)
 
         def _register_productivity_event(
             metric_key,
@@ -5098,230 +5169,116 @@ class CarteiraAdmin(admin.ModelAdmin):
             date_key=None,
             carteira_id=None,
             carteira_nome="",
+            quantidade=1,
         ):
             if metric_key not in ("analises", "tarefas", "prazos"):
                 return
             user_bucket = _ensure_productivity_user(user_key, user_label)
-            _register_productivity_carteira(user_bucket, carteira_id=carteira_id, carteira_nome=carteira_nome)
-            user_bucket["totals"][metric_key] += 1
-            productivity_totals[metric_key] += 1
+            _register_productivity_carteira(
+                user_bucket, carteira_id=carteira_id, carteira_nome=carteira_nome, quantidade=quantidade
+            )
+            user_bucket["totals"][metric_key] += quantidade
+            productivity_totals[metric_key] += quantidade
 
             normalized_date = _clean_text(date_key)
             if not normalized_date:
-                user_bucket["sem_data"][metric_key] += 1
-                productivity_sem_data[metric_key] += 1
+                user_bucket["sem_data"][metric_key] += quantidade
+                productivity_sem_data[metric_key] += quantidade
                 return
 
             daily_item = user_bucket["daily"].setdefault(
                 normalized_date,
                 {"date": normalized_date, "analises": 0, "tarefas": 0, "prazos": 0},
             )
-            daily_item[metric_key] += 1
+            daily_item[metric_key] += quantidade
 
             daily_total_item = productivity_daily_all.setdefault(
                 normalized_date,
                 {"date": normalized_date, "analises": 0, "tarefas": 0, "prazos": 0},
             )
-            daily_total_item[metric_key] += 1
-
-        def _process_entry_for_bucket(bucket, entry):
-            bucket["cards_total"] += 1
-            bucket["process_ids"].add(entry["processo_id"])
-            bucket["cpfs"].update(entry["cpfs"])
-
-            combo_key = (
-                entry["carteira_id"] or 0,
-                entry["tipo_id"] or 0,
-                entry["tipo_slug"] or "",
-                entry["tipo_nome"] or "",
-            )
-            combo = bucket["combos"].get(combo_key)
+            daily_total_item[metric_key] += quantidade
+
+        for row in kpi_queries.run("analises_totais", **analise_params):
+            bucket = _get_bucket(row["uf"] or "ALL")
+            bucket["cards_total"] = row["cards"]
+            bucket["processos_total"] = row["processos"]
+            bucket["cpfs_total"] = row["cpfs"]
+
+        combos_por_uf = []
+        for row in kpi_queries.run("analises_por_tipo", **analise_params):
+            tipo_id, tipo_slug, tipo_nome = tipo_por_grupo[row["grupo"]]
+            _get_bucket(row["uf"] or "ALL")["combos"][(row["carteira_id"], row["grupo"])] = {
+                "carteira_id": row["carteira_id"],
+                "carteira_nome": carteira_lookup.get(row["carteira_id"], "[Sem carteira]"),
+                "tipo_id": tipo_id,
+                "tipo_nome": tipo_nome,
+                "tipo_slug": tipo_slug,
+                "processos": row["processos"],
+                "cpfs": row["cpfs"],
+                "cards": row["cards"],
+                "cards_by_uf": {},
+                "kpis": row["kpis"],
+                "questions": {},
+            }
+            if row["uf"]:
+                combos_por_uf.append(row)
+        for row in combos_por_uf:
+            for uf_code in (row["uf"], "ALL"):
+                combo = _get_bucket(uf_code)["combos"].get((row["carteira_id"], row["grupo"]))
+                if combo is not None:
+                    combo["cards_by_uf"][row["uf"]] = row["cards"]
+
+        respostas_por_uf = []
+        for row in kpi_queries.run("analises_respostas", **analise_params):
+            combo = _get_bucket(row["uf"] or "ALL")["combos"].get((row["carteira_id"], row["grupo"]))
             if combo is None:
-                combo = {
-                    "carteira_id": entry["carteira_id"],
-                    "carteira_nome": entry["carteira_nome"],
-                    "tipo_id": entry["tipo_id"],
-                    "tipo_nome": entry["tipo_nome"],
-                    "tipo_slug": entry["tipo_slug"],
-                    "process_ids": set(),
-                    "cpfs": set(),
-                    "cards": 0,
-                    "cards_by_uf": {},
-                    "kpis": {
-                        "propor_monitoria_sim": 0,
-                        "propor_monitoria_nao": 0,
-                        "repropor_monitoria_sim": 0,
-                        "repropor_monitoria_nao": 0,
-                        "recomendou_monitoria": 0,
-                        "cumprimento_sentenca_sim": 0,
-                        "cumprimento_sentenca_nao": 0,
-                        "cumprimento_sentenca_iniciar_cs": 0,
-                        "habilitar_sim": 0,
-                        "habilitar_nao": 0,
-                    },
-                    "questions": {},
-                }
-                bucket["combos"][combo_key] = combo
-
-            combo["cards"] += 1
-            combo["process_ids"].add(entry["processo_id"])
-            combo["cpfs"].update(entry["cpfs"])
-            uf_code = _clean_text(entry.get("uf")).upper() or "SEM_UF"
-            combo["cards_by_uf"][uf_code] = combo["cards_by_uf"].get(uf_code, 0) + 1
-
-            respostas_obj = entry["respostas_obj"]
-            propor_monitoria = respostas_obj.get("propor_monitoria")
-            repropor_monitoria = respostas_obj.get("repropor_monitoria")
-            cumprimento_sentenca = respostas_obj.get("cumprimento_de_sentenca")
-            habilitacao = respostas_obj.get("habilitacao")
-
-            if _is_yes(propor_monitoria):
-                combo["kpis"]["propor_monitoria_sim"] += 1
-            elif _is_no(propor_monitoria):
-                combo["kpis"]["propor_monitoria_nao"] += 1
-
-            if _is_yes(repropor_monitoria):
-                combo["kpis"]["repropor_monitoria_sim"] += 1
-            elif _is_no(repropor_monitoria):
-                combo["kpis"]["repropor_monitoria_nao"] += 1
-
-            if _is_yes(propor_monitoria) or _is_yes(repropor_monitoria):
-                combo["kpis"]["recomendou_monitoria"] += 1
-
-            cumprimento_norm = _normalize_answer(cumprimento_sentenca)
-            if _is_yes(cumprimento_sentenca):
-                combo["kpis"]["cumprimento_sentenca_sim"] += 1
-            elif _is_no(cumprimento_sentenca):
-                combo["kpis"]["cumprimento_sentenca_nao"] += 1
-
-            if cumprimento_norm in {
-                "iniciar cs",
-                "iniciar c.s.",
-                "iniciar cumprimento de sentenca",
-            }:
-                combo["kpis"]["cumprimento_sentenca_iniciar_cs"] += 1
-
-            habilitacao_norm = _normalize_answer(habilitacao)
-            if habilitacao_norm.startswith("habilitar"):
-                combo["kpis"]["habilitar_sim"] += 1
-            elif habilitacao_norm.startswith("nao habilitar"):
-                combo["kpis"]["habilitar_nao"] += 1
-
-            for chave, valor in respostas_obj.items():
-                if chave in technical_response_keys:
-                    continue
-                resposta_valor = _clean_text(valor)
-                if not resposta_valor or resposta_valor == "---":
-                    continue
-                question_meta = questao_lookup.get(chave, {})
-                question_item = combo["questions"].get(chave)
-                if question_item is None:
-                    expected_options = list(question_meta.get("opcoes") or [])
-                    question_item = {
-                        "chave": chave,
-                        "pergunta": question_meta.get("texto_pergunta") or chave,
-                        "tipo_campo": question_meta.get("tipo_campo") or "",
-                        "cards_com_resposta": 0,
-                        "cards_com_resposta_by_uf": {},
-                        "expected_options": expected_options,
-                        "answers": {},
-                    }
-                    combo["questions"][chave] = question_item
-                question_item["cards_com_resposta"] += 1
-                question_item["cards_com_resposta_by_uf"][uf_code] = (
-                    question_item["cards_com_resposta_by_uf"].get(uf_code, 0) + 1
-                )
-                answer_key = _normalize_answer(resposta_valor) or resposta_valor
-                answer_item = question_item["answers"].get(answer_key)
-                if answer_item is None:
-                    answer_item = {
-                        "valor": resposta_valor,
-                        "count": 0,
-                        "by_uf": {},
-                    }
-                    question_item["answers"][answer_key] = answer_item
-                answer_item["count"] += 1
-                answer_item["by_uf"][uf_code] = answer_item["by_uf"].get(uf_code, 0) + 1
-
-        for processo in processos:
-            analise_obj = getattr(processo, "analise_processo", None)
-            respostas = getattr(analise_obj, "respostas", None)
-            cards = _get_cards_from_respostas(respostas)
-            if not cards:
                 continue
-
-            vinc_ids = [carteira.id for carteira in processo.carteiras_vinculadas.all()]
-            carteira_default = processo.carteira_id or (vinc_ids[0] if vinc_ids else None)
-            uf_code = _clean_text(processo.uf).upper() or "SEM_UF"
-            all_ufs.add(uf_code)
-            cpfs = cpf_by_processo.get(processo.id, set())
-
-            for card in cards:
-                if not isinstance(card, dict):
-                    continue
-
-                analysis_type = card.get("analysis_type") if isinstance(card.get("analysis_type"), dict) else {}
-                respostas_obj = card.get("tipo_de_acao_respostas")
-                if not isinstance(respostas_obj, dict):
-                    respostas_obj = {}
-
-                card_has_content = _card_has_analysis_content(card)
-                card_author_key = ""
-                card_author_label = ""
-                card_date = ""
-                if card_has_content:
-                    analysis_author = _clean_text(card.get("analysis_author"))
-                    fallback_user = getattr(analise_obj, "updated_by", None)
-                    card_author_key, card_author_label = _resolve_actor_key_label(
-                        analysis_author,
-                        fallback_user=fallback_user,
-                    )
-                    card_timestamp = (
-                        _parse_datetime_value(card.get("saved_at"))
-                        or _parse_datetime_value(card.get("updated_at"))
-                        or _parse_datetime_value(getattr(analise_obj, "updated_at", None))
-                    )
-                    card_date = card_timestamp.date().isoformat() if card_timestamp else ""
-
-                tipo_meta = _resolve_tipo_meta(analysis_type, respostas_obj)
-                tipo_id = int(tipo_meta["id"]) if isinstance(tipo_meta, dict) and tipo_meta.get("id") else None
-                tipo_nome = (tipo_meta or {}).get("nome") or _clean_text(analysis_type.get("nome")) or "[Sem tipo]"
-                tipo_slug = (tipo_meta or {}).get("slug") or _clean_text(analysis_type.get("slug")) or "[sem-slug]"
-
-                carteira_card_id = _safe_int(card.get("carteira_id"))
-                carteira_id = carteira_card_id
-                if not carteira_id:
-                    tipo_norm_for_carteira = _normalize_type_text(f"{tipo_slug or ''} {tipo_nome or ''}")
-                    if passivas_carteira_id and "passiv" in tipo_norm_for_carteira:
-                        carteira_id = passivas_carteira_id
-                    else:
-                        carteira_id = carteira_default
-                if not carteira_id:
+            question_meta = questao_lookup.get(row["chave"], {})
+            question_item = combo["questions"].setdefault(
+                row["chave"],
+                {
+                    "chave": row["chave"],
+                    "pergunta": question_meta.get("texto_pergunta") or row["chave"],
+                    "tipo_campo": question_meta.get("tipo_campo") or "",
+                    "cards_com_resposta": 0,
+                    "cards_com_resposta_by_uf": {},
+                    "expected_options": list(question_meta.get("opcoes") or []),
+                    "answers": {},
+                },
+            )
+            question_item["cards_com_resposta"] += row["cards"]
+            question_item["answers"][row["resposta"]] = {"valor": row["valor"], "count": row["cards"], "by_uf": {}}
+            if row["uf"]:
+                respostas_por_uf.append(row)
+        for row in respostas_por_uf:
+            for uf_code in (row["uf"], "ALL"):
+                combo = _get_bucket(uf_code)["combos"].get((row["carteira_id"], row["grupo"]))
+                question_item = (combo or {}).get("questions", {}).get(row["chave"])
+                answer_item = (question_item or {}).get("answers", {}).get(row["resposta"])
+                if answer_item is None:
                     continue
-                carteira_nome = carteira_lookup.get(carteira_id, "[Sem carteira]")
-                if card_has_content:
-                    _register_productivity_event(
-                        "analises",
-                        card_author_key,
-                        card_author_label,
-                        card_date,
-                        carteira_id=carteira_id,
-                        carteira_nome=carteira_nome,
-                    )
+                by_uf = question_item["cards_com_resposta_by_uf"]
+                by_uf[row["uf"]] = by_uf.get(row["uf"], 0) + row["cards"]
+                answer_item["by_uf"][row["uf"]] = row["cards"]
 
-                entry = {
-                    "processo_id": processo.id,
-                    "cpfs": cpfs,
-                    "uf": uf_code,
-                    "carteira_id": carteira_id,
-                    "carteira_nome": carteira_nome,
-                    "tipo_id": tipo_id,
-                    "tipo_nome": tipo_nome,
-                    "tipo_slug": tipo_slug,
-                    "respostas_obj": respostas_obj,
-                }
-                _process_entry_for_bucket(_get_bucket("ALL"), entry)
-                _process_entry_for_bucket(_get_bucket(uf_code), entry)
+        analises_produtividade = kpi_queries.run("analises_produtividade", **analise_params)
+        editores_analises = User.objects.in_bulk(
+            {row["usuario_id"] for row in analises_produtividade if row["usuario_id"]}
+        )
+        for row in analises_produtividade:
+            author_key, author_label = _resolve_actor_key_label(
+                row["autor"],
+                fallback_user=editores_analises.get(row["usuario_id"]),
+            )
+            _register_productivity_event(
+                "analises",
+                author_key,
+                author_label,
+                row["data"].isoformat() if row["data"] else "",
+                carteira_id=row["carteira_id"],
+                carteira_nome=carteira_lookup.get(row["carteira_id"], "[Sem carteira]"),
+                quantidade=row["analises"],
+            )
 
         def _serialize_bucket(bucket):
             combo_items = []
@@ -5429,8 +5386,8 @@ class CarteiraAdmin(admin.ModelAdmin):
                         "tipo_nome": combo["tipo_nome"],
                         "tipo_slug": combo["tipo_slug"],
                         "cards": cards_total,
-                        "processos": len(combo["process_ids"]),
-                        "cpfs": len(combo["cpfs"]),
+                        "processos": combo["processos"],
+                        "cpfs": combo["cpfs"],
                         "pct_recomendou_monitoria": round(
                             (combo["kpis"]["recomendou_monitoria"] * 100.0 / cards_total), 2
                         )
@@ -5449,8 +5406,8 @@ class CarteiraAdmin(admin.ModelAdmin):
             )
             return {
                 "cards_total": bucket["cards_total"],
-                "processos_total": len(bucket["process_ids"]),
-                "cpfs_total": len(bucket["cpfs"]),
+                "processos_total": bucket["processos_total"],
+                "cpfs_total": bucket["cpfs_total"],
                 "combos": combo_items,
             }
 
@@ -5476,58 +5433,34 @@ class CarteiraAdmin(admin.ModelAdmin):
         ]
         peticao_slugs = [item["slug"] for item in peticao_type_defs]
 
-        processo_carteiras = {}
-        processo_carteira_rows = (
-            ProcessoJudicial.objects.values_list("id", "carteira_id", "carteiras_vinculadas__id").distinct()
-        )
-        for processo_id, carteira_principal_id, carteira_vinculada_id in processo_carteira_rows:
-            bucket = processo_carteiras.setdefault(int(processo_id), set())
-            if carteira_principal_id:
-                bucket.add(int(carteira_principal_id))
-            if carteira_vinculada_id:
-                bucket.add(int(carteira_vinculada_id))
-
-        peticao_by_carteira = {
-            int(carteira_id): {
-                "carteira_id": int(carteira_id),
-                "carteira_nome": carteira_nome,
-                "pieces": {slug: 0 for slug in peticao_slugs},
-                "process_ids": {slug: set() for slug in peticao_slugs},
-            }
-            for carteira_id, carteira_nome in carteira_lookup.items()
+        peticao_by_carteira = {}
+        for row in kpi_queries.run("peticoes_por_tipo", carteira_ids=carteira_filtro_ids):
+            carteira_id = int(row["carteira_id"])
+            tipo_slug = row["tipo"]
+            if tipo_slug not in peticao_slugs:
+                continue
+            carteira_bucket = peticao_by_carteira.setdefault(
+                carteira_id,
+                {
+                    "carteira_id": carteira_id,
+                    "carteira_nome": carteira_lookup.get(carteira_id, f"Carteira {carteira_id}"),
+                    "pieces": {slug: 0 for slug in peticao_slugs},
+                    "processos": {slug: 0 for slug in peticao_slugs},
+                },
+            )
+            carteira_bucket["pieces"][tipo_slug] = int(row["pecas"])
+            carteira_bucket["processos"][tipo_slug] = int(row["processos"])
+        peticao_processos_por_carteira = {
+            int(row["carteira_id"]): int(row["processos"])
+            for row in kpi_queries.run("peticoes_processos_por_carteira", carteira_ids=carteira_filtro_ids)
         }
         peticao_totals = {
-            slug: {"pieces": 0, "process_ids": set()}
+            slug: {"pieces": 0, "processos": 0}
             for slug in peticao_slugs
         }
-
-        arquivo_rows = ProcessoArquivo.objects.values_list("processo_id", "nome", "arquivo")
-        for processo_id, nome_arquivo, arquivo_path in arquivo_rows.iterator():
-            if not processo_id:
-                continue
-            tipo_slug = _classify_peticao_kind(nome_arquivo, arquivo_path)
-            if not tipo_slug:
-                continue
-
-            carteira_ids = processo_carteiras.get(int(processo_id), set())
-            if not carteira_ids:
-                continue
-
-            for carteira_id in carteira_ids:
-                carteira_bucket = peticao_by_carteira.get(carteira_id)
-                if carteira_bucket is None:
-                    carteira_bucket = {
-                        "carteira_id": int(carteira_id),
-                        "carteira_nome": carteira_lookup.get(carteira_id, f"Carteira {carteira_id}"),
-                        "pieces": {slug: 0 for slug in peticao_slugs},
-                        "process_ids": {slug: set() for slug in peticao_slugs},
-                    }
-                    peticao_by_carteira[carteira_id] = carteira_bucket
-                carteira_bucket["pieces"][tipo_slug] += 1
-                carteira_bucket["process_ids"][tipo_slug].add(int(processo_id))
-
-            peticao_totals[tipo_slug]["pieces"] += 1
-            peticao_totals[tipo_slug]["process_ids"].add(int(processo_id))
+        for row in kpi_queries.run("peticoes_totais", carteira_ids=carteira_filtro_ids):
+            if row["tipo"] in peticao_totals:
+                peticao_totals[row["tipo"]] = {"pieces": int(row["pecas"]), "processos": int(row["processos"])}
 
         serialized_peticao_by_carteira = []
         for carteira in sorted(peticao_by_carteira.values(), key=lambda item: (item["carteira_nome"] or "").upper()):
@@ -5535,10 +5468,10 @@ class CarteiraAdmin(admin.ModelAdmin):
             if total_pieces <= 0:
                 continue
             processos_map = {
-                slug: len(carteira["process_ids"].get(slug, set()))
+                slug: int(carteira["processos"].get(slug, 0))
                 for slug in peticao_slugs
             }
-            total_processos = len(set().union(*[carteira["process_ids"].get(slug, set()) for slug in peticao_slugs]))
+            total_processos = peticao_processos_por_carteira.get(carteira["carteira_id"], 0)
             serialized_peticao_by_carteira.append(
                 {
                     "carteira_id": carteira["carteira_id"],
@@ -5555,7 +5488,7 @@ class CarteiraAdmin(admin.ModelAdmin):
                 "slug": item["slug"],
                 "label": item["label"],
                 "pieces": int(peticao_totals[item["slug"]]["pieces"]),
-                "processos": len(peticao_totals[item["slug"]]["process_ids"]),
+                "processos": int(peticao_totals[item["slug"]]["processos"]),
             }
             for item in peticao_type_defs
         ]
@@ -5572,7 +5505,6 @@ class CarteiraAdmin(admin.ModelAdmin):
             .order_by("nome")
         )
         priority_tag_ids = [int(item["id"]) for item in priority_tags if item.get("id")]
-        priority_tag_ids_set = set(priority_tag_ids)
         priority_lookup = {
             int(item["id"]): _clean_text(item.get("nome")) or f"Prioridade {item['id']}"
             for item in priority_tags
@@ -5605,145 +5537,59 @@ class CarteiraAdmin(admin.ModelAdmin):
                 },
             )
 
-        if priority_tag_ids:
-            processos_com_prioridade = (
-                ProcessoJudicial.objects.filter(etiquetas__id__in=priority_tag_ids)
-                .distinct()
-                .select_related("analise_processo")
-                .prefetch_related(
-                    Prefetch(
-                        "etiquetas",
-                        queryset=Etiqueta.objects.filter(id__in=priority_tag_ids).only("id", "nome"),
-                    )
-                )
-                .only("id", "uf", "analise_processo__respostas")
-            )
-
-            for processo in processos_com_prioridade:
-                uf_code = _clean_text(processo.uf).upper() or "SEM_UF"
-                respostas = getattr(getattr(processo, "analise_processo", None), "respostas", None)
-                processo_analisado = _process_has_analysis_content(respostas)
-                priority_process_count += 1
-                if processo_analisado:
-                    priority_process_analisados += 1
-
-                processo_carteira_ids = sorted(
-                    int(carteira_id)
-                    for carteira_id in (processo_carteiras.get(int(processo.id), set()) or set())
-                    if carteira_id
-                )
-                if not processo_carteira_ids:
-                    processo_carteira_ids = [0]
-
-                uf_bucket = priority_by_uf_map.setdefault(
-                    uf_code,
-                    {"uf": uf_code, "total": 0, "analisados": 0, "pendentes": 0},
-                )
-                uf_bucket["total"] += 1
-                if processo_analisado:
-                    uf_bucket["analisados"] += 1
-                else:
-                    uf_bucket["pendentes"] += 1
-
-                for carteira_id in processo_carteira_ids:
-                    carteira_bucket = _get_priority_carteira_bucket(carteira_id)
-                    carteira_totals = carteira_bucket["totals"]
-                    carteira_totals["processos"] += 1
-                    if processo_analisado:
-                        carteira_totals["analisados"] += 1
-                    else:
-                        carteira_totals["pendentes"] += 1
-
-                    carteira_uf_bucket = carteira_bucket["by_uf"].setdefault(
-                        uf_code,
-                        {"uf": uf_code, "total": 0, "analisados": 0, "pendentes": 0},
-                    )
-                    carteira_uf_bucket["total"] += 1
-                    if processo_analisado:
-                        carteira_uf_bucket["analisados"] += 1
-                    else:
-                        carteira_uf_bucket["pendentes"] += 1
-
-                process_priority_ids = set()
-                for tag in processo.etiquetas.all():
-                    tag_id = int(getattr(tag, "id", 0) or 0)
-                    if not tag_id or tag_id not in priority_tag_ids_set or tag_id in process_priority_ids:
-                        continue
-                    process_priority_ids.add(tag_id)
-                    tag_nome = priority_lookup.get(tag_id) or _clean_text(getattr(tag, "nome", "")) or f"Prioridade {tag_id}"
+        def _add_priority_counts(target, row):
+            target["total"] += row["processos"]
+            target["analisados"] += row["analisados"]
+            target["pendentes"] += row["processos"] - row["analisados"]
 
-                    row_key = (uf_code, tag_id)
-                    row_bucket = priority_rows_map.setdefault(
-                        row_key,
-                        {
-                            "uf": uf_code,
-                            "prioridade_id": tag_id,
-                            "prioridade_nome": tag_nome,
-                            "total": 0,
-                            "analisados": 0,
-                            "pendentes": 0,
-                        },
-                    )
-                    row_bucket["total"] += 1
-                    if processo_analisado:
-                        row_bucket["analisados"] += 1
-                    else:
-                        row_bucket["pendentes"] += 1
+        def _priority_item(tag_id, **extra):
+            return {
+                **extra,
+                "prioridade_id": tag_id,
+                "prioridade_nome": priority_lookup.get(tag_id) or f"Prioridade {tag_id}",
+                "total": 0,
+                "analisados": 0,
+                "pendentes": 0,
+            }
 
-                    priority_bucket = priority_by_priority_map.setdefault(
-                        tag_id,
-                        {
-                            "prioridade_id": tag_id,
-                            "prioridade_nome": tag_nome,
-                            "total": 0,
-                            "analisados": 0,
-                            "pendentes": 0,
-                        },
-                    )
-                    priority_bucket["total"] += 1
-                    if processo_analisado:
-                        priority_bucket["analisados"] += 1
-                    else:
-                        priority_bucket["pendentes"] += 1
-
-                    for carteira_id in processo_carteira_ids:
-                        carteira_bucket = _get_priority_carteira_bucket(carteira_id)
-                        carteira_rows_map = carteira_bucket["rows"]
-                        carteira_priority_map = carteira_bucket["by_priority"]
-
-                        carteira_row_key = (uf_code, tag_id)
-                        carteira_row_bucket = carteira_rows_map.setdefault(
-                            carteira_row_key,
-                            {
-                                "uf": uf_code,
-                                "prioridade_id": tag_id,
-                                "prioridade_nome": tag_nome,
-                                "total": 0,
-                                "analisados": 0,
-                                "pendentes": 0,
-                            },
+        if priority_tag_ids:
+            for row in kpi_queries.run(
+                "prioridades_por_uf", etiqueta_ids=priority_tag_ids, carteira_ids=carteira_filtro_ids
+            ):
+                uf_code = row["uf"]
+                tag_id = row["etiqueta_id"]
+                if row["carteira_id"] is None:
+                    if tag_id is None:
+                        priority_process_count += row["processos"]
+                        priority_process_analisados += row["analisados"]
+                        uf_bucket = priority_by_uf_map.setdefault(
+                            uf_code,
+                            {"uf": uf_code, "total": 0, "analisados": 0, "pendentes": 0},
                         )
-                        carteira_row_bucket["total"] += 1
-                        if processo_analisado:
-                            carteira_row_bucket["analisados"] += 1
-                        else:
-                            carteira_row_bucket["pendentes"] += 1
-
-                        carteira_priority_bucket = carteira_priority_map.setdefault(
-                            tag_id,
-                            {
-                                "prioridade_id": tag_id,
-                                "prioridade_nome": tag_nome,
-                                "total": 0,
-                                "analisados": 0,
-                                "pendentes": 0,
-                            },
+                        _add_priority_counts(uf_bucket, row)
+                        continue
+                    rows_map = priority_rows_map
+                    by_priority_map = priority_by_priority_map
+                else:
+                    carteira_bucket = _get_priority_carteira_bucket(row["carteira_id"])
+                    if tag_id is None:
+                        carteira_totals = carteira_bucket["totals"]
+                        carteira_totals["processos"] += row["processos"]
+                        carteira_totals["analisados"] += row["analisados"]
+                        carteira_totals["pendentes"] += row["processos"] - row["analisados"]
+                        carteira_uf_bucket = carteira_bucket["by_uf"].setdefault(
+                            uf_code,
+                            {"uf": uf_code, "total": 0, "analisados": 0, "pendentes": 0},
                         )
-                        carteira_priority_bucket["total"] += 1
-                        if processo_analisado:
-                            carteira_priority_bucket["analisados"] += 1
-                        else:
-                            carteira_priority_bucket["pendentes"] += 1
+                        _add_priority_counts(carteira_uf_bucket, row)
+                        continue
+                    rows_map = carteira_bucket["rows"]
+                    by_priority_map = carteira_bucket["by_priority"]
+                _add_priority_counts(
+                    rows_map.setdefault((uf_code, tag_id), _priority_item(tag_id, uf=uf_code)),
+                    row,
+                )
+                _add_priority_counts(by_priority_map.setdefault(tag_id, _priority_item(tag_id)), row)
 
         serialized_priority_rows = sorted(
             priority_rows_map.values(),
@@ -5810,119 +5656,46 @@ class CarteiraAdmin(admin.ModelAdmin):
             "by_carteira": serialized_priority_by_carteira,
             "default_carteira_id": int(priority_default_carteira_id or 0),
             "default_carteira_nome": priority_default_carteira_nome,
-            "can_configure_global_default": bool(can_configure_priority_default),
-            "set_default_url": priority_set_default_url,
+            "can_configure_global_default": False,
+            "set_default_url": "",
         }
 
-        tarefas_concluidas = (
-            Tarefa.objects.filter(concluida=True)
-            .select_related("concluido_por", "processo__carteira")
-            .only(
-                "id",
-                "concluido_em",
-                "concluido_por__id",
-                "concluido_por__username",
-                "concluido_por__first_name",
-                "concluido_por__last_name",
-                "processo_id",
-                "processo__carteira_id",
-                "processo__carteira__nome",
-            )
+        conclusoes = produtividade.linhas(
+            (ProdutividadeDiaria.METRICA_TAREFAS, ProdutividadeDiaria.METRICA_PRAZOS)
         )
-        for tarefa in tarefas_concluidas.iterator():
-            actor_key, actor_label = _resolve_actor_key_label("", fallback_user=getattr(tarefa, "concluido_por", None))
-            concluded_at = _parse_datetime_value(getattr(tarefa, "concluido_em", None))
-            concluded_date = concluded_at.date().isoformat() if concluded_at else ""
-            processo_obj = getattr(tarefa, "processo", None)
-            carteira_id = _safe_int(getattr(processo_obj, "carteira_id", None)) if processo_obj else None
-            carteira_nome = _clean_text(getattr(getattr(processo_obj, "carteira", None), "nome", "")) if processo_obj else ""
-            _register_productivity_event(
-                "tarefas",
-                actor_key,
-                actor_label,
-                concluded_date,
-                carteira_id=carteira_id,
-                carteira_nome=carteira_nome,
-            )
-
-        prazos_concluidos = (
-            Prazo.objects.filter(concluido=True)
-            .select_related("concluido_por", "processo__carteira")
-            .only(
-                "id",
-                "concluido_em",
-                "concluido_por__id",
-                "concluido_por__username",
-                "concluido_por__first_name",
-                "concluido_por__last_name",
-                "processo_id",
-                "processo__carteira_id",
-                "processo__carteira__nome",
-            )
+        usuarios_conclusoes = User.objects.in_bulk(
+            {row["usuario_id"] for row in conclusoes if row["usuario_id"]}
         )
-        for prazo in prazos_concluidos.iterator():
-            actor_key, actor_label = _resolve_actor_key_label("", fallback_user=getattr(prazo, "concluido_por", None))
-            concluded_at = _parse_datetime_value(getattr(prazo, "concluido_em", None))
-            concluded_date = concluded_at.date().isoformat() if concluded_at else ""
-            processo_obj = getattr(prazo, "processo", None)
-            carteira_id = _safe_int(getattr(processo_obj, "carteira_id", None)) if processo_obj else None
-            carteira_nome = _clean_text(getattr(getattr(processo_obj, "carteira", None), "nome", "")) if processo_obj else ""
+        if carteira_filtro:
+            conclusoes = [row for row in conclusoes if row["carteira_id"] == carteira_filtro]
+        for row in conclusoes:
+            actor_key, actor_label = _resolve_actor_key_label(
+                "", fallback_user=usuarios_conclusoes.get(row["usuario_id"])
+            )
             _register_productivity_event(
-                "prazos",
+                row["metrica"],
                 actor_key,
                 actor_label,
-                concluded_date,
-                carteira_id=carteira_id,
-                carteira_nome=carteira_nome,
+                row["data"].isoformat() if row["data"] else "",
+                carteira_id=row["carteira_id"],
+                quantidade=int(row["quantidade"]),
             )
 
-        tarefas_pendentes = (
-            Tarefa.objects.filter(concluida=False)
-            .select_related("responsavel", "processo__carteira")
-            .only(
-                "id",
-                "responsavel__id",
-                "responsavel__username",
-                "responsavel__first_name",
-                "responsavel__last_name",
-                "processo_id",
-                "processo__carteira_id",
-                "processo__carteira__nome",
-            )
+        pendencias = kpi_queries.run("pendencias_por_responsavel", carteira_ids=carteira_filtro_ids)
+        responsaveis_pendentes = User.objects.in_bulk(
+            {row["responsavel_id"] for row in pendencias if row["responsavel_id"]}
         )
-        for tarefa in tarefas_pendentes.iterator():
-            actor_key, actor_label = _resolve_actor_key_label("", fallback_user=getattr(tarefa, "responsavel", None))
-            user_bucket = _ensure_productivity_user(actor_key, actor_label)
-            processo_obj = getattr(tarefa, "processo", None)
-            carteira_id = _safe_int(getattr(processo_obj, "carteira_id", None)) if processo_obj else None
-            carteira_nome = _clean_text(getattr(getattr(processo_obj, "carteira", None), "nome", "")) if processo_obj else ""
-            _register_productivity_carteira(user_bucket, carteira_id=carteira_id, carteira_nome=carteira_nome)
-            user_bucket["pending"]["tarefas"] += 1
-            productivity_pending["tarefas"] += 1
-
-        prazos_pendentes = (
-            Prazo.objects.filter(concluido=False)
-            .select_related("responsavel", "processo__carteira")
-            .only(
-                "id",
-                "responsavel__id",
-                "responsavel__username",
-                "responsavel__first_name",
-                "responsavel__last_name",
-                "processo_id",
-                "processo__carteira_id",
-                "processo__carteira__nome",
+        for row in pendencias:
+            actor_key, actor_label = _resolve_actor_key_label(
+                "", fallback_user=responsaveis_pendentes.get(row["responsavel_id"])
             )
-        )
-        for prazo in prazos_pendentes.iterator():
-            actor_key, actor_label = _resolve_actor_key_label("", fallback_user=getattr(prazo, "responsavel", None))
             user_bucket = _ensure_productivity_user(actor_key, actor_label)
-            processo_obj = getattr(prazo, "processo", None)
-            carteira_id = _safe_int(getattr(processo_obj, "carteira_id", None)) if processo_obj else None
-            carteira_nome = _clean_text(getattr(getattr(processo_obj, "carteira", None), "nome", "")) if processo_obj else ""
-            _register_productivity_carteira(user_bucket, carteira_id=carteira_id, carteira_nome=carteira_nome)
-            user_bucket["pending"]["prazos"] += 1
-            productivity_pending["prazos"] += 1
+            for metric_key, total in (("tarefas", row["tarefas_abertas"]), ("prazos", row["prazos_abertos"])):
+                if not total:
+                    continue
+                _register_productivity_carteira(user_bucket, carteira_id=row["carteira_id"], quantidade=total)
+                user_bucket["pending"][metric_key] += total
+                productivity_pending[metric_key] += total
 
         serialized_productivity_users = []
         for user_bucket in productivity_users.values():
@@ -6045,10 +5818,42 @@ class CarteiraAdmin(admin.ModelAdmin):
             "date_min": productivity_date_min,
             "date_max": productivity_date_max,
         }
+
+        kpi_data = {
+            "ufs": uf_options,
+            "buckets": serialized_buckets,
+            "process_changelist_url": process_changelist_url,
+            "peticao_types": peticao_type_defs,
+            "peticao_by_carteira": serialized_peticao_by_carteira,
+            "peticao_totals": serialized_peticao_totals,
+            "priority_kpi": priority_kpi_data,
+            "productivity_kpi": productivity_kpi_data,
+        }
+        return self._apply_kpi_user_context(kpi_data, request)
+
+    def _apply_kpi_user_context(self, kpi_data, request=None):
+        """
+        Completa o payload de KPI (que é igual para todos e pode vir de um
+        KpiSnapshot) com as partes que dependem do usuário da requisição.
+        """
+        user = getattr(request, "user", None) if request else None
+        can_configure_priority_default = bool(
+            user
+            and getattr(user, "is_authenticated", False)
+            and bool(getattr(user, "is_superuser", False))
+        )
+        priority_kpi_data = dict(kpi_data.get("priority_kpi") or {})
+        priority_kpi_data["can_configure_global_default"] = can_configure_priority_default
+        priority_kpi_data["set_default_url"] = (
+            reverse("admin:contratos_carteira_kpi_priority_default")
+            if can_configure_priority_default
+            else ""
+        )
+
         settings_map = get_presence_settings()
         online_presence_enabled_for_user = bool(
-            request
-            and is_user_supervisor(getattr(request, "user", None))
+            user
+            and is_user_supervisor(user)
             and is_online_presence_enabled()
         )
         online_presence_kpi_data = {
@@ -6058,27 +5863,36 @@ class CarteiraAdmin(admin.ModelAdmin):
             "ttl_seconds": int(settings_map["ttl_seconds"]),
             "idle_seconds": int(settings_map["idle_seconds"]),
         }
-
         return {
-            "ufs": uf_options,
-            "buckets": serialized_buckets,
-            "process_changelist_url": process_changelist_url,
-            "peticao_types": peticao_type_defs,
-            "peticao_by_carteira": serialized_peticao_by_carteira,
-            "peticao_totals": serialized_peticao_totals,
+            **kpi_data,
             "priority_kpi": priority_kpi_data,
-            "productivity_kpi": productivity_kpi_data,
             "online_presence_kpi": online_presence_kpi_data,
         }
 
     def changelist_view(self, request, extra_context=None):
-        chart_data = list(self.get_queryset(request).values('nome', 'cor_grafico', 'total_processos', 'valor_total'))
-        intersection_data = self._build_carteira_intersections()
-        kpi_data = self._build_carteira_kpi_data(request)
+        # Os KPIs não são calculados aqui: a página renderiza o esqueleto e
+        # busca cada seção em paralelo em kpi-secao/<secao>/.
+        # ?kpi_carteira=<id> troca as seções do dashboard pelo snapshot da carteira;
+        # o parâmetro sai do GET para não virar filtro do changelist.
+        carteira_id = self._kpi_carteira_id(request.GET.get('kpi_carteira'))
+        if 'kpi_carteira' in request.GET:
+            request.GET = request.GET.copy()
+            del request.GET['kpi_carteira']
+        snapshot = (
+            KpiSnapshot.objects.defer('payload')
+            .filter(escopo=KpiSnapshot.ESCOPO_DASHBOARD, carteira_id=carteira_id)
+            .first()
+        )
         extra_context = extra_context or {}
-        extra_context['chart_data'] = json.dumps(chart_data, default=str)
-        extra_context['intersection_data'] = json.dumps(intersection_data, default=str)
-        extra_context['kpi_data'] = json.dumps(kpi_data, default=str)
+        extra_context['kpi_snapshot'] = snapshot
+        extra_context['kpi_snapshot_stale'] = bool(snapshot and kpi_snapshots.precisa_atualizar(snapshot))
+        extra_context['kpi_carteira'] = Carteira.objects.filter(pk=carteira_id).first() if carteira_id else None
+        extra_context['kpi_secoes'] = {}
+        for secao, (escopo, _chaves) in self.KPI_SECOES.items():
+            url = reverse('admin:contratos_carteira_kpi_section', args=[secao])
+            if carteira_id and escopo == KpiSnapshot.ESCOPO_DASHBOARD:
+                url += f'?carteira={carteira_id}'
+            extra_context['kpi_secoes'][secao] = url
         return super().changelist_view(request, extra_context=extra_context)
 
     class Media:
@@ -6091,7 +5905,7 @@ class CarteiraAdmin(admin.ModelAdmin):
             'https://cdn.jsdelivr.net/npm/@simonwep/pickr/dist/pickr.min.js',
             'admin/js/carteira_color_picker.js',
             'https://cdn.jsdelivr.net/npm/chart.js',
-            'admin/js/carteira_charts.js?v=20260221c',
+            'admin/js/carteira_charts.js?v=20261019a',
         )
 
 class ValorCausaOrderFilter(admin.SimpleListFilter):
@@ -6318,7 +6132,10 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
     change_form_template = "admin/contratos/processojudicial/change_form_navegacao.html"
     history_template = "admin/contratos/processojudicial/object_history.html"
     change_list_template = "admin/contratos/processojudicial/change_list_mapa.html"
-    actions = ['excluir_andamentos_selecionados', 'delegate_processes', 'change_carteira_bulk']
+    actions = [
+        'excluir_andamentos_selecionados', 'delegate_processes', 'change_carteira_bulk',
+        'exportar_processos_csv', 'exportar_processos_xlsx', 'gerar_peticoes_lote',
+    ]
 
     FILTER_SESSION_KEY = 'processo_last_filters'
     FILTER_SKIP_KEY = 'processo_skip_last_filters'
@@ -6540,6 +6357,9 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         return None
 
     def save_model(self, request, obj, form, change):
+        if change:
+            obj.ultima_edicao_em = timezone.now()
+            obj.ultima_edicao_por = request.user
         selected_carteira_ids = self._extract_selected_carteira_ids(form, request=request)
         # Snapshot para uso no save_related; evita perda de seleção em cenários
         # onde o POST/M2M chega parcialmente no fluxo do admin.
@@ -6575,19 +6395,7 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         qs = self._apply_peticao_kpi_filter(qs, request)
         qs = self._apply_priority_kpi_filter(qs, request)
         qs = qs.select_related('carteira').prefetch_related('carteiras_vinculadas')
-        order_filter = request.GET.get('ord_ultima_edicao')
-        if order_filter not in {'recente', 'antigo'}:
-            return qs
-        ct = ContentType.objects.get_for_model(ProcessoJudicial)
-        last_logs = LogEntry.objects.filter(
-            content_type=ct,
-            object_id=Cast(OuterRef('pk'), models.CharField()),
-            action_flag=CHANGE
-        ).order_by('-action_time')
-        return qs.annotate(
-            last_edit_time=Subquery(last_logs.values('action_time')[:1]),
-            last_edit_user_id=Subquery(last_logs.values('user_id')[:1]),
-        )
+        return qs
 
     @admin.display(description="Carteira", ordering="carteira__nome")
     def carteira_com_indicador(self, obj):
@@ -6632,68 +6440,22 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         return tuple(sorted((carteira_a_id, carteira_b_id)))
 
     def _build_intersection_process_ids(self, carteira_a_id, carteira_b_id):
-        pair_ids = {carteira_a_id, carteira_b_id}
-        processo_carteiras = {}
-
-        processo_rows = (
-            ProcessoJudicial.objects.filter(
-                Q(carteira_id__in=pair_ids) | Q(carteiras_vinculadas__id__in=pair_ids)
+        cpfs_a = CarteiraCpf.objects.filter(carteira_id=carteira_a_id).values('cpf')
+        cpfs_b = CarteiraCpf.objects.filter(carteira_id=carteira_b_id).values('cpf')
+        return (
+            CarteiraCpf.objects.filter(
+                carteira_id__in=(carteira_a_id, carteira_b_id),
+                cpf__in=cpfs_a,
             )
-            .values_list('id', 'carteira_id', 'carteiras_vinculadas__id')
-            .distinct()
+            .filter(cpf__in=cpfs_b)
+            .values('processo_id')
         )
 
-        for processo_id, carteira_principal_id, carteira_vinculada_id in processo_rows:
-            bucket = processo_carteiras.setdefault(processo_id, set())
-            if carteira_principal_id in pair_ids:
-                bucket.add(carteira_principal_id)
-            if carteira_vinculada_id in pair_ids:
-                bucket.add(carteira_vinculada_id)
-
-        if not processo_carteiras:
-            return set()
-
-        carteira_cpfs = {carteira_a_id: set(), carteira_b_id: set()}
-        processo_cpfs = {}
-
-        partes_rows = (
-            Parte.objects.filter(tipo_polo='PASSIVO', processo_id__in=processo_carteiras.keys())
-            .exclude(documento__isnull=True)
-            .exclude(documento__exact='')
-            .values_list('processo_id', 'documento')
-            .distinct()
-        )
-
-        for processo_id, documento in partes_rows:
-            cpf_digits = re.sub(r'\D', '', str(documento or ''))
-            if not cpf_digits:
-                continue
-            processo_cpfs.setdefault(processo_id, set()).add(cpf_digits)
-            for carteira_id in processo_carteiras.get(processo_id, set()):
-                if carteira_id in pair_ids:
-                    carteira_cpfs[carteira_id].add(cpf_digits)
-
-        intersection_cpfs = carteira_cpfs.get(carteira_a_id, set()).intersection(
-            carteira_cpfs.get(carteira_b_id, set())
-        )
-        if not intersection_cpfs:
-            return set()
-
-        process_ids = {
-            processo_id
-            for processo_id, cpfs in processo_cpfs.items()
-            if cpfs.intersection(intersection_cpfs)
-        }
-        return process_ids
-
     def _apply_intersection_pair_filter(self, queryset, request):
         pair_ids = self._parse_intersection_pair_ids(request)
         if not pair_ids:
             return queryset
-        process_ids = self._build_intersection_process_ids(*pair_ids)
-        if not process_ids:
-            return queryset.none()
-        return queryset.filter(pk__in=process_ids)
+        return queryset.filter(pk__in=self._build_intersection_process_ids(*pair_ids))
 
     def _safe_positive_int(self, value):
         try:
@@ -6909,27 +6671,6 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
             return queryset.none()
         return queryset.filter(pk__in=process_ids)
 
-    def _normalize_filename_text(self, value):
-        text = str(value or '').strip().lower()
-        if not text:
-            return ''
-        text = unicodedata.normalize('NFKD', text)
-        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
-        text = text.replace('_', ' ').replace('-', ' ')
-        return re.sub(r'\s+', ' ', text).strip()
-
-    def _classify_peticao_kind(self, nome, arquivo_nome):
-        joined = f"{self._normalize_filename_text(nome)} {self._normalize_filename_text(arquivo_nome)}".strip()
-        if not joined:
-            return ''
-        if 'monitoria inicial' in joined:
-            return 'monitoria_inicial'
-        if 'cobranca judicial' in joined:
-            return 'cobranca_judicial'
-        if 'habilitacao' in joined:
-            return 'habilitacao'
-        return ''
-
     def _parse_peticao_kpi_filter(self, request):
         tipo_slug = str(request.GET.get('peticao_tipo') or '').strip().lower()
         allowed = {'monitoria_inicial', 'cobranca_judicial', 'habilitacao'}
@@ -6952,16 +6693,12 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         if not candidate_ids:
             return set()
 
-        target_tipo = peticao_filter.get('tipo_slug')
-        matched_ids = set()
-        arquivo_rows = ProcessoArquivo.objects.filter(
-            processo_id__in=candidate_ids
-        ).values_list('processo_id', 'nome', 'arquivo')
-        for processo_id, nome_arquivo, arquivo_path in arquivo_rows.iterator():
-            tipo_slug = self._classify_peticao_kind(nome_arquivo, arquivo_path)
-            if tipo_slug == target_tipo:
-                matched_ids.add(int(processo_id))
-        return matched_ids
+        return set(
+            kpi_queries.arquivos_classificados_queryset()
+            .filter(processo_id__in=candidate_ids, tipo_peca=peticao_filter.get('tipo_slug'))
+            .values_list('processo_id', flat=True)
+            .distinct()
+        )
 
     def _apply_peticao_kpi_filter(self, queryset, request):
         peticao_filter = self._parse_peticao_kpi_filter(request)
@@ -7543,6 +7280,8 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         extra_context['tipos_peticao_api_url'] = reverse('admin:contratos_documentomodelo_tipos_peticao')
         extra_context['tipos_peticao_preview_url'] = reverse('admin:contratos_documentomodelo_tipos_peticao_preview')
         extra_context['tipos_peticao_generate_url'] = reverse('admin:contratos_documentomodelo_tipos_peticao_generate')
+        extra_context['tipos_peticao_pdf_url'] = reverse('admin:contratos_documentomodelo_tipos_peticao_pdf')
+        extra_context['upload_direto_processo_id'] = object_id if uploads_diretos.ativo() else ''
         extra_context['csrf_token'] = get_token(request)
         
         return super().change_view(request, object_id, form_url, extra_context=extra_context)
@@ -7918,6 +7657,8 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         custom_urls = [
             path('<path:object_id>/etiquetas/', self.admin_site.admin_view(self.etiquetas_view), name='processo_etiquetas'),
             path('etiquetas/bulk/', self.admin_site.admin_view(self.etiquetas_bulk_view), name='processo_etiquetas_bulk'),
+            path('operacoes-lote/<int:operacao_id>/', self.admin_site.admin_view(self.operacao_lote_status_view), name='processo_operacao_lote_status'),
+            path('exportar/<str:formato>/', self.admin_site.admin_view(self.exportar_view), name='processo_exportar'),
             path('<path:object_id>/checagem-sistemas/', self.admin_site.admin_view(self.checagem_sistemas_view), name='processo_checagem_sistemas'),
             path('<path:object_id>/online-presence/', self.admin_site.admin_view(self.online_presence_heartbeat_view), name='processo_online_presence_heartbeat'),
             path('etiquetas/criar/', self.admin_site.admin_view(self.criar_etiqueta_view), name='etiqueta_criar'),
@@ -8080,16 +7821,12 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
             pk_list = _parse_ids(ids_raw)
             if not pk_list:
                 return JsonResponse({'error': 'Nenhum processo selecionado.'}, status=400)
-            processos = ProcessoJudicial.objects.filter(pk__in=pk_list)
-            if processos.count() != len(pk_list):
+            pk_list = sorted(set(pk_list))
+            if ProcessoJudicial.objects.filter(pk__in=pk_list).count() != len(pk_list):
                 return JsonResponse({'error': 'Um ou mais processos não foram encontrados.'}, status=400)
 
             todas_etiquetas = list(Etiqueta.objects.order_by('ordem', 'nome').values('id', 'nome', 'cor_fundo', 'cor_fonte'))
-            etiquetas_ids = None
-            for processo in processos:
-                ids_set = set(processo.etiquetas.values_list('id', flat=True))
-                etiquetas_ids = ids_set if etiquetas_ids is None else (etiquetas_ids & ids_set)
-            etiquetas_ids = etiquetas_ids or set()
+            etiquetas_ids = operacoes_lote.etiquetas_em_comum(pk_list)
             etiquetas_processo = list(Etiqueta.objects.filter(id__in=etiquetas_ids).values('id', 'nome', 'cor_fundo', 'cor_fonte'))
             return JsonResponse({'todas_etiquetas': todas_etiquetas, 'etiquetas_processo': etiquetas_processo})
 
@@ -8109,14 +7846,38 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         if not etiqueta_id:
             return JsonResponse({'error': 'Etiqueta inválida.'}, status=400)
         etiqueta = get_object_or_404(Etiqueta, pk=etiqueta_id)
-        processos = ProcessoJudicial.objects.filter(pk__in=pk_list)
+        if action not in ('add', 'remove'):
+            return JsonResponse({'error': 'Ação inválida.'}, status=400)
+        if operacoes_lote.deve_executar_em_segundo_plano(pk_list):
+            tipo = (
+                OperacaoLote.TIPO_ETIQUETA_ADICIONAR if action == 'add'
+                else OperacaoLote.TIPO_ETIQUETA_REMOVER
+            )
+            operacao = operacoes_lote.criar_operacao(
+                tipo,
+                pk_list,
+                parametros={'etiqueta_id': etiqueta.pk},
+                usuario=request.user,
+            )
+            return JsonResponse(
+                {
+                    'status': 'queued',
+                    'operacao': operacoes_lote.serializar_operacao(operacao),
+                    'status_url': reverse('admin:processo_operacao_lote_status', args=[operacao.pk]),
+                },
+                status=202,
+            )
         if action == 'add':
-            etiqueta.processojudicial_set.add(*processos)
-            return JsonResponse({'status': 'added', 'updated': processos.count()})
-        if action == 'remove':
-            etiqueta.processojudicial_set.remove(*processos)
-            return JsonResponse({'status': 'removed', 'updated': processos.count()})
-        return JsonResponse({'error': 'Ação inválida.'}, status=400)
+            updated = operacoes_lote.adicionar_etiqueta(pk_list, etiqueta.pk)
+            return JsonResponse({'status': 'added', 'updated': updated})
+        updated = operacoes_lote.remover_etiqueta(pk_list, etiqueta.pk)
+        return JsonResponse({'status': 'removed', 'updated': updated})
+
+    def operacao_lote_status_view(self, request, operacao_id):
+        operacao = get_object_or_404(OperacaoLote, pk=operacao_id)
+        if not request.user.is_superuser and operacao.criado_por_id != request.user.id:
+            return JsonResponse({'error': 'Permissão negada.'}, status=403)
+        return JsonResponse(operacoes_lote.serializar_operacao(operacao))
 
     def etiquetas_view(self, request, object_id):
         processo = get_object_or_404(ProcessoJudicial, pk=object_id)
@@ -8258,6 +8019,39 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         pass
     excluir_andamentos_selecionados.short_description = "Excluir Andamentos Selecionados"
 
+    def _exportar_response(self, queryset, formato):
+        stamp = timezone.localtime().strftime('%Y%m%d_%H%M')
+        if formato == 'xlsx':
+            response = StreamingHttpResponse(
+                exportacao_processos.stream_xlsx(queryset),
+                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+        else:
+            response = StreamingHttpResponse(
+                exportacao_processos.stream_csv(queryset),
+                content_type='text/csv; charset=utf-8',
+            )
+            formato = 'csv'
+        response['Content-Disposition'] = f'attachment; filename="processos_{stamp}.{formato}"'
+        return response
+
+    def exportar_view(self, request, formato):
+        """Exporta todos os processos da lista com os filtros/busca atuais da URL."""
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        if formato not in ('csv', 'xlsx'):
+            return HttpResponse('Formato inválido.', status=400)
+        changelist = self.get_changelist_instance(request)
+        return self._exportar_response(changelist.get_queryset(request), formato)
+
+    @admin.action(description="Exportar selecionados (CSV)")
+    def exportar_processos_csv(self, request, queryset):
+        return self._exportar_response(queryset, 'csv')
+
+    @admin.action(description="Exportar selecionados (XLSX)")
+    def exportar_processos_xlsx(self, request, queryset):
+        return self._exportar_response(queryset, 'xlsx')
+
     def delegate_processes(self, request, queryset):
         # Redireciona para uma view intermediária para selecionar o usuário
         selected_ids = ','.join(str(pk) for pk in queryset.values_list('pk', flat=True))
@@ -8275,11 +8069,34 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
             form = CarteiraBulkForm(request.POST)
             if form.is_valid():
                 carteira = form.cleaned_data.get('carteira')
-                updated = queryset.update(carteira=carteira)
-                if carteira:
-                    for processo in queryset.only('id'):
-                        processo.carteiras_vinculadas.add(carteira)
+                processo_ids = list(queryset.order_by().values_list('id', flat=True))
                 carteira_label = carteira.nome if carteira else "Sem carteira"
+                if operacoes_lote.deve_executar_em_segundo_plano(processo_ids):
+                    operacao = operacoes_lote.criar_operacao(
+                        OperacaoLote.TIPO_CARTEIRA,
+                        processo_ids,
+                        parametros={'carteira_id': carteira.pk if carteira else None},
+                        usuario=request.user,
+                    )
+                    status_url = reverse('admin:processo_operacao_lote_status', args=[operacao.pk])
+                    self.message_user(
+                        request,
+                        format_html(
+                            'Alteração de {} cadastro(s) para a carteira {} iniciada em segundo plano '
+                            '(operação #{}). <a href="{}" target="_blank">Acompanhar progresso</a>.',
+                            len(processo_ids),
+                            carteira_label,
+                            operacao.pk,
+                            status_url,
+                        ),
+                        messages.INFO,
+                    )
+                    return HttpResponseRedirect(request.get_full_path())
+                updated = operacoes_lote.aplicar_carteira(
+                    processo_ids,
+                    carteira.pk if carteira else None,
+                    usuario_id=request.user.pk,
+                )
                 self.message_user(
                     request,
                     f"{updated} cadastro(s) atualizado(s) para a carteira: {carteira_label}.",
@@ -8301,6 +8118,53 @@ class ProcessoJudicialAdmin(NoRelatedLinksMixin, admin.ModelAdmin):
         return render(request, 'admin/contratos/processojudicial/change_carteira_bulk.html', context)
     change_carteira_bulk.short_description = "Alterar carteira (Supervisor)"
 
+    def gerar_peticoes_lote(self, request, queryset):
+        selected_ids = request.POST.getlist(ACTION_CHECKBOX_NAME)
+
+        if request.method == 'POST' and request.POST.get('apply'):
+            form = PeticoesLoteForm(request.POST)
+            if form.is_valid():
+                processo_ids = list(queryset.order_by().values_list('id', flat=True))
+                try:
+                    geracao, _ = peticoes_lote.enfileirar_lote(
+                        form.cleaned_data['tipo'],
+                        processo_ids,
+                        converter_pdf=form.cleaned_data['converter_pdf'],
+                        emitir_extrato=form.cleaned_data['emitir_extrato'],
+                        usuario=request.user,
+                    )
+                except ValueError as exc:
+                    self.message_user(request, str(exc), messages.ERROR)
+                    return HttpResponseRedirect(request.get_full_path())
+                status_url = reverse('contratos:geracao_documento_status', args=[geracao.pk])
+                self.message_user(
+                    request,
+                    format_html(
+                        'Geração de {} petição(ões) iniciada em segundo plano (geração #{}); '
+                        'os documentos serão salvos em Arquivos de cada processo. '
+                        '<a href="{}" target="_blank">Acompanhar progresso</a>.',
+                        len(processo_ids),
+                        geracao.pk,
+                        status_url,
+                    ),
+                    messages.INFO,
+                )
+                return HttpResponseRedirect(request.get_full_path())
+        else:
+            form = PeticoesLoteForm()
+
+        context = {
+            'title': 'Gerar petições (em lote)',
+            'form': form,
+            'opts': self.model._meta,
+            'app_label': self.model._meta.app_label,
+            'action_name': 'gerar_peticoes_lote',
+            'selected_ids': selected_ids,
+            'media': self.media,
+        }
+        return render(request, 'admin/contratos/processojudicial/gerar_peticoes_lote.html', context)
+    gerar_peticoes_lote.short_description = "Gerar petições em lote"
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "status":
             kwargs["queryset"] = StatusProcessual.objects.filter(ativo=True, ordem__gte=0)
@@ -8460,6 +8324,15 @@ class BuscaAtivaConfigAdmin(admin.ModelAdmin):
         # Impede múltiplos registros; apenas edição do único registro
         return not BuscaAtivaConfig.objects.exists()
 
+@admin.register(ComboDocumentoPattern)
+class ComboDocumentoPatternAdmin(admin.ModelAdmin):
+    list_display = ("tipo_peticao", "categoria", "ordem", "label_template", "keywords", "obrigatorio", "ativo")
+    list_editable = ("ordem", "obrigatorio", "ativo")
+    list_filter = ("tipo_peticao", "categoria", "ativo")
+    search_fields = ("label_template",)
+    ordering = ("tipo_peticao", "categoria", "ordem")
+    readonly_fields = ("atualizado_em",)
+
 @admin.register(StatusProcessual)
 class StatusProcessualAdmin(admin.ModelAdmin):
     list_display = ("nome", "ordem", "ativo")
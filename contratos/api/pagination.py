@@ -0,0 +1,140 @@
+from collections import OrderedDict
+
+from django.core import signing
+from django.db import models
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+CURSOR_SALT = 'contratos-api-keyset-cursor'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por chave (keyset) sobre (campo de ordenação, id).
+
+    Cada página é obtida com `WHERE (chave, id) > (última chave, último id)`,
+    então o custo não cresce com a profundidade da paginação como no OFFSET.
+    Valores nulos da chave ficam sempre no fim, nas duas direções.
+
+    A view informa os campos aceitos em `keyset_ordering_fields`
+    (nome público -> campo do modelo) e o padrão em `keyset_default_ordering`.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 500
+
+    def _get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        try:
+            value = int(raw)
+        except (TypeError, ValueError):
+            return self.page_size
+        if value <= 0:
+            return self.page_size
+        return min(value, self.max_page_size)
+
+    def _get_ordering(self, request, view):
+        fields = getattr(view, 'keyset_ordering_fields', {'id': 'id'})
+        default = getattr(view, 'keyset_default_ordering', 'id')
+        raw = (request.query_params.get(self.ordering_query_param) or default).strip()
+        descending = raw.startswith('-')
+        name = raw.lstrip('-')
+        if name not in fields:
+            raise ValidationError({
+                self.ordering_query_param: f"Ordenação inválida. Use um de: {', '.join(sorted(fields))}."
+            })
+        return name, fields[name], descending
+
+    def _decode_cursor(self, request, ordering_name, descending, model_field):
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None
+        try:
+            payload = signing.loads(raw, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise ValidationError({self.cursor_query_param: 'Cursor inválido.'})
+        if payload.get('o') != ordering_name or bool(payload.get('d')) != descending:
+            raise ValidationError({self.cursor_query_param: 'Cursor não corresponde à ordenação solicitada.'})
+        try:
+            last_id = int(payload['i'])
+            last_value = payload.get('v')
+            if last_value is not None:
+                last_value = model_field.to_python(last_value)
+        except Exception:
+            raise ValidationError({self.cursor_query_param: 'Cursor inválido.'})
+        return last_value, last_id
+
+    def _encode_cursor(self, ordering_name, descending, value, pk):
+        if value is not None and not isinstance(value, (int, float, str, bool)):
+            value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return signing.dumps(
+            {'o': ordering_name, 'd': int(descending), 'v': value, 'i': pk},
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    @staticmethod
+    def _after_cursor_q(field_name, descending, last_value, last_id):
+        id_cmp = 'lt' if descending else 'gt'
+        if field_name == 'id':
+            return models.Q(**{f'id__{id_cmp}': last_id})
+        if last_value is None:
+            # Já estamos no bloco de nulos (sempre por último).
+            return models.Q(**{f'{field_name}__isnull': True, f'id__{id_cmp}': last_id})
+        value_cmp = 'lt' if descending else 'gt'
+        return (
+            models.Q(**{f'{field_name}__{value_cmp}': last_value})
+            | models.Q(**{field_name: last_value, f'id__{id_cmp}': last_id})
+            | models.Q(**{f'{field_name}__isnull': True})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self._get_page_size(request)
+        ordering_name, field_name, descending = self._get_ordering(request, view)
+        model_field = queryset.model._meta.get_field(field_name)
+        cursor = self._decode_cursor(request, ordering_name, descending, model_field)
+
+        if field_name == 'id':
+            order_by = ['-id' if descending else 'id']
+        else:
+            key = models.F(field_name)
+            key = key.desc(nulls_last=True) if descending else key.asc(nulls_last=True)
+            order_by = [key, '-id' if descending else 'id']
+        queryset = queryset.order_by(*order_by)
+        if cursor is not None:
+            queryset = queryset.filter(self._after_cursor_q(field_name, descending, *cursor))
+
+        # Busca um item a mais para saber se existe próxima página sem COUNT(*).
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        self.next_cursor = None
+        if self.has_more and rows:
+            last = rows[-1]
+            self.next_cursor = self._encode_cursor(
+                ordering_name,
+                descending,
+                getattr(last, field_name),
+                last.pk,
+            )
+        return rows
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.next_cursor),
+            ('has_more', self.has_more),
+            ('page_size', self.page_size_value),
+            ('results', data),
+        ]))
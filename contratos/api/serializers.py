@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.urls import reverse
-from ..models import Tarefa, Prazo, ListaDeTarefas, TarefaMensagem, PrazoMensagem, ProcessoArquivo
+from ..models import Tarefa, Prazo, ListaDeTarefas, TarefaMensagem, PrazoMensagem, ProcessoArquivo, ProcessoJudicial
 
 class UserSerializer(serializers.ModelSerializer):
     pending_tasks = serializers.IntegerField(read_only=True, default=0)
@@ -118,3 +118,86 @@ class PrazoMensagemSerializer(serializers.ModelSerializer):
     class Meta:
         model = PrazoMensagem
         fields = ['id', 'texto', 'autor', 'criado_em', 'anexos']
+
+
+class ProcessoListSerializer(serializers.ModelSerializer):
+    """
+    Serializer da listagem de processos com fieldsets esparsos: a view passa
+    `fields=` com os campos pedidos em `?fields=` e os demais são descartados.
+    """
+    DEFAULT_FIELDS = (
+        'id',
+        'cnj',
+        'uf',
+        'carteira',
+        'status',
+        'valor_causa',
+        'ultima_edicao_em',
+        'admin_url',
+    )
+
+    carteira = serializers.SerializerMethodField()
+    status = serializers.SerializerMethodField()
+    carteiras_vinculadas = serializers.SerializerMethodField()
+    etiquetas = serializers.SerializerMethodField()
+    partes_passivas = serializers.SerializerMethodField()
+    delegado_para_id = serializers.IntegerField(read_only=True)
+    admin_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProcessoJudicial
+        fields = [
+            'id',
+            'cnj',
+            'uf',
+            'vara',
+            'tribunal',
+            'valor_causa',
+            'soma_contratos',
+            'viabilidade',
+            'nao_judicializado',
+            'busca_ativa',
+            'carteira',
+            'carteiras_vinculadas',
+            'status',
+            'etiquetas',
+            'partes_passivas',
+            'delegado_para_id',
+            'ultima_edicao_em',
+            'admin_url',
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_carteira(self, obj):
+        if not obj.carteira_id:
+            return None
+        return {'id': obj.carteira_id, 'nome': obj.carteira.nome}
+
+    def get_status(self, obj):
+        if not obj.status_id:
+            return None
+        return {'id': obj.status_id, 'nome': obj.status.nome}
+
+    def get_carteiras_vinculadas(self, obj):
+        return [carteira.id for carteira in obj.carteiras_vinculadas.all()]
+
+    def get_etiquetas(self, obj):
+        return [{'id': etiqueta.id, 'nome': etiqueta.nome} for etiqueta in obj.etiquetas.all()]
+
+    def get_partes_passivas(self, obj):
+        # Usa o prefetch filtrado (`partes_passivas_prefetch`) montado pela view.
+        partes = getattr(obj, 'partes_passivas_prefetch', None)
+        if partes is None:
+            partes = obj.partes_processuais.filter(tipo_polo='PASSIVO')
+        return [{'nome': parte.nome, 'documento': parte.documento} for parte in partes]
+
+    def get_admin_url(self, obj):
+        try:
+            return reverse('admin:contratos_processojudicial_change', args=[obj.pk])
+        except Exception:
+            return ''
@@ -4,6 +4,7 @@ from . import views
 app_name = 'contratos_api'
 
 urlpatterns = [
+    path('processos/', views.ProcessoListAPIView.as_view(), name='processo_list'),
     path('processo/<int:processo_id>/agenda/', views.AgendaAPIView.as_view(), name='agenda_list'),
     path('processo/<int:processo_id>/tarefas/', views.TarefaCreateAPIView.as_view(), name='tarefa_create'),
     path('processo/<int:processo_id>/prazos/', views.PrazoCreateAPIView.as_view(), name='prazo_create'),
@@ -21,6 +22,9 @@ urlpatterns = [
     path('agenda/concluir/', views.AgendaConcluirAPIView.as_view(), name='agenda_concluir'),
     path('tarefas/<int:tarefa_id>/comentarios/', views.TarefaComentarioListCreateAPIView.as_view(), name='tarefa_comentarios'),
     path('prazos/<int:prazo_id>/comentarios/', views.PrazoComentarioListCreateAPIView.as_view(), name='prazo_comentarios'),
+    path('uploads/', views.UploadDiretoAPIView.as_view(), name='upload_direto'),
+    path('uploads/local/', views.UploadDiretoLocalAPIView.as_view(), name='upload_direto_local'),
+    path('uploads/confirmar/', views.UploadDiretoConfirmarAPIView.as_view(), name='upload_direto_confirmar'),
     path('agenda/tarefa/<int:pk>/update-date/', views.AgendaTarefaUpdateDateAPIView.as_view(), name='agenda_tarefa_update_date'),
     path('agenda/prazo/<int:pk>/update-date/', views.AgendaPrazoUpdateDateAPIView.as_view(), name='agenda_prazo_update_date'),
     path('listas-de-tarefas/', views.ListaDeTarefasAPIView.as_view(), name='listadetarefas_list_create'),
@@ -1,11 +1,12 @@
 import json
 import os
 import re
-from datetime import datetime, date as date_cls, time as time_cls
+from datetime import datetime, date as date_cls, time as time_cls, timedelta
 from decimal import Decimal, InvalidOperation
 
-import requests
+import httpx
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
@@ -15,7 +16,7 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.core.files.base import ContentFile
 from django.db import transaction
-from django.db.models import Q, Count
+from django.db.models import Q, Count, Min, Prefetch
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
@@ -34,10 +35,12 @@ from ..models import (
     ProcessoJudicial,
     Prazo,
     PrazoMensagem,
+    ProdutividadeDiaria,
     Tarefa,
     TarefaLote,
     TarefaMensagem,
 )
+from ..services import integracoes_http, produtividade, uploads_diretos
 from ..services.demandas import DemandasImportError, DemandasImportService
 from ..permissoes import filter_processos_queryset_for_user, get_user_allowed_carteira_ids
 from .serializers import (
@@ -47,7 +50,10 @@ from .serializers import (
     ListaDeTarefasSerializer,
     TarefaMensagemSerializer,
     PrazoMensagemSerializer,
+    ProcessoArquivoSerializer,
+    ProcessoListSerializer,
 )
+from .pagination import KeysetPagination
 from ..services.nowlex_calc import (
     NowlexCalcError,
     create_calc,
@@ -934,6 +940,7 @@ class AgendaSupervisionStatusAPIView(APIView):
         analise.respostas = respostas
         analise.updated_by = request.user
         analise.save(update_fields=['respostas', 'updated_by'])
+        ProcessoJudicial.registrar_edicao([analise.processo_judicial_id], request.user)
         return Response({
             'supervisor_status': new_status,
             'status_label': SUPERVISION_STATUS_LABELS.get(new_status, new_status.capitalize()),
@@ -998,6 +1005,7 @@ class AgendaSupervisionBarradoAPIView(APIView):
         analise.respostas = respostas
         analise.updated_by = request.user
         analise.save(update_fields=['respostas', 'updated_by'])
+        ProcessoJudicial.registrar_edicao([analise.processo_judicial_id], request.user)
         return Response({'barrado': barrado})
 
 
@@ -1050,6 +1058,7 @@ class AgendaSupervisionCustasAPIView(APIView):
         analise.respostas = respostas
         analise.updated_by = request.user
         analise.save(update_fields=['respostas', 'updated_by'])
+        ProcessoJudicial.registrar_edicao([analise.processo_judicial_id], request.user)
 
         return Response({'custas_total': card.get('custas_total')})
 
@@ -1096,6 +1105,7 @@ class AgendaSupervisionDateAPIView(APIView):
         analise.respostas = respostas
         analise.updated_by = request.user
         analise.save(update_fields=['respostas', 'updated_by'])
+        ProcessoJudicial.registrar_edicao([analise.processo_judicial_id], request.user)
 
         return Response({'date': card.get('supervision_date')})
 
@@ -1119,25 +1129,40 @@ class TarefaComentarioListCreateAPIView(APIView):
         tarefa = self.get_tarefa(tarefa_id)
         texto = (request.data.get('texto') or '').strip()
         arquivo = request.FILES.get('arquivo')
-        if not texto and not arquivo:
+        upload_token = (request.data.get('upload_token') or '').strip()
+        if not texto and not arquivo and not upload_token:
             return Response(
                 {'detail': 'É necessário informar texto ou arquivo.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        comentario = TarefaMensagem.objects.create(
-            tarefa=tarefa,
-            autor=request.user,
-            texto=texto,
-        )
-        if arquivo:
-            processo_arquivo = ProcessoArquivo.objects.create(
-                processo=tarefa.processo,
-                tarefa=tarefa,
-                mensagem=comentario,
-                enviado_por=request.user,
-                arquivo=arquivo,
+        if upload_token and tarefa.processo_id is None:
+            return Response(
+                {'detail': 'Tarefa sem processo não aceita upload direto.'},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            processo_arquivo.save()
+        try:
+            with transaction.atomic():
+                comentario = TarefaMensagem.objects.create(
+                    tarefa=tarefa,
+                    autor=request.user,
+                    texto=texto,
+                )
+                if arquivo:
+                    processo_arquivo = ProcessoArquivo.objects.create(
+                        processo=tarefa.processo,
+                        tarefa=tarefa,
+                        mensagem=comentario,
+                        enviado_por=request.user,
+                        arquivo=arquivo,
+                    )
+                    processo_arquivo.save()
+                elif upload_token:
+                    uploads_diretos.confirmar(
+                        upload_token, request.user, processo=tarefa.processo, tarefa=tarefa, mensagem=comentario,
+                    )
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        ProcessoJudicial.registrar_edicao([tarefa.processo_id], request.user)
         serializer = TarefaMensagemSerializer(comentario, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -1161,25 +1186,40 @@ class PrazoComentarioListCreateAPIView(APIView):
         prazo = self.get_prazo(prazo_id)
         texto = (request.data.get('texto') or '').strip()
         arquivo = request.FILES.get('arquivo')
-        if not texto and not arquivo:
+        upload_token = (request.data.get('upload_token') or '').strip()
+        if not texto and not arquivo and not upload_token:
             return Response(
                 {'detail': 'É necessário informar texto ou arquivo.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        comentario = PrazoMensagem.objects.create(
-            prazo=prazo,
-            autor=request.user,
-            texto=texto,
-        )
-        if arquivo:
-            processo_arquivo = ProcessoArquivo.objects.create(
-                processo=prazo.processo,
-                prazo=prazo,
-                prazo_mensagem=comentario,
-                enviado_por=request.user,
-                arquivo=arquivo,
+        if upload_token and prazo.processo_id is None:
+            return Response(
+                {'detail': 'Prazo sem processo não aceita upload direto.'},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            processo_arquivo.save()
+        try:
+            with transaction.atomic():
+                comentario = PrazoMensagem.objects.create(
+                    prazo=prazo,
+                    autor=request.user,
+                    texto=texto,
+                )
+                if arquivo:
+                    processo_arquivo = ProcessoArquivo.objects.create(
+                        processo=prazo.processo,
+                        prazo=prazo,
+                        prazo_mensagem=comentario,
+                        enviado_por=request.user,
+                        arquivo=arquivo,
+                    )
+                    processo_arquivo.save()
+                elif upload_token:
+                    uploads_diretos.confirmar(
+                        upload_token, request.user, processo=prazo.processo, prazo=prazo, prazo_mensagem=comentario,
+                    )
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        ProcessoJudicial.registrar_edicao([prazo.processo_id], request.user)
         serializer = PrazoMensagemSerializer(comentario, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -1200,6 +1240,7 @@ class TarefaCreateAPIView(generics.CreateAPIView):
             extra['concluido_em'] = timezone.now()
             extra['concluido_por'] = self.request.user
         serializer.save(**extra)
+        ProcessoJudicial.registrar_edicao([processo.pk], self.request.user)
 
 class PrazoCreateAPIView(generics.CreateAPIView):
     """
@@ -1218,6 +1259,7 @@ class PrazoCreateAPIView(generics.CreateAPIView):
             extra['concluido_em'] = timezone.now()
             extra['concluido_por'] = self.request.user
         serializer.save(**extra)
+        ProcessoJudicial.registrar_edicao([processo.pk], self.request.user)
 
 def _bulk_payload_from_request(request):
     payload_raw = request.data.get('payload') if hasattr(request, 'data') else None
@@ -1292,6 +1334,95 @@ def _parse_datetime_value(value):
         dt = timezone.make_aware(dt, timezone.get_default_timezone())
     return dt
 
+def _confirmar_upload_em_lote(upload_token, processo_map, usuario):
+    dados = uploads_diretos.ler_token(upload_token, usuario)
+    processo = processo_map.get(dados['p'])
+    if processo is None:
+        raise uploads_diretos.UploadInvalido("O upload foi reservado para um processo fora da seleção.")
+    return uploads_diretos.confirmar(upload_token, usuario, processo=processo)
+
+
+def _vincular_upload_em_lote(anexo, processo, usuario, **vinculos):
+    """O processo do upload fica com o arquivo enviado; os demais recebem uma cópia feita no storage."""
+    if processo.pk == anexo.processo_id:
+        for campo, valor in vinculos.items():
+            setattr(anexo, campo, valor)
+        anexo.save(update_fields=list(vinculos))
+        return anexo
+    return uploads_diretos.copiar(anexo, processo, usuario, **vinculos)
+
+
+def _processo_para_upload(request):
+    data = request.data
+    try:
+        processo_id = int(data.get('processo_id') or 0)
+        if not processo_id and data.get('tarefa_id'):
+            processo_id = Tarefa.objects.filter(pk=int(data.get('tarefa_id'))).values_list('processo_id', flat=True).first()
+        elif not processo_id and data.get('prazo_id'):
+            processo_id = Prazo.objects.filter(pk=int(data.get('prazo_id'))).values_list('processo_id', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if not processo_id:
+        return None
+    return filter_processos_queryset_for_user(
+        ProcessoJudicial.objects.filter(pk=processo_id), request.user
+    ).first()
+
+
+class UploadDiretoAPIView(APIView):
+    """
+    Primeira etapa do upload direto (services/uploads_diretos.py): reserva a
+    chave em processos/{id}/pasta/ e devolve para onde o navegador envia o
+    arquivo. Aceita processo_id, tarefa_id ou prazo_id, mais nome e tamanho.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        processo = _processo_para_upload(request)
+        if processo is None:
+            return Response({'detail': 'Processo não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            destino = uploads_diretos.iniciar(
+                processo, request.data.get('nome'), request.data.get('tamanho'), request.user,
+            )
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(destino, status=status.HTTP_201_CREATED)
+
+
+class UploadDiretoLocalAPIView(APIView):
+    """Destino do envio quando o storage é local (mesmo formato do presigned POST do S3)."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            uploads_diretos.receber_local(request.data.get('token'), request.FILES.get('file'), request.user)
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadDiretoConfirmarAPIView(APIView):
+    """Última etapa do upload direto: valida o arquivo enviado e cria o ProcessoArquivo."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        token = request.data.get('token')
+        try:
+            dados = uploads_diretos.ler_token(token, request.user)
+            processo = filter_processos_queryset_for_user(
+                ProcessoJudicial.objects.filter(pk=dados['p']), request.user
+            ).first()
+            if processo is None:
+                return Response({'detail': 'Processo não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+            arquivo = uploads_diretos.confirmar(token, request.user, processo=processo, nome=request.data.get('nome') or '')
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        ProcessoJudicial.registrar_edicao([processo.pk], request.user)
+        serializer = ProcessoArquivoSerializer(arquivo, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
 class TarefaBulkCreateAPIView(APIView):
     """
     API para criar tarefas em lote (com ou sem processos selecionados).
@@ -1310,6 +1441,7 @@ class TarefaBulkCreateAPIView(APIView):
         concluida = bool(payload.get('concluida'))
         comentario_texto = (payload.get('comentario_texto') or '').strip()
         arquivo = request.FILES.get('arquivo')
+        upload_token = (payload.get('upload_token') or '').strip()
 
         if not descricao:
             return Response({'detail': 'Informe a descrição da tarefa.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -1317,7 +1449,7 @@ class TarefaBulkCreateAPIView(APIView):
             return Response({'detail': 'Informe a data da tarefa.'}, status=status.HTTP_400_BAD_REQUEST)
         if not processo_ids and not responsavel_id:
             return Response({'detail': 'Selecione um responsável para criar tarefa geral.'}, status=status.HTTP_400_BAD_REQUEST)
-        if arquivo and not processo_ids:
+        if (arquivo or upload_token) and not processo_ids:
             return Response({'detail': 'Anexo exige pelo menos um processo selecionado.'}, status=status.HTTP_400_BAD_REQUEST)
 
         processos = []
@@ -1337,6 +1469,10 @@ class TarefaBulkCreateAPIView(APIView):
         processo_map = {proc.id: proc for proc in processos}
         if processo_ids and len(processo_map) != len(processo_ids):
             return Response({'detail': 'Um ou mais processos não foram encontrados.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            anexo_direto = _confirmar_upload_em_lote(upload_token, processo_map, request.user) if upload_token else None
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         responsavel = User.objects.filter(id=responsavel_id).first() if responsavel_id else None
         lista = ListaDeTarefas.objects.filter(id=lista_id).first() if lista_id else None
@@ -1365,7 +1501,7 @@ class TarefaBulkCreateAPIView(APIView):
                 criado_por=request.user,
             )
             created_tasks.append(tarefa)
-            if comentario_texto or arquivo:
+            if comentario_texto or arquivo or anexo_direto:
                 comentario = TarefaMensagem.objects.create(
                     tarefa=tarefa,
                     autor=request.user,
@@ -1380,7 +1516,10 @@ class TarefaBulkCreateAPIView(APIView):
                         enviado_por=request.user,
                         arquivo=arquivo,
                     )
+                elif anexo_direto and processo:
+                    _vincular_upload_em_lote(anexo_direto, processo, request.user, tarefa=tarefa, mensagem=comentario)
 
+        ProcessoJudicial.registrar_edicao(processo_map.keys(), request.user)
         return Response({
             'created': len(created_tasks),
             'ids': [task.id for task in created_tasks],
@@ -1436,11 +1575,14 @@ class TarefaBulkHistoryActionAPIView(APIView):
 
         tarefas_qs = Tarefa.objects.filter(lote_id__in=allowed_ids)
         if action in ('concluir', 'concluida', 'concluidas', 'finalizar'):
-            updated = tarefas_qs.filter(concluida=False).update(
+            pendentes = tarefas_qs.filter(concluida=False)
+            processo_ids = list(pendentes.exclude(processo__isnull=True).values_list('processo_id', flat=True).distinct())
+            updated = pendentes.update(
                 concluida=True,
                 concluido_em=timezone.now(),
                 concluido_por=request.user,
             )
+            ProcessoJudicial.registrar_edicao(processo_ids, request.user)
             return Response({'updated': updated, 'action': 'concluir'})
         if action in ('delete', 'deletar', 'excluir', 'remover'):
             deleted = tarefas_qs.count()
@@ -1468,6 +1610,7 @@ class PrazoBulkCreateAPIView(APIView):
         concluido = bool(payload.get('concluido'))
         comentario_texto = (payload.get('comentario_texto') or '').strip()
         arquivo = request.FILES.get('arquivo')
+        upload_token = (payload.get('upload_token') or '').strip()
 
         if not titulo:
             return Response({'detail': 'Informe o título do prazo.'}, status=status.HTTP_400_BAD_REQUEST)
@@ -1475,7 +1618,7 @@ class PrazoBulkCreateAPIView(APIView):
             return Response({'detail': 'Informe a data do prazo.'}, status=status.HTTP_400_BAD_REQUEST)
         if not processo_ids and not responsavel_id:
             return Response({'detail': 'Selecione um responsável para criar prazo geral.'}, status=status.HTTP_400_BAD_REQUEST)
-        if arquivo and not processo_ids:
+        if (arquivo or upload_token) and not processo_ids:
             return Response({'detail': 'Anexo exige pelo menos um processo selecionado.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
@@ -1500,6 +1643,10 @@ class PrazoBulkCreateAPIView(APIView):
         processo_map = {proc.id: proc for proc in processos}
         if processo_ids and len(processo_map) != len(processo_ids):
             return Response({'detail': 'Um ou mais processos não foram encontrados.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            anexo_direto = _confirmar_upload_em_lote(upload_token, processo_map, request.user) if upload_token else None
+        except uploads_diretos.UploadInvalido as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
         responsavel = User.objects.filter(id=responsavel_id).first() if responsavel_id else None
 
@@ -1521,7 +1668,7 @@ class PrazoBulkCreateAPIView(APIView):
                 criado_por=request.user,
             )
             created_prazos.append(prazo)
-            if comentario_texto or arquivo:
+            if comentario_texto or arquivo or anexo_direto:
                 comentario = PrazoMensagem.objects.create(
                     prazo=prazo,
                     autor=request.user,
@@ -1536,7 +1683,12 @@ class PrazoBulkCreateAPIView(APIView):
                         enviado_por=request.user,
                         arquivo=arquivo,
                     )
+                elif anexo_direto and processo:
+                    _vincular_upload_em_lote(
+                        anexo_direto, processo, request.user, prazo=prazo, prazo_mensagem=comentario,
+                    )
 
+        ProcessoJudicial.registrar_edicao(processo_map.keys(), request.user)
         return Response({
             'created': len(created_prazos),
             'ids': [prazo.id for prazo in created_prazos],
@@ -1573,63 +1725,50 @@ class AgendaUsersAPIView(APIView):
         )
         if not is_supervisor_user:
             # Usuário comum não deve navegar agendas de terceiros.
-            users = (
-                User.objects.filter(id=request.user.id, is_active=True)
-                .annotate(
-                    pending_tasks=Count(
-                        'tarefas_responsaveis',
-                        filter=Q(tarefas_responsaveis__concluida=False),
-                        distinct=True,
-                    ),
-                    pending_prazos=Count(
-                        'prazos_responsaveis',
-                        filter=Q(prazos_responsaveis__concluido=False),
-                        distinct=True,
-                    ),
-                    completed_tasks=Count(
-                        'tarefas_responsaveis',
-                        filter=Q(tarefas_responsaveis__concluida=True),
-                        distinct=True,
-                    ),
-                    completed_prazos=Count(
-                        'prazos_responsaveis',
-                        filter=Q(prazos_responsaveis__concluido=True),
-                        distinct=True,
-                    ),
-                )
-            )
-            serializer = UserSerializer(users, many=True)
-            return Response(serializer.data)
-
-        users = (
-            User.objects.filter(is_active=True)
-            .annotate(
-                pending_tasks=Count(
-                    'tarefas_responsaveis',
-                    filter=Q(tarefas_responsaveis__concluida=False),
-                    distinct=True,
-                ),
-                pending_prazos=Count(
-                    'prazos_responsaveis',
-                    filter=Q(prazos_responsaveis__concluido=False),
-                    distinct=True,
-                ),
-                completed_tasks=Count(
-                    'tarefas_responsaveis',
-                    filter=Q(tarefas_responsaveis__concluida=True),
-                    distinct=True,
-                ),
-                completed_prazos=Count(
-                    'prazos_responsaveis',
-                    filter=Q(prazos_responsaveis__concluido=True),
-                    distinct=True,
-                ),
+            users = list(User.objects.filter(id=request.user.id, is_active=True))
+        else:
+            users = list(
+                User.objects.filter(is_active=True)
+                .order_by('first_name', 'last_name', 'username')[:40]
             )
-            .order_by('first_name', 'last_name', 'username')[:40]
-        )
+        self._annotate_counts(users)
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data)
 
+    def _annotate_counts(self, users):
+        """
+        Pendências vêm de um GROUP BY por responsável (ao vivo); concluídas,
+        do rollup de produtividade diária.
+        """
+        user_ids = [user.id for user in users]
+        if not user_ids:
+            return
+        pending_tasks = dict(
+            Tarefa.objects.filter(responsavel_id__in=user_ids, concluida=False)
+            .values('responsavel_id')
+            .annotate(total=Count('id'))
+            .values_list('responsavel_id', 'total')
+        )
+        pending_prazos = dict(
+            Prazo.objects.filter(responsavel_id__in=user_ids, concluido=False)
+            .values('responsavel_id')
+            .annotate(total=Count('id'))
+            .values_list('responsavel_id', 'total')
+        )
+        completed = produtividade.totais_por_usuario(
+            (
+                ProdutividadeDiaria.METRICA_TAREFAS_RESPONSAVEL,
+                ProdutividadeDiaria.METRICA_PRAZOS_RESPONSAVEL,
+            ),
+            usuario_ids=user_ids,
+        )
+        for user in users:
+            user_completed = completed.get(user.id, {})
+            user.pending_tasks = pending_tasks.get(user.id, 0)
+            user.pending_prazos = pending_prazos.get(user.id, 0)
+            user.completed_tasks = user_completed.get(ProdutividadeDiaria.METRICA_TAREFAS_RESPONSAVEL, 0)
+            user.completed_prazos = user_completed.get(ProdutividadeDiaria.METRICA_PRAZOS_RESPONSAVEL, 0)
+
 class HerdeiroAPIView(APIView):
     """
     API para listar e salvar herdeiros vinculados ao CPF com óbito.
@@ -1776,6 +1915,7 @@ class AgendaTarefaUpdateDateAPIView(APIView):
         tarefa.data = new_date
         update_fields = ['data', 'data_origem'] if tarefa.data_origem is not None else ['data']
         tarefa.save(update_fields=update_fields)
+        ProcessoJudicial.registrar_edicao([tarefa.processo_id], request.user)
         return Response({
             'status': 'ok',
             'id': tarefa.id,
@@ -1836,6 +1976,7 @@ class AgendaPrazoUpdateDateAPIView(APIView):
         prazo.data_limite = updated_dt
         update_fields = ['data_limite', 'data_limite_origem'] if prazo.data_limite_origem is not None else ['data_limite']
         prazo.save(update_fields=update_fields)
+        ProcessoJudicial.registrar_edicao([prazo.processo_id], request.user)
         return Response({
             'status': 'ok',
             'id': prazo.id,
@@ -1940,6 +2081,14 @@ class AgendaConcluirAPIView(APIView):
         prazos_to_close_ids = list(prazos_qs.filter(concluido=False).values_list('id', flat=True))
         now = timezone.now()
 
+        processo_ids = set(
+            Tarefa.objects.filter(id__in=tarefas_to_close_ids, processo__isnull=False)
+            .values_list('processo_id', flat=True)
+        ) | set(
+            Prazo.objects.filter(id__in=prazos_to_close_ids, processo__isnull=False)
+            .values_list('processo_id', flat=True)
+        )
+
         with transaction.atomic():
             if tarefas_to_close_ids:
                 Tarefa.objects.filter(id__in=tarefas_to_close_ids).update(
@@ -1971,6 +2120,8 @@ class AgendaConcluirAPIView(APIView):
                     for prazo_id in prazos_to_close_ids
                 ])
 
+            ProcessoJudicial.registrar_edicao(processo_ids, request.user, quando=now)
+
         updated_tasks = len(tarefas_to_close_ids)
         updated_prazos = len(prazos_to_close_ids)
         return Response({
@@ -2042,11 +2193,11 @@ class FetchAddressAPIView(View):
         if not api_key:
             return JsonResponse({'error': 'A chave da API não está configurada no servidor.'}, status=500)
 
-        url = f'https://nowlex-mini-erp-api.onrender.com/api/clientes/cpf/{cpf}?contracts=true'
+        url = f'/api/clientes/cpf/{cpf}?contracts=true'
         headers = {'X-API-Key': api_key}
         
         try:
-            res = requests.get(url, headers=headers, timeout=10)
+            res = integracoes_http.cliente('enderecos').get(url, headers=headers)
             res.raise_for_status()
 
             payload = res.json()
@@ -2071,13 +2222,13 @@ class FetchAddressAPIView(View):
             endereco_formatado = _montar_texto_endereco(map_data)
             return JsonResponse({'endereco_formatado': endereco_formatado})
 
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             if e.response.status_code in [401, 403]:
                 return JsonResponse({'error': 'Acesso negado pela API de endereços.'}, status=403)
             if e.response.status_code == 404:
                 return JsonResponse({'error': 'CPF não encontrado na API de endereços.'}, status=404)
             return JsonResponse({'error': f'Erro na API externa: {e.response.status_code}'}, status=500)
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return JsonResponse({'error': f'Erro de conexão com a API de endereços: {e}'}, status=500)
 
 @method_decorator(login_required, name='dispatch')
@@ -2246,11 +2397,11 @@ class BuscarDadosEscavadorView(View):
         if not api_key:
             return JsonResponse({'status': 'error', 'message': 'A chave da API do Escavador não está configurada no servidor.'}, status=500)
 
-        url = f'https://api.escavador.com/api/v2/processos/numero_cnj/{numero_cnj}'
+        url = f'/processos/numero_cnj/{numero_cnj}'
         headers = {'Authorization': f'Bearer {api_key}'}
         
         try:
-            res = requests.get(url, headers=headers, timeout=15)
+            res = integracoes_http.cliente('escavador').get(url, headers=headers)
             res.raise_for_status()
             
             escavador_data = res.json()
@@ -2334,11 +2485,11 @@ class BuscarDadosEscavadorView(View):
                 'andamentos': andamentos_data
             })
 
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
                 return JsonResponse({'status': 'error', 'message': 'Processo não encontrado no Escavador.'}, status=404)
             return JsonResponse({'status': 'error', 'message': f'Erro na API do Escavador: {e.response.status_code}'}, status=500)
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return JsonResponse({'status': 'error', 'message': f'Erro de conexão com a API do Escavador: {e}'}, status=500)
 
 
@@ -2425,3 +2576,141 @@ class ProcessoNowlexValorCausaAPIView(View):
             })
 
         return JsonResponse(response)
+
+
+PRESCRICAO_BUCKETS = ('nao_prescrito', 'prescrito', 'ate_90_dias', 'ate_1_ano', 'acima_1_ano', 'sem_data')
+
+
+def _filter_processos_by_prescricao_bucket(queryset, bucket):
+    """
+    Faixas de prescrição pela data mais próxima ainda não vencida dos contratos.
+    Tudo é resolvido com subconsultas em contratos_contrato (semi-join), sem
+    anotar o queryset principal.
+    """
+    today = timezone.localdate()
+    vigentes = Q(data_prescricao__gte=today) | Q(data_prescricao__isnull=True)
+    if bucket == 'nao_prescrito':
+        return queryset.filter(pk__in=Contrato.objects.filter(vigentes).values('processo_id'))
+    if bucket == 'prescrito':
+        return queryset.filter(
+            pk__in=Contrato.objects.values('processo_id')
+        ).exclude(
+            pk__in=Contrato.objects.filter(vigentes).values('processo_id')
+        )
+    if bucket == 'sem_data':
+        return queryset.exclude(
+            pk__in=Contrato.objects.filter(data_prescricao__isnull=False).values('processo_id')
+        )
+    proximas = (
+        Contrato.objects.filter(data_prescricao__gte=today)
+        .values('processo_id')
+        .annotate(proxima=Min('data_prescricao'))
+    )
+    if bucket == 'ate_90_dias':
+        proximas = proximas.filter(proxima__lte=today + timedelta(days=90))
+    elif bucket == 'ate_1_ano':
+        proximas = proximas.filter(
+            proxima__gt=today + timedelta(days=90),
+            proxima__lte=today + timedelta(days=365),
+        )
+    else:
+        proximas = proximas.filter(proxima__gt=today + timedelta(days=365))
+    return queryset.filter(pk__in=proximas.values('processo_id'))
+
+
+class ProcessoListAPIView(generics.ListAPIView):
+    """
+    Lista processos em JSON com paginação por chave (cursor) e campos esparsos.
+
+    Parâmetros:
+    - carteira: ID (principal ou vinculada)
+    - uf: UF ou lista separada por vírgula
+    - status: ID da classe processual
+    - etiqueta: IDs separados por vírgula (todas precisam estar presentes)
+    - prescricao: nao_prescrito | prescrito | ate_90_dias | ate_1_ano | acima_1_ano | sem_data
+    - ordering: id | ultima_edicao_em | valor_causa | cnj (prefixo "-" para decrescente)
+    - fields: campos do ProcessoListSerializer separados por vírgula
+    - page_size / cursor: controle da paginação
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ProcessoListSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = {
+        'id': 'id',
+        'ultima_edicao_em': 'ultima_edicao_em',
+        'valor_causa': 'valor_causa',
+        'cnj': 'cnj',
+    }
+    keyset_default_ordering = 'id'
+
+    def _requested_fields(self):
+        raw = (self.request.query_params.get('fields') or '').strip()
+        available = ProcessoListSerializer.Meta.fields
+        if not raw:
+            return list(ProcessoListSerializer.DEFAULT_FIELDS)
+        requested = [name.strip() for name in raw.split(',') if name.strip()]
+        invalid = [name for name in requested if name not in available]
+        if invalid:
+            raise ValidationError({'fields': f"Campos inválidos: {', '.join(invalid)}."})
+        if 'id' not in requested:
+            requested.insert(0, 'id')
+        return requested
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self._requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        params = self.request.query_params
+        qs = filter_processos_queryset_for_user(ProcessoJudicial.objects.all(), self.request.user)
+
+        carteira_id = params.get('carteira')
+        if carteira_id:
+            try:
+                carteira_id = int(carteira_id)
+            except (TypeError, ValueError):
+                raise ValidationError({'carteira': 'Carteira inválida.'})
+            vinculos = ProcessoJudicial.carteiras_vinculadas.through.objects.filter(carteira_id=carteira_id)
+            qs = qs.filter(Q(carteira_id=carteira_id) | Q(pk__in=vinculos.values('processojudicial_id')))
+
+        ufs = sorted({uf.strip().upper() for uf in (params.get('uf') or '').split(',') if uf.strip()})
+        if ufs:
+            qs = qs.filter(uf__in=ufs)
+
+        status_id = params.get('status')
+        if status_id:
+            try:
+                qs = qs.filter(status_id=int(status_id))
+            except (TypeError, ValueError):
+                raise ValidationError({'status': 'Status inválido.'})
+
+        etiqueta_ids = _coerce_id_list(params.get('etiqueta'))
+        etiquetas_through = ProcessoJudicial.etiquetas.through.objects
+        for etiqueta_id in etiqueta_ids:
+            qs = qs.filter(
+                pk__in=etiquetas_through.filter(etiqueta_id=etiqueta_id).values('processojudicial_id')
+            )
+
+        bucket = (params.get('prescricao') or '').strip()
+        if bucket:
+            if bucket not in PRESCRICAO_BUCKETS:
+                raise ValidationError({'prescricao': f"Use um de: {', '.join(PRESCRICAO_BUCKETS)}."})
+            qs = _filter_processos_by_prescricao_bucket(qs, bucket)
+
+        fields = set(self._requested_fields())
+        related = [name for name in ('carteira', 'status') if name in fields]
+        if related:
+            qs = qs.select_related(*related)
+        if 'carteiras_vinculadas' in fields:
+            qs = qs.prefetch_related('carteiras_vinculadas')
+        if 'etiquetas' in fields:
+            qs = qs.prefetch_related('etiquetas')
+        if 'partes_passivas' in fields:
+            qs = qs.prefetch_related(
+                Prefetch(
+                    'partes_processuais',
+                    queryset=Parte.objects.filter(tipo_polo='PASSIVO').only('id', 'processo_id', 'nome', 'documento'),
+                    to_attr='partes_passivas_prefetch',
+                )
+            )
+        return qs
@@ -1,9 +1,10 @@
-import requests
+import httpx
 import re
 from django.conf import settings
 
-# URL base da API v2 do Escavador
-URL_BASE_API = "https://api.escavador.com/api/v2"
+from contratos.services.integracoes_http import cliente
+
+# A URL base da API v2 do Escavador fica em ESCAVADOR_API_BASE (services/integracoes_http.py).
 
 def buscar_processo_por_cnj(cnj: str) -> dict:
     """
@@ -40,14 +41,15 @@ def buscar_processo_por_cnj(cnj: str) -> dict:
 
     try:
         # 1. Buscar os detalhes do processo
-        url_detalhes = f"{URL_BASE_API}/processos/numero_cnj/{cnj_limpo}"
-        response_detalhes = requests.get(url_detalhes, headers=headers)
+        escavador = cliente('escavador')
+        url_detalhes = f"/processos/numero_cnj/{cnj_limpo}"
+        response_detalhes = escavador.get(url_detalhes, headers=headers)
         response_detalhes.raise_for_status()
         dados_processo = response_detalhes.json()
 
         # 2. Buscar as movimentações do processo
-        url_movimentacoes = f"{URL_BASE_API}/processos/numero_cnj/{cnj_limpo}/movimentacoes"
-        response_movimentacoes = requests.get(url_movimentacoes, headers=headers)
+        url_movimentacoes = f"/processos/numero_cnj/{cnj_limpo}/movimentacoes"
+        response_movimentacoes = escavador.get(url_movimentacoes, headers=headers)
         response_movimentacoes.raise_for_status()
         dados_movimentacoes = response_movimentacoes.json()
 
@@ -55,7 +57,7 @@ def buscar_processo_por_cnj(cnj: str) -> dict:
         dados_processo['movimentacoes'] = dados_movimentacoes.get('items', [])
         return dados_processo
 
-    except requests.exceptions.HTTPError as http_err:
+    except httpx.HTTPStatusError as http_err:
         print(f"Erro HTTP ao buscar processo {cnj_limpo}: {http_err}")
         # Tratamento de erro robusto
         try:
@@ -68,7 +70,7 @@ def buscar_processo_por_cnj(cnj: str) -> dict:
         except ValueError:
             print(f"Resposta da API (não-JSON): {http_err.response.text}")
             
-    except requests.exceptions.RequestException as req_err:
+    except httpx.HTTPError as req_err:
         print(f"Erro de conexão ao buscar processo {cnj_limpo}: {req_err}")
     except Exception as e:
         print(f"Ocorreu um erro inesperado ao buscar processo {cnj_limpo}: {e}")
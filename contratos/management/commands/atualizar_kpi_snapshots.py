@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from contratos.models import KpiSnapshot
+from contratos.services.kpi_snapshots import atualizar_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os snapshots de KPI do dashboard de carteiras que estiverem "
+        "desatualizados. Com --loop, roda continuamente como worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recalcula mesmo que o snapshot não esteja marcado como desatualizado.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Mantém o comando rodando e verifica os snapshots periodicamente.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=60,
+            help="Segundos entre verificações no modo --loop (padrão: 60).",
+        )
+
+    def handle(self, *args, **options):
+        force = bool(options.get("force"))
+        intervalo = max(int(options.get("intervalo") or 60), 5)
+        if not options.get("loop"):
+            self._rodada(force)
+            return
+        while True:
+            close_old_connections()
+            self._rodada(force)
+            force = False
+            time.sleep(intervalo)
+
+    def _rodada(self, force):
+        alvos = {(escopo, None) for escopo, _ in KpiSnapshot.ESCOPO_CHOICES}
+        alvos.update(KpiSnapshot.objects.values_list("escopo", "carteira_id"))
+        for escopo, carteira_id in sorted(alvos, key=lambda item: (item[0], item[1] or 0)):
+            try:
+                snapshot = atualizar_snapshot(escopo, carteira_id, force=force)
+            except ValueError as exc:
+                self.stderr.write(str(exc))
+                continue
+            alvo = f"{escopo}/{carteira_id or 'geral'}"
+            if snapshot is None:
+                self.stdout.write(f"{alvo}: já está sendo atualizado por outro processo.")
+            else:
+                self.stdout.write(
+                    f"{alvo}: gerado em {snapshot.gerado_em:%d/%m/%Y %H:%M:%S} ({snapshot.duracao_ms} ms)."
+                )
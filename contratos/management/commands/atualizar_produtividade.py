@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from contratos.services.produtividade import atualizar_rollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Consolida a produtividade diária (tarefas, prazos e ações do admin) por "
+        "usuário e carteira a partir da marca da última execução. Agende de hora "
+        "em hora; rode com --completo de vez em quando para refazer todo o histórico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--completo",
+            action="store_true",
+            help="Descarta o rollup e recalcula todo o histórico.",
+        )
+
+    def handle(self, *args, **options):
+        resultado = atualizar_rollup(completo=bool(options.get("completo")))
+        desde = resultado["desde"].strftime("%d/%m/%Y") if resultado["desde"] else "o início"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Produtividade consolidada de {desde} até "
+                f"{timezone.localtime(resultado['ate']):%d/%m/%Y %H:%M:%S} ({resultado['linhas']} linhas)."
+            )
+        )
@@ -0,0 +1,89 @@
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from docx import Document
+
+from contratos import views
+from contratos.models import DocumentoModelo
+from contratos.services import modelos_documento, plano_docx
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o tempo por documento do preenchimento de placeholders varrendo o "
+        "template campo a campo com o plano compilado (monitória e cobrança)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeticoes",
+            type=int,
+            default=20,
+            help="Documentos gerados por template em cada modo (padrão: 20).",
+        )
+        parser.add_argument(
+            "--arquivo",
+            action="append",
+            default=[],
+            help="DOCX local a medir no lugar dos modelos cadastrados (pode repetir).",
+        )
+
+    def handle(self, *args, **options):
+        repeticoes = max(int(options.get("repeticoes") or 20), 1)
+        templates = [(Path(caminho).name, Path(caminho).read_bytes()) for caminho in options["arquivo"]]
+        if not templates:
+            for slug in (DocumentoModelo.SlugChoices.MONITORIA_INICIAL, DocumentoModelo.SlugChoices.COBRANCA_JUDICIAL):
+                try:
+                    modelo = views._get_template_modelo(slug)
+                except FileNotFoundError as exc:
+                    self.stdout.write(self.style.WARNING(str(exc)))
+                    continue
+                templates.append((modelo.nome or slug, modelos_documento.obter_bytes(modelo)))
+        if not templates:
+            raise CommandError("Nenhum template para medir.")
+
+        for nome, conteudo in templates:
+            self._medir(nome, conteudo, repeticoes)
+
+    def _medir(self, nome, conteudo, repeticoes):
+        original = Document(BytesIO(conteudo))
+        compilado = modelos_documento.copiar_documento(original)
+        inicio = time.perf_counter()
+        plano = plano_docx.compilar(compilado)
+        compilacao_ms = (time.perf_counter() - inicio) * 1000
+
+        dados = {token[1:-1]: f"Valor de teste {i}" for i, token in enumerate(plano.placeholders) if token != '[E]/[H]'}
+        dados.setdefault('E_FORO', 'Foro')
+        dados.setdefault('H_FORO', 'UF')
+        valores = views._placeholder_values(dados)
+
+        def varredura():
+            document = modelos_documento.copiar_documento(original)
+            views._replace_placeholders_in_container(document, dados)
+            for section in document.sections:
+                views._replace_placeholders_in_container(section.header, dados)
+                views._replace_placeholders_in_container(section.footer, dados)
+
+        def plano_compilado():
+            plano.vincular(modelos_documento.copiar_documento(compilado)).renderizar(valores)
+
+        copia_ms = self._tempo(lambda: modelos_documento.copiar_documento(original), repeticoes)
+        varredura_ms = self._tempo(varredura, repeticoes) - copia_ms
+        plano_ms = self._tempo(plano_compilado, repeticoes) - copia_ms
+        self.stdout.write(
+            f"{nome}: {len(plano.placeholders)} placeholder(s) em {len(plano.alvos)} run(s); "
+            f"compilação {compilacao_ms:.1f} ms, cópia do template {copia_ms:.1f} ms/doc"
+        )
+        ganho = varredura_ms / plano_ms if plano_ms > 0 else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f"  varredura {varredura_ms:.2f} ms/doc, plano {plano_ms:.2f} ms/doc ({ganho:.1f}x)"
+        ))
+
+    @staticmethod
+    def _tempo(funcao, repeticoes):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        return (time.perf_counter() - inicio) * 1000 / repeticoes
@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from contratos.models import ProcessoArquivo, ZipGerado, marcar_kpi_snapshots_desatualizados
+from contratos.services.classificacao_arquivos import classificar_arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche tipo_documento dos arquivos ainda não classificados usando a "
+        "heurística de nome/caminho, e o tipo de petição de origem a partir dos "
+        "ZIPs gerados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reclassificar",
+            action="store_true",
+            help="Reclassifica também os arquivos que já têm tipo_documento.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=2000,
+            help="Quantidade de arquivos lidos por consulta (padrão: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        lote = max(int(options.get("lote") or 2000), 100)
+        queryset = ProcessoArquivo.objects.order_by("pk")
+        if not options.get("reclassificar"):
+            queryset = queryset.filter(tipo_documento="")
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=ultimo_id).values_list("pk", "nome", "arquivo")[:lote]
+            )
+            if not rows:
+                break
+            ultimo_id = rows[-1][0]
+            por_tipo = defaultdict(list)
+            for pk, nome, caminho in rows:
+                tipo = classificar_arquivo(nome, caminho)
+                if tipo:
+                    por_tipo[tipo].append(pk)
+            with transaction.atomic():
+                for tipo, ids in por_tipo.items():
+                    total += ProcessoArquivo.objects.filter(pk__in=ids).update(tipo_documento=tipo)
+            self.stdout.write(f"{total} arquivos classificados até o id {ultimo_id}.")
+
+        origem = 0
+        with transaction.atomic():
+            for zip_name, base_id, tipo_peticao_id in ZipGerado.objects.values_list(
+                "zip_file", "arquivo_base_id", "tipo_peticao_id"
+            ).iterator():
+                origem += ProcessoArquivo.objects.filter(
+                    arquivo=zip_name, tipo_peticao__isnull=True
+                ).update(tipo_peticao_id=tipo_peticao_id)
+                if base_id:
+                    origem += ProcessoArquivo.objects.filter(
+                        pk=base_id, tipo_peticao__isnull=True
+                    ).update(tipo_peticao_id=tipo_peticao_id)
+            if total or origem:
+                marcar_kpi_snapshots_desatualizados()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} arquivos classificados; {origem} vinculados ao tipo de petição de origem."
+            )
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from contratos.services import conversao_pdf
+
+
+class Command(BaseCommand):
+    help = "Mostra a taxa de acerto do cache de conversão DOCX → PDF."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=7,
+            help="Quantidade de dias considerados, incluindo hoje (padrão: 7).",
+        )
+
+    def handle(self, *args, **options):
+        totais = conversao_pdf.estatisticas(max(int(options.get("dias") or 7), 1))
+        media_ms = totais["duracao_conversoes_ms"] // totais["conversoes"] if totais["conversoes"] else 0
+        self.stdout.write(
+            f"Desde {totais['desde']}: {totais['pedidos']} pedido(s), "
+            f"{totais['acertos']} no cache, {totais['conversoes']} convertido(s) "
+            f"(média {media_ms} ms), {totais['falhas']} sem resultado."
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Taxa de acerto: {totais['taxa_acerto'] * 100:.1f}% (versão {conversao_pdf.get_conversor_versao()}).")
+        )
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from contratos.models import ProcessoArquivo
+from contratos.services import previews_arquivos
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as miniaturas da primeira página e a contagem de páginas dos PDFs "
+        "e DOCX de Arquivos que ainda não têm (ou cujo conteúdo mudou)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--refazer",
+            action="store_true",
+            help="Gera de novo também as miniaturas já prontas ou indisponíveis.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=2000,
+            help="Quantidade de arquivos lidos por consulta (padrão: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        if not previews_arquivos.disponivel():
+            raise CommandError("PyMuPDF não está instalado; não é possível gerar miniaturas.")
+        lote = max(int(options.get("lote") or 2000), 100)
+        refazer = bool(options.get("refazer"))
+        extensoes = Q()
+        for extensao in previews_arquivos.EXTENSOES:
+            extensoes |= Q(arquivo__iendswith=extensao)
+        queryset = ProcessoArquivo.objects.filter(extensoes).order_by("pk")
+        if not refazer:
+            queryset = queryset.filter(Q(hash_conteudo="") | ~Q(preview_hash=F("hash_conteudo")))
+
+        totais = {}
+        ultimo_id = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=ultimo_id).values_list("pk", flat=True)[:lote])
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            for arquivo in ProcessoArquivo.objects.filter(pk__in=ids).order_by("pk"):
+                status = previews_arquivos.gerar(arquivo, refazer=refazer) or "ilegivel"
+                totais[status] = totais.get(status, 0) + 1
+            self.stdout.write(f"{sum(totais.values())} arquivos processados até o id {ultimo_id}.")
+
+        prontas = totais.get(ProcessoArquivo.PREVIEW_PRONTO, 0)
+        indisponiveis = totais.get(ProcessoArquivo.PREVIEW_INDISPONIVEL, 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"{prontas} miniaturas geradas, {indisponiveis} indisponíveis, "
+            f"{totais.get('ilegivel', 0)} arquivos não lidos."
+        ))
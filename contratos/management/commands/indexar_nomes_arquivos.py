@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from contratos.models import ProcessoArquivo
+from contratos.services.classificacao_arquivos import contratos_no_nome, tokens_nome
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche os tokens do nome e os contratos citados (nome_tokens e "
+        "contratos_nome) dos arquivos usados na busca de documentos do combo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reindexar",
+            action="store_true",
+            help="Recalcula também os arquivos que já têm tokens.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=2000,
+            help="Quantidade de arquivos lidos por consulta (padrão: 2000).",
+        )
+
+    def handle(self, *args, **options):
+        lote = max(int(options.get("lote") or 2000), 100)
+        queryset = ProcessoArquivo.objects.order_by("pk")
+        if not options.get("reindexar"):
+            queryset = queryset.filter(nome_tokens="")
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            rows = list(
+                queryset.filter(pk__gt=ultimo_id).values_list("pk", "nome", "arquivo")[:lote]
+            )
+            if not rows:
+                break
+            ultimo_id = rows[-1][0]
+            arquivos = []
+            for pk, nome, caminho in rows:
+                nome = nome or (caminho or "").split("/")[-1]
+                arquivos.append(ProcessoArquivo(
+                    pk=pk,
+                    nome_tokens=tokens_nome(nome),
+                    contratos_nome=contratos_no_nome(nome)[:255],
+                ))
+            with transaction.atomic():
+                ProcessoArquivo.objects.bulk_update(arquivos, ["nome_tokens", "contratos_nome"])
+            total += len(arquivos)
+            self.stdout.write(f"{total} arquivos indexados até o id {ultimo_id}.")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} arquivos indexados."))
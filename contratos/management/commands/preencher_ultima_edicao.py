@@ -0,0 +1,85 @@
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from contratos.models import ProcessoJudicial
+
+
+class Command(BaseCommand):
+    help = (
+        "Preenche ProcessoJudicial.ultima_edicao_em/ultima_edicao_por a partir do "
+        "histórico do admin (django_admin_log), de forma idempotente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Quantidade de processos atualizados por transação.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Sobrescreve valores já preenchidos (por padrão só completa os vazios).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Não grava no banco (apenas mostra quantos processos seriam atualizados).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(int(options.get("batch_size") or 1000), 1)
+        force = bool(options.get("force"))
+        dry_run = bool(options.get("dry_run"))
+
+        ct = ContentType.objects.get_for_model(ProcessoJudicial)
+        # DISTINCT ON (object_id) mantém apenas a edição mais recente de cada processo.
+        ultimas = (
+            LogEntry.objects.filter(content_type=ct, action_flag=CHANGE)
+            .order_by("object_id", "-action_time")
+            .distinct("object_id")
+            .values_list("object_id", "action_time", "user_id")
+        )
+
+        pendentes = ProcessoJudicial.objects.all()
+        if not force:
+            pendentes = pendentes.filter(ultima_edicao_em__isnull=True)
+        pendentes_ids = set(pendentes.values_list("id", flat=True))
+
+        batch = []
+        total = 0
+        for object_id, action_time, user_id in ultimas.iterator(chunk_size=batch_size):
+            try:
+                processo_id = int(object_id)
+            except (TypeError, ValueError):
+                continue
+            if processo_id not in pendentes_ids:
+                continue
+            batch.append(
+                ProcessoJudicial(
+                    pk=processo_id,
+                    ultima_edicao_em=action_time,
+                    ultima_edicao_por_id=user_id,
+                )
+            )
+            if len(batch) >= batch_size:
+                total += self._flush(batch, dry_run)
+                batch = []
+        if batch:
+            total += self._flush(batch, dry_run)
+
+        prefix = "[dry-run] " if dry_run else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}{total} processo(s) com última edição preenchida."))
+
+    def _flush(self, batch, dry_run):
+        if dry_run:
+            return len(batch)
+        with transaction.atomic():
+            ProcessoJudicial.objects.bulk_update(
+                batch,
+                ["ultima_edicao_em", "ultima_edicao_por"],
+            )
+        return len(batch)
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from contratos.services.geracao_documentos import executar_pendentes, get_timeout_minutes, retomar_travadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker da fila de geração de documentos (petições e ZIPs de combo): "
+        "executa as gerações pendentes e, com --loop, continua aguardando novas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Não encerra quando a fila esvazia; consulta novamente a cada --intervalo segundos.",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=int,
+            default=2,
+            help="Segundos entre consultas à fila no modo --loop (padrão: 2).",
+        )
+        parser.add_argument(
+            "--retomar-apos-minutos",
+            type=int,
+            default=None,
+            help=(
+                "Marca como erro e enfileira de novo as gerações 'executando' sem atividade "
+                "há mais de N minutos (ex.: processo reiniciado no meio da geração). "
+                "Padrão: GERACAO_DOCUMENTOS_TIMEOUT_MINUTES; 0 desativa."
+            ),
+        )
+
+    def _retomar_travadas(self, minutos):
+        retomadas = retomar_travadas(minutos)
+        if retomadas:
+            self.stdout.write(f"{len(retomadas)} geração(ões) travada(s) reenfileirada(s).")
+
+    def handle(self, *args, **options):
+        minutos = options.get("retomar_apos_minutos")
+        if minutos is None:
+            minutos = get_timeout_minutes()
+        intervalo = max(int(options.get("intervalo") or 2), 1)
+        while True:
+            if minutos > 0:
+                self._retomar_travadas(minutos)
+            executadas = executar_pendentes()
+            if executadas:
+                self.stdout.write(f"{executadas} geração(ões) executada(s).")
+            if not options.get("loop"):
+                break
+            close_old_connections()
+            time.sleep(intervalo)
+        self.stdout.write(self.style.SUCCESS("Fila de geração de documentos processada."))
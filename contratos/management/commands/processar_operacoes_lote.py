@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from contratos.models import OperacaoLote
+from contratos.services.operacoes_lote import executar_operacao, get_timeout_minutes, retomar_travadas
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa operações em lote pendentes (carteira/etiquetas), por exemplo as "
+        "que ficaram na fila após um reinício do servidor."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retomar-apos-minutos",
+            type=int,
+            default=None,
+            help=(
+                "Reenfileira operações 'executando' sem atividade há mais de N minutos "
+                "(as operações são idempotentes). Padrão: OPERACAO_LOTE_TIMEOUT_MINUTES; "
+                "0 desativa."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        minutos = options.get("retomar_apos_minutos")
+        if minutos is None:
+            minutos = get_timeout_minutes()
+        if minutos > 0:
+            retomadas = retomar_travadas(minutos)
+            if retomadas:
+                self.stdout.write(f"{len(retomadas)} operação(ões) travada(s) reenfileirada(s).")
+
+        pendentes = list(
+            OperacaoLote.objects.filter(status=OperacaoLote.STATUS_PENDENTE)
+            .order_by("criado_em", "id")
+            .values_list("id", flat=True)
+        )
+        concluidas = 0
+        for operacao_id in pendentes:
+            operacao = executar_operacao(operacao_id)
+            if operacao is None:
+                continue
+            if operacao.status == OperacaoLote.STATUS_ERRO:
+                self.stderr.write(f"Operação #{operacao.pk} falhou: {operacao.erro}")
+            else:
+                concluidas += 1
+        self.stdout.write(self.style.SUCCESS(f"{concluidas} operação(ões) concluída(s)."))
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from contratos.models import CarteiraStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara as estatísticas mantidas por carteira (CarteiraStats) com os "
+        "dados de origem e regrava as que divergirem. Idempotente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--carteira",
+            type=int,
+            default=0,
+            help="Limita a reconciliação a uma carteira (ID).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Apenas lista as divergências, sem corrigir.",
+        )
+
+    def handle(self, *args, **options):
+        carteira_id = int(options.get("carteira") or 0)
+        esperado = CarteiraStats.calcular([carteira_id] if carteira_id else None)
+        atuais = {
+            stats.carteira_id: stats
+            for stats in CarteiraStats.objects.filter(carteira_id__in=list(esperado))
+        }
+
+        divergentes = []
+        for pk, valores in sorted(esperado.items()):
+            stats = atuais.get(pk)
+            if stats is None:
+                divergentes.append(pk)
+                self.stdout.write(f"Carteira {pk}: sem estatísticas.")
+                continue
+            diferencas = [
+                f"{campo} {getattr(stats, campo)} → {valor}"
+                for campo, valor in valores.items()
+                if getattr(stats, campo) != valor
+            ]
+            if diferencas:
+                divergentes.append(pk)
+                self.stdout.write(f"Carteira {pk}: " + "; ".join(diferencas))
+
+        if not divergentes:
+            self.stdout.write(self.style.SUCCESS(f"{len(esperado)} carteira(s) conferida(s), nenhuma divergência."))
+            return
+        if options.get("dry_run"):
+            self.stdout.write(self.style.WARNING(f"{len(divergentes)} carteira(s) divergente(s); nada foi alterado."))
+            return
+        CarteiraStats.recalcular(divergentes)
+        self.stdout.write(self.style.SUCCESS(f"{len(divergentes)} carteira(s) corrigida(s)."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from contratos.models import CarteiraCpf, ProcessoJudicial
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o índice CPF × carteira × processo (CarteiraCpf) usado nas "
+        "interseções de carteiras. Idempotente; use para reparar divergências."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--carteira",
+            type=int,
+            default=0,
+            help="Limita a reconstrução aos processos de uma carteira (ID).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Quantidade de processos recalculados por transação.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(int(options.get("chunk_size") or 1000), 1)
+        carteira_id = int(options.get("carteira") or 0)
+
+        processos = ProcessoJudicial.objects.all()
+        if carteira_id:
+            processos = processos.filter(carteira_id=carteira_id) | processos.filter(
+                carteiras_vinculadas__id=carteira_id
+            )
+            processo_ids = set(processos.values_list("id", flat=True))
+            processo_ids.update(
+                CarteiraCpf.objects.filter(carteira_id=carteira_id).values_list("processo_id", flat=True)
+            )
+        else:
+            processo_ids = set(processos.values_list("id", flat=True))
+
+        total_processos = len(processo_ids)
+        self.stdout.write(f"Recalculando {total_processos} processo(s)...")
+        total_linhas = CarteiraCpf.sincronizar_processos(processo_ids, chunk_size=chunk_size)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Índice reconstruído: {total_linhas} vínculo(s) CPF/carteira em {total_processos} processo(s)."
+            )
+        )
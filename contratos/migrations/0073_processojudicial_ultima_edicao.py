@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0072_alter_advogadopassivo_nome_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processojudicial',
+            name='ultima_edicao_em',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Última edição em'),
+        ),
+        migrations.AddField(
+            model_name='processojudicial',
+            name='ultima_edicao_por',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Última edição por'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:14
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_carteira_cpf(apps, schema_editor):
+    """
+    Carga inicial do índice CPF × carteira × processo a partir das partes passivas.
+    """
+    ProcessoJudicial = apps.get_model('contratos', 'ProcessoJudicial')
+    Parte = apps.get_model('contratos', 'Parte')
+    CarteiraCpf = apps.get_model('contratos', 'CarteiraCpf')
+    Vinculo = ProcessoJudicial.carteiras_vinculadas.through
+    db_alias = schema_editor.connection.alias
+
+    carteiras_por_processo = {}
+    for processo_id, carteira_id in (
+        ProcessoJudicial.objects.using(db_alias)
+        .filter(carteira_id__isnull=False)
+        .values_list('id', 'carteira_id')
+    ):
+        carteiras_por_processo.setdefault(processo_id, set()).add(carteira_id)
+    for processo_id, carteira_id in Vinculo.objects.using(db_alias).values_list('processojudicial_id', 'carteira_id'):
+        carteiras_por_processo.setdefault(processo_id, set()).add(carteira_id)
+
+    rows = set()
+    partes = (
+        Parte.objects.using(db_alias)
+        .filter(tipo_polo='PASSIVO')
+        .exclude(documento__isnull=True)
+        .exclude(documento__exact='')
+        .values_list('processo_id', 'documento')
+    )
+    for processo_id, documento in partes.iterator(chunk_size=2000):
+        cpf = re.sub(r'\D', '', str(documento or ''))
+        if not cpf:
+            continue
+        for carteira_id in carteiras_por_processo.get(processo_id, ()):
+            rows.add((cpf, carteira_id, processo_id))
+
+    CarteiraCpf.objects.using(db_alias).bulk_create(
+        [CarteiraCpf(cpf=cpf, carteira_id=carteira_id, processo_id=processo_id) for cpf, carteira_id, processo_id in rows],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0073_processojudicial_ultima_edicao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarteiraCpf',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cpf', models.CharField(max_length=20, verbose_name='CPF/CNPJ (somente dígitos)')),
+                ('carteira', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cpfs_membros', to='contratos.carteira', verbose_name='Carteira')),
+                ('processo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cpfs_carteira', to='contratos.processojudicial', verbose_name='Processo Judicial')),
+            ],
+            options={
+                'verbose_name': 'CPF por Carteira',
+                'verbose_name_plural': 'CPFs por Carteira',
+                'indexes': [models.Index(fields=['carteira', 'cpf'], name='carteiracpf_carteira_cpf_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cpf', 'carteira', 'processo'), name='uniq_carteiracpf_cpf_carteira_processo')],
+            },
+        ),
+        migrations.RunPython(populate_carteira_cpf, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0074_carteiracpf'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperacaoLote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('carteira', 'Alterar carteira'), ('etiqueta_add', 'Adicionar etiqueta'), ('etiqueta_remove', 'Remover etiqueta')], max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('erro', 'Erro')], db_index=True, default='pendente', max_length=12, verbose_name='Status')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parâmetros')),
+                ('processo_ids', models.JSONField(blank=True, default=list, verbose_name='Processos')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('processados', models.PositiveIntegerField(default=0, verbose_name='Processados')),
+                ('erro', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado em')),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='operacoes_lote', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+            ],
+            options={
+                'verbose_name': 'Operação em lote',
+                'verbose_name_plural': 'Operações em lote',
+                'ordering': ['-criado_em', '-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0075_operacaolote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KpiSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('escopo', models.CharField(choices=[('dashboard', 'Dashboard de carteiras')], default='dashboard', max_length=40, verbose_name='Escopo')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Payload')),
+                ('gerado_em', models.DateTimeField(blank=True, null=True, verbose_name='Gerado em')),
+                ('duracao_ms', models.PositiveIntegerField(default=0, verbose_name='Duração do cálculo (ms)')),
+                ('desatualizado', models.BooleanField(default=True, verbose_name='Desatualizado')),
+                ('atualizando_desde', models.DateTimeField(blank=True, null=True, verbose_name='Atualizando desde')),
+                ('carteira', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='kpi_snapshots', to='contratos.carteira', verbose_name='Carteira')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de KPI',
+                'verbose_name_plural': 'Snapshots de KPI',
+                'constraints': [models.UniqueConstraint(fields=('carteira', 'escopo'), name='uniq_kpisnapshot_carteira_escopo'), models.UniqueConstraint(condition=models.Q(('carteira__isnull', True)), fields=('escopo',), name='uniq_kpisnapshot_geral_escopo')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0076_kpisnapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutividadeRollupEstado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processado_ate', models.DateTimeField(blank=True, null=True, verbose_name='Processado até')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+                ('duracao_ms', models.PositiveIntegerField(default=0, verbose_name='Duração da última execução (ms)')),
+            ],
+            options={
+                'verbose_name': 'Estado do rollup de produtividade',
+                'verbose_name_plural': 'Estado do rollup de produtividade',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProdutividadeDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(blank=True, null=True, verbose_name='Data')),
+                ('metrica', models.CharField(choices=[('tarefas', 'Tarefas concluídas (por quem concluiu)'), ('prazos', 'Prazos concluídos (por quem concluiu)'), ('tarefas_responsavel', 'Tarefas concluídas (por responsável)'), ('prazos_responsavel', 'Prazos concluídos (por responsável)'), ('acoes', 'Ações registradas no admin')], max_length=30, verbose_name='Métrica')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Quantidade')),
+                ('carteira', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='produtividade_diaria', to='contratos.carteira', verbose_name='Carteira')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='produtividade_diaria', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Produtividade diária',
+                'verbose_name_plural': 'Produtividade diária',
+                'indexes': [models.Index(fields=['metrica', 'data'], name='produtividade_metrica_data'), models.Index(fields=['usuario', 'metrica', 'data'], name='produtividade_usuario_data')],
+            },
+        ),
+    ]
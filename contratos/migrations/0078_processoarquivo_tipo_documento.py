@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0077_produtividadediaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='tipo_documento',
+            field=models.CharField(blank=True, choices=[('monitoria_inicial', 'Monitória'), ('cobranca_judicial', 'Ação de Cobrança'), ('habilitacao', 'Habilitação'), ('combo_zip', 'Pacote de protocolo (ZIP)'), ('extrato_titularidade', 'Extrato de titularidade'), ('outro', 'Outro')], db_index=True, help_text='Preenchido na criação do arquivo; vazio enquanto não classificado.', max_length=30, verbose_name='Tipo de documento'),
+        ),
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='tipo_peticao',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='arquivos_gerados', to='contratos.tipopeticao', verbose_name='Tipo de petição de origem'),
+        ),
+        migrations.AddIndex(
+            model_name='processoarquivo',
+            index=models.Index(fields=['tipo_documento', 'processo'], name='procarquivo_tipo_processo'),
+        ),
+    ]
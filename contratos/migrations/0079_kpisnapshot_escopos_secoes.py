@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0078_processoarquivo_tipo_documento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='kpisnapshot',
+            name='escopo',
+            field=models.CharField(choices=[('dashboard', 'Dashboard de carteiras'), ('graficos', 'Gráficos de carteiras'), ('intersecoes', 'Interseções entre carteiras')], default='dashboard', max_length=40, verbose_name='Escopo'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_carteira_stats(apps, schema_editor):
+    """
+    Carga inicial das estatísticas por carteira.
+    """
+    Carteira = apps.get_model('contratos', 'Carteira')
+    ProcessoJudicial = apps.get_model('contratos', 'ProcessoJudicial')
+    CarteiraCpf = apps.get_model('contratos', 'CarteiraCpf')
+    CarteiraStats = apps.get_model('contratos', 'CarteiraStats')
+    Vinculo = ProcessoJudicial.carteiras_vinculadas.through
+    db_alias = schema_editor.connection.alias
+
+    stats = {pk: CarteiraStats(carteira_id=pk) for pk in Carteira.objects.using(db_alias).values_list('pk', flat=True)}
+    for row in (
+        ProcessoJudicial.objects.using(db_alias).filter(carteira_id__isnull=False)
+        .values('carteira_id').annotate(total=Count('pk')).order_by()
+    ):
+        stats[row['carteira_id']].processos_principal = row['total']
+    for row in (
+        Vinculo.objects.using(db_alias).values('carteira_id')
+        .annotate(
+            total=Count('processojudicial_id', distinct=True),
+            valor=Sum('processojudicial__valor_causa'),
+            soma=Sum('processojudicial__soma_contratos'),
+        )
+        .order_by()
+    ):
+        item = stats[row['carteira_id']]
+        item.processos_vinculados = row['total']
+        item.valor_causa_total = row['valor'] or 0
+        item.soma_contratos_total = row['soma'] or 0
+    for row in CarteiraCpf.objects.using(db_alias).values('carteira_id').annotate(total=Count('cpf', distinct=True)).order_by():
+        stats[row['carteira_id']].cpfs_distintos = row['total']
+    CarteiraStats.objects.using(db_alias).bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0079_kpisnapshot_escopos_secoes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarteiraStats',
+            fields=[
+                ('carteira', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='contratos.carteira', verbose_name='Carteira')),
+                ('processos_principal', models.PositiveIntegerField(default=0, verbose_name='Processos (carteira principal)')),
+                ('processos_vinculados', models.PositiveIntegerField(default=0, verbose_name='Processos vinculados')),
+                ('valor_causa_total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor da causa (total)')),
+                ('soma_contratos_total', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Soma dos contratos (total)')),
+                ('cpfs_distintos', models.PositiveIntegerField(default=0, verbose_name='CPFs distintos')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Estatística da Carteira',
+                'verbose_name_plural': 'Estatísticas das Carteiras',
+            },
+        ),
+        migrations.RunPython(populate_carteira_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0080_carteirastats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversaoPdfEstatistica',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True, verbose_name='Data')),
+                ('acertos', models.PositiveIntegerField(default=0, verbose_name='Acertos no cache')),
+                ('conversoes', models.PositiveIntegerField(default=0, verbose_name='Conversões realizadas')),
+                ('falhas', models.PositiveIntegerField(default=0, verbose_name='Conversões sem resultado')),
+                ('duracao_conversoes_ms', models.PositiveBigIntegerField(default=0, verbose_name='Tempo total convertendo (ms)')),
+            ],
+            options={
+                'verbose_name': 'Estatística de conversão PDF',
+                'verbose_name_plural': 'Estatísticas de conversão PDF',
+                'ordering': ['-data'],
+            },
+        ),
+    ]
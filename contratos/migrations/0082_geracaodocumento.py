@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0081_conversaopdfestatistica'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeracaoDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('monitoria', 'Petição monitória'), ('cobranca', 'Cobrança judicial'), ('habilitacao', 'Habilitação'), ('combo_zip', 'ZIP de combo de petição')], max_length=20, verbose_name='Tipo')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('erro', 'Erro')], db_index=True, default='pendente', max_length=12, verbose_name='Status')),
+                ('chave', models.CharField(db_index=True, max_length=64, verbose_name='Chave do pedido')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parâmetros')),
+                ('etapa', models.CharField(blank=True, default='', max_length=120, verbose_name='Etapa atual')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total de etapas')),
+                ('processados', models.PositiveIntegerField(default=0, verbose_name='Etapas concluídas')),
+                ('resultado', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('erro', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado em')),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True, verbose_name='Finalizado em')),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='geracoes_documento', to=settings.AUTH_USER_MODEL, verbose_name='Criado por')),
+                ('processo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='geracoes_documento', to='contratos.processojudicial', verbose_name='Processo')),
+            ],
+            options={
+                'verbose_name': 'Geração de documento',
+                'verbose_name_plural': 'Gerações de documentos',
+                'ordering': ['-criado_em', '-id'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['pendente', 'executando'])), fields=('chave',), name='uniq_geracao_documento_chave_ativa')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0082_geracaodocumento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geracaodocumento',
+            name='tipo',
+            field=models.CharField(choices=[('monitoria', 'Petição monitória'), ('cobranca', 'Cobrança judicial'), ('habilitacao', 'Habilitação'), ('combo_zip', 'ZIP de combo de petição'), ('lote_peticoes', 'Petições em lote')], max_length=20, verbose_name='Tipo'),
+        ),
+    ]
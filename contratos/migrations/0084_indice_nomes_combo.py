@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0083_geracaodocumento_lote_peticoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='combodocumentopattern',
+            name='ativo',
+            field=models.BooleanField(default=True, verbose_name='Ativo'),
+        ),
+        migrations.AddField(
+            model_name='combodocumentopattern',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, verbose_name='Atualizado em'),
+        ),
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='contratos_nome',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Contratos citados no nome'),
+        ),
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='nome_tokens',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Nome normalizado (sem acento, minúsculo) usado na busca de documentos do combo.', verbose_name='Tokens do nome'),
+        ),
+        migrations.AlterField(
+            model_name='combodocumentopattern',
+            name='keywords',
+            field=models.JSONField(blank=True, default=list, help_text="Alternativas buscadas no início das palavras do nome do arquivo (sem acento, case-insensitive). Use '+' para exigir termos juntos (ex.: 'saldo + b6') e '^' para o início do nome (ex.: '^05 - extrato').", verbose_name='Palavras-chave'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0084_indice_nomes_combo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64, verbose_name='Hash do conteúdo (SHA-256)'),
+        ),
+        migrations.AddField(
+            model_name='tipopeticaoanexocontinua',
+            name='hash_conteudo',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Hash do conteúdo (SHA-256)'),
+        ),
+        migrations.AddField(
+            model_name='zipgerado',
+            name='entradas',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='zipgerado',
+            name='manifesto_hash',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='Arquivos de origem, hashes do conteúdo e opções de conversão usados no ZIP.', max_length=64, verbose_name='Hash do manifesto'),
+        ),
+    ]
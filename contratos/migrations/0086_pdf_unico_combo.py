@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0085_manifesto_zip_combo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='geracaodocumento',
+            name='tipo',
+            field=models.CharField(choices=[('monitoria', 'Petição monitória'), ('cobranca', 'Cobrança judicial'), ('habilitacao', 'Habilitação'), ('combo_zip', 'ZIP de combo de petição'), ('lote_peticoes', 'Petições em lote'), ('combo_pdf', 'PDF único de combo de petição')], max_length=20, verbose_name='Tipo'),
+        ),
+        migrations.AlterField(
+            model_name='processoarquivo',
+            name='tipo_documento',
+            field=models.CharField(blank=True, choices=[('monitoria_inicial', 'Monitória'), ('cobranca_judicial', 'Ação de Cobrança'), ('habilitacao', 'Habilitação'), ('combo_zip', 'Pacote de protocolo (ZIP)'), ('combo_pdf', 'Pacote de protocolo (PDF único)'), ('extrato_titularidade', 'Extrato de titularidade'), ('outro', 'Outro')], db_index=True, help_text='Preenchido na criação do arquivo; vazio enquanto não classificado.', max_length=30, verbose_name='Tipo de documento'),
+        ),
+    ]
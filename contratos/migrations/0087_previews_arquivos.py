@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0086_pdf_unico_combo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='paginas',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Páginas'),
+        ),
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='preview_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='hash_conteudo do arquivo quando a miniatura foi gerada; diferente dele, a miniatura está pendente.', max_length=64, verbose_name='Hash do conteúdo da miniatura'),
+        ),
+        migrations.AddField(
+            model_name='processoarquivo',
+            name='preview_status',
+            field=models.CharField(blank=True, choices=[('pronto', 'Pronta'), ('indisponivel', 'Indisponível')], default='', editable=False, max_length=12, verbose_name='Situação da miniatura'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contratos', '0087_previews_arquivos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operacaolote',
+            name='atualizado_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Última atividade'),
+        ),
+    ]
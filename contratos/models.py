@@ -1,10 +1,13 @@
+import re
+import threading
 import uuid
 
 from django.conf import settings
 from django.core.validators import RegexValidator
 from django.db import connection, models, transaction
 from django.db.utils import ProgrammingError
-from django.db.models.signals import pre_delete
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.utils.text import slugify
 from django.utils import timezone
@@ -15,6 +18,9 @@ def _generate_tipo_peticao_key():
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 import datetime
+from decimal import Decimal
+
+from .services import classificacao_arquivos, hash_arquivos
 
 
 class Etiqueta(models.Model):
@@ -198,6 +204,25 @@ class ProcessoJudicial(models.Model):
         verbose_name="Delegado Para"
     )
 
+    # Desnormalizado a partir do histórico de edições para ordenar/filtrar o
+    # changelist sem varrer o django_admin_log.
+    ultima_edicao_em = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="Última edição em"
+    )
+    ultima_edicao_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name="Última edição por"
+    )
+
     def save(self, *args, **kwargs):
         if self.cnj and self.cnj.strip():
             self.nao_judicializado = False
@@ -205,6 +230,23 @@ class ProcessoJudicial(models.Model):
             self.nao_judicializado = True
         super().save(*args, **kwargs)
 
+    @classmethod
+    def registrar_edicao(cls, processo_ids, usuario=None, quando=None):
+        """
+        Marca os processos informados como editados agora (ou em `quando`).
+        Usa UPDATE direto para não disparar save()/signals dos processos.
+        """
+        ids = {int(pk) for pk in (processo_ids or []) if pk}
+        if not ids:
+            return 0
+        usuario_id = None
+        if usuario is not None and getattr(usuario, 'is_authenticated', False):
+            usuario_id = usuario.pk
+        return cls.objects.filter(pk__in=ids).update(
+            ultima_edicao_em=quando or timezone.now(),
+            ultima_edicao_por_id=usuario_id,
+        )
+
     def vincular_carteira(self, carteira_obj):
         if not carteira_obj or not getattr(carteira_obj, 'pk', None):
             return
@@ -314,6 +356,13 @@ def processo_arquivo_upload_path(instance, filename):
 
 
 class ProcessoArquivo(models.Model):
+    PREVIEW_PRONTO = 'pronto'
+    PREVIEW_INDISPONIVEL = 'indisponivel'
+    PREVIEW_STATUS_CHOICES = [
+        (PREVIEW_PRONTO, 'Pronta'),
+        (PREVIEW_INDISPONIVEL, 'Indisponível'),
+    ]
+
     processo = models.ForeignKey(ProcessoJudicial, on_delete=models.CASCADE, related_name='arquivos')
     nome = models.CharField(max_length=255, blank=True, verbose_name="Nome do arquivo")
     arquivo = models.FileField(upload_to=processo_arquivo_upload_path, verbose_name="Arquivo")
@@ -328,15 +377,94 @@ class ProcessoArquivo(models.Model):
     mensagem = models.ForeignKey('TarefaMensagem', on_delete=models.SET_NULL, null=True, blank=True, related_name='anexos')
     prazo = models.ForeignKey('Prazo', on_delete=models.SET_NULL, null=True, blank=True, related_name='arquivos')
     prazo_mensagem = models.ForeignKey('PrazoMensagem', on_delete=models.SET_NULL, null=True, blank=True, related_name='anexos')
+    tipo_documento = models.CharField(
+        max_length=30,
+        choices=classificacao_arquivos.TIPO_DOCUMENTO_CHOICES,
+        blank=True,
+        db_index=True,
+        verbose_name="Tipo de documento",
+        help_text="Preenchido na criação do arquivo; vazio enquanto não classificado.",
+    )
+    tipo_peticao = models.ForeignKey(
+        'TipoPeticao',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='arquivos_gerados',
+        verbose_name="Tipo de petição de origem",
+    )
+    nome_tokens = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Tokens do nome",
+        help_text="Nome normalizado (sem acento, minúsculo) usado na busca de documentos do combo.",
+    )
+    contratos_nome = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Contratos citados no nome",
+    )
+    hash_conteudo = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name="Hash do conteúdo (SHA-256)",
+    )
+    paginas = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Páginas")
+    preview_status = models.CharField(
+        max_length=12,
+        choices=PREVIEW_STATUS_CHOICES,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Situação da miniatura",
+    )
+    preview_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name="Hash do conteúdo da miniatura",
+        help_text="hash_conteudo do arquivo quando a miniatura foi gerada; diferente dele, a miniatura está pendente.",
+    )
 
     class Meta:
         verbose_name = "Arquivo"
         verbose_name_plural = "Arquivos"
         ordering = ['-criado_em']
+        indexes = [
+            models.Index(fields=['tipo_documento', 'processo'], name='procarquivo_tipo_processo'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.nome and self.arquivo:
             self.nome = self.arquivo.name.split('/')[-1]
+        if not self.tipo_documento:
+            self.tipo_documento = classificacao_arquivos.classificar_arquivo(
+                self.nome,
+                self.arquivo.name if self.arquivo else '',
+            )
+        if hash_arquivos.pendente_no_upload(self.arquivo):
+            self.hash_conteudo = hash_arquivos.calcular(self.arquivo)
+        nome_indexado = self.nome or (self.arquivo.name.split('/')[-1] if self.arquivo else '')
+        self.nome_tokens = classificacao_arquivos.tokens_nome(nome_indexado)
+        self.contratos_nome = classificacao_arquivos.contratos_no_nome(nome_indexado)[:255]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extras = []
+            if self.tipo_documento and 'tipo_documento' not in update_fields:
+                extras.append('tipo_documento')
+            if {'nome', 'arquivo'} & set(update_fields):
+                extras.extend(f for f in ('nome_tokens', 'contratos_nome') if f not in update_fields)
+            if 'arquivo' in update_fields and 'hash_conteudo' not in update_fields:
+                extras.append('hash_conteudo')
+            if extras:
+                kwargs['update_fields'] = [*update_fields, *extras]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -400,6 +528,475 @@ class Parte(models.Model):
         ordering = ['tipo_polo', 'id']
 
 
+class CarteiraCpf(models.Model):
+    """
+    Índice mantido de (CPF normalizado da parte passiva, carteira, processo).
+
+    Alimentado por signals de Parte, ProcessoJudicial.carteira e
+    carteiras_vinculadas; permite calcular interseções entre carteiras com
+    GROUP BY no banco em vez de montar conjuntos de CPFs em Python.
+    """
+    cpf = models.CharField(max_length=20, verbose_name="CPF/CNPJ (somente dígitos)")
+    carteira = models.ForeignKey(
+        Carteira,
+        on_delete=models.CASCADE,
+        related_name='cpfs_membros',
+        verbose_name="Carteira"
+    )
+    processo = models.ForeignKey(
+        ProcessoJudicial,
+        on_delete=models.CASCADE,
+        related_name='cpfs_carteira',
+        verbose_name="Processo Judicial"
+    )
+
+    class Meta:
+        verbose_name = "CPF por Carteira"
+        verbose_name_plural = "CPFs por Carteira"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cpf', 'carteira', 'processo'],
+                name='uniq_carteiracpf_cpf_carteira_processo',
+            )
+        ]
+        indexes = [
+            models.Index(fields=['carteira', 'cpf'], name='carteiracpf_carteira_cpf_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cpf} › {self.carteira_id}"
+
+    @staticmethod
+    def normalizar_documento(value):
+        return re.sub(r'\D', '', str(value or ''))
+
+    @classmethod
+    def sincronizar_processos(cls, processo_ids, chunk_size=1000):
+        """
+        Recalcula as linhas dos processos informados a partir do estado atual
+        (partes passivas × carteira principal + carteiras vinculadas).
+        """
+        ids = sorted({int(pk) for pk in (processo_ids or []) if pk})
+        total = 0
+        vinculo_model = ProcessoJudicial.carteiras_vinculadas.through
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            carteiras_por_processo = {}
+            principais = (
+                ProcessoJudicial.objects.filter(pk__in=chunk, carteira_id__isnull=False)
+                .values_list('id', 'carteira_id')
+            )
+            for processo_id, carteira_id in principais:
+                carteiras_por_processo.setdefault(processo_id, set()).add(carteira_id)
+            vinculadas = (
+                vinculo_model.objects.filter(processojudicial_id__in=chunk)
+                .values_list('processojudicial_id', 'carteira_id')
+            )
+            for processo_id, carteira_id in vinculadas:
+                carteiras_por_processo.setdefault(processo_id, set()).add(carteira_id)
+
+            rows = set()
+            if carteiras_por_processo:
+                partes = (
+                    Parte.objects.filter(tipo_polo='PASSIVO', processo_id__in=carteiras_por_processo.keys())
+                    .exclude(documento__isnull=True)
+                    .exclude(documento__exact='')
+                    .values_list('processo_id', 'documento')
+                )
+                for processo_id, documento in partes:
+                    cpf = cls.normalizar_documento(documento)
+                    if not cpf:
+                        continue
+                    for carteira_id in carteiras_por_processo.get(processo_id, ()):
+                        rows.add((cpf, carteira_id, processo_id))
+
+            with transaction.atomic():
+                carteiras_afetadas = set(
+                    cls.objects.filter(processo_id__in=chunk).values_list('carteira_id', flat=True).distinct()
+                )
+                carteiras_afetadas.update(carteira_id for _, carteira_id, _ in rows)
+                cls.objects.filter(processo_id__in=chunk).delete()
+                cls.objects.bulk_create(
+                    [cls(cpf=cpf, carteira_id=carteira_id, processo_id=processo_id) for cpf, carteira_id, processo_id in rows],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+                CarteiraStats.recontar_cpfs(carteiras_afetadas)
+            total += len(rows)
+        return total
+
+
+_carteira_cpf_pendentes = threading.local()
+
+
+def _sincronizar_carteira_cpf_pendentes():
+    pendentes = getattr(_carteira_cpf_pendentes, 'ids', None)
+    if not pendentes:
+        return
+    _carteira_cpf_pendentes.ids = set()
+    CarteiraCpf.sincronizar_processos(pendentes)
+
+
+def agendar_sincronizacao_carteira_cpf(processo_ids):
+    """
+    Agrega os processos alterados e sincroniza uma única vez após o commit,
+    evitando recalcular a cada Parte salva dentro do mesmo formset.
+    """
+    ids = {int(pk) for pk in (processo_ids or []) if pk}
+    if not ids:
+        return
+    pendentes = getattr(_carteira_cpf_pendentes, 'ids', None)
+    if pendentes is None:
+        pendentes = _carteira_cpf_pendentes.ids = set()
+    pendentes.update(ids)
+    transaction.on_commit(_sincronizar_carteira_cpf_pendentes)
+
+
+@receiver(pre_save, sender=Parte)
+def carteira_cpf_parte_pre_save(sender, instance, **kwargs):
+    # Uma parte movida para outro processo deixa linhas no processo antigo.
+    if instance.pk:
+        instance._carteira_cpf_processo_anterior = (
+            Parte.objects.filter(pk=instance.pk).values_list('processo_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Parte)
+@receiver(post_delete, sender=Parte)
+def carteira_cpf_parte_changed(sender, instance, **kwargs):
+    agendar_sincronizacao_carteira_cpf([
+        instance.processo_id,
+        getattr(instance, '_carteira_cpf_processo_anterior', None),
+    ])
+
+
+@receiver(post_save, sender=ProcessoJudicial)
+def carteira_cpf_processo_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is not None and not {'carteira', 'carteira_id'} & set(update_fields):
+        return
+    # sincronizar_processos apaga as linhas atuais do processo, então a
+    # carteira anterior também é recalculada.
+    agendar_sincronizacao_carteira_cpf([instance.pk])
+
+
+@receiver(m2m_changed, sender=ProcessoJudicial.carteiras_vinculadas.through)
+def carteira_cpf_vinculos_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            agendar_sincronizacao_carteira_cpf([instance.pk])
+        return
+    # Lado reverso (carteira.processos_multicarteira): pk_set contém processos.
+    if action == 'pre_clear':
+        instance._carteira_cpf_processos_clear = list(
+            instance.processos_multicarteira.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        agendar_sincronizacao_carteira_cpf(pk_set)
+    elif action == 'post_clear':
+        agendar_sincronizacao_carteira_cpf(getattr(instance, '_carteira_cpf_processos_clear', []))
+
+
+class CarteiraStats(models.Model):
+    """
+    Totais mantidos por carteira para a changelist e os gráficos de carteiras,
+    no lugar de agregar todos os processos a cada listagem.
+
+    Mantidos por deltas (F()) na mesma transação das alterações em processos
+    e vínculos; cpfs_distintos é recontado quando CarteiraCpf muda. Só o
+    comando reconciliar_carteira_stats recalcula tudo a partir da origem.
+    Valores somam os processos vinculados (carteiras_vinculadas), a mesma
+    base que a changelist já usava.
+    """
+    carteira = models.OneToOneField(
+        Carteira,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name="Carteira",
+    )
+    processos_principal = models.PositiveIntegerField(default=0, verbose_name="Processos (carteira principal)")
+    processos_vinculados = models.PositiveIntegerField(default=0, verbose_name="Processos vinculados")
+    valor_causa_total = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, verbose_name="Valor da causa (total)"
+    )
+    soma_contratos_total = models.DecimalField(
+        max_digits=18, decimal_places=2, default=0, verbose_name="Soma dos contratos (total)"
+    )
+    cpfs_distintos = models.PositiveIntegerField(default=0, verbose_name="CPFs distintos")
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
+
+    CAMPOS_TOTAIS = (
+        'processos_principal', 'processos_vinculados', 'valor_causa_total', 'soma_contratos_total', 'cpfs_distintos',
+    )
+
+    class Meta:
+        verbose_name = "Estatística da Carteira"
+        verbose_name_plural = "Estatísticas das Carteiras"
+
+    def __str__(self):
+        return f"Estatísticas › {self.carteira_id}"
+
+    @classmethod
+    def calcular(cls, carteira_ids=None):
+        """{carteira_id: {campo: valor}} calculado a partir dos dados de origem."""
+        carteiras = Carteira.objects.all()
+        if carteira_ids is not None:
+            carteiras = carteiras.filter(pk__in=carteira_ids)
+        ids = list(carteiras.values_list('pk', flat=True))
+        totais = {
+            pk: {
+                'processos_principal': 0,
+                'processos_vinculados': 0,
+                'valor_causa_total': Decimal('0'),
+                'soma_contratos_total': Decimal('0'),
+                'cpfs_distintos': 0,
+            }
+            for pk in ids
+        }
+        if not ids:
+            return totais
+        principais = (
+            ProcessoJudicial.objects.filter(carteira_id__in=ids)
+            .values('carteira_id').annotate(total=models.Count('pk')).order_by()
+        )
+        for row in principais:
+            totais[row['carteira_id']]['processos_principal'] = row['total']
+        vinculados = (
+            ProcessoJudicial.carteiras_vinculadas.through.objects.filter(carteira_id__in=ids)
+            .values('carteira_id')
+            .annotate(
+                total=models.Count('processojudicial_id', distinct=True),
+                valor=models.Sum('processojudicial__valor_causa'),
+                soma=models.Sum('processojudicial__soma_contratos'),
+            )
+            .order_by()
+        )
+        for row in vinculados:
+            item = totais[row['carteira_id']]
+            item['processos_vinculados'] = row['total']
+            item['valor_causa_total'] = row['valor'] or Decimal('0')
+            item['soma_contratos_total'] = row['soma'] or Decimal('0')
+        cpfs = (
+            CarteiraCpf.objects.filter(carteira_id__in=ids)
+            .values('carteira_id').annotate(total=models.Count('cpf', distinct=True)).order_by()
+        )
+        for row in cpfs:
+            totais[row['carteira_id']]['cpfs_distintos'] = row['total']
+        return totais
+
+    @classmethod
+    def _garantir_linhas(cls, carteira_ids):
+        """
+        Cria, já calculadas, as linhas que faltam e devolve os ids que já
+        existiam (os únicos que recebem deltas).
+        """
+        existentes = set(cls.objects.filter(carteira_id__in=carteira_ids).values_list('carteira_id', flat=True))
+        faltando = set(carteira_ids) - existentes
+        if faltando:
+            cls.recalcular(faltando)
+        return existentes
+
+    @classmethod
+    def aplicar_delta(cls, carteira_ids, **deltas):
+        """Soma `deltas` ({campo: valor}) às carteiras informadas com F()."""
+        ids = {int(pk) for pk in (carteira_ids or []) if pk}
+        deltas = {campo: valor for campo, valor in deltas.items() if valor}
+        if not ids or not deltas:
+            return
+        valores = {}
+        for campo, valor in deltas.items():
+            expressao = models.F(campo) + valor
+            if campo not in ('valor_causa_total', 'soma_contratos_total') and valor < 0:
+                # Contadores são positivos; divergências ficam para a reconciliação.
+                expressao = Greatest(expressao, 0)
+            valores[campo] = expressao
+        with transaction.atomic():
+            existentes = cls._garantir_linhas(ids)
+            if existentes:
+                cls.objects.filter(carteira_id__in=existentes).update(atualizado_em=timezone.now(), **valores)
+
+    @classmethod
+    def aplicar_vinculos(cls, carteira_ids, processo_ids, sinal):
+        """Delta de vincular (sinal 1) ou desvincular (-1) processos das carteiras."""
+        processo_ids = [pk for pk in (processo_ids or []) if pk]
+        if not processo_ids or not carteira_ids:
+            return
+        totais = ProcessoJudicial.objects.filter(pk__in=processo_ids).aggregate(
+            total=models.Count('pk'),
+            valor=models.Sum('valor_causa'),
+            soma=models.Sum('soma_contratos'),
+        )
+        cls.aplicar_delta(
+            carteira_ids,
+            processos_vinculados=sinal * totais['total'],
+            valor_causa_total=sinal * (totais['valor'] or Decimal('0')),
+            soma_contratos_total=sinal * (totais['soma'] or Decimal('0')),
+        )
+
+    @classmethod
+    def recontar_cpfs(cls, carteira_ids):
+        """Reconta só cpfs_distintos: CPFs distintos não admitem delta."""
+        ids = {int(pk) for pk in (carteira_ids or []) if pk}
+        if not ids:
+            return
+        contagem = (
+            CarteiraCpf.objects.filter(carteira_id=models.OuterRef('carteira_id'))
+            .values('carteira_id')
+            .annotate(total=models.Count('cpf', distinct=True))
+            .values('total')
+        )
+        with transaction.atomic():
+            existentes = cls._garantir_linhas(ids)
+            if existentes:
+                cls.objects.filter(carteira_id__in=existentes).update(
+                    cpfs_distintos=Coalesce(models.Subquery(contagem), 0),
+                    atualizado_em=timezone.now(),
+                )
+
+    @classmethod
+    def recalcular(cls, carteira_ids=None):
+        """Regrava as linhas das carteiras informadas (todas, se None)."""
+        totais = cls.calcular(carteira_ids)
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(carteira_id=pk, **valores) for pk, valores in totais.items()],
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['carteira'],
+                update_fields=[*cls.CAMPOS_TOTAIS, 'atualizado_em'],
+            )
+        return len(totais)
+
+
+def _carteiras_vinculadas_do_processo(processo_id):
+    return set(
+        ProcessoJudicial.carteiras_vinculadas.through.objects.filter(processojudicial_id=processo_id)
+        .values_list('carteira_id', flat=True)
+    )
+
+
+CAMPOS_CARTEIRA_STATS = {'carteira', 'carteira_id', 'valor_causa', 'soma_contratos'}
+
+
+def _valores_carteira_stats(processo_id):
+    return ProcessoJudicial.objects.filter(pk=processo_id).values_list(
+        'carteira_id', 'valor_causa', 'soma_contratos'
+    ).first()
+
+
+def _mesmo_decimal(anterior, atual):
+    if anterior is None or atual is None:
+        return anterior is None and atual is None
+    try:
+        return Decimal(str(atual)) == anterior
+    except (ArithmeticError, ValueError):
+        return False
+
+
+@receiver(pre_save, sender=ProcessoJudicial)
+def carteira_stats_processo_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._carteira_stats_anterior = None
+    instance._carteira_stats_valores_anteriores = None
+    if not instance.pk or (update_fields is not None and not CAMPOS_CARTEIRA_STATS & set(update_fields)):
+        return
+    anterior = _valores_carteira_stats(instance.pk)
+    if anterior is None:
+        return
+    carteira_id, valor_causa, soma_contratos = anterior
+    instance._carteira_stats_anterior = carteira_id
+    if (
+        carteira_id == instance.carteira_id
+        and _mesmo_decimal(valor_causa, instance.valor_causa)
+        and _mesmo_decimal(soma_contratos, instance.soma_contratos)
+    ):
+        return
+    instance._carteira_stats_valores_anteriores = anterior
+
+
+@receiver(post_save, sender=ProcessoJudicial)
+def carteira_stats_processo_saved(sender, instance, created=False, update_fields=None, **kwargs):
+    if created:
+        CarteiraStats.aplicar_delta([instance.carteira_id], processos_principal=1)
+        return
+    anterior = getattr(instance, '_carteira_stats_valores_anteriores', None)
+    instance._carteira_stats_valores_anteriores = None
+    atual = _valores_carteira_stats(instance.pk) if anterior else None
+    if not atual:
+        return
+    carteira_anterior, valor_anterior, soma_anterior = anterior
+    carteira_atual, valor_atual, soma_atual = atual
+    if carteira_anterior != carteira_atual:
+        CarteiraStats.aplicar_delta([carteira_anterior], processos_principal=-1)
+        CarteiraStats.aplicar_delta([carteira_atual], processos_principal=1)
+    delta_valor = (valor_atual or Decimal('0')) - (valor_anterior or Decimal('0'))
+    delta_soma = (soma_atual or Decimal('0')) - (soma_anterior or Decimal('0'))
+    if delta_valor or delta_soma:
+        CarteiraStats.aplicar_delta(
+            _carteiras_vinculadas_do_processo(instance.pk),
+            valor_causa_total=delta_valor,
+            soma_contratos_total=delta_soma,
+        )
+
+
+@receiver(pre_delete, sender=ProcessoJudicial)
+def carteira_stats_processo_pre_delete(sender, instance, **kwargs):
+    anterior = _valores_carteira_stats(instance.pk)
+    vinculadas = _carteiras_vinculadas_do_processo(instance.pk)
+    instance._carteira_stats_valores_anteriores = anterior
+    instance._carteira_stats_vinculadas_anteriores = vinculadas
+    instance._carteira_stats_anterior_ids = vinculadas | ({anterior[0]} if anterior and anterior[0] else set())
+
+
+@receiver(post_delete, sender=ProcessoJudicial)
+def carteira_stats_processo_deleted(sender, instance, **kwargs):
+    anterior = getattr(instance, '_carteira_stats_valores_anteriores', None)
+    if not anterior:
+        return
+    carteira_id, valor_causa, soma_contratos = anterior
+    CarteiraStats.aplicar_delta([carteira_id], processos_principal=-1)
+    CarteiraStats.aplicar_delta(
+        getattr(instance, '_carteira_stats_vinculadas_anteriores', set()),
+        processos_vinculados=-1,
+        valor_causa_total=-(valor_causa or Decimal('0')),
+        soma_contratos_total=-(soma_contratos or Decimal('0')),
+    )
+    # As linhas de CarteiraCpf do processo saem em cascata, sem signals.
+    CarteiraStats.recontar_cpfs(instance._carteira_stats_anterior_ids)
+
+
+@receiver(m2m_changed, sender=ProcessoJudicial.carteiras_vinculadas.through)
+def carteira_stats_vinculos_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    # Lado da carteira (carteira.processos_multicarteira): pk_set contém processos.
+    vinculos = instance.processos_multicarteira if reverse else instance.carteiras_vinculadas
+    if action == 'pre_remove':
+        # remove() repassa os ids pedidos, inclusive os que não estavam vinculados.
+        instance._carteira_stats_vinculos_removidos = set(
+            vinculos.filter(pk__in=pk_set or ()).values_list('pk', flat=True)
+        )
+        return
+    if action == 'pre_clear':
+        instance._carteira_stats_vinculos_removidos = set(vinculos.values_list('pk', flat=True))
+        return
+    if action == 'post_add':
+        ids, sinal = pk_set or set(), 1
+    elif action in ('post_remove', 'post_clear'):
+        ids, sinal = instance.__dict__.pop('_carteira_stats_vinculos_removidos', set()), -1
+    else:
+        return
+    if reverse:
+        CarteiraStats.aplicar_vinculos([instance.pk], ids, sinal)
+    else:
+        CarteiraStats.aplicar_vinculos(ids, [instance.pk], sinal)
+
+
+@receiver(post_save, sender=Carteira)
+def carteira_stats_carteira_criada(sender, instance, created=False, **kwargs):
+    if created:
+        CarteiraStats.objects.get_or_create(carteira=instance)
+
+
 class Herdeiro(models.Model):
     cpf_falecido = models.CharField(max_length=20, db_index=True, verbose_name="CPF falecido")
     nome_completo = models.CharField(max_length=255, verbose_name="Nome completo")
@@ -602,7 +1199,11 @@ class ComboDocumentoPattern(models.Model):
         default=list,
         blank=True,
         verbose_name="Palavras-chave",
-        help_text="Palavras que devem estar no nome do arquivo (case-insensitive)."
+        help_text=(
+            "Alternativas buscadas no início das palavras do nome do arquivo (sem acento, "
+            "case-insensitive). Use '+' para exigir termos juntos (ex.: 'saldo + b6') e '^' "
+            "para o início do nome (ex.: '^05 - extrato')."
+        )
     )
     placeholder = models.CharField(
         max_length=32,
@@ -615,6 +1216,8 @@ class ComboDocumentoPattern(models.Model):
         verbose_name="Obrigatório",
         help_text="Define se a ausência gera item em 'faltantes'."
     )
+    ativo = models.BooleanField(default=True, verbose_name="Ativo")
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name="Atualizado em")
 
     class Meta:
         verbose_name = "Configuração de documento para o combo"
@@ -654,6 +1257,15 @@ class ZipGerado(models.Model):
     )
     missing = models.JSONField(default=list, blank=True)
     contratos = models.JSONField(default=list, blank=True)
+    manifesto_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name="Hash do manifesto",
+        help_text="Arquivos de origem, hashes do conteúdo e opções de conversão usados no ZIP."
+    )
+    entradas = models.JSONField(default=list, blank=True)
     criado_em = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -681,12 +1293,24 @@ class TipoPeticaoAnexoContinua(models.Model):
         verbose_name='Nome exibido'
     )
     criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    hash_conteudo = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Hash do conteúdo (SHA-256)'
+    )
 
     class Meta:
         verbose_name = 'Anexo contínuo'
         verbose_name_plural = 'Anexos contínuos'
         ordering = ['-criado_em']
 
+    def save(self, *args, **kwargs):
+        if hash_arquivos.pendente_no_upload(self.arquivo):
+            self.hash_conteudo = hash_arquivos.calcular(self.arquivo)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         label = self.nome or self.arquivo.name
         return f"{self.tipo_peticao.nome} › {label}"
@@ -790,6 +1414,168 @@ class DemandaAnaliseLoteSalvo(models.Model):
         return f'{self.nome} ({self.usuario})'
 
 
+class OperacaoLote(models.Model):
+    """
+    Operação em lote sobre processos (carteira/etiquetas) executada fora do
+    request quando a seleção é grande. Guarda o progresso para a tela consultar.
+    """
+    TIPO_CARTEIRA = 'carteira'
+    TIPO_ETIQUETA_ADICIONAR = 'etiqueta_add'
+    TIPO_ETIQUETA_REMOVER = 'etiqueta_remove'
+    TIPO_CHOICES = [
+        (TIPO_CARTEIRA, 'Alterar carteira'),
+        (TIPO_ETIQUETA_ADICIONAR, 'Adicionar etiqueta'),
+        (TIPO_ETIQUETA_REMOVER, 'Remover etiqueta'),
+    ]
+
+    STATUS_PENDENTE = 'pendente'
+    STATUS_EXECUTANDO = 'executando'
+    STATUS_CONCLUIDO = 'concluido'
+    STATUS_ERRO = 'erro'
+    STATUS_CHOICES = [
+        (STATUS_PENDENTE, 'Pendente'),
+        (STATUS_EXECUTANDO, 'Executando'),
+        (STATUS_CONCLUIDO, 'Concluído'),
+        (STATUS_ERRO, 'Erro'),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name='Tipo')
+    status = models.CharField(
+        max_length=12,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDENTE,
+        db_index=True,
+        verbose_name='Status',
+    )
+    parametros = models.JSONField(default=dict, blank=True, verbose_name='Parâmetros')
+    processo_ids = models.JSONField(default=list, blank=True, verbose_name='Processos')
+    total = models.PositiveIntegerField(default=0, verbose_name='Total')
+    processados = models.PositiveIntegerField(default=0, verbose_name='Processados')
+    erro = models.TextField(blank=True, default='', verbose_name='Erro')
+    criado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='operacoes_lote',
+        verbose_name='Criado por',
+    )
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado em')
+    # Atualizado a cada bloco processado; sem atividade por muito tempo, a
+    # operação é tratada como órfã (servidor reiniciado no meio).
+    atualizado_em = models.DateTimeField(null=True, blank=True, verbose_name='Última atividade')
+    finalizado_em = models.DateTimeField(null=True, blank=True, verbose_name='Finalizado em')
+
+    class Meta:
+        verbose_name = 'Operação em lote'
+        verbose_name_plural = 'Operações em lote'
+        ordering = ['-criado_em', '-id']
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} #{self.pk} ({self.get_status_display()})'
+
+    @property
+    def percentual(self):
+        if not self.total:
+            return 100 if self.status == self.STATUS_CONCLUIDO else 0
+        return min(100, int(self.processados * 100 / self.total))
+
+
+class GeracaoDocumento(models.Model):
+    """
+    Geração de petição/ZIP (DOCX + conversão para PDF) enfileirada pelas views
+    e executada fora do request. Pedidos idênticos ainda pendentes ou em
+    execução compartilham o mesmo registro (chave).
+    """
+    TIPO_MONITORIA = 'monitoria'
+    TIPO_COBRANCA = 'cobranca'
+    TIPO_HABILITACAO = 'habilitacao'
+    TIPO_COMBO_ZIP = 'combo_zip'
+    TIPO_LOTE_PETICOES = 'lote_peticoes'
+    TIPO_COMBO_PDF = 'combo_pdf'
+    TIPO_CHOICES = [
+        (TIPO_MONITORIA, 'Petição monitória'),
+        (TIPO_COBRANCA, 'Cobrança judicial'),
+        (TIPO_HABILITACAO, 'Habilitação'),
+        (TIPO_COMBO_ZIP, 'ZIP de combo de petição'),
+        (TIPO_LOTE_PETICOES, 'Petições em lote'),
+        (TIPO_COMBO_PDF, 'PDF único de combo de petição'),
+    ]
+    TIPOS_PETICAO = (TIPO_MONITORIA, TIPO_COBRANCA, TIPO_HABILITACAO)
+
+    STATUS_PENDENTE = 'pendente'
+    STATUS_EXECUTANDO = 'executando'
+    STATUS_CONCLUIDO = 'concluido'
+    STATUS_ERRO = 'erro'
+    STATUS_CHOICES = [
+        (STATUS_PENDENTE, 'Pendente'),
+        (STATUS_EXECUTANDO, 'Executando'),
+        (STATUS_CONCLUIDO, 'Concluído'),
+        (STATUS_ERRO, 'Erro'),
+    ]
+    STATUS_ATIVOS = (STATUS_PENDENTE, STATUS_EXECUTANDO)
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name='Tipo')
+    status = models.CharField(
+        max_length=12,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDENTE,
+        db_index=True,
+        verbose_name='Status',
+    )
+    processo = models.ForeignKey(
+        ProcessoJudicial,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='geracoes_documento',
+        verbose_name='Processo',
+    )
+    chave = models.CharField(max_length=64, db_index=True, verbose_name='Chave do pedido')
+    parametros = models.JSONField(default=dict, blank=True, verbose_name='Parâmetros')
+    etapa = models.CharField(max_length=120, blank=True, default='', verbose_name='Etapa atual')
+    total = models.PositiveIntegerField(default=0, verbose_name='Total de etapas')
+    processados = models.PositiveIntegerField(default=0, verbose_name='Etapas concluídas')
+    resultado = models.JSONField(default=dict, blank=True, verbose_name='Resultado')
+    erro = models.TextField(blank=True, default='', verbose_name='Erro')
+    criado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='geracoes_documento',
+        verbose_name='Criado por',
+    )
+    criado_em = models.DateTimeField(auto_now_add=True, verbose_name='Criado em')
+    iniciado_em = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado em')
+    # Atualizado a cada etapa; sem atividade por muito tempo, a geração é
+    # tratada como abandonada (servidor reiniciado no meio).
+    atualizado_em = models.DateTimeField(null=True, blank=True, verbose_name='Última atividade')
+    finalizado_em = models.DateTimeField(null=True, blank=True, verbose_name='Finalizado em')
+
+    class Meta:
+        verbose_name = 'Geração de documento'
+        verbose_name_plural = 'Gerações de documentos'
+        ordering = ['-criado_em', '-id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chave'],
+                condition=models.Q(status__in=['pendente', 'executando']),
+                name='uniq_geracao_documento_chave_ativa',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} #{self.pk} ({self.get_status_display()})'
+
+    @property
+    def percentual(self):
+        if not self.total:
+            return 100 if self.status == self.STATUS_CONCLUIDO else 0
+        return min(100, int(self.processados * 100 / self.total))
+
+
 class Tarefa(models.Model):
     PRIORIDADE_CHOICES = [
         ('B', 'Baixa'),
@@ -1004,6 +1790,203 @@ class KpiGlobalConfig(models.Model):
         return "Configuração Global de KPI"
 
 
+class KpiSnapshot(models.Model):
+    """
+    Payload de KPI pré-calculado por (carteira, escopo). carteira=None guarda o
+    payload geral (todas as carteiras), usado no dashboard de carteiras.
+    """
+    ESCOPO_DASHBOARD = 'dashboard'
+    ESCOPO_GRAFICOS = 'graficos'
+    ESCOPO_INTERSECOES = 'intersecoes'
+    ESCOPO_CHOICES = [
+        (ESCOPO_DASHBOARD, 'Dashboard de carteiras'),
+        (ESCOPO_GRAFICOS, 'Gráficos de carteiras'),
+        (ESCOPO_INTERSECOES, 'Interseções entre carteiras'),
+    ]
+
+    carteira = models.ForeignKey(
+        Carteira,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='kpi_snapshots',
+        verbose_name='Carteira',
+    )
+    escopo = models.CharField(
+        max_length=40,
+        choices=ESCOPO_CHOICES,
+        default=ESCOPO_DASHBOARD,
+        verbose_name='Escopo',
+    )
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Payload')
+    gerado_em = models.DateTimeField(null=True, blank=True, verbose_name='Gerado em')
+    duracao_ms = models.PositiveIntegerField(default=0, verbose_name='Duração do cálculo (ms)')
+    desatualizado = models.BooleanField(default=True, verbose_name='Desatualizado')
+    atualizando_desde = models.DateTimeField(null=True, blank=True, verbose_name='Atualizando desde')
+
+    class Meta:
+        verbose_name = 'Snapshot de KPI'
+        verbose_name_plural = 'Snapshots de KPI'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['carteira', 'escopo'],
+                name='uniq_kpisnapshot_carteira_escopo',
+            ),
+            models.UniqueConstraint(
+                fields=['escopo'],
+                condition=models.Q(carteira__isnull=True),
+                name='uniq_kpisnapshot_geral_escopo',
+            ),
+        ]
+
+    def __str__(self):
+        alvo = self.carteira.nome if self.carteira_id else 'Geral'
+        return f'{self.get_escopo_display()} - {alvo}'
+
+
+_kpi_snapshot_pendente = threading.local()
+
+
+def _carteiras_dos_processos(processo_ids):
+    ids = set()
+    processo_ids = list(processo_ids)
+    for inicio in range(0, len(processo_ids), 1000):
+        lote = processo_ids[inicio:inicio + 1000]
+        ids.update(
+            ProcessoJudicial.carteiras_vinculadas.through.objects.filter(processojudicial_id__in=lote)
+            .values_list('carteira_id', flat=True)
+        )
+        ids.update(
+            ProcessoJudicial.objects.filter(pk__in=lote, carteira__isnull=False)
+            .values_list('carteira_id', flat=True)
+        )
+    return ids
+
+
+def _marcar_kpi_snapshots_pendentes():
+    if not getattr(_kpi_snapshot_pendente, 'ativo', False):
+        return
+    todas = _kpi_snapshot_pendente.todas
+    carteira_ids = _kpi_snapshot_pendente.carteiras
+    processo_ids = _kpi_snapshot_pendente.processos
+    _kpi_snapshot_pendente.ativo = False
+    snapshots = KpiSnapshot.objects.filter(desatualizado=False)
+    if not todas:
+        # Os snapshots gerais sempre mudam; os por carteira, só os das
+        # carteiras tocadas (e as atuais dos processos alterados).
+        carteira_ids = carteira_ids | _carteiras_dos_processos(processo_ids)
+        snapshots = snapshots.filter(models.Q(carteira__isnull=True) | models.Q(carteira_id__in=carteira_ids))
+    snapshots.update(desatualizado=True)
+
+
+def marcar_kpi_snapshots_desatualizados(carteira_ids=None, processo_ids=None):
+    """
+    Marca os snapshots de KPI como desatualizados uma única vez por transação;
+    o recálculo fica a cargo do comando atualizar_kpi_snapshots / da próxima visita.
+
+    Sem argumentos marca todos. Com carteira_ids/processo_ids marca os gerais e
+    os das carteiras informadas ou às quais os processos pertencem no commit.
+    """
+    if not getattr(_kpi_snapshot_pendente, 'ativo', False):
+        _kpi_snapshot_pendente.ativo = True
+        _kpi_snapshot_pendente.todas = False
+        _kpi_snapshot_pendente.carteiras = set()
+        _kpi_snapshot_pendente.processos = set()
+    # Registra a cada chamada: se a transação anterior sofreu rollback, o
+    # callback dela nunca roda e o estado acumulado vai junto com este.
+    transaction.on_commit(_marcar_kpi_snapshots_pendentes)
+    if carteira_ids is None and processo_ids is None:
+        _kpi_snapshot_pendente.todas = True
+        return
+    _kpi_snapshot_pendente.carteiras.update(int(pk) for pk in (carteira_ids or []) if pk)
+    _kpi_snapshot_pendente.processos.update(int(pk) for pk in (processo_ids or []) if pk)
+
+
+class ProdutividadeDiaria(models.Model):
+    """
+    Contagem pré-agregada de eventos por (dia, usuário, carteira, métrica),
+    preenchida pelo comando atualizar_produtividade. data=None agrupa eventos
+    concluídos sem data de conclusão registrada.
+    """
+    METRICA_TAREFAS = 'tarefas'
+    METRICA_PRAZOS = 'prazos'
+    METRICA_TAREFAS_RESPONSAVEL = 'tarefas_responsavel'
+    METRICA_PRAZOS_RESPONSAVEL = 'prazos_responsavel'
+    METRICA_ACOES = 'acoes'
+    METRICA_CHOICES = [
+        (METRICA_TAREFAS, 'Tarefas concluídas (por quem concluiu)'),
+        (METRICA_PRAZOS, 'Prazos concluídos (por quem concluiu)'),
+        (METRICA_TAREFAS_RESPONSAVEL, 'Tarefas concluídas (por responsável)'),
+        (METRICA_PRAZOS_RESPONSAVEL, 'Prazos concluídos (por responsável)'),
+        (METRICA_ACOES, 'Ações registradas no admin'),
+    ]
+
+    data = models.DateField(null=True, blank=True, verbose_name='Data')
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='produtividade_diaria',
+        verbose_name='Usuário',
+    )
+    carteira = models.ForeignKey(
+        Carteira,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='produtividade_diaria',
+        verbose_name='Carteira',
+    )
+    metrica = models.CharField(max_length=30, choices=METRICA_CHOICES, verbose_name='Métrica')
+    quantidade = models.PositiveIntegerField(default=0, verbose_name='Quantidade')
+
+    class Meta:
+        verbose_name = 'Produtividade diária'
+        verbose_name_plural = 'Produtividade diária'
+        indexes = [
+            models.Index(fields=['metrica', 'data'], name='produtividade_metrica_data'),
+            models.Index(fields=['usuario', 'metrica', 'data'], name='produtividade_usuario_data'),
+        ]
+
+    def __str__(self):
+        return f'{self.data or "sem data"} - {self.usuario_id or "-"} - {self.metrica}: {self.quantidade}'
+
+
+class ProdutividadeRollupEstado(models.Model):
+    """Marca até onde (`processado_ate`) a produtividade diária já foi consolidada."""
+    processado_ate = models.DateTimeField(null=True, blank=True, verbose_name='Processado até')
+    atualizado_em = models.DateTimeField(auto_now=True, verbose_name='Atualizado em')
+    duracao_ms = models.PositiveIntegerField(default=0, verbose_name='Duração da última execução (ms)')
+
+    class Meta:
+        verbose_name = 'Estado do rollup de produtividade'
+        verbose_name_plural = 'Estado do rollup de produtividade'
+
+    def __str__(self):
+        return f'Produtividade processada até {self.processado_ate or "-"}'
+
+
+class ConversaoPdfEstatistica(models.Model):
+    """
+    Contadores diários do cache de conversão DOCX → PDF
+    (services/conversao_pdf.py), para acompanhar a taxa de acerto.
+    """
+    data = models.DateField(unique=True, verbose_name='Data')
+    acertos = models.PositiveIntegerField(default=0, verbose_name='Acertos no cache')
+    conversoes = models.PositiveIntegerField(default=0, verbose_name='Conversões realizadas')
+    falhas = models.PositiveIntegerField(default=0, verbose_name='Conversões sem resultado')
+    duracao_conversoes_ms = models.PositiveBigIntegerField(default=0, verbose_name='Tempo total convertendo (ms)')
+
+    class Meta:
+        verbose_name = 'Estatística de conversão PDF'
+        verbose_name_plural = 'Estatísticas de conversão PDF'
+        ordering = ['-data']
+
+    def __str__(self):
+        return f'Conversões PDF em {self.data:%d/%m/%Y}'
+
+
 # --- Modelos para o Motor da Árvore de Decisão de Análise ---
 
 class TipoAnaliseObjetiva(models.Model):
@@ -1182,3 +2165,103 @@ class AnaliseProcesso(models.Model):
                 if isinstance(item, dict) and item.get('supervisionado'):
                     return True
         return False
+
+
+@receiver(post_save, sender=ProcessoArquivo)
+def agendar_preview_arquivo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .services import previews_arquivos
+
+    previews_arquivos.agendar(instance)
+
+
+# KPI: cada alteração marca os snapshots gerais e os das carteiras afetadas.
+@receiver(post_save, sender=ProcessoJudicial)
+def kpi_snapshot_processo_salvo(sender, instance, **kwargs):
+    marcar_kpi_snapshots_desatualizados(
+        carteira_ids=[getattr(instance, '_carteira_stats_anterior', None)],
+        processo_ids=[instance.pk],
+    )
+
+
+@receiver(post_delete, sender=ProcessoJudicial)
+def kpi_snapshot_processo_removido(sender, instance, **kwargs):
+    marcar_kpi_snapshots_desatualizados(
+        carteira_ids=getattr(instance, '_carteira_stats_anterior_ids', None) or [instance.carteira_id],
+    )
+
+
+@receiver(post_save, sender=Parte)
+@receiver(post_delete, sender=Parte)
+@receiver(post_save, sender=ProcessoArquivo)
+@receiver(post_delete, sender=ProcessoArquivo)
+@receiver(post_save, sender=Tarefa)
+@receiver(post_delete, sender=Tarefa)
+@receiver(post_save, sender=Prazo)
+@receiver(post_delete, sender=Prazo)
+def kpi_snapshot_item_do_processo_alterado(sender, instance, **kwargs):
+    marcar_kpi_snapshots_desatualizados(
+        processo_ids=[instance.processo_id, getattr(instance, '_carteira_cpf_processo_anterior', None)],
+    )
+
+
+def _carteiras_passivas():
+    # Cards de passivas sem carteira vão para a carteira "Passivas" no dashboard.
+    return [
+        pk for pk, nome in Carteira.objects.values_list('id', 'nome')
+        if ' '.join(str(nome or '').split()).lower() == 'passivas'
+    ]
+
+
+@receiver(post_save, sender=AnaliseProcesso)
+@receiver(post_delete, sender=AnaliseProcesso)
+def kpi_snapshot_analise_alterada(sender, instance, **kwargs):
+    marcar_kpi_snapshots_desatualizados(
+        carteira_ids=_carteiras_passivas(),
+        processo_ids=[instance.processo_judicial_id],
+    )
+
+
+@receiver(post_save, sender=Carteira)
+@receiver(post_delete, sender=Carteira)
+def kpi_snapshot_carteira_alterada(sender, instance, **kwargs):
+    # Nome da carteira aparece nos payloads; apagada, os snapshots dela vão junto.
+    marcar_kpi_snapshots_desatualizados(carteira_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=ProcessoJudicial.etiquetas.through)
+def kpi_snapshot_etiquetas_alteradas(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        marcar_kpi_snapshots_desatualizados(processo_ids=[instance.pk])
+    elif pk_set is not None:
+        marcar_kpi_snapshots_desatualizados(processo_ids=pk_set)
+    else:
+        # clear() pelo lado da etiqueta: os processos já não são conhecidos.
+        marcar_kpi_snapshots_desatualizados()
+
+
+@receiver(m2m_changed, sender=ProcessoJudicial.carteiras_vinculadas.through)
+def kpi_snapshot_vinculos_alterados(sender, instance, action, reverse, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        marcar_kpi_snapshots_desatualizados(carteira_ids=[instance.pk], processo_ids=pk_set or [])
+    elif action == 'post_clear':
+        marcar_kpi_snapshots_desatualizados(
+            carteira_ids=getattr(instance, '_carteira_stats_vinculos_clear', None) or [],
+            processo_ids=[instance.pk],
+        )
+    else:
+        marcar_kpi_snapshots_desatualizados(carteira_ids=pk_set or [], processo_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Etiqueta)
+@receiver(post_delete, sender=Etiqueta)
+@receiver(post_save, sender=TipoAnaliseObjetiva)
+@receiver(post_save, sender=KpiGlobalConfig)
+def kpi_snapshot_configuracao_alterada(sender, **kwargs):
+    # Mudam a classificação de todos os processos (prioridade, tipo de análise).
+    marcar_kpi_snapshots_desatualizados()
@@ -0,0 +1,103 @@
+"""
+Classificação de ProcessoArquivo por tipo de documento.
+
+Os geradores de peça informam o tipo explicitamente; para uploads, anexos e o
+backfill de arquivos antigos vale a heurística de nome/caminho que o dashboard
+de KPI já usava.
+
+Também ficam aqui os tokens normalizados do nome e os números de contrato que
+o ProcessoArquivo grava para a busca de documentos do combo (combo_padroes).
+"""
+import re
+import unicodedata
+
+TIPO_MONITORIA_INICIAL = 'monitoria_inicial'
+TIPO_COBRANCA_JUDICIAL = 'cobranca_judicial'
+TIPO_HABILITACAO = 'habilitacao'
+TIPO_COMBO_ZIP = 'combo_zip'
+TIPO_COMBO_PDF = 'combo_pdf'
+TIPO_EXTRATO_TITULARIDADE = 'extrato_titularidade'
+TIPO_OUTRO = 'outro'
+
+TIPO_DOCUMENTO_CHOICES = [
+    (TIPO_MONITORIA_INICIAL, 'Monitória'),
+    (TIPO_COBRANCA_JUDICIAL, 'Ação de Cobrança'),
+    (TIPO_HABILITACAO, 'Habilitação'),
+    (TIPO_COMBO_ZIP, 'Pacote de protocolo (ZIP)'),
+    (TIPO_COMBO_PDF, 'Pacote de protocolo (PDF único)'),
+    (TIPO_EXTRATO_TITULARIDADE, 'Extrato de titularidade'),
+    (TIPO_OUTRO, 'Outro'),
+]
+
+# Peças contadas nos KPIs de petição, na ordem de prioridade da heurística.
+TIPOS_PETICAO = (TIPO_MONITORIA_INICIAL, TIPO_COBRANCA_JUDICIAL, TIPO_HABILITACAO)
+
+
+def normalizar_nome_arquivo(value) -> str:
+    text = str(value or '').strip().lower()
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace('_', ' ').replace('-', ' ')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def classificar_peca(nome, arquivo_nome) -> str:
+    """Tipo de peça pelo nome/caminho ('' quando não é uma das peças conhecidas)."""
+    joined = f"{normalizar_nome_arquivo(nome)} {normalizar_nome_arquivo(arquivo_nome)}".strip()
+    if not joined:
+        return ''
+    if 'monitoria inicial' in joined:
+        return TIPO_MONITORIA_INICIAL
+    if 'cobranca judicial' in joined:
+        return TIPO_COBRANCA_JUDICIAL
+    if 'habilitacao' in joined:
+        return TIPO_HABILITACAO
+    return ''
+
+
+def classificar_arquivo(nome, arquivo_nome) -> str:
+    """
+    Tipo de documento pelo nome/caminho. Devolve '' se não houver nada para
+    classificar (o arquivo ainda não foi gravado).
+    """
+    nome_norm = normalizar_nome_arquivo(nome)
+    caminho_norm = normalizar_nome_arquivo(arquivo_nome)
+    if not nome_norm and not caminho_norm:
+        return ''
+    base_nome = nome_norm.rsplit('/', 1)[-1]
+    base_caminho = caminho_norm.rsplit('/', 1)[-1]
+    if any(base.endswith('.zip') and 'protocolo' in base for base in (base_nome, base_caminho)):
+        return TIPO_COMBO_ZIP
+    if 'extrato de titularidade' in f'{nome_norm} {caminho_norm}':
+        return TIPO_EXTRATO_TITULARIDADE
+    return classificar_peca(nome, arquivo_nome) or TIPO_OUTRO
+
+
+_NUMERO_RE = re.compile(r'\d[\d./-]*\d|\d')
+MIN_DIGITOS_CONTRATO = 5
+
+
+def tokens_nome(value) -> str:
+    """Palavras do nome sem acento, minúsculas, separadas por um espaço."""
+    text = unicodedata.normalize('NFKD', str(value or '').lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def numero_contrato(value) -> str:
+    return re.sub(r'\D', '', str(value or ''))
+
+
+def contratos_no_nome(value) -> str:
+    """
+    Números com cara de contrato (5+ dígitos, pontuação removida) citados no
+    nome, entre espaços (' 123456 789012 ') para busca por `contains`.
+    """
+    numeros = []
+    for trecho in _NUMERO_RE.findall(str(value or '')):
+        for numero in {numero_contrato(trecho), *re.findall(r'\d+', trecho)}:
+            if len(numero) >= MIN_DIGITOS_CONTRATO and numero not in numeros:
+                numeros.append(numero)
+    return f" {' '.join(sorted(numeros))} " if numeros else ''
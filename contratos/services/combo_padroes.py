@@ -0,0 +1,236 @@
+"""
+Busca dos documentos do combo de petição (peticao_combo) pelos padrões
+ComboDocumentoPattern do tipo de petição.
+
+Os padrões ativos de um tipo são compilados uma vez por versão (quantidade,
+maior id e último `atualizado_em`) em expressões sobre o nome normalizado;
+tipos sem padrão cadastrado usam PADROES_PADRAO, as mesmas regras que o combo
+sempre aplicou (extrato, contrato, relatório, saldo devedor, TED e anexos).
+
+Os arquivos do processo entram num índice invertido montado com os campos que
+o ProcessoArquivo grava no save (`nome_tokens` e `contratos_nome`): número de
+contrato -> arquivos e prefixo de palavra -> arquivos. Cada padrão só testa a
+expressão nos candidatos dessas chaves, sem percorrer todos os arquivos.
+Contratos com menos de MIN_DIGITOS_CONTRATO dígitos não estão no índice: são
+conferidos como palavra inteira nos candidatos do padrão.
+"""
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db.models import Count, Max
+
+from ..models import ComboDocumentoPattern
+from .classificacao_arquivos import MIN_DIGITOS_CONTRATO, contratos_no_nome, numero_contrato, tokens_nome
+
+PLACEHOLDER_PADRAO = 'xxxxxxxxx'
+_TAMANHO_CHAVE = 3
+
+FIXO = ComboDocumentoPattern.CATEGORIA_FIXO
+CONTRATO = ComboDocumentoPattern.CATEGORIA_CONTRATO
+ANEXO = ComboDocumentoPattern.CATEGORIA_ANEXO
+
+
+@dataclass(frozen=True)
+class Termo:
+    regex: re.Pattern
+    chave: str  # prefixo de palavra usado no índice; vazio se o termo for curto demais
+    inicial: bool
+
+
+@dataclass(frozen=True)
+class PadraoCompilado:
+    chave: str
+    categoria: str
+    rotulo: str
+    placeholder: str
+    obrigatorio: bool
+    # Qualquer alternativa basta; dentro dela todos os termos são exigidos.
+    alternativas: Tuple[Tuple[Termo, ...], ...]
+
+    def rotulo_para(self, contrato: str = '') -> str:
+        if contrato and self.placeholder:
+            return self.rotulo.replace(self.placeholder, contrato)
+        return self.rotulo
+
+    def pontuacao(self, tokens: str) -> int:
+        """Quantidade de alternativas presentes no nome (0 = não casa)."""
+        return sum(
+            1 for alternativa in self.alternativas
+            if all(termo.regex.search(tokens) for termo in alternativa)
+        )
+
+
+def compilar_termo(texto: str) -> Optional[Termo]:
+    texto = str(texto or '').strip()
+    inicial = texto.startswith('^')
+    tokens = tokens_nome(texto.lstrip('^'))
+    if not tokens:
+        return None
+    # Casa no início de palavra; a última pode ser só o começo ('termo de ades').
+    regex = re.compile(('^' if inicial else r'(?:^| )') + re.escape(tokens))
+    primeira = tokens.split(' ', 1)[0]
+    chave = primeira[:_TAMANHO_CHAVE] if len(primeira) >= _TAMANHO_CHAVE else ''
+    return Termo(regex=regex, chave=chave, inicial=inicial)
+
+
+def compilar_palavras_chave(keywords: Iterable[str]) -> Tuple[Tuple[Termo, ...], ...]:
+    alternativas = []
+    for keyword in keywords or []:
+        termos = tuple(t for t in (compilar_termo(parte) for parte in str(keyword).split('+')) if t)
+        if termos:
+            alternativas.append(termos)
+    return tuple(alternativas)
+
+
+def compilar(chave, categoria, rotulo, keywords, placeholder=PLACEHOLDER_PADRAO, obrigatorio=True):
+    return PadraoCompilado(
+        chave=chave,
+        categoria=categoria,
+        rotulo=rotulo,
+        placeholder=placeholder or '',
+        obrigatorio=obrigatorio,
+        alternativas=compilar_palavras_chave(keywords),
+    )
+
+
+PADROES_PADRAO: Tuple[PadraoCompilado, ...] = (
+    compilar('anexos', ANEXO, 'Anexos', ['^anexo'], obrigatorio=False),
+    compilar('a05', FIXO, '05 - Extrato de Titularidade', ['^05 - extrato de titularidade']),
+    compilar('a06', CONTRATO, '06 - xxxxxxxxx - Contrato', ['contrato', 'termo de ades', 'termo de adesao']),
+    compilar('a07', CONTRATO, '07 - xxxxxxxxx - Relatório', ['relatorio']),
+    compilar(
+        'a08', CONTRATO, '08 - xxxxxxxxx - Saldo Devedor (ou Cálculo)',
+        ['calculo de saldo devedor', 'saldo devedor', 'saldo + b6'],
+    ),
+    compilar('a09', CONTRATO, '09 - xxxxxxxxx - TED', ['ted']),
+)
+
+_ORDEM_CATEGORIAS = {ANEXO: 0, FIXO: 1, CONTRATO: 2}
+
+_cache: Dict[int, Tuple[tuple, Tuple[PadraoCompilado, ...]]] = {}
+_lock = threading.Lock()
+
+
+def versao(tipo_id) -> tuple:
+    agregado = ComboDocumentoPattern.objects.filter(tipo_peticao_id=tipo_id, ativo=True).aggregate(
+        total=Count('id'),
+        ultimo_id=Max('id'),
+        atualizado=Max('atualizado_em'),
+    )
+    return agregado['total'], agregado['ultimo_id'], agregado['atualizado']
+
+
+def padroes_do_tipo(tipo) -> Tuple[PadraoCompilado, ...]:
+    """
+    Padrões compilados do tipo na ordem de busca: anexos opcionais, fixos e
+    por contrato, cada grupo pela `ordem` cadastrada.
+    """
+    tipo_id = getattr(tipo, 'pk', tipo)
+    atual = versao(tipo_id)
+    em_cache = _cache.get(tipo_id)
+    if em_cache is not None and em_cache[0] == atual:
+        return em_cache[1]
+    if not atual[0]:
+        padroes = PADROES_PADRAO
+    else:
+        linhas = ComboDocumentoPattern.objects.filter(tipo_peticao_id=tipo_id, ativo=True).order_by('ordem', 'id')
+        padroes = tuple(
+            padrao
+            for padrao in (
+                compilar(
+                    f'p{linha.pk}',
+                    linha.categoria,
+                    linha.label_template,
+                    linha.keywords if isinstance(linha.keywords, list) else [linha.keywords],
+                    placeholder=linha.placeholder,
+                    obrigatorio=linha.obrigatorio,
+                )
+                for linha in linhas
+            )
+            if padrao.alternativas
+        )
+    padroes = tuple(sorted(padroes, key=lambda p: _ORDEM_CATEGORIAS.get(p.categoria, len(_ORDEM_CATEGORIAS))))
+    with _lock:
+        _cache[tipo_id] = (atual, padroes)
+    return padroes
+
+
+def limpar_cache():
+    with _lock:
+        _cache.clear()
+
+
+class IndiceArquivos:
+    """Índice dos arquivos de um processo por contrato citado e prefixo de palavra."""
+
+    def __init__(self, arquivos: Iterable):
+        self.arquivos = {}
+        self.tokens: Dict[int, str] = {}
+        self.por_contrato: Dict[str, Set[int]] = defaultdict(set)
+        self.por_chave: Dict[str, Set[int]] = defaultdict(set)
+        self.por_chave_inicial: Dict[str, Set[int]] = defaultdict(set)
+        for arquivo in arquivos:
+            tokens = arquivo.nome_tokens
+            contratos = arquivo.contratos_nome
+            if not tokens:
+                # Arquivo ainda não indexado (ver indexar_nomes_arquivos).
+                nome = arquivo.nome or (arquivo.arquivo.name or '').rsplit('/', 1)[-1]
+                tokens, contratos = tokens_nome(nome), contratos_no_nome(nome)
+            self.arquivos[arquivo.id] = arquivo
+            self.tokens[arquivo.id] = tokens
+            for numero in contratos.split():
+                self.por_contrato[numero].add(arquivo.id)
+            palavras = tokens.split()
+            for palavra in palavras:
+                self.por_chave[palavra[:_TAMANHO_CHAVE]].add(arquivo.id)
+            if palavras:
+                self.por_chave_inicial[palavras[0][:_TAMANHO_CHAVE]].add(arquivo.id)
+
+    def _candidatos_alternativa(self, alternativa: Tuple[Termo, ...]) -> Optional[Set[int]]:
+        conjuntos = [
+            (self.por_chave_inicial if termo.inicial else self.por_chave).get(termo.chave, set())
+            for termo in alternativa if termo.chave
+        ]
+        if not conjuntos:
+            return None
+        return set.intersection(*conjuntos)
+
+    def candidatos(self, padrao: PadraoCompilado, contrato: str = '') -> Set[int]:
+        ids: Set[int] = set()
+        for alternativa in padrao.alternativas:
+            encontrados = self._candidatos_alternativa(alternativa)
+            if encontrados is None:
+                # Termos curtos ('b6') não têm chave: sobra o teste em todos.
+                ids = set(self.arquivos)
+                break
+            ids |= encontrados
+        if contrato:
+            numero = numero_contrato(contrato)
+            if len(numero) >= MIN_DIGITOS_CONTRATO:
+                ids &= self.por_contrato.get(numero, set())
+            elif numero:
+                palavra = re.compile(rf'(?:^| ){numero}(?: |$)')
+                ids = {arquivo_id for arquivo_id in ids if palavra.search(self.tokens[arquivo_id])}
+            else:
+                ids = set()
+        return ids
+
+    def buscar(self, padrao: PadraoCompilado, contrato: str = '', ignorar: Set[int] = frozenset()) -> List:
+        """
+        Arquivos que casam com o padrão (e citam o contrato, se informado), do
+        melhor para o pior: PDF primeiro, mais alternativas casadas, mais recente.
+        """
+        encontrados = []
+        for arquivo_id in self.candidatos(padrao, contrato) - set(ignorar):
+            pontos = padrao.pontuacao(self.tokens[arquivo_id])
+            if not pontos:
+                continue
+            arquivo = self.arquivos[arquivo_id]
+            nome = arquivo.nome or (arquivo.arquivo.name or '')
+            criado = arquivo.criado_em.timestamp() if arquivo.criado_em else 0
+            encontrados.append((nome.lower().endswith('.pdf'), pontos, criado, arquivo_id, arquivo))
+        encontrados.sort(key=lambda item: item[:4], reverse=True)
+        return [item[-1] for item in encontrados]
@@ -0,0 +1,442 @@
+"""
+Conversão DOCX → PDF compartilhada pelo download on-demand e pela montagem do
+ZIP de protocolo, com cache por conteúdo no storage padrão.
+
+A chave é o SHA-256 do DOCX somado à versão do conversor
+(DOCX_PDF_CONVERSOR_VERSAO); mudar a versão invalida o cache inteiro. Só os
+resultados do Gotenberg/LibreOffice entram no cache: os fallbacks em Python
+são aproximações e não devem continuar sendo servidos quando o serviço voltar.
+"""
+import hashlib
+import json
+import logging
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple
+
+import httpx
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from contratos.models import ConversaoPdfEstatistica
+from contratos.services import integracoes_http, libreoffice_pool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONVERSOR_VERSAO = '1'
+CACHE_PREFIXO = 'conversoes/docx-pdf'
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+CONVERSOR_GOTENBERG = 'gotenberg'
+CONVERSOR_LIBREOFFICE = 'libreoffice'
+CONVERSOR_XHTML2PDF = 'xhtml2pdf'
+CONVERSOR_REPORTLAB = 'reportlab'
+CONVERSORES_CACHEAVEIS = {CONVERSOR_GOTENBERG, CONVERSOR_LIBREOFFICE}
+
+SOFFICE_CANDIDATOS = [
+    "soffice",
+    "/usr/bin/soffice",
+    "libreoffice",
+    "/usr/bin/libreoffice",
+    "/opt/libreoffice/program/soffice",
+    "/usr/lib/libreoffice/program/soffice",
+    "/snap/bin/libreoffice",
+]
+
+
+def get_conversor_versao() -> str:
+    value = str(getattr(settings, 'DOCX_PDF_CONVERSOR_VERSAO', '') or '').strip()
+    return value or DEFAULT_CONVERSOR_VERSAO
+
+
+def chave_conteudo(docx_bytes: bytes) -> str:
+    return hashlib.sha256(docx_bytes).hexdigest()
+
+
+def _caminhos_cache(chave: str) -> Tuple[str, str]:
+    base = f"{CACHE_PREFIXO}/v{get_conversor_versao()}/{chave[:2]}/{chave}"
+    return f"{base}.pdf", f"{base}.json"
+
+
+def _ler_cache(chave: str) -> Optional[bytes]:
+    pdf_path, _ = _caminhos_cache(chave)
+    try:
+        if not default_storage.exists(pdf_path):
+            return None
+        with default_storage.open(pdf_path, 'rb') as fh:
+            return fh.read() or None
+    except Exception as exc:
+        logger.warning("Cache de conversão indisponível (%s): %s", pdf_path, exc)
+        return None
+
+
+def _gravar_cache(chave: str, pdf_bytes: bytes, conversor: str, duracao_ms: int):
+    pdf_path, meta_path = _caminhos_cache(chave)
+    metadados = {
+        'sha256': chave,
+        'versao': get_conversor_versao(),
+        'conversor': conversor,
+        'duracao_ms': duracao_ms,
+        'tamanho': len(pdf_bytes),
+        'gerado_em': timezone.now().isoformat(),
+    }
+    try:
+        # Duas conversões simultâneas do mesmo DOCX: a segunda não grava de novo
+        # (o storage renomearia o arquivo em vez de sobrescrever).
+        if default_storage.exists(pdf_path):
+            return
+        default_storage.save(pdf_path, ContentFile(pdf_bytes))
+        default_storage.save(meta_path, ContentFile(json.dumps(metadados).encode('utf-8')))
+    except Exception as exc:
+        logger.warning("Falha ao gravar cache de conversão (%s): %s", pdf_path, exc)
+
+
+def metadados_cache(docx_bytes: bytes) -> Optional[dict]:
+    """Metadados (conversor, duração, tamanho) da entrada em cache, se houver."""
+    _, meta_path = _caminhos_cache(chave_conteudo(docx_bytes))
+    try:
+        if not default_storage.exists(meta_path):
+            return None
+        with default_storage.open(meta_path, 'rb') as fh:
+            return json.loads(fh.read().decode('utf-8'))
+    except Exception:
+        return None
+
+
+def _registrar(acerto: bool, convertido: bool = False, duracao_ms: int = 0):
+    hoje = timezone.localdate()
+    campos = {'acertos': F('acertos') + 1} if acerto else {
+        'conversoes': F('conversoes') + (1 if convertido else 0),
+        'falhas': F('falhas') + (0 if convertido else 1),
+        'duracao_conversoes_ms': F('duracao_conversoes_ms') + duracao_ms,
+    }
+    try:
+        if not ConversaoPdfEstatistica.objects.filter(data=hoje).update(**campos):
+            ConversaoPdfEstatistica.objects.get_or_create(data=hoje)
+            ConversaoPdfEstatistica.objects.filter(data=hoje).update(**campos)
+    except Exception as exc:
+        logger.warning("Falha ao registrar estatística de conversão: %s", exc)
+
+
+def estatisticas(dias: int = 7) -> dict:
+    """Totais e taxa de acerto do cache nos últimos `dias` dias (incluindo hoje)."""
+    desde = timezone.localdate() - timedelta(days=max(dias, 1) - 1)
+    totais = ConversaoPdfEstatistica.objects.filter(data__gte=desde).aggregate(
+        acertos=Sum('acertos'),
+        conversoes=Sum('conversoes'),
+        falhas=Sum('falhas'),
+        duracao_conversoes_ms=Sum('duracao_conversoes_ms'),
+    )
+    totais = {campo: int(valor or 0) for campo, valor in totais.items()}
+    pedidos = totais['acertos'] + totais['conversoes'] + totais['falhas']
+    totais['pedidos'] = pedidos
+    totais['taxa_acerto'] = round(totais['acertos'] / pedidos, 4) if pedidos else 0.0
+    totais['desde'] = desde.isoformat()
+    return totais
+
+
+def converter_docx_para_pdf(docx_bytes: bytes, permitir_fallback: bool = True) -> Optional[bytes]:
+    """
+    Converte DOCX para PDF, reaproveitando conversões anteriores do mesmo
+    conteúdo. Com permitir_fallback=False só Gotenberg/LibreOffice são
+    usados (o ZIP de protocolo prefere um PDF já anexado a uma aproximação).
+    """
+    if not docx_bytes:
+        return None
+    chave = chave_conteudo(docx_bytes)
+    pdf_bytes = _ler_cache(chave)
+    if pdf_bytes:
+        _registrar(acerto=True)
+        return pdf_bytes
+
+    inicio = time.monotonic()
+    pdf_bytes, conversor = _converter(docx_bytes, permitir_fallback)
+    duracao_ms = int((time.monotonic() - inicio) * 1000)
+    if pdf_bytes and conversor in CONVERSORES_CACHEAVEIS:
+        _gravar_cache(chave, pdf_bytes, conversor, duracao_ms)
+    _registrar(acerto=False, convertido=bool(pdf_bytes), duracao_ms=duracao_ms)
+    if pdf_bytes:
+        logger.info("DOCX convertido via %s em %d ms (%d bytes)", conversor, duracao_ms, len(pdf_bytes))
+    return pdf_bytes
+
+
+def _converter(docx_bytes: bytes, permitir_fallback: bool) -> Tuple[Optional[bytes], str]:
+    """
+    Prioriza Gotenberg (serviço com LibreOffice embutido), com uma nova
+    tentativa em caso de falha; depois LibreOffice local (soffice). Com
+    fallback: mammoth + xhtml2pdf (100% Python) e, por último, reportlab
+    direto do DOCX (texto/tabelas).
+    """
+    if integracoes_http.cliente('gotenberg').configurado:
+        # Qualquer falha (status, PDF inválido, timeout) tem uma nova tentativa,
+        # não só as transitórias que o cliente HTTP repete.
+        for _ in range(2):
+            pdf_bytes = _converter_gotenberg(docx_bytes)
+            if pdf_bytes:
+                return pdf_bytes, CONVERSOR_GOTENBERG
+
+    pdf_bytes = _converter_libreoffice(docx_bytes)
+    if pdf_bytes:
+        return pdf_bytes, CONVERSOR_LIBREOFFICE
+    if not permitir_fallback:
+        return None, ''
+
+    pdf_bytes = _converter_xhtml2pdf(docx_bytes)
+    if pdf_bytes:
+        return pdf_bytes, CONVERSOR_XHTML2PDF
+    return _converter_reportlab(docx_bytes), CONVERSOR_REPORTLAB
+
+
+def _converter_gotenberg(docx_bytes: bytes) -> Optional[bytes]:
+    try:
+        files = {'files': ('document.docx', docx_bytes, DOCX_CONTENT_TYPE)}
+        response = integracoes_http.cliente('gotenberg').post('/forms/libreoffice/convert', files=files)
+        if response.status_code == 200 and response.content:
+            pdf_size = len(response.content)
+            # PDFs válidos começam com %PDF- e geralmente têm mais de 1KB
+            if response.content[:5] == b'%PDF-' and pdf_size > 1000:
+                return response.content
+            logger.warning("Gotenberg: PDF inválido ou muito pequeno (%d bytes)", pdf_size)
+        else:
+            logger.warning("Gotenberg falhou: status=%s", response.status_code)
+    except httpx.TimeoutException:
+        logger.warning("Gotenberg timeout")
+    except Exception as exc:
+        logger.warning("Erro ao usar Gotenberg: %s", exc)
+    return None
+
+
+def _find_soffice() -> Optional[str]:
+    for candidate in SOFFICE_CANDIDATOS:
+        if shutil.which(candidate):
+            return candidate
+    logger.error("LibreOffice não encontrado. Tentou: %s", ", ".join(SOFFICE_CANDIDATOS))
+    return None
+
+
+def _converter_libreoffice(docx_bytes: bytes) -> Optional[bytes]:
+    # Com o pool ativo, fila cheia ou falha não viram um soffice avulso: o
+    # limite do pool é justamente o que protege o servidor.
+    if libreoffice_pool.habilitado():
+        return libreoffice_pool.converter(docx_bytes)
+    soffice_cmd = _find_soffice()
+    if not soffice_cmd:
+        return None
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir_path = Path(tmpdir)
+            docx_path = tmpdir_path / "input.docx"
+            pdf_path = tmpdir_path / "input.pdf"
+            docx_path.write_bytes(docx_bytes)
+            # Perfil próprio por conversão: dois soffice com o mesmo perfil
+            # colidem (o segundo entrega o pedido ao primeiro e sai).
+            perfil_uri = (tmpdir_path / "perfil").as_uri()
+            cmd = [
+                soffice_cmd,
+                f"-env:UserInstallation={perfil_uri}",
+                "--headless",
+                "--nologo",
+                "--nodefault",
+                "--norestore",
+                "--nofirststartwizard",
+                "--convert-to",
+                "pdf:writer_pdf_Export",
+                "--outdir",
+                str(tmpdir_path),
+                str(docx_path),
+            ]
+            result = subprocess.run(cmd, capture_output=True, timeout=90)
+            if result.returncode == 0 and pdf_path.exists():
+                return pdf_path.read_bytes()
+            logger.warning(
+                "LibreOffice falhou: rc=%s stdout=%s stderr=%s",
+                result.returncode,
+                result.stdout.decode('utf-8', errors='ignore')[:200],
+                result.stderr.decode('utf-8', errors='ignore')[:200],
+            )
+    except Exception as exc:
+        logger.warning("Erro com LibreOffice: %s", exc, exc_info=True)
+    return None
+
+
+def _converter_xhtml2pdf(docx_bytes: bytes) -> Optional[bytes]:
+    try:
+        import mammoth
+        from xhtml2pdf import pisa
+
+        # Converte DOCX para HTML usando mammoth
+        docx_io = BytesIO(docx_bytes)
+        result = mammoth.convert_to_html(docx_io)
+        html_content = result.value
+
+        # Adiciona CSS para melhor formatação do PDF
+        html_with_style = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="UTF-8">
+            <style>
+                @page {{
+                    size: A4;
+                    margin: 2cm;
+                }}
+                body {{
+                    font-family: 'Times New Roman', Times, serif;
+                    font-size: 12pt;
+                    line-height: 1.5;
+                    color: #000;
+                }}
+                p {{
+                    margin: 0 0 10pt 0;
+                    text-align: justify;
+                }}
+                table {{
+                    border-collapse: collapse;
+                    width: 100%;
+                    margin: 10pt 0;
+                }}
+                td, th {{
+                    border: 1px solid #000;
+                    padding: 5pt;
+                }}
+                h1 {{ font-size: 14pt; font-weight: bold; margin: 12pt 0 6pt 0; }}
+                h2 {{ font-size: 13pt; font-weight: bold; margin: 10pt 0 5pt 0; }}
+                h3 {{ font-size: 12pt; font-weight: bold; margin: 8pt 0 4pt 0; }}
+                strong, b {{ font-weight: bold; }}
+                em, i {{ font-style: italic; }}
+                u {{ text-decoration: underline; }}
+            </style>
+        </head>
+        <body>
+            {html_content}
+        </body>
+        </html>
+        """
+
+        # Converte HTML para PDF usando xhtml2pdf
+        pdf_io = BytesIO()
+        pisa_status = pisa.CreatePDF(html_with_style, dest=pdf_io, encoding='UTF-8')
+
+        if pisa_status.err:
+            logger.error("Erro ao converter HTML para PDF com xhtml2pdf: %s", pisa_status.err)
+            return None
+
+        pdf_io.seek(0)
+        return pdf_io.read()
+
+    except ImportError as e:
+        logger.error("Bibliotecas mammoth/xhtml2pdf não instaladas: %s", e)
+    except Exception as exc:
+        logger.error("Erro ao converter DOCX para PDF (fallback): %s", exc, exc_info=True)
+        # continua para o fallback de reportlab
+    return None
+
+
+def _converter_reportlab(docx_bytes: bytes) -> Optional[bytes]:
+    try:
+        from docx import Document
+        from docx.table import Table as DocxTable
+        from docx.text.paragraph import Paragraph as DocxParagraph
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+        from reportlab.lib.units import cm
+        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+        import html as html_lib
+
+        def iter_block_items(parent):
+            for child in parent.element.body.iterchildren():
+                if child.tag.endswith('}p'):
+                    yield DocxParagraph(child, parent)
+                elif child.tag.endswith('}tbl'):
+                    yield DocxTable(child, parent)
+
+        def run_to_markup(run):
+            text = html_lib.escape(run.text or '').replace('\n', '<br/>')
+            if not text:
+                return ''
+            if run.bold:
+                text = f"<b>{text}</b>"
+            if run.italic:
+                text = f"<i>{text}</i>"
+            if run.underline:
+                text = f"<u>{text}</u>"
+            return text
+
+        alignment_map = {
+            None: TA_LEFT,
+            0: TA_LEFT,
+            1: TA_CENTER,
+            2: TA_RIGHT,
+            3: TA_JUSTIFY,
+        }
+
+        styles = getSampleStyleSheet()
+        base_style = ParagraphStyle(
+            'DocxBase',
+            parent=styles['Normal'],
+            fontName='Times-Roman',
+            fontSize=12,
+            leading=15,
+            spaceAfter=6,
+        )
+
+        doc = Document(BytesIO(docx_bytes))
+        buffer = BytesIO()
+        pdf = SimpleDocTemplate(
+            buffer,
+            pagesize=A4,
+            leftMargin=2 * cm,
+            rightMargin=2 * cm,
+            topMargin=2 * cm,
+            bottomMargin=2 * cm,
+        )
+        flowables = []
+
+        for block in iter_block_items(doc):
+            if isinstance(block, DocxParagraph):
+                paragraph_text = ''.join(run_to_markup(run) for run in block.runs).strip()
+                if not paragraph_text:
+                    flowables.append(Spacer(1, 8))
+                    continue
+                style = ParagraphStyle(
+                    'DocxParagraph',
+                    parent=base_style,
+                    alignment=alignment_map.get(block.alignment, TA_LEFT),
+                )
+                flowables.append(Paragraph(paragraph_text, style))
+            elif isinstance(block, DocxTable):
+                table_data = []
+                for row in block.rows:
+                    row_cells = []
+                    for cell in row.cells:
+                        cell_text = html_lib.escape(cell.text or '').replace('\n', '<br/>')
+                        row_cells.append(Paragraph(cell_text, base_style))
+                    table_data.append(row_cells)
+                if table_data:
+                    table = Table(table_data, hAlign='LEFT')
+                    table.setStyle(TableStyle([
+                        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                    ]))
+                    flowables.append(table)
+                    flowables.append(Spacer(1, 8))
+
+        if not flowables:
+            return None
+
+        pdf.build(flowables)
+        buffer.seek(0)
+        return buffer.read()
+    except Exception as exc:
+        logger.error("Erro ao converter DOCX para PDF (reportlab): %s", exc, exc_info=True)
+        return None
@@ -10,7 +10,10 @@ from django.db.models.expressions import RawSQL
 from django.db.models import Q
 from django.db.utils import OperationalError
 
-from contratos.models import Carteira, Contrato, Etiqueta, Parte, ProcessoJudicial, ProcessoJudicialNumeroCnj
+from contratos.models import (
+    Carteira, Contrato, Etiqueta, Parte, ProcessoJudicial, ProcessoJudicialNumeroCnj,
+    agendar_sincronizacao_carteira_cpf, marcar_kpi_snapshots_desatualizados,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -1282,6 +1285,9 @@ class DemandasImportService:
             )
             for contract in contracts
         ])
+        # bulk_create não dispara os signals de Parte.
+        agendar_sincronizacao_carteira_cpf([processo.pk])
+        marcar_kpi_snapshots_desatualizados(processo_ids=[processo.pk])
         self._upsert_numeros_cnj(processo, contracts, carteira)
 
         return processo
@@ -0,0 +1,150 @@
+"""
+Leitura em streaming dos arquivos do storage para o proxy de visualização
+(proxy_arquivo_view): metadados para ETag/Last-Modified, leitura de um
+intervalo de bytes sem carregar o arquivo inteiro e URL assinada do S3.
+
+No S3 o `S3File` do django-storages baixa o objeto inteiro no primeiro read;
+aqui o intervalo pedido vem direto de um GET com `Range`, e o HEAD feito ao
+abrir já traz tamanho, ETag e data de modificação.
+"""
+import hashlib
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.utils.http import quote_etag
+
+DEFAULT_URL_EXPIRA_SECONDS = 300
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class IntervaloInvalido(Exception):
+    """Range fora do tamanho do arquivo (resposta 416)."""
+
+
+def _storage_s3(storage) -> bool:
+    try:
+        from storages.backends.s3 import S3Storage
+    except ImportError:
+        return False
+    return isinstance(storage, S3Storage)
+
+
+def redirecionar_s3() -> bool:
+    return bool(getattr(settings, 'ARQUIVOS_PROXY_REDIRECIONAR_S3', False))
+
+
+def get_url_expira_seconds() -> int:
+    try:
+        value = int(getattr(settings, 'ARQUIVOS_PROXY_URL_EXPIRA_SECONDS', DEFAULT_URL_EXPIRA_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_URL_EXPIRA_SECONDS
+    return value if value > 0 else DEFAULT_URL_EXPIRA_SECONDS
+
+
+class _LeituraLimitada:
+    """File-like que entrega no máximo `restante` bytes do arquivo já posicionado."""
+
+    def __init__(self, arquivo, restante: int):
+        self._arquivo = arquivo
+        self._restante = restante
+
+    def read(self, tamanho: int = -1) -> bytes:
+        if self._restante <= 0:
+            return b''
+        if tamanho is None or tamanho < 0 or tamanho > self._restante:
+            tamanho = self._restante
+        dados = self._arquivo.read(tamanho)
+        self._restante -= len(dados)
+        return dados
+
+    def close(self):
+        self._arquivo.close()
+
+
+@dataclass
+class ArquivoAberto:
+    tamanho: int
+    etag: str
+    modificado_em: Optional[datetime]
+    _arquivo: object
+    _objeto_s3: object = None
+
+    def ler(self, inicio: int = 0, fim: Optional[int] = None):
+        """File-like com os bytes [inicio, fim] (inclusivo); quem lê deve fechá-lo."""
+        fim = self.tamanho - 1 if fim is None else fim
+        if self._objeto_s3 is not None:
+            self._arquivo.close()
+            if self.tamanho == 0:
+                return _LeituraLimitada(self._arquivo, 0)
+            resposta = self._objeto_s3.get(Range=f'bytes={inicio}-{fim}')
+            return resposta['Body']
+        if inicio:
+            self._arquivo.seek(inicio)
+        return _LeituraLimitada(self._arquivo, fim - inicio + 1)
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+def abrir(field_file) -> ArquivoAberto:
+    """Abre o arquivo sem ler o conteúdo. FileNotFoundError se não existir no storage."""
+    storage = field_file.storage
+    arquivo = storage.open(field_file.name, 'rb')
+    objeto_s3 = getattr(arquivo, 'obj', None) if _storage_s3(storage) else None
+    if objeto_s3 is not None:
+        return ArquivoAberto(
+            tamanho=int(objeto_s3.content_length or 0),
+            etag=objeto_s3.e_tag or quote_etag(field_file.name),
+            modificado_em=objeto_s3.last_modified,
+            _arquivo=arquivo,
+            _objeto_s3=objeto_s3,
+        )
+    tamanho = arquivo.size
+    try:
+        modificado_em = storage.get_modified_time(field_file.name)
+    except (NotImplementedError, OSError):
+        modificado_em = None
+    assinatura = f'{field_file.name}:{tamanho}:{modificado_em.timestamp() if modificado_em else ""}'
+    return ArquivoAberto(
+        tamanho=tamanho,
+        etag=quote_etag(hashlib.sha1(assinatura.encode('utf-8')).hexdigest()),
+        modificado_em=modificado_em,
+        _arquivo=arquivo,
+    )
+
+
+def intervalo(header: str, tamanho: int) -> Optional[Tuple[int, int]]:
+    """
+    (inicio, fim) do header Range, ou None para responder o arquivo inteiro
+    (sem Range, sintaxe não suportada ou múltiplos intervalos).
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match or not any(match.groups()):
+        return None
+    inicio_txt, fim_txt = match.groups()
+    if not inicio_txt:
+        # Sufixo: os últimos N bytes.
+        sufixo = int(fim_txt)
+        if sufixo == 0:
+            raise IntervaloInvalido()
+        return max(tamanho - sufixo, 0), tamanho - 1
+    inicio = int(inicio_txt)
+    fim = min(int(fim_txt), tamanho - 1) if fim_txt else tamanho - 1
+    if inicio >= tamanho or fim < inicio:
+        raise IntervaloInvalido()
+    return inicio, fim
+
+
+def url_assinada(field_file, content_type: str) -> Optional[str]:
+    """URL temporária do S3 servindo o arquivo inline; None para outros storages."""
+    storage = field_file.storage
+    if not _storage_s3(storage):
+        return None
+    return storage.url(
+        field_file.name,
+        parameters={'ResponseContentDisposition': 'inline', 'ResponseContentType': content_type},
+        expire=get_url_expira_seconds(),
+    )
@@ -0,0 +1,329 @@
+"""
+Exportação em streaming (CSV/XLSX) da lista de processos.
+
+O queryset é percorrido com `.iterator()` em blocos; para cada bloco há uma
+única consulta por tabela relacionada (partes, contratos, análise, etiquetas),
+então a memória usada não depende do tamanho da exportação.
+"""
+import csv
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from contratos.models import AnaliseProcesso, Contrato, Parte, ProcessoJudicial
+
+DEFAULT_CHUNK_SIZE = 2000
+
+PROCESSO_FIELDS = (
+    'id', 'cnj', 'uf', 'vara', 'tribunal', 'valor_causa', 'soma_contratos',
+    'viabilidade', 'status__nome', 'carteira__nome', 'delegado_para__username',
+    'ultima_edicao_em',
+)
+
+COLUMNS = (
+    ('id', 'ID'),
+    ('cnj', 'CNJ'),
+    ('uf', 'UF'),
+    ('vara', 'Vara'),
+    ('tribunal', 'Tribunal'),
+    ('carteira', 'Carteira'),
+    ('status', 'Classe processual'),
+    ('viabilidade', 'Viabilidade'),
+    ('valor_causa', 'Valor da causa'),
+    ('polo_ativo', 'Polo ativo'),
+    ('polo_passivo', 'Polo passivo'),
+    ('documentos_passivo', 'CPF/CNPJ polo passivo'),
+    ('contratos_qtd', 'Qtd. contratos'),
+    ('contratos_valor_total_devido', 'Total devido (contratos)'),
+    ('contratos_valor_causa', 'Valor da causa (contratos)'),
+    ('soma_contratos', 'Soma dos contratos'),
+    ('etiquetas', 'Etiquetas'),
+    ('analise_status', 'Status da análise'),
+    ('analise_atualizada_em', 'Análise atualizada em'),
+    ('delegado_para', 'Delegado para'),
+    ('ultima_edicao_em', 'Última edição em'),
+)
+
+VIABILIDADE_LABELS = dict(ProcessoJudicial.VIABILIDADE_CHOICES)
+SUPERVISOR_STATUS_LABELS = {
+    'aprovado': 'Aprovado',
+    'pre_aprovado': 'Pré-aprovado',
+    'reprovado': 'Reprovado',
+}
+
+
+def _chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _resumo_analise(respostas) -> str:
+    if not isinstance(respostas, dict) or not respostas:
+        return ''
+    cards = []
+    for key in ('saved_processos_vinculados', 'processos_vinculados'):
+        entries = respostas.get(key)
+        if isinstance(entries, list):
+            cards.extend(card for card in entries if isinstance(card, dict))
+        if cards:
+            break
+    if not cards:
+        return 'Em análise'
+    # O card supervisionado mais recente define o status exibido.
+    card = max(cards, key=lambda item: str(item.get('supervision_date') or ''))
+    barrado = card.get('barrado')
+    if isinstance(barrado, dict) and barrado.get('ativo'):
+        return 'Barrado'
+    status = str(card.get('supervisor_status') or '').strip()
+    if status in SUPERVISOR_STATUS_LABELS:
+        return SUPERVISOR_STATUS_LABELS[status]
+    if card.get('supervisionado'):
+        return 'Aguardando supervisão'
+    return 'Analisado'
+
+
+def _related_for_chunk(ids: List[int]) -> Dict[str, dict]:
+    partes: Dict[int, dict] = {}
+    for row in (
+        Parte.objects.filter(processo_id__in=ids)
+        .order_by('processo_id', 'id')
+        .values('processo_id', 'tipo_polo', 'nome', 'documento')
+    ):
+        bucket = partes.setdefault(row['processo_id'], {'ativo': [], 'passivo': [], 'documentos': []})
+        if row['tipo_polo'] == 'ATIVO':
+            bucket['ativo'].append(row['nome'] or '')
+        else:
+            bucket['passivo'].append(row['nome'] or '')
+            if row['documento']:
+                bucket['documentos'].append(row['documento'])
+
+    contratos = {
+        row['processo_id']: row
+        for row in (
+            Contrato.objects.filter(processo_id__in=ids)
+            .values('processo_id')
+            .annotate(
+                qtd=Count('id'),
+                total_devido=Sum('valor_total_devido'),
+                total_causa=Sum('valor_causa'),
+            )
+            .order_by()
+        )
+    }
+
+    analises = {
+        row['processo_judicial_id']: row
+        for row in AnaliseProcesso.objects.filter(processo_judicial_id__in=ids).values(
+            'processo_judicial_id', 'respostas', 'updated_at'
+        )
+    }
+
+    etiquetas: Dict[int, List[str]] = {}
+    for processo_id, nome in (
+        ProcessoJudicial.etiquetas.through.objects.filter(processojudicial_id__in=ids)
+        .order_by('processojudicial_id', 'etiqueta__ordem', 'etiqueta__nome')
+        .values_list('processojudicial_id', 'etiqueta__nome')
+    ):
+        etiquetas.setdefault(processo_id, []).append(nome)
+
+    return {'partes': partes, 'contratos': contratos, 'analises': analises, 'etiquetas': etiquetas}
+
+
+def iter_export_rows(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Gera um dict por processo com as chaves de `COLUMNS`, na ordem do queryset
+    (a da changelist, com a ordenação escolhida na tela); sem ordem, por pk.
+    """
+    if not queryset.ordered:
+        queryset = queryset.order_by('pk')
+    base = queryset.values(*PROCESSO_FIELDS)
+    for chunk in _chunked(base.iterator(chunk_size=chunk_size), chunk_size):
+        related = _related_for_chunk([row['id'] for row in chunk])
+        for row in chunk:
+            pk = row['id']
+            partes = related['partes'].get(pk, {})
+            contratos = related['contratos'].get(pk, {})
+            analise = related['analises'].get(pk, {})
+            yield {
+                'id': pk,
+                'cnj': row['cnj'] or '',
+                'uf': row['uf'] or '',
+                'vara': row['vara'] or '',
+                'tribunal': row['tribunal'] or '',
+                'carteira': row['carteira__nome'] or '',
+                'status': row['status__nome'] or '',
+                'viabilidade': VIABILIDADE_LABELS.get(row['viabilidade'], '') if row['viabilidade'] else '',
+                'valor_causa': row['valor_causa'],
+                'polo_ativo': ' | '.join(partes.get('ativo', [])),
+                'polo_passivo': ' | '.join(partes.get('passivo', [])),
+                'documentos_passivo': ' | '.join(partes.get('documentos', [])),
+                'contratos_qtd': contratos.get('qtd') or 0,
+                'contratos_valor_total_devido': contratos.get('total_devido'),
+                'contratos_valor_causa': contratos.get('total_causa'),
+                'soma_contratos': row['soma_contratos'],
+                'etiquetas': ' | '.join(related['etiquetas'].get(pk, [])),
+                'analise_status': _resumo_analise(analise.get('respostas')),
+                'analise_atualizada_em': analise.get('updated_at'),
+                'delegado_para': row['delegado_para__username'] or '',
+                'ultima_edicao_em': row['ultima_edicao_em'],
+            }
+
+
+def _format_datetime(value) -> str:
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.strftime('%d/%m/%Y %H:%M')
+    if isinstance(value, datetime.date):
+        return value.strftime('%d/%m/%Y')
+    return ''
+
+
+# --- CSV ---
+
+class _Echo:
+    """Objeto com write() que apenas devolve a linha, para o csv.writer em streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        return f'{value:.2f}'.replace('.', ',')
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return _format_datetime(value)
+    return value
+
+
+def stream_csv(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    # BOM + ';' para o Excel em pt-BR abrir com acentuação e colunas corretas.
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow([label for _key, label in COLUMNS])
+    for row in iter_export_rows(queryset, chunk_size=chunk_size):
+        yield writer.writerow([_csv_value(row[key]) for key, _label in COLUMNS])
+
+
+# --- XLSX (SpreadsheetML escrito à mão, sem dependências) ---
+
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Processos" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+class _StreamBuffer:
+    """Destino não-seekable do ZipFile; o conteúdo é drenado a cada bloco."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _xlsx_cell(value) -> str:
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        value = 'Sim' if value else 'Não'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = _format_datetime(value)
+    text = _INVALID_XML_CHARS.sub('', str(value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values) -> str:
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES_XML)
+        archive.writestr('_rels/.rels', _ROOT_RELS_XML)
+        archive.writestr('xl/workbook.xml', _WORKBOOK_XML)
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS_XML)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>'
+                + _xlsx_row(label for _key, label in COLUMNS)
+            ).encode('utf-8'))
+            pending = []
+            for row in iter_export_rows(queryset, chunk_size=chunk_size):
+                pending.append(_xlsx_row(row[key] for key, _label in COLUMNS))
+                if len(pending) >= 500:
+                    sheet.write(''.join(pending).encode('utf-8'))
+                    pending = []
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            if pending:
+                sheet.write(''.join(pending).encode('utf-8'))
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
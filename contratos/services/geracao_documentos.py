@@ -0,0 +1,271 @@
+"""
+Fila de geração de documentos (petições e ZIPs de combo) persistida em
+GeracaoDocumento.
+
+As views só validam o pedido e enfileiram; a montagem do DOCX e a conversão
+para PDF rodam numa thread do próprio processo (GERACAO_DOCUMENTOS_EM_THREAD)
+e/ou no comando `processar_geracoes_documentos`. A reserva é um UPDATE
+condicional, então thread e worker nunca executam a mesma geração duas vezes.
+
+Uma geração "executando" sem atividade há mais de
+GERACAO_DOCUMENTOS_TIMEOUT_MINUTES (thread perdida num reinício) não segura
+mais o pedido: vira erro e o pedido é enfileirado de novo. Se a execução
+antiga ainda terminar, o resultado dela é descartado.
+"""
+import hashlib
+import json
+import logging
+import threading
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from contratos.models import GeracaoDocumento
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_MINUTES = 30
+
+
+class GeracaoErro(Exception):
+    """Falha esperada (dados faltando, template ausente); a mensagem vai para o usuário."""
+
+
+def executar_em_thread() -> bool:
+    return bool(getattr(settings, 'GERACAO_DOCUMENTOS_EM_THREAD', True))
+
+
+def get_timeout_minutes() -> int:
+    try:
+        value = int(getattr(settings, 'GERACAO_DOCUMENTOS_TIMEOUT_MINUTES', DEFAULT_TIMEOUT_MINUTES))
+    except (TypeError, ValueError):
+        return DEFAULT_TIMEOUT_MINUTES
+    return value if value > 0 else DEFAULT_TIMEOUT_MINUTES
+
+
+def chave_pedido(tipo: str, processo_id: Optional[int], parametros: dict) -> str:
+    conteudo = json.dumps([tipo, processo_id, parametros], sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def expirar_travadas(chave: Optional[str] = None, minutos: Optional[int] = None) -> List[GeracaoDocumento]:
+    """
+    Marca como erro as gerações "executando" sem atividade há mais de `minutos`
+    (padrão: GERACAO_DOCUMENTOS_TIMEOUT_MINUTES), liberando a chave do pedido.
+    Retorna as gerações expiradas.
+    """
+    minutos = minutos or get_timeout_minutes()
+    agora = timezone.now()
+    travadas = GeracaoDocumento.objects.annotate(
+        ultima_atividade=Coalesce('atualizado_em', 'iniciado_em', 'criado_em'),
+    ).filter(
+        status=GeracaoDocumento.STATUS_EXECUTANDO,
+        ultima_atividade__lt=agora - timedelta(minutes=minutos),
+    )
+    if chave is not None:
+        travadas = travadas.filter(chave=chave)
+    expiradas = []
+    for geracao in travadas.select_related('criado_por'):
+        # Condicional: a thread pode ter terminado entre a consulta e o UPDATE.
+        if GeracaoDocumento.objects.filter(pk=geracao.pk, status=GeracaoDocumento.STATUS_EXECUTANDO).update(
+            status=GeracaoDocumento.STATUS_ERRO,
+            erro=f'Geração interrompida: sem atividade há mais de {minutos} minutos. Solicite novamente.',
+            finalizado_em=agora,
+        ):
+            logger.warning('Geração de documento %s sem atividade desde %s; marcada como erro.',
+                           geracao.pk, geracao.ultima_atividade)
+            expiradas.append(geracao)
+    return expiradas
+
+
+def retomar_travadas(minutos: Optional[int] = None) -> List[GeracaoDocumento]:
+    """Expira as gerações travadas e enfileira de novo os mesmos pedidos."""
+    novas = []
+    for antiga in expirar_travadas(minutos=minutos):
+        geracao, _ = enfileirar(antiga.tipo, antiga.processo_id, antiga.parametros, usuario=antiga.criado_por)
+        novas.append(geracao)
+    return novas
+
+
+def enfileirar(tipo: str, processo_id: Optional[int], parametros=None, usuario=None) -> Tuple[GeracaoDocumento, bool]:
+    """
+    Cria a geração, ou devolve a que já está pendente/em execução para o
+    mesmo pedido. Retorna (geracao, criada).
+
+    Pedidos sem processo (lotes) só são compartilhados pelo mesmo usuário: o
+    status de uma geração sem processo só é visível para quem a criou.
+    """
+    parametros = parametros or {}
+    dono = getattr(usuario, 'pk', None) if processo_id is None else None
+    chave = chave_pedido(tipo, processo_id, {**parametros, '_usuario': dono} if dono else parametros)
+    expirar_travadas(chave=chave)
+    existente = GeracaoDocumento.objects.filter(
+        chave=chave, status__in=GeracaoDocumento.STATUS_ATIVOS
+    ).first()
+    if existente is not None:
+        if existente.status == GeracaoDocumento.STATUS_PENDENTE and executar_em_thread():
+            # A thread que executaria a pendente pode ter morrido antes de
+            # reservá-la; a reserva condicional impede execução dupla.
+            transaction.on_commit(lambda: _iniciar_thread(existente.pk))
+        return existente, False
+    try:
+        with transaction.atomic():
+            geracao = GeracaoDocumento.objects.create(
+                tipo=tipo,
+                processo_id=processo_id,
+                chave=chave,
+                parametros=parametros,
+                criado_por=usuario if getattr(usuario, 'pk', None) else None,
+            )
+    except IntegrityError:
+        # Outro request criou o mesmo pedido entre a consulta e o INSERT.
+        existente = GeracaoDocumento.objects.filter(
+            chave=chave, status__in=GeracaoDocumento.STATUS_ATIVOS
+        ).first()
+        if existente is None:
+            raise
+        return existente, False
+    if executar_em_thread():
+        transaction.on_commit(lambda: _iniciar_thread(geracao.pk))
+    return geracao, True
+
+
+def _iniciar_thread(geracao_id: int):
+    thread = threading.Thread(
+        target=_executar_em_thread,
+        args=(geracao_id,),
+        name=f'geracao-documento-{geracao_id}',
+        daemon=True,
+    )
+    thread.start()
+
+
+def _executar_em_thread(geracao_id: int):
+    close_old_connections()
+    try:
+        executar_geracao(geracao_id)
+    finally:
+        close_old_connections()
+
+
+def _reservar(geracao_id: int) -> Optional[GeracaoDocumento]:
+    """Marca a geração como em execução; retorna None se outro processo já a pegou."""
+    agora = timezone.now()
+    reservadas = GeracaoDocumento.objects.filter(
+        pk=geracao_id,
+        status=GeracaoDocumento.STATUS_PENDENTE,
+    ).update(status=GeracaoDocumento.STATUS_EXECUTANDO, iniciado_em=agora, atualizado_em=agora)
+    if not reservadas:
+        return None
+    return GeracaoDocumento.objects.select_related('processo', 'criado_por').get(pk=geracao_id)
+
+
+def _executor(tipo: str) -> Callable:
+    # As rotinas de montagem dos DOCX vivem nas views/serviços que já as usavam.
+    if tipo == GeracaoDocumento.TIPO_COMBO_ZIP:
+        from contratos.services import peticao_combo
+        return peticao_combo.executar_geracao_zip
+    if tipo == GeracaoDocumento.TIPO_COMBO_PDF:
+        from contratos.services import peticao_combo
+        return peticao_combo.executar_geracao_pdf
+    if tipo == GeracaoDocumento.TIPO_LOTE_PETICOES:
+        from contratos.services import peticoes_lote
+        return peticoes_lote.executar_lote
+    from contratos import views
+    executores: Dict[str, Callable] = {
+        GeracaoDocumento.TIPO_MONITORIA: views.executar_geracao_monitoria,
+        GeracaoDocumento.TIPO_COBRANCA: views.executar_geracao_cobranca,
+        GeracaoDocumento.TIPO_HABILITACAO: views.executar_geracao_habilitacao,
+    }
+    try:
+        return executores[tipo]
+    except KeyError:
+        raise ValueError(f'Tipo de geração desconhecido: {tipo}')
+
+
+def executar_geracao(geracao_id: int) -> Optional[GeracaoDocumento]:
+    geracao = _reservar(geracao_id)
+    if geracao is None:
+        return None
+
+    def progresso(etapa: str, total: Optional[int] = None):
+        if total is not None:
+            geracao.total = total
+        elif geracao.etapa:
+            geracao.processados = min(geracao.total, geracao.processados + 1)
+        geracao.etapa = etapa[:120]
+        GeracaoDocumento.objects.filter(pk=geracao.pk, status=GeracaoDocumento.STATUS_EXECUTANDO).update(
+            etapa=geracao.etapa, total=geracao.total, processados=geracao.processados,
+            atualizado_em=timezone.now(),
+        )
+
+    try:
+        geracao.resultado = _executor(geracao.tipo)(geracao, progresso) or {}
+    except GeracaoErro as exc:
+        geracao.status = GeracaoDocumento.STATUS_ERRO
+        geracao.erro = str(exc)[:2000]
+    except Exception as exc:
+        logger.exception('Falha na geração de documento %s', geracao.pk)
+        geracao.status = GeracaoDocumento.STATUS_ERRO
+        geracao.erro = f'Erro ao gerar o documento: {exc}'[:2000]
+    else:
+        geracao.status = GeracaoDocumento.STATUS_CONCLUIDO
+        geracao.processados = geracao.total
+        geracao.etapa = ''
+    geracao.finalizado_em = timezone.now()
+    # Condicional: expirar_travadas pode ter marcado a geração como erro e o
+    # pedido já ter sido enfileirado de novo; nesse caso o resultado é descartado.
+    finalizadas = GeracaoDocumento.objects.filter(
+        pk=geracao.pk, status=GeracaoDocumento.STATUS_EXECUTANDO,
+    ).update(
+        status=geracao.status,
+        erro=geracao.erro,
+        etapa=geracao.etapa,
+        processados=geracao.processados,
+        resultado=geracao.resultado,
+        finalizado_em=geracao.finalizado_em,
+        atualizado_em=geracao.finalizado_em,
+    )
+    if not finalizadas:
+        logger.warning('Geração de documento %s expirou durante a execução; resultado descartado.', geracao.pk)
+        return None
+    return geracao
+
+
+def executar_pendentes(limite: Optional[int] = None) -> int:
+    """Executa as gerações pendentes em ordem de chegada; usado pelo worker."""
+    executadas = 0
+    ultimo_id = 0
+    while limite is None or executadas < limite:
+        proxima = (
+            GeracaoDocumento.objects.filter(status=GeracaoDocumento.STATUS_PENDENTE, pk__gt=ultimo_id)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if proxima is None:
+            break
+        ultimo_id = proxima
+        if executar_geracao(proxima) is not None:
+            executadas += 1
+    return executadas
+
+
+def serializar_geracao(geracao: GeracaoDocumento) -> dict:
+    finalizado = geracao.status in (GeracaoDocumento.STATUS_CONCLUIDO, GeracaoDocumento.STATUS_ERRO)
+    return {
+        'id': geracao.pk,
+        'tipo': geracao.tipo,
+        'status': geracao.status,
+        'etapa': geracao.etapa,
+        'total': geracao.total,
+        'processados': geracao.processados,
+        'percentual': geracao.percentual,
+        'erro': geracao.erro,
+        'finalizado': finalizado,
+        'resultado': geracao.resultado if geracao.status == GeracaoDocumento.STATUS_CONCLUIDO else None,
+    }
@@ -0,0 +1,62 @@
+"""
+Hash SHA-256 do conteúdo dos arquivos (ProcessoArquivo e anexos contínuos).
+
+O hash é calculado no save quando o arquivo chega por upload (antes de ir para
+o storage) e, para registros antigos ou arquivos gravados direto no storage,
+na primeira vez que alguém precisa dele; nos dois casos fica gravado em
+`hash_conteudo` e não é recalculado.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def calcular(arquivo) -> str:
+    """Hash de um File do Django (upload ou FieldFile ainda não gravado)."""
+    digest = hashlib.sha256()
+    for chunk in arquivo.chunks(HASH_CHUNK_BYTES):
+        digest.update(chunk)
+    if hasattr(arquivo, 'seek'):
+        arquivo.seek(0)
+    return digest.hexdigest()
+
+
+def _calcular_no_storage(field_file) -> Optional[str]:
+    if not field_file:
+        return None
+    digest = hashlib.sha256()
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as origem:
+            for chunk in iter(lambda: origem.read(HASH_CHUNK_BYTES), b''):
+                digest.update(chunk)
+    except Exception as exc:
+        logger.warning("Hash de arquivos: não foi possível ler %s: %s", field_file.name, exc)
+        return None
+    return digest.hexdigest()
+
+
+def pendente_no_upload(field_file) -> bool:
+    return bool(field_file) and not getattr(field_file, '_committed', True)
+
+
+def preencher(objetos: Iterable, leituras: int = 4):
+    """
+    Preenche `hash_conteudo` nos objetos (com campo `arquivo`), lendo do
+    storage em paralelo só os que ainda não têm. Quem não puder ser lido
+    (ausente no storage, erro de rede) continua sem hash.
+    """
+    pendentes = [obj for obj in objetos if not obj.hash_conteudo]
+    if not pendentes:
+        return
+    with ThreadPoolExecutor(max_workers=max(leituras, 1), thread_name_prefix='hash-arquivos') as executor:
+        hashes = list(executor.map(lambda obj: _calcular_no_storage(obj.arquivo), pendentes))
+    for obj, valor in zip(pendentes, hashes):
+        if not valor:
+            continue
+        type(obj).objects.filter(pk=obj.pk).update(hash_conteudo=valor)
+        obj.hash_conteudo = valor
@@ -0,0 +1,254 @@
+"""
+Cliente HTTP compartilhado pelas integrações externas (NowLex Calc, NowLex
+ERP/extrato, Gotenberg, Escavador, API de endereços).
+
+Cada serviço tem um `httpx.Client` próprio (conexões reaproveitadas entre
+requests do mesmo processo), base URL e timeouts definidos em SERVICOS,
+tentativas com backoff exponencial (tenacity) só para falhas transitórias, um
+circuit breaker que recusa chamadas por alguns segundos depois de falhas
+seguidas, e métricas de latência/erro por serviço (`metricas()`).
+
+Os clientes, o circuito e as métricas valem por processo.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+from django.conf import settings
+from tenacity import (
+    RetryError, Retrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter, wait_none,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FALHAS_PARA_ABRIR = 5
+DEFAULT_CIRCUITO_ABERTO_SECONDS = 30
+DEFAULT_MAX_TENTATIVAS = 3
+STATUS_TRANSITORIOS = {429, 502, 503, 504}
+AMOSTRAS_LATENCIA = 200
+
+
+class CircuitoAberto(httpx.HTTPError):
+    """
+    O serviço falhou seguidamente e as chamadas estão suspensas. Herda de
+    httpx.HTTPError para cair no mesmo tratamento das falhas de conexão.
+    """
+
+
+class _RespostaTransitoria(Exception):
+    def __init__(self, response: httpx.Response):
+        super().__init__(f'HTTP {response.status_code}')
+        self.response = response
+
+
+@dataclass
+class ServicoHttp:
+    nome: str
+    base_url_setting: str
+    base_url_padrao: str = ''
+    timeout: float = 30
+    connect_timeout: float = 5
+
+
+SERVICOS: Dict[str, ServicoHttp] = {
+    'nowlex_calc': ServicoHttp('nowlex_calc', 'NOWLEX_CALC_API_BASE', 'https://calc.nowlex.com', timeout=60),
+    'nowlex_erp': ServicoHttp('nowlex_erp', 'NOWLEX_ERP_API_BASE', 'https://erp-api.nowlex.com', timeout=60),
+    'gotenberg': ServicoHttp('gotenberg', 'GOTENBERG_URL', timeout=120),
+    'escavador': ServicoHttp('escavador', 'ESCAVADOR_API_BASE', 'https://api.escavador.com/api/v2', timeout=15),
+    'enderecos': ServicoHttp(
+        'enderecos', 'ENDERECOS_API_BASE', 'https://nowlex-mini-erp-api.onrender.com', timeout=10
+    ),
+}
+
+
+def _setting_int(nome: str, default: int) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+class _Circuito:
+    """Fechado → aberto após N falhas seguidas → meio-aberto (uma chamada de teste) após o intervalo."""
+
+    def __init__(self, falhas_para_abrir: int, aberto_segundos: int):
+        self.falhas_para_abrir = falhas_para_abrir
+        self.aberto_segundos = aberto_segundos
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.falhas < self.falhas_para_abrir:
+                return True
+            if time.monotonic() < self.aberto_ate or self.teste_em_andamento:
+                return False
+            self.teste_em_andamento = True
+            return True
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.teste_em_andamento = False
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            self.teste_em_andamento = False
+            if self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = time.monotonic() + self.aberto_segundos
+
+    @property
+    def estado(self) -> str:
+        if self.falhas < self.falhas_para_abrir:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self.aberto_ate else 'meio-aberto'
+
+
+class _Metricas:
+    def __init__(self):
+        self.requisicoes = 0
+        self.erros = 0
+        self.novas_tentativas = 0
+        self.recusadas = 0
+        self.latencias_ms = deque(maxlen=AMOSTRAS_LATENCIA)
+        self._lock = threading.Lock()
+
+    def registrar(self, duracao_ms: float, erro: bool, tentativas: int):
+        with self._lock:
+            self.requisicoes += 1
+            self.erros += int(erro)
+            self.novas_tentativas += max(tentativas - 1, 0)
+            self.latencias_ms.append(duracao_ms)
+
+    def recusar(self):
+        with self._lock:
+            self.recusadas += 1
+
+    def resumo(self) -> dict:
+        with self._lock:
+            amostras = sorted(self.latencias_ms)
+            return {
+                'requisicoes': self.requisicoes,
+                'erros': self.erros,
+                'novas_tentativas': self.novas_tentativas,
+                'recusadas_circuito_aberto': self.recusadas,
+                'latencia_media_ms': int(sum(amostras) / len(amostras)) if amostras else 0,
+                'latencia_p95_ms': int(amostras[int(len(amostras) * 0.95) - 1]) if amostras else 0,
+            }
+
+
+class ClienteIntegracao:
+    def __init__(self, servico: ServicoHttp, transport: Optional[httpx.BaseTransport] = None, espera_base: float = 0.5):
+        self.servico = servico
+        self.max_tentativas = _setting_int('INTEGRACOES_HTTP_MAX_TENTATIVAS', DEFAULT_MAX_TENTATIVAS)
+        self.espera_base = espera_base
+        self.circuito = _Circuito(
+            _setting_int('INTEGRACOES_HTTP_FALHAS_PARA_ABRIR', DEFAULT_FALHAS_PARA_ABRIR),
+            _setting_int('INTEGRACOES_HTTP_CIRCUITO_ABERTO_SECONDS', DEFAULT_CIRCUITO_ABERTO_SECONDS),
+        )
+        self.metricas = _Metricas()
+        base_url = str(getattr(settings, servico.base_url_setting, '') or servico.base_url_padrao).rstrip('/')
+        self.client = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(servico.timeout, connect=servico.connect_timeout),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            transport=transport,
+            # requests seguia redirecionamentos por padrão; o httpx não.
+            follow_redirects=True,
+        )
+
+    @property
+    def configurado(self) -> bool:
+        return bool(str(self.client.base_url).strip('/'))
+
+    def request(self, method: str, url: str, *, tentativas: Optional[int] = None, **kwargs) -> httpx.Response:
+        """
+        Envia a requisição e devolve a resposta (inclusive 4xx/5xx finais; quem
+        chama decide o que fazer). Só GET tem novas tentativas por padrão;
+        informe `tentativas` para POSTs idempotentes.
+        """
+        if tentativas is None:
+            tentativas = self.max_tentativas if method.upper() == 'GET' else 1
+        if not self.circuito.permitir():
+            self.metricas.recusar()
+            raise CircuitoAberto(f'{self.servico.nome}: serviço indisponível, chamadas suspensas temporariamente.')
+
+        inicio = time.monotonic()
+        tentativa_atual = 0
+        erro = True
+        try:
+            for tentativa in Retrying(
+                stop=stop_after_attempt(max(tentativas, 1)),
+                wait=wait_exponential_jitter(initial=self.espera_base, max=5) if self.espera_base else wait_none(),
+                retry=retry_if_exception(lambda exc: isinstance(exc, (httpx.TransportError, _RespostaTransitoria))),
+            ):
+                with tentativa:
+                    tentativa_atual = tentativa.retry_state.attempt_number
+                    response = self.client.request(method, url, **kwargs)
+                    if response.status_code in STATUS_TRANSITORIOS:
+                        raise _RespostaTransitoria(response)
+            erro = response.status_code >= 500
+            return response
+        except RetryError as exc:
+            falha = exc.last_attempt.exception()
+            if isinstance(falha, _RespostaTransitoria):
+                return falha.response
+            raise falha
+        finally:
+            duracao_ms = (time.monotonic() - inicio) * 1000
+            self.metricas.registrar(duracao_ms, erro, tentativa_atual)
+            if erro:
+                self.circuito.falha()
+                logger.warning(
+                    '%s %s %s falhou após %s tentativa(s) em %d ms',
+                    self.servico.nome, method.upper(), url, tentativa_atual, duracao_ms,
+                )
+            else:
+                self.circuito.sucesso()
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request('POST', url, **kwargs)
+
+    def fechar(self):
+        self.client.close()
+
+
+_clientes: Dict[str, ClienteIntegracao] = {}
+_clientes_lock = threading.Lock()
+
+
+def cliente(nome: str) -> ClienteIntegracao:
+    """Cliente do serviço para o processo atual, criado no primeiro uso."""
+    existente = _clientes.get(nome)
+    if existente is not None:
+        return existente
+    with _clientes_lock:
+        if nome not in _clientes:
+            _clientes[nome] = ClienteIntegracao(SERVICOS[nome])
+        return _clientes[nome]
+
+
+def fechar_clientes():
+    """Fecha e descarta os clientes (ex.: após mudar base URLs nos testes)."""
+    with _clientes_lock:
+        for existente in _clientes.values():
+            existente.fechar()
+        _clientes.clear()
+
+
+def metricas() -> Dict[str, dict]:
+    return {
+        nome: {**existente.metricas.resumo(), 'circuito': existente.circuito.estado}
+        for nome, existente in sorted(_clientes.items())
+    }
@@ -0,0 +1,905 @@
+"""
+Camada de consultas de KPI agregadas no banco.
+
+Cada KPI é uma consulta nomeada e parametrizada (GROUP BY no SQL), registrada
+em `KPI_QUERIES` e executada por `run(nome, **parametros)`. O pertencimento de
+um processo a uma carteira segue o dashboard: carteira principal mais as
+carteiras vinculadas, sem duplicar o processo na mesma carteira.
+"""
+import datetime
+import json
+import zoneinfo
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from contratos.models import (
+    AnaliseProcesso, Carteira, Parte, Prazo, ProcessoArquivo, ProcessoJudicial, StatusProcessual, Tarefa,
+)
+from contratos.services.classificacao_arquivos import TIPOS_PETICAO
+
+KPI_QUERIES: Dict[str, Callable[..., List[dict]]] = {}
+
+
+def kpi_query(name: str):
+    def decorator(func):
+        KPI_QUERIES[name] = func
+        return func
+    return decorator
+
+
+def run(name: str, **params) -> List[dict]:
+    try:
+        query = KPI_QUERIES[name]
+    except KeyError:
+        raise KeyError(f'Consulta de KPI desconhecida: {name}') from None
+    return query(**params)
+
+
+def _qn(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _ids(values: Optional[Iterable]) -> Optional[List[int]]:
+    if values is None:
+        return None
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return sorted(set(ids))
+
+
+def _in_clause(column: str, values: Optional[List[int]]) -> Tuple[str, list]:
+    if values is None:
+        return '', []
+    if not values:
+        return ' AND 1 = 0', []
+    return f" AND {column} IN ({', '.join(['%s'] * len(values))})", list(values)
+
+
+def _decimal(value) -> Decimal:
+    if value is None:
+        return Decimal('0.00')
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _fetch(sql: str, params: list) -> List[tuple]:
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _membros_cte() -> str:
+    """CTE `membros(processo_id, carteira_id)`: carteira principal ∪ vinculadas."""
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    vinculos = _qn(ProcessoJudicial.carteiras_vinculadas.through._meta.db_table)
+    return (
+        f'membros AS ('
+        f' SELECT p.id AS processo_id, p.carteira_id AS carteira_id'
+        f' FROM {processo} p WHERE p.carteira_id IS NOT NULL'
+        f' UNION'
+        f' SELECT v.processojudicial_id AS processo_id, v.carteira_id AS carteira_id'
+        f' FROM {vinculos} v'
+        f')'
+    )
+
+
+@kpi_query('processos_por_status')
+def processos_por_status(carteira_ids=None) -> List[dict]:
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    status = _qn(StatusProcessual._meta.db_table)
+    filtro, params = _in_clause('m.carteira_id', _ids(carteira_ids))
+    sql = (
+        f'WITH {_membros_cte()} '
+        f'SELECT m.carteira_id, p.status_id, s.nome, COUNT(*) '
+        f'FROM membros m '
+        f'JOIN {processo} p ON p.id = m.processo_id '
+        f'LEFT JOIN {status} s ON s.id = p.status_id '
+        f'WHERE 1 = 1{filtro} '
+        f'GROUP BY m.carteira_id, p.status_id, s.nome '
+        f'ORDER BY m.carteira_id, s.nome'
+    )
+    return [
+        {
+            'carteira_id': carteira_id,
+            'status_id': status_id,
+            'status_nome': status_nome or 'Sem classe',
+            'processos': int(total),
+        }
+        for carteira_id, status_id, status_nome, total in _fetch(sql, params)
+    ]
+
+
+@kpi_query('valores_por_carteira')
+def valores_por_carteira(carteira_ids=None) -> List[dict]:
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    filtro, params = _in_clause('m.carteira_id', _ids(carteira_ids))
+    sql = (
+        f'WITH {_membros_cte()} '
+        f'SELECT m.carteira_id, COUNT(*), SUM(p.valor_causa), SUM(p.soma_contratos) '
+        f'FROM membros m '
+        f'JOIN {processo} p ON p.id = m.processo_id '
+        f'WHERE 1 = 1{filtro} '
+        f'GROUP BY m.carteira_id '
+        f'ORDER BY m.carteira_id'
+    )
+    return [
+        {
+            'carteira_id': carteira_id,
+            'processos': int(total),
+            'valor_causa_total': _decimal(valor_causa),
+            'soma_contratos_total': _decimal(soma_contratos),
+        }
+        for carteira_id, total, valor_causa, soma_contratos in _fetch(sql, params)
+    ]
+
+
+def arquivos_classificados_queryset():
+    """ProcessoArquivo das peças de petição, anotado com `tipo_peca` (slug)."""
+    return (
+        ProcessoArquivo.objects.filter(processo_id__isnull=False, tipo_documento__in=TIPOS_PETICAO)
+        .annotate(tipo_peca=F('tipo_documento'))
+        .order_by()
+    )
+
+
+def _pecas_cte() -> Tuple[str, list]:
+    sql, params = arquivos_classificados_queryset().values('id', 'processo_id', 'tipo_peca').query.sql_with_params()
+    return f'pecas AS ({sql})', list(params)
+
+
+@kpi_query('peticoes_por_tipo')
+def peticoes_por_tipo(carteira_ids=None) -> List[dict]:
+    """Peças geradas por (carteira, tipo): quantidade de arquivos e de processos."""
+    pecas_cte, params = _pecas_cte()
+    filtro, filtro_params = _in_clause('m.carteira_id', _ids(carteira_ids))
+    sql = (
+        f'WITH {pecas_cte}, {_membros_cte()} '
+        f'SELECT m.carteira_id, pc.tipo_peca, COUNT(*), COUNT(DISTINCT pc.processo_id) '
+        f'FROM pecas pc '
+        f'JOIN membros m ON m.processo_id = pc.processo_id '
+        f'WHERE 1 = 1{filtro} '
+        f'GROUP BY m.carteira_id, pc.tipo_peca '
+        f'ORDER BY m.carteira_id, pc.tipo_peca'
+    )
+    return [
+        {'carteira_id': carteira_id, 'tipo': tipo, 'pecas': int(pecas), 'processos': int(processos)}
+        for carteira_id, tipo, pecas, processos in _fetch(sql, params + filtro_params)
+    ]
+
+
+@kpi_query('peticoes_processos_por_carteira')
+def peticoes_processos_por_carteira(carteira_ids=None) -> List[dict]:
+    """Processos distintos com alguma peça reconhecida, por carteira."""
+    pecas_cte, params = _pecas_cte()
+    filtro, filtro_params = _in_clause('m.carteira_id', _ids(carteira_ids))
+    sql = (
+        f'WITH {pecas_cte}, {_membros_cte()} '
+        f'SELECT m.carteira_id, COUNT(DISTINCT pc.processo_id) '
+        f'FROM pecas pc '
+        f'JOIN membros m ON m.processo_id = pc.processo_id '
+        f'WHERE 1 = 1{filtro} '
+        f'GROUP BY m.carteira_id '
+        f'ORDER BY m.carteira_id'
+    )
+    return [
+        {'carteira_id': carteira_id, 'processos': int(processos)}
+        for carteira_id, processos in _fetch(sql, params + filtro_params)
+    ]
+
+
+@kpi_query('peticoes_totais')
+def peticoes_totais(carteira_ids=None) -> List[dict]:
+    """Totais por tipo de peça, contando cada arquivo uma vez (processos com carteira)."""
+    pecas_cte, params = _pecas_cte()
+    filtro, filtro_params = _in_clause('m.carteira_id', _ids(carteira_ids))
+    sql = (
+        f'WITH {pecas_cte}, {_membros_cte()} '
+        f'SELECT pc.tipo_peca, COUNT(*), COUNT(DISTINCT pc.processo_id) '
+        f'FROM pecas pc '
+        f'WHERE pc.processo_id IN (SELECT m.processo_id FROM membros m WHERE 1 = 1{filtro}) '
+        f'GROUP BY pc.tipo_peca '
+        f'ORDER BY pc.tipo_peca'
+    )
+    return [
+        {'tipo': tipo, 'pecas': int(pecas), 'processos': int(processos)}
+        for tipo, pecas, processos in _fetch(sql, params + filtro_params)
+    ]
+
+
+@kpi_query('pendencias_por_responsavel')
+def pendencias_por_responsavel(carteira_ids=None, agora=None) -> List[dict]:
+    """
+    Tarefas e prazos em aberto por (responsável, carteira principal do processo),
+    com quantos já estão vencidos em `agora`.
+    """
+    agora = agora or timezone.now()
+    hoje = timezone.localdate(agora) if timezone.is_aware(agora) else agora.date()
+    ids = _ids(carteira_ids)
+    linhas: Dict[Tuple[Optional[int], Optional[int]], dict] = {}
+
+    def _linha(responsavel_id, carteira_id):
+        return linhas.setdefault(
+            (responsavel_id, carteira_id),
+            {
+                'responsavel_id': responsavel_id,
+                'carteira_id': carteira_id,
+                'tarefas_abertas': 0,
+                'tarefas_vencidas': 0,
+                'prazos_abertos': 0,
+                'prazos_vencidos': 0,
+            },
+        )
+
+    tarefas = Tarefa.objects.filter(concluida=False)
+    prazos = Prazo.objects.filter(concluido=False)
+    if ids is not None:
+        tarefas = tarefas.filter(processo__carteira_id__in=ids)
+        prazos = prazos.filter(processo__carteira_id__in=ids)
+
+    for row in (
+        tarefas.values('responsavel_id', 'processo__carteira_id')
+        .annotate(abertas=Count('id'), vencidas=Count('id', filter=Q(data__lt=hoje)))
+        .order_by()
+    ):
+        linha = _linha(row['responsavel_id'], row['processo__carteira_id'])
+        linha['tarefas_abertas'] += row['abertas']
+        linha['tarefas_vencidas'] += row['vencidas']
+
+    for row in (
+        prazos.values('responsavel_id', 'processo__carteira_id')
+        .annotate(abertos=Count('id'), vencidos=Count('id', filter=Q(data_limite__lt=agora)))
+        .order_by()
+    ):
+        linha = _linha(row['responsavel_id'], row['processo__carteira_id'])
+        linha['prazos_abertos'] += row['abertos']
+        linha['prazos_vencidos'] += row['vencidos']
+
+    return sorted(linhas.values(), key=lambda item: (item['responsavel_id'] or 0, item['carteira_id'] or 0))
+
+
+# --- Análises (cards salvos em AnaliseProcesso.respostas) ---
+#
+# Os cards de uma análise são a lista salva (`saved_processos_vinculados`) ou,
+# sem ela, a ativa (`processos_vinculados`). O tipo de análise de um card sai
+# de uma heurística em Python (id, slug, nome, hashtag, chaves respondidas):
+# `analises_assinaturas` devolve as combinações distintas desses campos, o
+# dashboard resolve cada uma e as demais consultas recebem o resultado em
+# `tipos` = {assinatura: (grupo, carteira_fixa)}. A carteira do card vale;
+# sem ela, `carteira_fixa` (Passivas) e depois a principal do processo ou a
+# primeira vinculada por nome.
+#
+# PostgreSQL usa jsonb; o SQLite do ambiente local usa JSON1 e aproxima o
+# fuso horário pelo deslocamento atual.
+
+RESPOSTAS_TECNICAS = ('ativar_botao_monitoria', 'contratos_para_monitoria')
+
+_ACENTOS = 'áàâãäåéèêëíìîïóòôõöúùûüçñýÿÁÀÂÃÄÅÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑÝ'
+_SEM_ACENTOS = 'aaaaaaeeeeiiiiooooouuuucnyyAAAAAAEEEEIIIIOOOOOUUUUCNY'
+_RESPOSTAS_SIM = "('sim', 's', 'yes', 'y')"
+_RESPOSTAS_NAO = "('nao', 'n', 'no')"
+_INICIAR_CS = "('iniciar cs', 'iniciar c.s.', 'iniciar cumprimento de sentenca')"
+_VAZIOS = "('', '---', '-', '—')"
+_DATA_ISO = r'^[0-9]{4}-[0-9]{2}-[0-9]{2}([T ][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]+)?)?(Z|[+-][0-9]{2}:[0-9]{2})?)?$'
+_COM_FUSO = r'(Z|[+-][0-9]{2}:[0-9]{2})$'
+_SEP_CAMPO = '\x1f'
+_SEP_CHAVE = '\x1e'
+
+
+def _postgres() -> bool:
+    return connection.vendor == 'postgresql'
+
+
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _espacos() -> str:
+    char = 'chr' if _postgres() else 'char'
+    return "' ' || " + ' || '.join(f'{char}({codigo})' for codigo in (9, 10, 11, 12, 13))
+
+
+def _aparado(expr: str) -> str:
+    return f"{'btrim' if _postgres() else 'trim'}({expr}, {_espacos()})"
+
+
+def _regex(expr: str, padrao: str) -> str:
+    return f"{expr} {'~' if _postgres() else 'REGEXP'} {_literal(padrao)}"
+
+
+def _normalizado(expr: str) -> str:
+    """Minúsculas, sem acentos e com espaços colapsados (como `_normalize_answer` do dashboard)."""
+    if _postgres():
+        return (
+            f"btrim(regexp_replace(lower(translate({expr}, '{_ACENTOS}', '{_SEM_ACENTOS}')), "
+            f"'[[:space:]]+', ' ', 'g'))"
+        )
+    for origem, destino in zip(_ACENTOS, _SEM_ACENTOS):
+        expr = f"replace({expr}, '{origem}', '{destino}')"
+    for codigo in (9, 10, 11, 12, 13):
+        expr = f"replace({expr}, char({codigo}), ' ')"
+    expr = f'lower({expr})'
+    for _ in range(5):
+        expr = f"replace({expr}, '  ', ' ')"
+    return f'trim({expr})'
+
+
+def _caminho(chaves: Tuple[str, ...]) -> str:
+    if _postgres():
+        return "'{" + ','.join(chaves) + "}'"
+    return "'$." + '.'.join(chaves) + "'"
+
+
+def _json_tipo(doc: str, *chaves: str) -> str:
+    """Tipo do valor com os nomes do SQLite ('object', 'array', 'text', ...)."""
+    if _postgres():
+        return (
+            f"(CASE jsonb_typeof({doc} #> {_caminho(chaves)}) WHEN 'string' THEN 'text' "
+            f"ELSE jsonb_typeof({doc} #> {_caminho(chaves)}) END)"
+        )
+    return f'json_type({doc}, {_caminho(chaves)})'
+
+
+def _json_texto(doc: str, *chaves: str) -> str:
+    """Valor como texto (strings sem aspas); NULL quando ausente ou null."""
+    if _postgres():
+        return f'({doc} #>> {_caminho(chaves)})'
+    caminho = _caminho(chaves)
+    return (
+        f"(CASE json_type({doc}, {caminho}) WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' "
+        f"ELSE CAST(json_extract({doc}, {caminho}) AS TEXT) END)"
+    )
+
+
+def _json_documento(doc: str, *chaves: str) -> str:
+    """Valor serializado em JSON ('null' quando ausente)."""
+    if _postgres():
+        return f"COALESCE(CAST(({doc} #> {_caminho(chaves)}) AS TEXT), 'null')"
+    return f'json_quote(json_extract({doc}, {_caminho(chaves)}))'
+
+
+def _json_inteiro(doc: str, *chaves: str) -> str:
+    """Inteiro do valor como `int()` aceitaria (número, texto com dígitos ou booleano)."""
+    tipo = _json_tipo(doc, *chaves)
+    texto = _aparado(_json_texto(doc, *chaves))
+    inteiro = 'BIGINT' if _postgres() else 'INTEGER'
+    if _postgres():
+        numero = (
+            f"CASE WHEN {_regex(_json_texto(doc, *chaves), '^-?[0-9]{1,18}([.][0-9]+)?$')} "
+            f"THEN CAST(trunc(CAST({_json_texto(doc, *chaves)} AS NUMERIC)) AS BIGINT) END"
+        )
+    else:
+        numero = f'CAST(json_extract({doc}, {_caminho(chaves)}) AS INTEGER)'
+    return (
+        f"(CASE {tipo} "
+        f"WHEN 'integer' THEN {numero} WHEN 'real' THEN {numero} WHEN 'number' THEN {numero} "
+        f"WHEN 'text' THEN CASE WHEN {_regex(texto, '^[+-]?[0-9]{1,18}$')} THEN CAST({texto} AS {inteiro}) END "
+        f"WHEN 'true' THEN 1 WHEN 'boolean' THEN CASE WHEN {_json_texto(doc, *chaves)} = 'true' THEN 1 ELSE 0 END "
+        f"WHEN 'false' THEN 0 END)"
+    )
+
+
+def _preenchido(doc: str, chave: str, somente_objeto: bool = False) -> str:
+    """Existe alguma folha preenchida (não nula, não vazia, não '---') em doc[chave]?"""
+    if _postgres():
+        alvo = f"{doc} -> '{chave}'"
+        if somente_objeto:
+            alvo = f"CASE WHEN jsonb_typeof({alvo}) = 'object' THEN {alvo} END"
+        texto = _aparado("folha.valor #>> '{}'")
+        return (
+            f"EXISTS (SELECT 1 FROM jsonb_path_query({alvo}, 'strict $.**') AS folha(valor) "
+            f"WHERE jsonb_typeof(folha.valor) NOT IN ('object', 'array', 'null') "
+            f"AND (jsonb_typeof(folha.valor) <> 'string' OR {texto} NOT IN {_VAZIOS}))"
+        )
+    caminho = _caminho((chave,))
+    objeto = f"json_type({doc}, {caminho}) = 'object' AND " if somente_objeto else ''
+    return (
+        f"EXISTS (SELECT 1 FROM json_tree({doc}, {caminho}) AS folha "
+        f"WHERE {objeto}folha.type NOT IN ('object', 'array', 'null') "
+        f"AND (folha.type <> 'text' OR {_aparado('folha.atom')} NOT IN {_VAZIOS}))"
+    )
+
+
+def _com_conteudo(card: str) -> str:
+    return f"({_preenchido(card, 'observacoes')} OR {_preenchido(card, 'tipo_de_acao_respostas', True)})"
+
+
+def _data_local(texto: str, fuso: str) -> str:
+    """Data local de um timestamp ISO em texto; NULL quando não é uma data válida."""
+    texto = _aparado(texto)
+    if _postgres():
+        valido_com_fuso = valido_sem_fuso = 'TRUE'
+        if connection.pg_version >= 160000:
+            valido_com_fuso = f"pg_input_is_valid({texto}, 'timestamptz')"
+            valido_sem_fuso = f"pg_input_is_valid({texto}, 'timestamp')"
+        return (
+            f"(CASE WHEN {_regex(texto, _DATA_ISO)} THEN CASE "
+            f"WHEN {_regex(texto, _COM_FUSO)} THEN CASE WHEN {valido_com_fuso} "
+            f"THEN CAST(CAST({texto} AS TIMESTAMPTZ) AT TIME ZONE {_literal(fuso)} AS DATE) END "
+            f"ELSE CASE WHEN {valido_sem_fuso} THEN CAST(CAST({texto} AS TIMESTAMP) AS DATE) END END END)"
+        )
+    dia = f'substr({texto}, 1, 10)'
+    return (
+        f"(CASE WHEN {_regex(texto, _DATA_ISO)} AND date({dia}, '+0 days') = {dia} THEN CASE "
+        f"WHEN {_regex(texto, _COM_FUSO)} THEN date({texto}, {_literal(_deslocamento(fuso))}) "
+        f"ELSE date({texto}) END END)"
+    )
+
+
+def _deslocamento(fuso: str) -> str:
+    """Deslocamento atual do fuso como modificador de data do SQLite."""
+    minutos = int(timezone.now().astimezone(zoneinfo.ZoneInfo(fuso)).utcoffset().total_seconds() // 60)
+    return f'{minutos:+d} minutes'
+
+
+def _data_registro_local(coluna: str, fuso: str) -> str:
+    if _postgres():
+        return f'CAST({coluna} AT TIME ZONE {_literal(fuso)} AS DATE)'
+    return f'date({coluna}, {_literal(_deslocamento(fuso))})'
+
+
+def _ordem(processo_id: str, idx: str) -> str:
+    """Chave textual que ordena os cards por (processo, posição na lista)."""
+    if _postgres():
+        return f"(lpad(CAST({processo_id} AS TEXT), 12, '0') || lpad(CAST({idx} AS TEXT), 6, '0'))"
+    return f"(substr('000000000000' || {processo_id}, -12) || substr('000000' || {idx}, -6))"
+
+
+def _uf(processo: str) -> str:
+    return f"COALESCE(NULLIF(upper({_aparado(f'{processo}.uf')}), ''), 'SEM_UF')"
+
+
+def _cards_ctes() -> str:
+    """
+    CTEs `analises(processo_id, updated_at, updated_by_id, lista)` e
+    `cards(processo_id, updated_at, updated_by_id, idx, card)`.
+    """
+    analise = _qn(AnaliseProcesso._meta.db_table)
+    if _postgres():
+        listas = [f"ap.respostas -> '{chave}'" for chave in ('saved_processos_vinculados', 'processos_vinculados')]
+        casos = ' '.join(
+            f"WHEN jsonb_typeof({lista}) = 'array' AND {lista} <> '[]'::jsonb THEN {lista}" for lista in listas
+        )
+        expansao = (
+            'FROM analises a CROSS JOIN LATERAL jsonb_array_elements(a.lista) WITH ORDINALITY AS c(card, idx) '
+            "WHERE jsonb_typeof(c.card) = 'object'"
+        )
+        colunas = 'c.idx, c.card'
+    else:
+        casos = ' '.join(
+            f"WHEN json_type(ap.respostas, '$.{chave}') = 'array' "
+            f"AND json_array_length(ap.respostas, '$.{chave}') > 0 "
+            f"THEN json_extract(ap.respostas, '$.{chave}')"
+            for chave in ('saved_processos_vinculados', 'processos_vinculados')
+        )
+        expansao = "FROM analises a, json_each(a.lista) AS c WHERE c.type = 'object'"
+        colunas = 'CAST(c.key AS INTEGER) AS idx, c.value AS card'
+    return (
+        f'analises AS ('
+        f' SELECT ap.processo_judicial_id AS processo_id, ap.updated_at, ap.updated_by_id,'
+        f' CASE {casos} END AS lista'
+        f' FROM {analise} ap'
+        f'), '
+        f'cards AS ('
+        f' SELECT a.processo_id, a.updated_at, a.updated_by_id, {colunas} {expansao}'
+        f')'
+    )
+
+
+def _cpfs_ctes() -> str:
+    """CTE `cpfs(processo_id, cpf)`: dígitos dos documentos do polo passivo."""
+    parte = _qn(Parte._meta.db_table)
+    partes = (
+        f"FROM {parte} pt WHERE pt.tipo_polo = 'PASSIVO' AND pt.documento IS NOT NULL AND pt.documento <> ''"
+    )
+    if _postgres():
+        return (
+            f'cpfs AS ('
+            f" SELECT DISTINCT d.processo_id, d.cpf FROM ("
+            f" SELECT pt.processo_id, regexp_replace(pt.documento, '[^0-9]', '', 'g') AS cpf {partes}"
+            f") d WHERE d.cpf <> '')"
+        )
+    return (
+        f'cpf_digitos(processo_id, resto, cpf) AS ('
+        f" SELECT pt.processo_id, pt.documento, '' {partes}"
+        f' UNION ALL'
+        f' SELECT processo_id, substr(resto, 2),'
+        f" cpf || CASE WHEN substr(resto, 1, 1) BETWEEN '0' AND '9' THEN substr(resto, 1, 1) ELSE '' END"
+        f" FROM cpf_digitos WHERE resto <> ''"
+        f'), '
+        f"cpfs AS (SELECT DISTINCT processo_id, cpf FROM cpf_digitos WHERE resto = '' AND cpf <> '')"
+    )
+
+
+def _assinatura(card: str) -> str:
+    """analysis_type, tipo_de_acao e chaves respondidas do card, serializados."""
+    respostas = 'tipo_de_acao_respostas'
+    if _postgres():
+        objeto = f"CASE WHEN jsonb_typeof({card} -> '{respostas}') = 'object' THEN {card} -> '{respostas}' END"
+        chaves = (
+            f'(SELECT string_agg(chave.nome, chr(30) ORDER BY chave.ordem) '
+            f'FROM jsonb_object_keys({objeto}) WITH ORDINALITY AS chave(nome, ordem))'
+        )
+        separador = 'chr(31)'
+    else:
+        chaves = (
+            f"(SELECT group_concat(chave.key, char(30)) FROM json_each({card}, '$.{respostas}') AS chave "
+            f"WHERE json_type({card}, '$.{respostas}') = 'object')"
+        )
+        separador = 'char(31)'
+    return (
+        f"({_json_documento(card, 'analysis_type')} || {separador} || "
+        f"{_json_documento(card, respostas, 'tipo_de_acao')} || {separador} || COALESCE({chaves}, ''))"
+    )
+
+
+def _membro(processo_id: str, carteira_id: str) -> str:
+    return f'EXISTS (SELECT 1 FROM membros m WHERE m.processo_id = {processo_id} AND m.carteira_id = {carteira_id})'
+
+
+def _analises_ctes(tipos, carteira_ids, passivas_carteira_id) -> Tuple[str, list]:
+    """
+    CTEs comuns das consultas de análise, terminando em `selecionados`: um
+    registro por card com (processo_id, idx, card, updated_at, updated_by_id,
+    grupo, uf, carteira_id), já filtrado pelas carteiras pedidas.
+    """
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    vinculos = _qn(ProcessoJudicial.carteiras_vinculadas.through._meta.db_table)
+    carteira = _qn(Carteira._meta.db_table)
+    valores = ', '.join(['(CAST(%s AS TEXT), CAST(%s AS INTEGER), CAST(%s AS BIGINT))'] * len(tipos))
+    params = []
+    for assinatura, (grupo, carteira_fixa) in tipos.items():
+        params.extend([assinatura, grupo, carteira_fixa])
+    carteira_padrao = (
+        f'COALESCE(p.carteira_id, (SELECT v.carteira_id FROM {vinculos} v '
+        f'JOIN {carteira} k ON k.id = v.carteira_id '
+        f'WHERE v.processojudicial_id = p.id ORDER BY k.nome, k.id LIMIT 1))'
+    )
+    ids = _ids(carteira_ids)
+    filtro, filtro_params = _in_clause('r.carteira_id', ids)
+    if ids is not None:
+        # Fora da carteira Passivas, o card só conta se o processo pertence à carteira.
+        filtro += f" AND (r.carteira_id = %s OR {_membro('r.processo_id', 'r.carteira_id')})"
+        filtro_params.append(passivas_carteira_id)
+    ctes = (
+        f'{_membros_cte()}, {_cards_ctes()}, {_cpfs_ctes()}, '
+        f'tipos(assinatura, grupo, carteira_fixa) AS (VALUES {valores}), '
+        f'resolvidos AS ('
+        f' SELECT c.processo_id, c.idx, c.card, c.updated_at, c.updated_by_id, t.grupo, {_uf("p")} AS uf,'
+        f" COALESCE(NULLIF({_json_inteiro('c.card', 'carteira_id')}, 0), t.carteira_fixa, {carteira_padrao})"
+        f' AS carteira_id'
+        f' FROM cards c'
+        f' JOIN {processo} p ON p.id = c.processo_id'
+        f" JOIN tipos t ON t.assinatura = {_assinatura('c.card')}"
+        f'), '
+        f'selecionados AS (SELECT r.* FROM resolvidos r WHERE r.carteira_id IS NOT NULL{filtro})'
+    )
+    return ctes, params + filtro_params
+
+
+def _niveis(origem: str) -> str:
+    """Cada registro na sua UF e de novo no total (nivel '')."""
+    return f"SELECT o.uf AS nivel, o.* FROM {origem} o UNION ALL SELECT '' AS nivel, o.* FROM {origem} o"
+
+
+def _nivel_uf(nivel: str) -> Optional[str]:
+    return nivel or None
+
+
+def _como_data(value) -> Optional[datetime.date]:
+    if value is None or isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+@kpi_query('analises_assinaturas')
+def analises_assinaturas() -> List[dict]:
+    """
+    Combinações distintas dos campos que definem o tipo de um card:
+    `analysis_type` e `respostas` (chaves de tipo_de_acao_respostas, com o
+    valor de tipo_de_acao), prontos para a resolução do dashboard.
+    """
+    sql = f'WITH {_cards_ctes()} SELECT DISTINCT {_assinatura("c.card")} FROM cards c'
+    linhas = []
+    for (assinatura,) in _fetch(sql, []):
+        analysis_type, tipo_de_acao, chaves = assinatura.split(_SEP_CAMPO, 2)
+        respostas = dict.fromkeys(chaves.split(_SEP_CHAVE) if chaves else [])
+        if 'tipo_de_acao' in respostas:
+            respostas['tipo_de_acao'] = json.loads(tipo_de_acao)
+        linhas.append(
+            {'assinatura': assinatura, 'analysis_type': json.loads(analysis_type), 'respostas': respostas}
+        )
+    return linhas
+
+
+@kpi_query('analises_ufs')
+def analises_ufs(carteira_ids=None, passivas_carteira_id=None) -> List[dict]:
+    """UFs dos processos com cards de análise (os da carteira, exceto quando ela é Passivas)."""
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    ids = _ids(carteira_ids)
+    filtro, params = '', []
+    if ids is not None and passivas_carteira_id not in ids:
+        membros, params = _in_clause('m.carteira_id', ids)
+        filtro = f' AND EXISTS (SELECT 1 FROM membros m WHERE m.processo_id = p.id{membros})'
+    sql = (
+        f'WITH {_membros_cte()}, {_cards_ctes()} '
+        f'SELECT DISTINCT {_uf("p")} FROM analises a '
+        f'JOIN {processo} p ON p.id = a.processo_id '
+        f'WHERE a.lista IS NOT NULL{filtro} '
+        f'ORDER BY 1'
+    )
+    return [{'uf': uf} for (uf,) in _fetch(sql, params)]
+
+
+@kpi_query('analises_totais')
+def analises_totais(tipos=None, carteira_ids=None, passivas_carteira_id=None) -> List[dict]:
+    """Cards, processos e CPFs distintos por UF; `uf` None é o total."""
+    if not tipos:
+        return []
+    ctes, params = _analises_ctes(tipos, carteira_ids, passivas_carteira_id)
+    sql = (
+        f'WITH RECURSIVE {ctes}, '
+        f'niveis AS ({_niveis("selecionados")}), '
+        f'totais AS ('
+        f' SELECT nivel, COUNT(*) AS cards, COUNT(DISTINCT processo_id) AS processos FROM niveis GROUP BY nivel'
+        f'), '
+        f'totais_cpfs AS ('
+        f' SELECT x.nivel, COUNT(DISTINCT f.cpf) AS cpfs'
+        f' FROM (SELECT DISTINCT nivel, processo_id FROM niveis) x'
+        f' JOIN cpfs f ON f.processo_id = x.processo_id'
+        f' GROUP BY x.nivel'
+        f') '
+        f'SELECT t.nivel, t.cards, t.processos, COALESCE(k.cpfs, 0) '
+        f'FROM totais t LEFT JOIN totais_cpfs k ON k.nivel = t.nivel '
+        f'ORDER BY t.nivel'
+    )
+    return [
+        {'uf': _nivel_uf(nivel), 'cards': int(cards), 'processos': int(processos), 'cpfs': int(cpfs)}
+        for nivel, cards, processos, cpfs in _fetch(sql, params)
+    ]
+
+
+_KPIS_ANALISE = (
+    ('propor_monitoria_sim', f'propor IN {_RESPOSTAS_SIM}'),
+    ('propor_monitoria_nao', f'propor IN {_RESPOSTAS_NAO}'),
+    ('repropor_monitoria_sim', f'repropor IN {_RESPOSTAS_SIM}'),
+    ('repropor_monitoria_nao', f'repropor IN {_RESPOSTAS_NAO}'),
+    ('recomendou_monitoria', f'(propor IN {_RESPOSTAS_SIM} OR repropor IN {_RESPOSTAS_SIM})'),
+    ('cumprimento_sentenca_sim', f'cumprimento IN {_RESPOSTAS_SIM}'),
+    ('cumprimento_sentenca_nao', f'cumprimento IN {_RESPOSTAS_NAO}'),
+    ('cumprimento_sentenca_iniciar_cs', f'cumprimento IN {_INICIAR_CS}'),
+    ('habilitar_sim', "substr(habilitacao, 1, 9) = 'habilitar'"),
+    ('habilitar_nao', "substr(habilitacao, 1, 13) = 'nao habilitar'"),
+)
+
+
+@kpi_query('analises_por_tipo')
+def analises_por_tipo(tipos=None, carteira_ids=None, passivas_carteira_id=None) -> List[dict]:
+    """
+    Cards por (UF, carteira, grupo de tipo), com processos e CPFs distintos e
+    as contagens das respostas de monitória, cumprimento e habilitação.
+    `uf` None é o total de todas as UFs.
+    """
+    if not tipos:
+        return []
+    ctes, params = _analises_ctes(tipos, carteira_ids, passivas_carteira_id)
+    respostas = {
+        'propor': 'propor_monitoria',
+        'repropor': 'repropor_monitoria',
+        'cumprimento': 'cumprimento_de_sentenca',
+        'habilitacao': 'habilitacao',
+    }
+    colunas = ', '.join(
+        f"{_normalizado(_json_texto('s.card', 'tipo_de_acao_respostas', chave))} AS {nome}"
+        for nome, chave in respostas.items()
+    )
+    somas = ', '.join(f'SUM(CASE WHEN {condicao} THEN 1 ELSE 0 END)' for _, condicao in _KPIS_ANALISE)
+    sql = (
+        f'WITH RECURSIVE {ctes}, '
+        f'respondidos AS (SELECT s.processo_id, s.uf, s.carteira_id, s.grupo, {colunas} FROM selecionados s), '
+        f'niveis AS ({_niveis("respondidos")}), '
+        f'combos AS ('
+        f' SELECT nivel, carteira_id, grupo, COUNT(*) AS cards, COUNT(DISTINCT processo_id) AS processos, {somas}'
+        f' FROM niveis GROUP BY nivel, carteira_id, grupo'
+        f'), '
+        f'combos_cpfs AS ('
+        f' SELECT x.nivel, x.carteira_id, x.grupo, COUNT(DISTINCT f.cpf) AS cpfs'
+        f' FROM (SELECT DISTINCT nivel, carteira_id, grupo, processo_id FROM niveis) x'
+        f' JOIN cpfs f ON f.processo_id = x.processo_id'
+        f' GROUP BY x.nivel, x.carteira_id, x.grupo'
+        f') '
+        f'SELECT c.*, COALESCE(k.cpfs, 0) FROM combos c '
+        f'LEFT JOIN combos_cpfs k ON k.nivel = c.nivel AND k.carteira_id = c.carteira_id AND k.grupo = c.grupo '
+        f'ORDER BY c.nivel, c.carteira_id, c.grupo'
+    )
+    linhas = []
+    for row in _fetch(sql, params):
+        nivel, carteira_id, grupo, cards, processos = row[:5]
+        kpis = row[5:5 + len(_KPIS_ANALISE)]
+        linhas.append(
+            {
+                'uf': _nivel_uf(nivel),
+                'carteira_id': int(carteira_id),
+                'grupo': int(grupo),
+                'cards': int(cards),
+                'processos': int(processos),
+                'cpfs': int(row[-1]),
+                'kpis': {nome: int(total or 0) for (nome, _), total in zip(_KPIS_ANALISE, kpis)},
+            }
+        )
+    return linhas
+
+
+@kpi_query('analises_respostas')
+def analises_respostas(tipos=None, carteira_ids=None, passivas_carteira_id=None) -> List[dict]:
+    """
+    Respostas dos cards por (UF, carteira, grupo, chave, resposta normalizada),
+    com o texto da primeira ocorrência. `uf` None é o total de todas as UFs.
+    """
+    if not tipos:
+        return []
+    ctes, params = _analises_ctes(tipos, carteira_ids, passivas_carteira_id)
+    respostas = 'tipo_de_acao_respostas'
+    if _postgres():
+        objeto = f"CASE WHEN jsonb_typeof(s.card -> '{respostas}') = 'object' THEN s.card -> '{respostas}' END"
+        expansao = f'CROSS JOIN LATERAL jsonb_each({objeto}) AS e(chave, valor) WHERE 1 = 1'
+        valor = _aparado(
+            "CASE e.valor WHEN 'true'::jsonb THEN 'True' WHEN 'false'::jsonb THEN 'False' ELSE e.valor #>> '{}' END"
+        )
+        chave = 'e.chave'
+        primeira = 'MIN(ordem || valor COLLATE "C")'
+    else:
+        expansao = f"JOIN json_each(s.card, '$.{respostas}') AS e WHERE json_type(s.card, '$.{respostas}') = 'object'"
+        valor = _aparado(
+            "CASE e.type WHEN 'true' THEN 'True' WHEN 'false' THEN 'False' ELSE CAST(e.value AS TEXT) END"
+        )
+        chave = 'e.key'
+        primeira = 'MIN(ordem || valor)'
+    tecnicas = ', '.join(_literal(item) for item in RESPOSTAS_TECNICAS)
+    sql = (
+        f'WITH RECURSIVE {ctes}, '
+        f'valores AS ('
+        f' SELECT s.uf, s.carteira_id, s.grupo, {chave} AS chave, {valor} AS valor,'
+        f" {_ordem('s.processo_id', 's.idx')} AS ordem"
+        f' FROM selecionados s {expansao} AND {chave} NOT IN ({tecnicas})'
+        f'), '
+        f'respostas AS ('
+        f' SELECT v.*, COALESCE(NULLIF({_normalizado("v.valor")}, \'\'), v.valor) AS resposta FROM valores v'
+        f" WHERE v.valor IS NOT NULL AND v.valor <> '' AND v.valor <> '---'"
+        f'), '
+        f'niveis AS ({_niveis("respostas")}) '
+        f'SELECT nivel, carteira_id, grupo, chave, resposta, COUNT(*), {primeira} '
+        f'FROM niveis GROUP BY nivel, carteira_id, grupo, chave, resposta '
+        f'ORDER BY nivel, carteira_id, grupo, chave, resposta'
+    )
+    return [
+        {
+            'uf': _nivel_uf(nivel),
+            'carteira_id': int(carteira_id),
+            'grupo': int(grupo),
+            'chave': chave_resposta,
+            'resposta': resposta,
+            'valor': primeira_ocorrencia[18:],
+            'cards': int(cards),
+        }
+        for nivel, carteira_id, grupo, chave_resposta, resposta, cards, primeira_ocorrencia in _fetch(sql, params)
+    ]
+
+
+@kpi_query('analises_produtividade')
+def analises_produtividade(tipos=None, carteira_ids=None, passivas_carteira_id=None, fuso=None) -> List[dict]:
+    """
+    Cards com conteúdo por (autor informado no card, último editor da análise,
+    dia, carteira), na ordem em que aparecem. O dia vem de saved_at, updated_at
+    do card ou da análise, no fuso `fuso` (padrão: o atual).
+    """
+    if not tipos:
+        return []
+    fuso = fuso or timezone.get_current_timezone_name()
+    ctes, params = _analises_ctes(tipos, carteira_ids, passivas_carteira_id)
+    datas = [
+        f"CASE WHEN {_json_tipo('s.card', chave)} = 'text' THEN {_data_local(_json_texto('s.card', chave), fuso)} END"
+        for chave in ('saved_at', 'updated_at')
+    ]
+    datas.append(_data_registro_local('s.updated_at', fuso))
+    sql = (
+        f'WITH RECURSIVE {ctes}, '
+        f'eventos AS ('
+        f" SELECT COALESCE({_aparado(_json_texto('s.card', 'analysis_author'))}, '') AS autor,"
+        f' s.updated_by_id, COALESCE({", ".join(datas)}) AS dia, s.carteira_id,'
+        f" {_ordem('s.processo_id', 's.idx')} AS ordem"
+        f" FROM selecionados s WHERE {_com_conteudo('s.card')}"
+        f') '
+        f'SELECT autor, updated_by_id, dia, carteira_id, COUNT(*) FROM eventos '
+        f'GROUP BY autor, updated_by_id, dia, carteira_id '
+        f'ORDER BY MIN(ordem)'
+    )
+    return [
+        {
+            'autor': autor,
+            'usuario_id': usuario_id,
+            'data': _como_data(dia),
+            'carteira_id': int(carteira_id),
+            'analises': int(total),
+        }
+        for autor, usuario_id, dia, carteira_id, total in _fetch(sql, params)
+    ]
+
+
+@kpi_query('prioridades_por_uf')
+def prioridades_por_uf(etiqueta_ids=(), carteira_ids=None) -> List[dict]:
+    """
+    Processos com etiqueta de prioridade e quantos já têm análise preenchida,
+    em quatro recortes: por UF (carteira_id e etiqueta_id None), por UF e
+    etiqueta, por carteira e UF, e por carteira, UF e etiqueta. Sem filtro,
+    processos sem carteira entram na carteira 0; com filtro, só as carteiras
+    pedidas contam.
+    """
+    processo = _qn(ProcessoJudicial._meta.db_table)
+    etiquetas = _qn(ProcessoJudicial.etiquetas.through._meta.db_table)
+    tags, tags_params = _in_clause('pe.etiqueta_id', _ids(etiqueta_ids))
+    ids = _ids(carteira_ids)
+    membros, membros_params = _in_clause('m.carteira_id', ids)
+    filtro, filtro_params = '', []
+    if ids is None:
+        carteiras = (
+            'SELECT b.processo_id, COALESCE(m.carteira_id, 0) AS carteira_id '
+            'FROM base b LEFT JOIN membros m ON m.processo_id = b.processo_id'
+        )
+    else:
+        filtro = f' AND EXISTS (SELECT 1 FROM membros m WHERE m.processo_id = p.id{membros})'
+        filtro_params = list(membros_params)
+        carteiras = (
+            f'SELECT b.processo_id, m.carteira_id FROM base b '
+            f'JOIN membros m ON m.processo_id = b.processo_id WHERE 1 = 1{membros}'
+        )
+    inteiro = 'BIGINT' if _postgres() else 'INTEGER'
+    recortes = [
+        ('CAST(NULL AS {t})', 'CAST(NULL AS {t})', 'base b', 'b.uf'),
+        ('CAST(NULL AS {t})', 'e.etiqueta_id', 'base b JOIN rotulos e ON e.processo_id = b.processo_id', 'b.uf, e.etiqueta_id'),
+        ('k.carteira_id', 'CAST(NULL AS {t})', 'base b JOIN carteiras k ON k.processo_id = b.processo_id', 'k.carteira_id, b.uf'),
+        (
+            'k.carteira_id',
+            'e.etiqueta_id',
+            'base b JOIN carteiras k ON k.processo_id = b.processo_id JOIN rotulos e ON e.processo_id = b.processo_id',
+            'k.carteira_id, b.uf, e.etiqueta_id',
+        ),
+    ]
+    consultas = ' UNION ALL '.join(
+        f'SELECT {carteira.format(t=inteiro)}, b.uf, {etiqueta.format(t=inteiro)}, COUNT(*), SUM(b.analisado) '
+        f'FROM {origem} GROUP BY {grupos}'
+        for carteira, etiqueta, origem, grupos in recortes
+    )
+    sql = (
+        f'WITH {_membros_cte()}, {_cards_ctes()}, '
+        f'base AS ('
+        f' SELECT p.id AS processo_id, {_uf("p")} AS uf,'
+        f' CASE WHEN EXISTS (SELECT 1 FROM cards c WHERE c.processo_id = p.id AND {_com_conteudo("c.card")})'
+        f' THEN 1 ELSE 0 END AS analisado'
+        f' FROM {processo} p'
+        f' WHERE EXISTS (SELECT 1 FROM {etiquetas} pe WHERE pe.processojudicial_id = p.id{tags}){filtro}'
+        f'), '
+        f'rotulos AS ('
+        f' SELECT DISTINCT pe.processojudicial_id AS processo_id, pe.etiqueta_id FROM {etiquetas} pe'
+        f' WHERE pe.processojudicial_id IN (SELECT processo_id FROM base){tags}'
+        f'), '
+        f'carteiras AS ({carteiras}) '
+        f'{consultas}'
+    )
+    params = tags_params + filtro_params + tags_params + (list(membros_params) if ids is not None else [])
+    return [
+        {
+            'carteira_id': None if carteira_id is None else int(carteira_id),
+            'uf': uf,
+            'etiqueta_id': None if etiqueta_id is None else int(etiqueta_id),
+            'processos': int(processos),
+            'analisados': int(analisados or 0),
+        }
+        for carteira_id, uf, etiqueta_id, processos, analisados in _fetch(sql, params)
+    ]
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from contratos.models import KpiSnapshot
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE_SECONDS = 900
+# Depois disso uma atualização "em andamento" é considerada abandonada.
+LOCK_TIMEOUT_SECONDS = 600
+# As chaves de cache das seções incluem a versão do snapshot, então o timeout só
+# serve para liberar memória de versões antigas.
+SECAO_CACHE_TIMEOUT_SECONDS = 3600
+
+# Um único worker por processo: recálculos pedidos pelas visitas entram numa
+# fila em vez de abrir uma thread cada, e pedidos repetidos do mesmo snapshot
+# enquanto ele ainda está na fila são descartados.
+_executor = None
+_agendados = set()
+_lock = threading.Lock()
+
+
+def get_max_age_seconds() -> int:
+    try:
+        value = int(getattr(settings, 'KPI_SNAPSHOT_MAX_AGE_SECONDS', DEFAULT_MAX_AGE_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_AGE_SECONDS
+    return value if value > 0 else DEFAULT_MAX_AGE_SECONDS
+
+
+def executar_em_thread() -> bool:
+    return bool(getattr(settings, 'KPI_SNAPSHOT_EM_THREAD', True))
+
+
+def calcular_payload(escopo: str = KpiSnapshot.ESCOPO_DASHBOARD, carteira_id: Optional[int] = None) -> dict:
+    """
+    Calcula o payload do escopo sem contexto de usuário. Só o dashboard tem
+    recorte por carteira; gráficos e interseções são sempre gerais.
+    """
+    escopos = (KpiSnapshot.ESCOPO_DASHBOARD, KpiSnapshot.ESCOPO_GRAFICOS, KpiSnapshot.ESCOPO_INTERSECOES)
+    if escopo not in escopos or (carteira_id is not None and escopo != KpiSnapshot.ESCOPO_DASHBOARD):
+        raise ValueError(f'Escopo de KPI não suportado: {escopo} (carteira={carteira_id}).')
+    from django.contrib import admin
+    from contratos.models import Carteira
+
+    model_admin = admin.site._registry.get(Carteira)
+    if model_admin is None:
+        from contratos.admin import CarteiraAdmin
+        model_admin = CarteiraAdmin(Carteira, admin.site)
+    if escopo == KpiSnapshot.ESCOPO_GRAFICOS:
+        return {'carteiras': model_admin._build_carteira_chart_data()}
+    if escopo == KpiSnapshot.ESCOPO_INTERSECOES:
+        return model_admin._build_carteira_intersections()
+    return model_admin._build_carteira_kpi_data(None, carteira_id=carteira_id)
+
+
+def _get_or_create_snapshot(escopo: str, carteira_id: Optional[int]) -> KpiSnapshot:
+    snapshot = KpiSnapshot.objects.filter(escopo=escopo, carteira_id=carteira_id).first()
+    if snapshot is not None:
+        return snapshot
+    try:
+        return KpiSnapshot.objects.create(escopo=escopo, carteira_id=carteira_id)
+    except IntegrityError:
+        return KpiSnapshot.objects.get(escopo=escopo, carteira_id=carteira_id)
+
+
+def _reservar(snapshot: KpiSnapshot) -> bool:
+    agora = timezone.now()
+    limite = agora - timedelta(seconds=LOCK_TIMEOUT_SECONDS)
+    return bool(
+        KpiSnapshot.objects.filter(pk=snapshot.pk)
+        .filter(Q(atualizando_desde__isnull=True) | Q(atualizando_desde__lt=limite))
+        .update(atualizando_desde=agora)
+    )
+
+
+def precisa_atualizar(snapshot: KpiSnapshot) -> bool:
+    if snapshot.desatualizado or not snapshot.gerado_em:
+        return True
+    return timezone.now() - snapshot.gerado_em > timedelta(seconds=get_max_age_seconds())
+
+
+def atualizar_snapshot(
+    escopo: str = KpiSnapshot.ESCOPO_DASHBOARD,
+    carteira_id: Optional[int] = None,
+    force: bool = False,
+) -> Optional[KpiSnapshot]:
+    """
+    Recalcula o snapshot se estiver desatualizado (ou sempre, com force=True).
+    Retorna None quando outra execução já está atualizando o mesmo snapshot.
+    """
+    snapshot = _get_or_create_snapshot(escopo, carteira_id)
+    if not force and not precisa_atualizar(snapshot):
+        return snapshot
+    if not _reservar(snapshot):
+        return None
+    try:
+        # Limpa a marca antes de calcular: alterações feitas durante o cálculo
+        # marcam o snapshot de novo e entram na próxima rodada.
+        KpiSnapshot.objects.filter(pk=snapshot.pk).update(desatualizado=False)
+        inicio = time.monotonic()
+        payload = calcular_payload(escopo, carteira_id)
+        duracao_ms = int((time.monotonic() - inicio) * 1000)
+        gerado_em = timezone.now()
+        KpiSnapshot.objects.filter(pk=snapshot.pk).update(
+            payload=payload,
+            gerado_em=gerado_em,
+            duracao_ms=duracao_ms,
+        )
+    except Exception:
+        KpiSnapshot.objects.filter(pk=snapshot.pk).update(desatualizado=True)
+        raise
+    finally:
+        KpiSnapshot.objects.filter(pk=snapshot.pk).update(atualizando_desde=None)
+    snapshot.refresh_from_db()
+    return snapshot
+
+
+def _atualizar_em_thread(escopo: str, carteira_id: Optional[int]):
+    close_old_connections()
+    try:
+        atualizar_snapshot(escopo, carteira_id)
+    except Exception:
+        logger.exception('Falha ao atualizar snapshot de KPI (%s, carteira=%s)', escopo, carteira_id)
+    finally:
+        with _lock:
+            _agendados.discard((escopo, carteira_id))
+        close_old_connections()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kpi-snapshot')
+        return _executor
+
+
+def agendar_atualizacao(snapshot: KpiSnapshot) -> bool:
+    """
+    Põe o recálculo na fila do worker do processo se ninguém já estiver
+    recalculando. Com KPI_SNAPSHOT_EM_THREAD=False não agenda nada: o
+    recálculo fica só com o comando `atualizar_kpi_snapshots --loop`.
+    """
+    if not executar_em_thread():
+        return False
+    if snapshot.atualizando_desde and timezone.now() - snapshot.atualizando_desde < timedelta(seconds=LOCK_TIMEOUT_SECONDS):
+        return False
+    chave = (snapshot.escopo, snapshot.carteira_id)
+    executor = _get_executor()
+    with _lock:
+        if chave in _agendados:
+            return False
+        _agendados.add(chave)
+    executor.submit(_atualizar_em_thread, *chave)
+    return True
+
+
+def obter_snapshot(
+    escopo: str = KpiSnapshot.ESCOPO_DASHBOARD,
+    carteira_id: Optional[int] = None,
+) -> KpiSnapshot:
+    """
+    Devolve o snapshot mais recente. Na primeira vez calcula na hora; depois,
+    se estiver desatualizado, serve o existente e recalcula em segundo plano.
+    """
+    snapshot = _get_or_create_snapshot(escopo, carteira_id)
+    if not snapshot.gerado_em:
+        atualizado = atualizar_snapshot(escopo, carteira_id, force=True)
+        if atualizado is not None:
+            return atualizado
+        snapshot.payload = calcular_payload(escopo, carteira_id)
+        snapshot.gerado_em = timezone.now()
+        return snapshot
+    if precisa_atualizar(snapshot):
+        agendar_atualizacao(snapshot)
+    return snapshot
+
+
+def obter_snapshot_sem_payload(
+    escopo: str = KpiSnapshot.ESCOPO_DASHBOARD,
+    carteira_id: Optional[int] = None,
+) -> Optional[KpiSnapshot]:
+    """
+    Variante de obter_snapshot para os endpoints por seção: não lê o payload
+    (gerado_em basta para versão/ETag) e devolve None, em vez de calcular de
+    novo, quando o primeiro cálculo já está em andamento em outra requisição.
+    """
+    snapshot = KpiSnapshot.objects.defer('payload').filter(escopo=escopo, carteira_id=carteira_id).first()
+    if snapshot is None or not snapshot.gerado_em:
+        return atualizar_snapshot(escopo, carteira_id, force=True)
+    if precisa_atualizar(snapshot):
+        agendar_atualizacao(snapshot)
+    return snapshot
+
+
+def versao_snapshot(snapshot: KpiSnapshot) -> str:
+    return f'{snapshot.pk}.{int(snapshot.gerado_em.timestamp() * 1000)}'
+
+
+def payload_secao(snapshot: KpiSnapshot, secao: str, chaves: Optional[Iterable[str]] = None) -> dict:
+    """
+    Recorte do payload do snapshot usado por uma seção do dashboard, em cache
+    por (seção, versão do snapshot). chaves=None devolve o payload inteiro.
+    """
+    chave_cache = f'contratos:kpi-secao:{secao}:{versao_snapshot(snapshot)}'
+    dados = cache.get(chave_cache)
+    if dados is None:
+        payload = snapshot.payload or {}
+        dados = dict(payload) if chaves is None else {chave: payload.get(chave) for chave in chaves}
+        cache.set(chave_cache, dados, SECAO_CACHE_TIMEOUT_SECONDS)
+    return dados
@@ -0,0 +1,267 @@
+"""
+Pool de processos LibreOffice headless de longa duração para a conversão
+DOCX → PDF local (quando o Gotenberg não está disponível).
+
+Cada instância é um `unoserver` (LibreOffice + servidor XML-RPC) com porta e
+diretório de perfil próprios; as conversões são enviadas pelo cliente
+`unoconvert`, que custa uma fração do cold start de um `soffice` novo. As
+instâncias sobem sob demanda, passam por health check antes de cada uso e são
+recicladas depois de LIBREOFFICE_POOL_MAX_CONVERSOES conversões, de um timeout
+ou de uma falha.
+
+O pool vale por processo (cada worker do gunicorn tem o seu). Com
+LIBREOFFICE_POOL_SIZE=0 ou sem os executáveis do unoserver, `habilitado()` é
+falso e quem chamou segue com o `soffice --convert-to` avulso.
+"""
+import atexit
+import logging
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAMANHO = 0
+DEFAULT_MAX_CONVERSOES = 200
+DEFAULT_FILA_MAX = 20
+DEFAULT_TIMEOUT_SECONDS = 90
+INICIO_TIMEOUT_SECONDS = 30
+
+
+class FilaCheia(Exception):
+    """Há mais pedidos esperando do que LIBREOFFICE_POOL_FILA_MAX."""
+
+
+def _setting_int(nome: str, default: int, minimo: int = 0) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value >= minimo else default
+
+
+def _setting_cmd(nome: str, default: str) -> str:
+    return str(getattr(settings, nome, '') or default).strip()
+
+
+def _porta_livre() -> int:
+    # Portas escolhidas pelo SO: vários workers do gunicorn sobem pools próprios.
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _Instancia:
+    def __init__(self, indice: int, perfil_dir: Path):
+        self.indice = indice
+        self.porta = 0
+        self.perfil_dir = perfil_dir
+        self.processo: Optional[subprocess.Popen] = None
+        self.conversoes = 0
+
+    def _porta_aberta(self) -> bool:
+        if not self.porta:
+            return False
+        try:
+            with socket.create_connection(('127.0.0.1', self.porta), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def saudavel(self) -> bool:
+        return bool(self.processo and self.processo.poll() is None and self._porta_aberta())
+
+    def iniciar(self, unoserver_cmd: str, soffice_cmd: Optional[str]):
+        self.perfil_dir.mkdir(parents=True, exist_ok=True)
+        self.porta = _porta_livre()
+        cmd = [
+            unoserver_cmd,
+            '--interface', '127.0.0.1',
+            '--port', str(self.porta),
+            '--uno-interface', '127.0.0.1',
+            '--uno-port', str(_porta_livre()),
+            '--user-installation', self.perfil_dir.as_uri(),
+        ]
+        if soffice_cmd:
+            cmd += ['--executable', soffice_cmd]
+        logger.info("LibreOffice pool: iniciando instância %s (porta %s)", self.indice, self.porta)
+        self.processo = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.conversoes = 0
+        limite = time.monotonic() + INICIO_TIMEOUT_SECONDS
+        while time.monotonic() < limite:
+            if self.processo.poll() is not None:
+                break
+            if self._porta_aberta():
+                return
+            time.sleep(0.25)
+        self.parar()
+        raise RuntimeError(f"instância {self.indice} do LibreOffice não respondeu na porta {self.porta}")
+
+    def parar(self):
+        processo, self.processo = self.processo, None
+        if processo is None or processo.poll() is not None:
+            return
+        processo.terminate()
+        try:
+            processo.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+            processo.wait(timeout=5)
+
+
+class PoolLibreOffice:
+    def __init__(
+        self,
+        tamanho: int,
+        max_conversoes: int,
+        fila_max: int,
+        timeout: int,
+        unoserver_cmd: str,
+        unoconvert_cmd: str,
+        soffice_cmd: Optional[str] = None,
+    ):
+        self.max_conversoes = max_conversoes
+        self.timeout = timeout
+        self.unoserver_cmd = unoserver_cmd
+        self.unoconvert_cmd = unoconvert_cmd
+        self.soffice_cmd = soffice_cmd
+        self._base_dir = Path(tempfile.mkdtemp(prefix='lo-pool-'))
+        self._instancias: List[_Instancia] = [
+            _Instancia(i, self._base_dir / f'perfil-{i}') for i in range(tamanho)
+        ]
+        self._livres: "queue.Queue[_Instancia]" = queue.Queue()
+        for instancia in self._instancias:
+            self._livres.put(instancia)
+        # Limita quantos pedidos podem estar em conversão ou aguardando.
+        self._vagas = threading.BoundedSemaphore(tamanho + fila_max)
+
+    def converter(self, docx_bytes: bytes) -> Optional[bytes]:
+        if not self._vagas.acquire(blocking=False):
+            raise FilaCheia()
+        try:
+            inicio = time.monotonic()
+            try:
+                instancia = self._livres.get(timeout=self.timeout)
+            except queue.Empty:
+                logger.warning("LibreOffice pool: nenhuma instância livre em %ss", self.timeout)
+                return None
+            try:
+                return self._converter_na_instancia(instancia, docx_bytes, self.timeout - (time.monotonic() - inicio))
+            finally:
+                self._livres.put(instancia)
+        finally:
+            self._vagas.release()
+
+    def _converter_na_instancia(self, instancia: _Instancia, docx_bytes: bytes, timeout: float) -> Optional[bytes]:
+        if instancia.conversoes >= self.max_conversoes:
+            logger.info("LibreOffice pool: reciclando instância %s após %s conversões", instancia.indice, instancia.conversoes)
+            instancia.parar()
+        if not instancia.saudavel():
+            instancia.parar()
+            try:
+                instancia.iniciar(self.unoserver_cmd, self.soffice_cmd)
+            except Exception as exc:
+                logger.warning("LibreOffice pool: %s", exc)
+                return None
+        cmd = [
+            self.unoconvert_cmd,
+            '--host', '127.0.0.1',
+            '--port', str(instancia.porta),
+            '--convert-to', 'pdf',
+            '-', '-',
+        ]
+        try:
+            result = subprocess.run(cmd, input=docx_bytes, capture_output=True, timeout=max(timeout, 1))
+        except subprocess.TimeoutExpired:
+            logger.warning("LibreOffice pool: timeout na instância %s; reiniciando", instancia.indice)
+            instancia.parar()
+            return None
+        instancia.conversoes += 1
+        if result.returncode == 0 and result.stdout[:5] == b'%PDF-':
+            return result.stdout
+        logger.warning(
+            "LibreOffice pool: conversão falhou na instância %s: rc=%s stderr=%s",
+            instancia.indice,
+            result.returncode,
+            result.stderr.decode('utf-8', errors='ignore')[:200],
+        )
+        instancia.parar()
+        return None
+
+    def status(self) -> List[dict]:
+        return [
+            {
+                'indice': instancia.indice,
+                'porta': instancia.porta,
+                'ativa': bool(instancia.processo and instancia.processo.poll() is None),
+                'conversoes': instancia.conversoes,
+            }
+            for instancia in self._instancias
+        ]
+
+    def encerrar(self):
+        for instancia in self._instancias:
+            try:
+                instancia.parar()
+            except Exception:
+                pass
+        shutil.rmtree(self._base_dir, ignore_errors=True)
+
+
+_pool: Optional[PoolLibreOffice] = None
+_pool_lock = threading.Lock()
+_pool_indisponivel = False
+
+
+def get_pool() -> Optional[PoolLibreOffice]:
+    """Pool do processo atual, criado no primeiro uso; None se desabilitado."""
+    global _pool, _pool_indisponivel
+    if _pool is not None or _pool_indisponivel:
+        return _pool
+    with _pool_lock:
+        if _pool is not None or _pool_indisponivel:
+            return _pool
+        tamanho = _setting_int('LIBREOFFICE_POOL_SIZE', DEFAULT_TAMANHO)
+        unoserver_cmd = shutil.which(_setting_cmd('LIBREOFFICE_POOL_UNOSERVER_CMD', 'unoserver'))
+        unoconvert_cmd = shutil.which(_setting_cmd('LIBREOFFICE_POOL_UNOCONVERT_CMD', 'unoconvert'))
+        if tamanho <= 0 or not unoserver_cmd or not unoconvert_cmd:
+            if tamanho > 0:
+                logger.warning("LibreOffice pool desabilitado: unoserver/unoconvert não encontrados no PATH")
+            _pool_indisponivel = True
+            return None
+        soffice_cmd = str(getattr(settings, 'LIBREOFFICE_POOL_SOFFICE_CMD', '') or '').strip() or None
+        _pool = PoolLibreOffice(
+            tamanho=tamanho,
+            max_conversoes=_setting_int('LIBREOFFICE_POOL_MAX_CONVERSOES', DEFAULT_MAX_CONVERSOES, minimo=1),
+            fila_max=_setting_int('LIBREOFFICE_POOL_FILA_MAX', DEFAULT_FILA_MAX),
+            timeout=_setting_int('LIBREOFFICE_POOL_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS, minimo=1),
+            unoserver_cmd=unoserver_cmd,
+            unoconvert_cmd=unoconvert_cmd,
+            soffice_cmd=soffice_cmd,
+        )
+        atexit.register(_pool.encerrar)
+        return _pool
+
+
+def habilitado() -> bool:
+    return get_pool() is not None
+
+
+def converter(docx_bytes: bytes) -> Optional[bytes]:
+    """PDF convertido pelo pool, ou None (pool desabilitado, fila cheia ou falha)."""
+    pool = get_pool()
+    if pool is None:
+        return None
+    try:
+        return pool.converter(docx_bytes)
+    except FilaCheia:
+        logger.warning("LibreOffice pool: fila cheia, conversão recusada")
+        return None
@@ -0,0 +1,142 @@
+"""
+Cache dos DOCX de DocumentoModelo usados na geração de petições.
+
+A versão de um modelo é o par (id, atualizado_em + nome do arquivo no
+storage); reenviar o arquivo muda as duas coisas e invalida o cache sem
+nenhuma limpeza explícita. Camadas:
+
+- memória do processo: bytes, o Document já lido pelo python-docx e o plano
+  de placeholders compilado (plano_docx); cada geração recebe uma cópia
+  profunda do pacote (`copy.deepcopy`), nunca o original;
+- disco local (DOCUMENTO_MODELO_CACHE_DIR): os bytes, para que workers novos
+  ou reiniciados não baixem de novo do S3;
+- storage padrão (S3 em produção), só quando as duas anteriores não têm a
+  versão atual.
+"""
+import copy
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+from docx import Document
+
+from contratos.services import plano_docx
+
+logger = logging.getLogger(__name__)
+
+
+class _ModeloEmCache:
+    def __init__(self, versao: str, conteudo: bytes):
+        self.versao = versao
+        self.conteudo = conteudo
+        self.documento = None
+        self.plano = None
+
+
+_cache: Dict[int, _ModeloEmCache] = {}
+_lock = threading.Lock()
+
+
+def get_cache_dir() -> Path:
+    value = str(getattr(settings, 'DOCUMENTO_MODELO_CACHE_DIR', '') or '').strip()
+    return Path(value or os.path.join(tempfile.gettempdir(), 'nowlex-documentos-modelo'))
+
+
+def versao_modelo(modelo) -> str:
+    marca = int(modelo.atualizado_em.timestamp() * 1_000_000) if modelo.atualizado_em else 0
+    arquivo = hashlib.sha1((modelo.arquivo.name or '').encode('utf-8')).hexdigest()[:12]
+    return f'{marca}-{arquivo}'
+
+
+def _caminho_disco(modelo_id: int, versao: str) -> Path:
+    return get_cache_dir() / str(modelo_id) / f'{versao}.docx'
+
+
+def _ler_disco(modelo_id: int, versao: str) -> Optional[bytes]:
+    try:
+        return _caminho_disco(modelo_id, versao).read_bytes()
+    except OSError:
+        return None
+
+
+def _gravar_disco(modelo_id: int, versao: str, conteudo: bytes):
+    destino = _caminho_disco(modelo_id, versao)
+    try:
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        for antigo in destino.parent.glob('*.docx'):
+            if antigo.name != destino.name:
+                antigo.unlink(missing_ok=True)
+        with tempfile.NamedTemporaryFile(dir=destino.parent, suffix='.tmp', delete=False) as tmp:
+            tmp.write(conteudo)
+        os.replace(tmp.name, destino)
+    except OSError as exc:
+        logger.warning("Cache de modelos: não foi possível gravar %s: %s", destino, exc)
+
+
+def _entrada(modelo) -> _ModeloEmCache:
+    versao = versao_modelo(modelo)
+    entrada = _cache.get(modelo.pk)
+    if entrada is not None and entrada.versao == versao:
+        return entrada
+    with _lock:
+        entrada = _cache.get(modelo.pk)
+        if entrada is not None and entrada.versao == versao:
+            return entrada
+        conteudo = _ler_disco(modelo.pk, versao)
+        if conteudo is None:
+            with modelo.arquivo.open('rb') as handle:
+                conteudo = handle.read()
+            _gravar_disco(modelo.pk, versao, conteudo)
+            logger.info("Cache de modelos: modelo %s (%s) baixado do storage", modelo.pk, versao)
+        entrada = _ModeloEmCache(versao, conteudo)
+        _cache[modelo.pk] = entrada
+        return entrada
+
+
+def obter_bytes(modelo) -> bytes:
+    """Bytes do DOCX na versão atual do modelo."""
+    return _entrada(modelo).conteudo
+
+
+def _compilada(modelo) -> _ModeloEmCache:
+    entrada = _entrada(modelo)
+    if entrada.documento is None:
+        with _lock:
+            if entrada.documento is None:
+                documento = Document(BytesIO(entrada.conteudo))
+                entrada.plano = plano_docx.compilar(documento)
+                entrada.documento = documento
+    return entrada
+
+
+def copiar_documento(documento):
+    # Copia o pacote, não o Document: o Document guarda o w:body em cache e a
+    # cópia desse cache ficaria desligada da árvore que é salva.
+    return copy.deepcopy(documento.part.package).main_document_part.document
+
+
+def obter_documento(modelo):
+    """Document do python-docx pronto para edição (cópia exclusiva desta geração)."""
+    return copiar_documento(_compilada(modelo).documento)
+
+
+def obter_renderizavel(modelo) -> plano_docx.DocumentoRenderizavel:
+    """Cópia do template já vinculada ao plano de placeholders compilado."""
+    entrada = _compilada(modelo)
+    return entrada.plano.vincular(copiar_documento(entrada.documento))
+
+
+def obter_plano(modelo) -> plano_docx.PlanoDocx:
+    return _compilada(modelo).plano
+
+
+def limpar_cache():
+    """Esvazia a camada em memória (o disco é invalidado pela versão)."""
+    with _lock:
+        _cache.clear()
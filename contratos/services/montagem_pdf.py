@@ -0,0 +1,187 @@
+"""
+Montagem de um PDF único (petição + anexos) com marcadores, gravado como novo
+ProcessoArquivo.
+
+Cada fonte é copiada do storage em blocos para um arquivo temporário (em
+memória só até ENTRADA_SPOOL_MAX_BYTES) e aberta uma de cada vez; DOCX passam
+pela conversão com cache por conteúdo (conversao_pdf). O pypdf mantém as
+páginas já copiadas até gravar a saída, então o consumo de memória é limitado
+pelos tetos de páginas (PDF_MONTAGEM_MAX_PAGINAS) e de bytes de entrada
+(PDF_MONTAGEM_MAX_MB), verificados antes de cada fonte entrar no documento.
+A junção é feita localmente com o pypdf; só um DOCX ainda sem conversão em
+cache passa pelo conversor configurado.
+"""
+import io
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import List
+
+from django.conf import settings
+from django.core.files.base import File
+
+from contratos.models import ProcessoArquivo
+from contratos.services import classificacao_arquivos, conversao_pdf, hash_arquivos
+from contratos.services.geracao_documentos import GeracaoErro
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGINAS = 1500
+DEFAULT_MAX_MB = 200
+COPIA_CHUNK_BYTES = 1024 * 1024
+ENTRADA_SPOOL_MAX_BYTES = 2 * 1024 * 1024
+SAIDA_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+
+@dataclass
+class FontePdf:
+    titulo: str
+    # FieldFile de ProcessoArquivo ou de TipoPeticaoAnexoContinua.
+    arquivo: object
+    # PDF já anexado usado quando o DOCX não pode ser convertido.
+    alternativa: object = None
+
+
+def _setting_int(nome: str, default: int) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def get_max_paginas() -> int:
+    return _setting_int('PDF_MONTAGEM_MAX_PAGINAS', DEFAULT_MAX_PAGINAS)
+
+
+def get_max_bytes() -> int:
+    return _setting_int('PDF_MONTAGEM_MAX_MB', DEFAULT_MAX_MB) * 1024 * 1024
+
+
+def _extensao(field_file) -> str:
+    return os.path.splitext(field_file.name or '')[1].lower()
+
+
+def _copiar_do_storage(field_file):
+    destino = tempfile.SpooledTemporaryFile(max_size=ENTRADA_SPOOL_MAX_BYTES)
+    try:
+        with field_file.storage.open(field_file.name, 'rb') as origem:
+            shutil.copyfileobj(origem, destino, COPIA_CHUNK_BYTES)
+        tamanho = destino.tell()
+        destino.seek(0)
+    except Exception:
+        destino.close()
+        raise
+    return destino, tamanho
+
+
+def _abrir_como_pdf(fonte: FontePdf):
+    """(file-like do PDF, tamanho) ou None se a fonte não puder virar PDF."""
+    extensao = _extensao(fonte.arquivo)
+    if extensao == '.pdf':
+        return _copiar_do_storage(fonte.arquivo)
+    if extensao == '.docx':
+        with fonte.arquivo.storage.open(fonte.arquivo.name, 'rb') as origem:
+            docx_bytes = origem.read()
+        pdf_bytes = conversao_pdf.converter_docx_para_pdf(docx_bytes, permitir_fallback=False)
+        if pdf_bytes:
+            return io.BytesIO(pdf_bytes), len(pdf_bytes)
+        if fonte.alternativa:
+            return _copiar_do_storage(fonte.alternativa)
+    return None
+
+
+def montar(processo, fontes: List[FontePdf], nome_pdf: str, usuario=None, tipo_peticao=None, progresso=None) -> dict:
+    """
+    Junta as fontes na ordem recebida, com um marcador por fonte, e grava o
+    resultado em Arquivos do processo. Fontes ilegíveis ou que não são
+    PDF/DOCX entram em `ignorados`; estourar os tetos levanta GeracaoErro.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.errors import PdfReadError
+
+    max_paginas = get_max_paginas()
+    max_bytes = get_max_bytes()
+    writer = PdfWriter()
+    ignorados = []
+    total_bytes = 0
+    if progresso:
+        progresso("Preparando o PDF", total=len(fontes) + 1)
+
+    for fonte in fontes:
+        if progresso:
+            progresso(f"Adicionando {fonte.titulo}"[:120])
+        try:
+            aberto = _abrir_como_pdf(fonte)
+        except Exception as exc:
+            logger.warning("Montagem de PDF: falha ao ler %s: %s", fonte.arquivo.name, exc)
+            aberto = None
+        if aberto is None:
+            ignorados.append(fonte.titulo)
+            continue
+        entrada, tamanho = aberto
+        with entrada:
+            total_bytes += tamanho
+            if total_bytes > max_bytes:
+                raise GeracaoErro(
+                    f"Os arquivos somam mais de {max_bytes // (1024 * 1024)} MB; "
+                    "selecione menos anexos."
+                )
+            try:
+                reader = PdfReader(entrada)
+                if reader.is_encrypted and not reader.decrypt(''):
+                    raise PdfReadError('PDF protegido por senha')
+                paginas = len(reader.pages)
+            except Exception as exc:
+                logger.warning("Montagem de PDF: %s não é um PDF legível: %s", fonte.titulo, exc)
+                ignorados.append(fonte.titulo)
+                continue
+            if len(writer.pages) + paginas > max_paginas:
+                raise GeracaoErro(
+                    f"O PDF passaria de {max_paginas} páginas; selecione menos anexos."
+                )
+            inicio = len(writer.pages)
+            # add_page copia a página para o writer; a entrada pode ser fechada em seguida.
+            for pagina in reader.pages:
+                writer.add_page(pagina)
+            if paginas:
+                writer.add_outline_item(fonte.titulo, inicio)
+
+    if not writer.pages:
+        raise GeracaoErro("Nenhum dos arquivos selecionados pôde ser convertido em PDF.")
+
+    writer.page_mode = '/UseOutlines'
+    total_paginas = len(writer.pages)
+    if progresso:
+        progresso("Salvando o PDF em Arquivos")
+    with tempfile.SpooledTemporaryFile(max_size=SAIDA_SPOOL_MAX_BYTES) as saida:
+        writer.write(saida)
+        writer.close()
+        saida.seek(0)
+        arquivo = ProcessoArquivo(
+            processo=processo,
+            nome=nome_pdf,
+            enviado_por=usuario if getattr(usuario, 'pk', None) else None,
+            tipo_documento=classificacao_arquivos.TIPO_COMBO_PDF,
+            tipo_peticao=tipo_peticao,
+        )
+        conteudo = File(saida, name=nome_pdf)
+        arquivo.hash_conteudo = hash_arquivos.calcular(conteudo)
+        arquivo.arquivo.save(nome_pdf, conteudo, save=False)
+        arquivo.save()
+
+    return {
+        'ok': True,
+        'url': arquivo.arquivo.url,
+        'arquivo_id': arquivo.pk,
+        'pdf_name': nome_pdf,
+        'paginas': total_paginas,
+        'ignorados': ignorados,
+    }
+
+
+def titulo_marcador(nome: str) -> str:
+    base, extensao = os.path.splitext(nome or '')
+    return base if extensao.lower() in ('.pdf', '.docx', '.doc') else (nome or '')
@@ -2,9 +2,11 @@ import logging
 from decimal import Decimal, InvalidOperation
 from urllib.parse import quote
 
-import requests
+import httpx
 from django.conf import settings
 
+from contratos.services.integracoes_http import cliente
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,11 +28,6 @@ def _get_headers(content_type='application/json'):
     return headers
 
 
-def _build_url(path):
-    base = getattr(settings, 'NOWLEX_CALC_API_BASE', 'https://calc.nowlex.com')
-    return f"{base.rstrip('/')}{path}"
-
-
 def _add_optional_payload(payload):
     mapping = {
         'NOWLEX_CALC_DATA_CORRENTE_MES': 'data_corrente_mes',
@@ -49,10 +46,10 @@ def create_calc(contract_number: str) -> dict:
         raise NowlexCalcError('Número de contrato inválido.')
     payload = {'contract_number': contract_number}
     _add_optional_payload(payload)
-    url = _build_url('/api/calculos/criar-por-contrato')
     try:
-        resp = requests.post(url, json=payload, headers=_get_headers(), timeout=60)
-    except requests.RequestException as exc:
+        # Criar cálculo não é idempotente: sem novas tentativas.
+        resp = cliente('nowlex_calc').post('/api/calculos/criar-por-contrato', json=payload, headers=_get_headers())
+    except httpx.HTTPError as exc:
         logger.exception('Erro ao criar cálculo NowLex: %s', exc)
         raise NowlexCalcError(f'Falha de conexão com NowLex Calc: {exc}')
     if resp.status_code < 200 or resp.status_code >= 300:
@@ -80,10 +77,9 @@ def get_latest_calc_id(contract_number: str) -> str | None:
     if not contract_number:
         return None
     quoted = quote(str(contract_number), safe='')
-    url = _build_url(f'/api/calc-atual/contrato/{quoted}')
     try:
-        resp = requests.get(url, headers=_get_headers(), timeout=30)
-    except requests.RequestException as exc:
+        resp = cliente('nowlex_calc').get(f'/api/calc-atual/contrato/{quoted}', headers=_get_headers(), timeout=30)
+    except httpx.HTTPError as exc:
         logger.warning('Falha ao buscar cálculo mais recente: %s', exc)
         return None
     if resp.status_code < 200 or resp.status_code >= 300:
@@ -105,11 +101,10 @@ def download_pdf(calc_id: str) -> bytes:
     if not calc_id:
         raise NowlexCalcError('Nenhum calc_id fornecido para baixar o PDF.')
     quoted = quote(str(calc_id), safe='')
-    url = _build_url(f'/api/calcs/id/{quoted}/pdf')
     headers = _get_headers('application/pdf,*/*')
     try:
-        resp = requests.get(url, headers=headers, timeout=80)
-    except requests.RequestException as exc:
+        resp = cliente('nowlex_calc').get(f'/api/calcs/id/{quoted}/pdf', headers=headers, timeout=80)
+    except httpx.HTTPError as exc:
         logger.exception('Erro ao baixar PDF do NowLex Calc: %s', exc)
         raise NowlexCalcError(f'Falha de conexão ao baixar PDF: {exc}')
     if resp.status_code < 200 or resp.status_code >= 300:
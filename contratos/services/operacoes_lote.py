@@ -0,0 +1,285 @@
+import logging
+import threading
+from datetime import timedelta
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from contratos.models import (
+    CarteiraStats, OperacaoLote, ProcessoJudicial, agendar_sincronizacao_carteira_cpf,
+    marcar_kpi_snapshots_desatualizados,
+)
+
+logger = logging.getLogger(__name__)
+
+CarteiraVinculo = ProcessoJudicial.carteiras_vinculadas.through
+EtiquetaVinculo = ProcessoJudicial.etiquetas.through
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_ASYNC_THRESHOLD = 500
+DEFAULT_TIMEOUT_MINUTES = 30
+
+
+def _chunks(ids: List[int], size: int):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _normalize_ids(processo_ids: Iterable) -> List[int]:
+    ids = set()
+    for pk in processo_ids or []:
+        try:
+            ids.add(int(pk))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+def get_async_threshold() -> int:
+    try:
+        value = int(getattr(settings, 'OPERACAO_LOTE_ASYNC_THRESHOLD', DEFAULT_ASYNC_THRESHOLD))
+    except (TypeError, ValueError):
+        return DEFAULT_ASYNC_THRESHOLD
+    return value if value > 0 else DEFAULT_ASYNC_THRESHOLD
+
+
+def get_chunk_size() -> int:
+    try:
+        value = int(getattr(settings, 'OPERACAO_LOTE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_CHUNK_SIZE
+    return value if value > 0 else DEFAULT_CHUNK_SIZE
+
+
+def get_timeout_minutes() -> int:
+    try:
+        value = int(getattr(settings, 'OPERACAO_LOTE_TIMEOUT_MINUTES', DEFAULT_TIMEOUT_MINUTES))
+    except (TypeError, ValueError):
+        return DEFAULT_TIMEOUT_MINUTES
+    return value if value > 0 else DEFAULT_TIMEOUT_MINUTES
+
+
+def deve_executar_em_segundo_plano(processo_ids) -> bool:
+    return len(processo_ids) > get_async_threshold()
+
+
+# --- Operações set-based (um UPDATE/INSERT/DELETE por bloco) ---
+
+def aplicar_carteira(processo_ids, carteira_id: Optional[int], usuario_id=None, progresso=None) -> int:
+    """
+    Move os processos para a carteira (ou remove a carteira, se None) e garante
+    o vínculo em `carteiras_vinculadas`, sem carregar instâncias.
+    """
+    ids = _normalize_ids(processo_ids)
+    quando = timezone.now()
+    atualizados = 0
+    for chunk in _chunks(ids, get_chunk_size()):
+        with transaction.atomic():
+            anteriores = dict(ProcessoJudicial.objects.filter(pk__in=chunk).values_list('pk', 'carteira_id'))
+            carteiras_anteriores = {pk for pk in anteriores.values() if pk}
+            atualizados += ProcessoJudicial.objects.filter(pk__in=chunk).update(
+                carteira_id=carteira_id,
+                ultima_edicao_em=quando,
+                ultima_edicao_por_id=usuario_id,
+            )
+            novos_vinculos = []
+            if carteira_id:
+                ja_vinculados = set(
+                    CarteiraVinculo.objects.filter(carteira_id=carteira_id, processojudicial_id__in=chunk)
+                    .values_list('processojudicial_id', flat=True)
+                )
+                novos_vinculos = [pk for pk in anteriores if pk not in ja_vinculados]
+                CarteiraVinculo.objects.bulk_create(
+                    [CarteiraVinculo(processojudicial_id=pk, carteira_id=carteira_id) for pk in novos_vinculos],
+                    ignore_conflicts=True,
+                )
+            # UPDATE e bulk_create não disparam signals (save/m2m_changed).
+            agendar_sincronizacao_carteira_cpf(chunk)
+            saidas = {}
+            for anterior in anteriores.values():
+                if anterior != carteira_id:
+                    saidas[anterior] = saidas.get(anterior, 0) + 1
+            for anterior, total in saidas.items():
+                CarteiraStats.aplicar_delta([anterior], processos_principal=-total)
+            CarteiraStats.aplicar_delta([carteira_id], processos_principal=sum(saidas.values()))
+            CarteiraStats.aplicar_vinculos([carteira_id], novos_vinculos, 1)
+            marcar_kpi_snapshots_desatualizados(carteira_ids=carteiras_anteriores, processo_ids=chunk)
+        if progresso:
+            progresso(len(chunk))
+    return atualizados
+
+
+def adicionar_etiqueta(processo_ids, etiqueta_id: int, progresso=None) -> int:
+    ids = _normalize_ids(processo_ids)
+    existentes = set()
+    for chunk in _chunks(ids, get_chunk_size()):
+        existentes.update(
+            ProcessoJudicial.objects.filter(pk__in=chunk).values_list('id', flat=True)
+        )
+        EtiquetaVinculo.objects.bulk_create(
+            [
+                EtiquetaVinculo(processojudicial_id=pk, etiqueta_id=etiqueta_id)
+                for pk in chunk if pk in existentes
+            ],
+            ignore_conflicts=True,
+        )
+        marcar_kpi_snapshots_desatualizados(processo_ids=chunk)
+        if progresso:
+            progresso(len(chunk))
+    return len(existentes)
+
+
+def remover_etiqueta(processo_ids, etiqueta_id: int, progresso=None) -> int:
+    ids = _normalize_ids(processo_ids)
+    removidos = 0
+    for chunk in _chunks(ids, get_chunk_size()):
+        removidos += EtiquetaVinculo.objects.filter(
+            etiqueta_id=etiqueta_id,
+            processojudicial_id__in=chunk,
+        ).delete()[0]
+        marcar_kpi_snapshots_desatualizados(processo_ids=chunk)
+        if progresso:
+            progresso(len(chunk))
+    return removidos
+
+
+def etiquetas_em_comum(processo_ids) -> List[int]:
+    """IDs das etiquetas presentes em todos os processos informados (uma consulta)."""
+    ids = _normalize_ids(processo_ids)
+    if not ids:
+        return []
+    return list(
+        EtiquetaVinculo.objects.filter(processojudicial_id__in=ids)
+        .values('etiqueta_id')
+        .annotate(total=Count('processojudicial_id', distinct=True))
+        .filter(total=len(ids))
+        .values_list('etiqueta_id', flat=True)
+    )
+
+
+# --- Execução em segundo plano ---
+
+def criar_operacao(tipo: str, processo_ids, parametros=None, usuario=None) -> OperacaoLote:
+    ids = _normalize_ids(processo_ids)
+    operacao = OperacaoLote.objects.create(
+        tipo=tipo,
+        parametros=parametros or {},
+        processo_ids=ids,
+        total=len(ids),
+        criado_por=usuario if getattr(usuario, 'pk', None) else None,
+    )
+    transaction.on_commit(lambda: _iniciar_thread(operacao.pk))
+    # Aproveita para retomar operações que ficaram órfãs num reinício.
+    transaction.on_commit(lambda: retomar_travadas(iniciar=True))
+    return operacao
+
+
+def retomar_travadas(minutos: Optional[int] = None, iniciar: bool = False) -> List[int]:
+    """
+    Devolve para a fila as operações 'executando' sem atividade há mais de
+    `minutos` (padrão OPERACAO_LOTE_TIMEOUT_MINUTES): a thread que as executava
+    morreu com o processo. As operações são idempotentes, então recomeçam do
+    início. Com `iniciar`, elas e as pendentes esquecidas por tanto tempo
+    voltam a rodar numa thread.
+    """
+    limite = timezone.now() - timedelta(minutes=minutos or get_timeout_minutes())
+    paradas = OperacaoLote.objects.annotate(
+        ultima_atividade=Coalesce('atualizado_em', 'iniciado_em', 'criado_em'),
+    ).filter(ultima_atividade__lt=limite)
+    travadas = paradas.filter(status=OperacaoLote.STATUS_EXECUTANDO)
+    ids = list(travadas.values_list('pk', flat=True))
+    if ids:
+        # O filtro se repete no UPDATE: outra instância pode ter retomado antes.
+        travadas.filter(pk__in=ids).update(status=OperacaoLote.STATUS_PENDENTE, processados=0)
+        logger.warning('Operações em lote retomadas após ficarem sem atividade: %s', ids)
+    if iniciar:
+        esquecidas = paradas.filter(status=OperacaoLote.STATUS_PENDENTE).values_list('pk', flat=True)
+        for operacao_id in sorted(set(ids) | set(esquecidas)):
+            _iniciar_thread(operacao_id)
+    return ids
+
+
+def _iniciar_thread(operacao_id: int):
+    thread = threading.Thread(
+        target=_executar_em_thread,
+        args=(operacao_id,),
+        name=f'operacao-lote-{operacao_id}',
+        daemon=True,
+    )
+    thread.start()
+
+
+def _executar_em_thread(operacao_id: int):
+    close_old_connections()
+    try:
+        executar_operacao(operacao_id)
+    finally:
+        close_old_connections()
+
+
+def _reservar(operacao_id: int) -> Optional[OperacaoLote]:
+    """Marca a operação como em execução; retorna None se outro processo já a pegou."""
+    agora = timezone.now()
+    reservadas = OperacaoLote.objects.filter(
+        pk=operacao_id,
+        status=OperacaoLote.STATUS_PENDENTE,
+    ).update(status=OperacaoLote.STATUS_EXECUTANDO, iniciado_em=agora, atualizado_em=agora)
+    if not reservadas:
+        return None
+    return OperacaoLote.objects.get(pk=operacao_id)
+
+
+def executar_operacao(operacao_id: int) -> Optional[OperacaoLote]:
+    operacao = _reservar(operacao_id)
+    if operacao is None:
+        return None
+
+    def progresso(quantidade):
+        operacao.processados = min(operacao.total, operacao.processados + quantidade)
+        OperacaoLote.objects.filter(pk=operacao.pk).update(
+            processados=operacao.processados,
+            atualizado_em=timezone.now(),
+        )
+
+    parametros = operacao.parametros or {}
+    try:
+        if operacao.tipo == OperacaoLote.TIPO_CARTEIRA:
+            aplicar_carteira(
+                operacao.processo_ids,
+                parametros.get('carteira_id'),
+                usuario_id=operacao.criado_por_id,
+                progresso=progresso,
+            )
+        elif operacao.tipo == OperacaoLote.TIPO_ETIQUETA_ADICIONAR:
+            adicionar_etiqueta(operacao.processo_ids, parametros['etiqueta_id'], progresso=progresso)
+        elif operacao.tipo == OperacaoLote.TIPO_ETIQUETA_REMOVER:
+            remover_etiqueta(operacao.processo_ids, parametros['etiqueta_id'], progresso=progresso)
+        else:
+            raise ValueError(f'Tipo de operação desconhecido: {operacao.tipo}')
+    except Exception as exc:
+        logger.exception('Falha na operação em lote %s', operacao.pk)
+        operacao.status = OperacaoLote.STATUS_ERRO
+        operacao.erro = str(exc)[:2000]
+    else:
+        operacao.status = OperacaoLote.STATUS_CONCLUIDO
+        operacao.processados = operacao.total
+    operacao.finalizado_em = timezone.now()
+    operacao.save(update_fields=['status', 'erro', 'processados', 'finalizado_em'])
+    return operacao
+
+
+def serializar_operacao(operacao: OperacaoLote) -> dict:
+    return {
+        'id': operacao.pk,
+        'tipo': operacao.tipo,
+        'status': operacao.status,
+        'total': operacao.total,
+        'processados': operacao.processados,
+        'percentual': operacao.percentual,
+        'erro': operacao.erro,
+        'finalizado': operacao.status in (OperacaoLote.STATUS_CONCLUIDO, OperacaoLote.STATUS_ERRO),
+    }
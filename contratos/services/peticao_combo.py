@@ -1,21 +1,32 @@
+import hashlib
 import io
+import json
 import logging
 import os
 import re
+import shutil
+import tempfile
 import time
 import unicodedata
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
-
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import File
 from django.db import transaction
 from ..models import (
+    Contrato,
+    Parte,
     ProcessoArquivo,
+    ProcessoJudicial,
     TipoPeticao,
     TipoPeticaoAnexoContinua,
     ZipGerado
 )
+from . import classificacao_arquivos, combo_padroes, conversao_pdf, hash_arquivos, montagem_pdf
+from .geracao_documentos import GeracaoErro
 
 
 class PreviewError(Exception):
@@ -24,8 +35,58 @@ class PreviewError(Exception):
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_LEITURAS_PARALELAS = 4
+COPIA_CHUNK_BYTES = 1024 * 1024
+ENTRADA_SPOOL_MAX_BYTES = 2 * 1024 * 1024
+ZIP_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_PREVIEW_CACHE_SECONDS = 600
+# Sobe quando o formato do manifesto ou do ZIP muda, para não reaproveitar ZIPs antigos.
+MANIFESTO_VERSAO = 1
+
+
+def get_preview_cache_seconds():
+    try:
+        value = int(getattr(settings, 'COMBO_PREVIEW_CACHE_SECONDS', DEFAULT_PREVIEW_CACHE_SECONDS))
+    except (TypeError, ValueError):
+        return DEFAULT_PREVIEW_CACHE_SECONDS
+    return value if value > 0 else DEFAULT_PREVIEW_CACHE_SECONDS
+
+
+def _preview_cache_key(tipo_id, arquivo_base_id):
+    """
+    Chave do preview: processo, tipo, arquivo-base e a versão de tudo que o
+    preview lê (nomes dos arquivos, anexos contínuos, padrões do tipo,
+    contratos, partes e UF). Qualquer mudança gera outra chave, então o cache
+    nunca precisa ser invalidado. None se o tipo ou o arquivo não existirem.
+    """
+    tipo = TipoPeticao.objects.filter(pk=tipo_id).values('pk', 'nome').first()
+    processo_id = ProcessoArquivo.objects.filter(pk=arquivo_base_id).values_list('processo_id', flat=True).first()
+    if not tipo or not processo_id:
+        return None
+    versao = repr((
+        tipo['nome'],
+        combo_padroes.versao(tipo['pk']),
+        list(ProcessoArquivo.objects.filter(processo_id=processo_id).order_by('pk').values_list('pk', 'nome', 'arquivo')),
+        list(TipoPeticaoAnexoContinua.objects.filter(tipo_peticao_id=tipo['pk']).order_by('pk').values_list('pk', 'nome', 'arquivo')),
+        list(Contrato.objects.filter(processo_id=processo_id).order_by('pk').values_list('numero_contrato', flat=True)),
+        list(Parte.objects.filter(processo_id=processo_id).order_by('pk').values_list('pk', 'tipo_polo', 'nome')),
+        ProcessoJudicial.objects.filter(pk=processo_id).values_list('uf', flat=True).first(),
+    ))
+    digest = hashlib.sha1(versao.encode('utf-8')).hexdigest()
+    return f"peticao_combo:preview:{processo_id}:{tipo['pk']}:{arquivo_base_id}:{digest}"
+
 
 def build_preview(tipo_id, arquivo_base_id):
+    chave = _preview_cache_key(tipo_id, arquivo_base_id)
+    preview = cache.get(chave) if chave else None
+    if preview is None:
+        preview = _montar_preview(tipo_id, arquivo_base_id)
+        if chave:
+            cache.set(chave, preview, get_preview_cache_seconds())
+    return preview
+
+
+def _montar_preview(tipo_id, arquivo_base_id):
     assets = _collect_combo_assets(tipo_id, arquivo_base_id)
     optional_preview = [
         {'id': arquivo.id, 'name': arquivo.nome or os.path.basename(arquivo.arquivo.name)}
@@ -35,10 +96,7 @@ def build_preview(tipo_id, arquivo_base_id):
     for entry in assets['per_contract']:
         per_contract_preview.append({
             'contrato': entry['contrato'],
-            'a06': entry['preview'].get('a06'),
-            'a07': entry['preview'].get('a07'),
-            'a08': entry['preview'].get('a08'),
-            'a09': entry['preview'].get('a09'),
+            **{key: entry['preview'].get(key) for key in entry['labels']},
         })
     return {
         'zip_name': assets['zip_name'],
@@ -57,11 +115,7 @@ def build_preview(tipo_id, arquivo_base_id):
     }
 
 
-def generate_zip(tipo_id, arquivo_base_id, optional_ids=None):
-    assets = _collect_combo_assets(tipo_id, arquivo_base_id)
-    tipo = assets['tipo']
-    processo = assets['processo']
-    base_file = assets['base_file']
+def _entradas_com_opcionais(assets, optional_ids):
     optional_ids_set = set(str(v) for v in (optional_ids or []))
     optional_files = [
         arquivo for arquivo in assets['optional_files']
@@ -78,83 +132,308 @@ def generate_zip(tipo_id, arquivo_base_id, optional_ids=None):
         if arquivo_id not in existing_ids:
             files_to_zip.append({'arquivo': arquivo, 'label': None})
             existing_ids.add(arquivo_id)
+    return files_to_zip
 
-    zip_buffer = io.BytesIO()
-    base_file = assets['base_file']
-    files = assets['files']
-    with zipfile.ZipFile(zip_buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_file:
-        for entry in files_to_zip:
-            entry_name = _determine_zip_entry_name(entry)
-            try:
-                raw_bytes = entry.get('force_bytes')
-                if raw_bytes is not None:
-                    zip_file.writestr(entry_name, raw_bytes)
-                    continue
-                arquivo = entry.get('arquivo')
-                if (
-                    arquivo
-                    and base_file
-                    and arquivo.id == base_file.id
-                    and (arquivo.arquivo.name or '').lower().endswith('.docx')
-                ):
-                    pdf_bytes = _convert_docx_to_pdf_bytes_for_zip(arquivo)
-                    if pdf_bytes:
-                        pdf_name = _swap_extension(entry_name, '.pdf')
-                        zip_file.writestr(pdf_name, pdf_bytes)
-                        entry['force_name'] = pdf_name
-                        entry['force_bytes'] = pdf_bytes
-                        continue
-                    fallback_pdf = _find_matching_pdf(arquivo, files)
-                    if fallback_pdf:
-                        with fallback_pdf.arquivo.open('rb') as fh:
-                            pdf_name = _swap_extension(entry_name, '.pdf')
-                            zip_file.writestr(pdf_name, fh.read())
-                        entry['force_name'] = pdf_name
-                        continue
-                with arquivo.arquivo.open('rb') as fh:
-                    zip_file.writestr(entry_name, fh.read())
-            except Exception:
-                continue
-    zip_buffer.seek(0)
 
+def generate_zip(tipo_id, arquivo_base_id, optional_ids=None, progresso=None):
+    assets = _collect_combo_assets(tipo_id, arquivo_base_id)
+    tipo = assets['tipo']
+    processo = assets['processo']
+    base_file = assets['base_file']
+    files_to_zip = _entradas_com_opcionais(assets, optional_ids)
     zip_name = assets['zip_name']
-    zip_proc_file = ProcessoArquivo.objects.create(
-        processo=processo,
-        nome=zip_name
-    )
-    zip_proc_file.arquivo.save(zip_name, ContentFile(zip_buffer.read()))
-    zip_proc_file.save()
+    manifesto_hash = _manifesto_hash(tipo, zip_name, files_to_zip, base_file, assets['pdf_base'])
+    existente = _zip_existente(processo, tipo, manifesto_hash) if manifesto_hash else None
+    if existente:
+        zip_gerado, zip_proc_file = existente
+        if progresso:
+            progresso("Reaproveitando o ZIP gerado com os mesmos arquivos", total=1)
+        logger.info("Combo ZIP: reaproveitado o arquivo %s (manifesto %s)", zip_proc_file.pk, manifesto_hash[:12])
+        return _resultado_zip(zip_proc_file, zip_proc_file.nome, zip_gerado.entradas, assets['missing'], True)
+
+    fontes, degradado = _resolver_fontes_zip(files_to_zip, base_file, assets['pdf_base'])
+    if degradado:
+        # Sem conversor o ZIP leva o PDF anexado ou o próprio DOCX; não entra no
+        # reaproveitamento para não continuar sendo servido quando o conversor voltar.
+        manifesto_hash = None
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_BYTES) as saida:
+        _escrever_zip(saida, fontes, progresso)
+        saida.seek(0)
+        if progresso:
+            progresso("Salvando o ZIP em Arquivos")
+        zip_proc_file = ProcessoArquivo.objects.create(
+            processo=processo,
+            nome=zip_name,
+            tipo_documento=classificacao_arquivos.TIPO_COMBO_ZIP,
+            tipo_peticao=tipo,
+        )
+        # Com S3 o storage envia o arquivo em partes (upload_fileobj/multipart).
+        zip_proc_file.arquivo.save(zip_name, File(saida, name=zip_name))
+        zip_proc_file.save()
 
+    if base_file:
+        ProcessoArquivo.objects.filter(pk=base_file.pk, tipo_peticao__isnull=True).update(tipo_peticao=tipo)
+
+    entradas = [
+        {
+            'label': entry.get('label'),
+            'name': _get_entry_name(entry)
+        }
+        for entry in files_to_zip
+        if entry.get('arquivo')
+    ]
     ZipGerado.objects.create(
         tipo_peticao=tipo,
         processo=processo,
         arquivo_base=base_file,
         zip_file=zip_proc_file.arquivo,
         missing=assets['missing'],
-        contratos=assets['contracts']
+        contratos=assets['contracts'],
+        manifesto_hash=manifesto_hash or '',
+        entradas=entradas,
     )
+    return _resultado_zip(zip_proc_file, zip_name, entradas, assets['missing'], False)
 
+
+def generate_pdf(tipo_id, arquivo_base_id, optional_ids=None, progresso=None, usuario=None):
+    """
+    PDF único do combo: a petição-base e os mesmos documentos do ZIP (na
+    mesma ordem, com os rótulos do combo como marcadores).
+    """
+    assets = _collect_combo_assets(tipo_id, arquivo_base_id)
+    base_file = assets['base_file']
+    fontes = []
+    for entry in _entradas_com_opcionais(assets, optional_ids):
+        arquivo = entry['arquivo']
+        alternativa = None
+        if arquivo is base_file and assets['pdf_base'] is not None:
+            alternativa = assets['pdf_base'].arquivo
+        fontes.append(montagem_pdf.FontePdf(
+            titulo=montagem_pdf.titulo_marcador(entry.get('label') or _get_file_display_name(arquivo)),
+            arquivo=arquivo.arquivo,
+            alternativa=alternativa,
+        ))
+    resultado = montagem_pdf.montar(
+        assets['processo'],
+        fontes,
+        _swap_extension(assets['zip_name'], '.pdf'),
+        usuario=usuario,
+        tipo_peticao=assets['tipo'],
+        progresso=progresso,
+    )
+    resultado['missing'] = assets['missing']
+    return resultado
+
+
+def executar_geracao_pdf(geracao, progresso):
+    """Executor da fila de geração (GeracaoDocumento.TIPO_COMBO_PDF)."""
+    parametros = geracao.parametros or {}
+    try:
+        return generate_pdf(
+            parametros.get('tipo_id'),
+            parametros.get('arquivo_base_id'),
+            parametros.get('optional_ids') or [],
+            progresso=progresso,
+            usuario=geracao.criado_por,
+        )
+    except PreviewError as exc:
+        raise GeracaoErro(str(exc))
+
+
+def _resultado_zip(zip_proc_file, zip_name, entradas, missing, reutilizado):
     return {
         'url': zip_proc_file.arquivo.url,
         'arquivo_id': zip_proc_file.id,
-        'missing': assets['missing'],
+        'missing': missing,
         'ok': True,
         'zip_name': zip_name,
-        'entries': [
-            {
-                'label': entry.get('label'),
-                'name': _get_entry_name(entry)
-            }
-            for entry in files_to_zip
-            if entry.get('arquivo')
-        ],
-        'missing_count': len(assets['missing']),
+        'reutilizado': reutilizado,
+        'entries': entradas,
+        'missing_count': len(missing),
         'missing_message': (
-            f"Existem {len(assets['missing'])} itens faltantes." if assets['missing'] else ''
+            f"Existem {len(missing)} itens faltantes." if missing else ''
         )
     }
 
 
+def _manifesto_hash(tipo, zip_name, files_to_zip, base_file, pdf_alternativo):
+    """
+    Hash do manifesto do ZIP: arquivos de origem (modelo, id, hash do
+    conteúdo) ordenados, com o nome de cada entrada, o nome do ZIP e as opções
+    de conversão do arquivo-base. None quando algum arquivo não pôde ser lido
+    para o hash; nesse caso o ZIP é gerado sem reaproveitamento. ZIPs em que a
+    conversão do DOCX base falhou também ficam sem hash (ver generate_zip).
+    """
+    objetos = [entry['arquivo'] for entry in files_to_zip if entry.get('arquivo') is not None]
+    converter_base = bool(base_file and (base_file.arquivo.name or '').lower().endswith('.docx'))
+    # Sem conversor disponível o ZIP leva o PDF já anexado no lugar do DOCX.
+    pdf_alternativo = pdf_alternativo if converter_base else None
+    hash_arquivos.preencher(
+        objetos + ([pdf_alternativo] if pdf_alternativo else []),
+        get_leituras_paralelas(),
+    )
+    if any(not obj.hash_conteudo for obj in objetos):
+        return None
+    manifesto = {
+        'versao': MANIFESTO_VERSAO,
+        'tipo_peticao': tipo.pk,
+        'zip_name': zip_name,
+        'fontes': sorted(
+            [
+                entry['arquivo']._meta.model_name,
+                entry['arquivo'].pk,
+                entry['arquivo'].hash_conteudo,
+                _determine_zip_entry_name(entry),
+            ]
+            for entry in files_to_zip
+            if entry.get('arquivo') is not None
+        ),
+        'conversao': {
+            'base_docx_para_pdf': converter_base,
+            'pdf_alternativo': (
+                [pdf_alternativo.pk, pdf_alternativo.hash_conteudo] if pdf_alternativo else None
+            ),
+        },
+    }
+    conteudo = json.dumps(manifesto, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def _zip_existente(processo, tipo, manifesto_hash):
+    """(ZipGerado, ProcessoArquivo do ZIP) com o mesmo manifesto, se o arquivo ainda existir."""
+    zips = ZipGerado.objects.filter(
+        processo=processo, tipo_peticao=tipo, manifesto_hash=manifesto_hash
+    ).order_by('-criado_em')
+    for zip_gerado in zips:
+        zip_proc_file = ProcessoArquivo.objects.filter(
+            processo=processo, arquivo=zip_gerado.zip_file.name
+        ).first()
+        if zip_proc_file is None:
+            continue
+        try:
+            if zip_proc_file.arquivo.storage.exists(zip_proc_file.arquivo.name):
+                return zip_gerado, zip_proc_file
+        except Exception as exc:
+            logger.warning("Combo ZIP: não foi possível verificar %s: %s", zip_proc_file.arquivo.name, exc)
+    return None
+
+
+def _resolver_fontes_zip(files_to_zip, base_file, pdf_base):
+    """
+    Lista (nome no ZIP, conteúdo) na ordem das entradas, e se a conversão do
+    DOCX base falhou; o conteúdo é `bytes` (já em memória) ou o FieldFile a
+    ser lido do storage. O DOCX base é convertido aqui, na thread do
+    request/worker, porque a conversão grava estatísticas no banco.
+    """
+    fontes = []
+    degradado = False
+    for entry in files_to_zip:
+        entry_name = _determine_zip_entry_name(entry)
+        try:
+            raw_bytes = entry.get('force_bytes')
+            if raw_bytes is not None:
+                fontes.append((entry_name, raw_bytes))
+                continue
+            arquivo = entry.get('arquivo')
+            if (
+                arquivo
+                and base_file
+                and arquivo.id == base_file.id
+                and (arquivo.arquivo.name or '').lower().endswith('.docx')
+            ):
+                pdf_bytes = _convert_docx_to_pdf_bytes_for_zip(arquivo)
+                if pdf_bytes:
+                    pdf_name = _swap_extension(entry_name, '.pdf')
+                    fontes.append((pdf_name, pdf_bytes))
+                    entry['force_name'] = pdf_name
+                    continue
+                degradado = True
+                if pdf_base:
+                    pdf_name = _swap_extension(entry_name, '.pdf')
+                    fontes.append((pdf_name, pdf_base.arquivo))
+                    entry['force_name'] = pdf_name
+                    continue
+            fontes.append((entry_name, arquivo.arquivo))
+        except Exception:
+            continue
+    return fontes, degradado
+
+
+def _ler_fonte(conteudo):
+    """Abre a fonte para cópia: bytes viram BytesIO; arquivos do storage vão para um spool."""
+    if isinstance(conteudo, (bytes, bytearray)):
+        return io.BytesIO(conteudo), len(conteudo)
+    destino = tempfile.SpooledTemporaryFile(max_size=ENTRADA_SPOOL_MAX_BYTES)
+    try:
+        # storage.open direto: o FieldFile compartilhado não é thread-safe.
+        with conteudo.storage.open(conteudo.name, 'rb') as origem:
+            shutil.copyfileobj(origem, destino, COPIA_CHUNK_BYTES)
+        tamanho = destino.tell()
+        destino.seek(0)
+    except Exception:
+        destino.close()
+        raise
+    return destino, tamanho
+
+
+def get_leituras_paralelas():
+    try:
+        value = int(getattr(settings, 'COMBO_ZIP_LEITURAS_PARALELAS', DEFAULT_LEITURAS_PARALELAS))
+    except (TypeError, ValueError):
+        return DEFAULT_LEITURAS_PARALELAS
+    return value if value > 0 else DEFAULT_LEITURAS_PARALELAS
+
+
+def _escrever_zip(saida, fontes, progresso=None):
+    """
+    Escreve as entradas em `saida` na ordem recebida, buscando no storage até
+    2× COMBO_ZIP_LEITURAS_PARALELAS arquivos à frente. Cada entrada é copiada
+    em blocos, então a memória não cresce com o tamanho do combo.
+    """
+    leituras = get_leituras_paralelas()
+    pendentes = deque()
+    proxima = 0
+    total = len(fontes) + 1
+    with ThreadPoolExecutor(max_workers=leituras, thread_name_prefix='combo-zip') as executor, \
+            zipfile.ZipFile(saida, mode='w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        try:
+            while pendentes or proxima < len(fontes):
+                while proxima < len(fontes) and len(pendentes) < leituras * 2:
+                    nome, conteudo = fontes[proxima]
+                    pendentes.append((nome, executor.submit(_ler_fonte, conteudo)))
+                    proxima += 1
+                nome, leitura = pendentes.popleft()
+                if progresso:
+                    progresso(f"Adicionando {nome}", total=total)
+                    total = None
+                try:
+                    origem, tamanho = leitura.result()
+                except Exception as exc:
+                    logger.warning("Combo ZIP: falha ao ler %s do storage: %s", nome, exc)
+                    continue
+                with origem, zip_file.open(nome, 'w', force_zip64=tamanho > zipfile.ZIP64_LIMIT) as destino:
+                    shutil.copyfileobj(origem, destino, COPIA_CHUNK_BYTES)
+        finally:
+            for _nome, leitura in pendentes:
+                leitura.cancel()
+                if leitura.done() and not leitura.cancelled() and leitura.exception() is None:
+                    leitura.result()[0].close()
+
+
+def executar_geracao_zip(geracao, progresso):
+    """Executor da fila de geração (GeracaoDocumento.TIPO_COMBO_ZIP)."""
+    parametros = geracao.parametros or {}
+    try:
+        return generate_zip(
+            parametros.get('tipo_id'),
+            parametros.get('arquivo_base_id'),
+            parametros.get('optional_ids') or [],
+            progresso=progresso,
+        )
+    except PreviewError as exc:
+        raise GeracaoErro(str(exc))
+
+
 def _collect_combo_assets(tipo_id, arquivo_base_id):
     try:
         tipo = TipoPeticao.objects.get(pk=tipo_id)
@@ -171,30 +450,36 @@ def _collect_combo_assets(tipo_id, arquivo_base_id):
     if not contratos:
         contratos = _extract_contracts_from_processo(processo)
     files = list(processo.arquivos.all())
+    # Um índice e uma busca do PDF do arquivo-base por execução: preview,
+    # manifesto, ZIP e PDF único usam os mesmos resultados.
+    indice = combo_padroes.IndiceArquivos(files)
+    pdf_base = (
+        _find_matching_pdf(base_file, files)
+        if (base_file.arquivo.name or '').lower().endswith('.docx') else None
+    )
+    padroes = combo_padroes.padroes_do_tipo(tipo)
     used_ids = {base_file.id}
     missing = []
-    optional_files = _find_optional_annexes(files, used_ids)
+    optional_files = _find_optional_annexes(indice, padroes, files, used_ids)
     continuous_annexes = _get_continuous_annexes(tipo)
     continuous_entries = _build_continuous_entries(continuous_annexes)
-    extrato = _find_extrato(files, used_ids)
-    if extrato:
-        used_ids.add(extrato.id)
-    else:
-        missing.append("05 - Extrato de Titularidade")
-    per_contract = _collect_contract_files(contratos, files, used_ids, missing)
+    fixed = _collect_fixed_files(indice, padroes, used_ids, missing)
+    per_contract = _collect_contract_files(indice, padroes, contratos, used_ids, missing)
     zip_entries = _build_zip_entries(
         base_file,
         continuous_entries,
-        extrato,
+        fixed,
         per_contract
     )
-    preview_found = _build_preview_found(base_file, continuous_entries, extrato, per_contract)
+    preview_found = _build_preview_found(base_file, continuous_entries, fixed, per_contract)
     zip_name = _build_zip_name(tipo, processo, contratos, _primeiros_nomes_passivo(processo))
     return {
         'tipo': tipo,
         'processo': processo,
         'base_file': base_file,
         'files': files,
+        'indice': indice,
+        'pdf_base': pdf_base,
         'contracts': contratos,
         'zip_name': zip_name,
         'missing': missing,
@@ -205,7 +490,7 @@ def _collect_combo_assets(tipo_id, arquivo_base_id):
         'zip_entries': zip_entries,
         'preview_found': preview_found,
         'file01': _build_file_preview(base_file),
-        'file05': _build_file_preview(extrato),
+        'file05': fixed[0]['preview'] if fixed else None,
         'continuous_annexes_preview': [
             {
                 'id': _entry_id(annex_entry['arquivo']),
@@ -284,9 +569,8 @@ def _find_matching_pdf(docx_file, files):
 
 def _convert_docx_to_pdf_bytes_for_zip(arquivo):
     """
-    Converte DOCX para PDF.
-    Prioriza Gotenberg (serviço com LibreOffice embutido).
-    Se não disponível, tenta LibreOffice local.
+    Converte o DOCX base para PDF (Gotenberg/LibreOffice, com cache por
+    conteúdo). Sem conversor disponível, o chamador usa um PDF já anexado.
     """
     try:
         arquivo.arquivo.open('rb')
@@ -294,108 +578,15 @@ def _convert_docx_to_pdf_bytes_for_zip(arquivo):
         arquivo.arquivo.close()
     except Exception:
         return None
+    return conversao_pdf.converter_docx_para_pdf(docx_bytes, permitir_fallback=False)
 
-    # Tenta Gotenberg primeiro (serviço Docker com LibreOffice)
-    from django.conf import settings
-    import os
-    gotenberg_url = getattr(settings, 'GOTENBERG_URL', os.environ.get('GOTENBERG_URL', ''))
 
-    if gotenberg_url:
-        try:
-            logger.info("ZIP: Tentando conversão via Gotenberg: %s", gotenberg_url)
-            files = {'files': ('document.docx', docx_bytes, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            response = requests.post(
-                f"{gotenberg_url}/forms/libreoffice/convert",
-                files=files,
-                timeout=120
-            )
-            if response.status_code == 200 and response.content:
-                pdf_size = len(response.content)
-                logger.info("ZIP: Gotenberg conversão bem-sucedida (PDF: %d bytes)", pdf_size)
-
-                # Valida se é um PDF válido
-                if response.content[:5] == b'%PDF-' and pdf_size > 1000:
-                    return response.content
-                else:
-                    logger.warning("ZIP: PDF inválido ou muito pequeno (%d bytes)", pdf_size)
-            else:
-                logger.warning("ZIP: Gotenberg falhou: status=%s", response.status_code)
-        except requests.Timeout:
-            logger.warning("ZIP: Gotenberg timeout após 120s")
-        except Exception as exc:
-            logger.warning("ZIP: Erro ao usar Gotenberg: %s", exc)
-
-    # Tenta LibreOffice local como fallback
-    import shutil
-    import subprocess
-    import tempfile
-    from pathlib import Path
-
-    def _find_soffice():
-        # Lista expandida de localizações possíveis do LibreOffice
-        candidates = [
-            "soffice",
-            "/usr/bin/soffice",
-            "libreoffice",
-            "/usr/bin/libreoffice",
-            "/opt/libreoffice/program/soffice",
-            "/usr/lib/libreoffice/program/soffice",
-            "/snap/bin/libreoffice",
-        ]
-        for candidate in candidates:
-            if shutil.which(candidate):
-                logger.info("LibreOffice encontrado em: %s", candidate)
-                return candidate
-        # Log de diagnóstico se não encontrar
-        logger.error("LibreOffice não encontrado em ZIP. Tentou: %s", ", ".join(candidates))
-        return None
-
-    soffice_cmd = _find_soffice()
-    if not soffice_cmd:
-        logger.warning("LibreOffice não encontrado para conversão do ZIP")
-        return None
-
-    try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir_path = Path(tmpdir)
-            docx_path = tmpdir_path / "input.docx"
-            pdf_path = tmpdir_path / "input.pdf"
-            docx_path.write_bytes(docx_bytes)
-            cmd = [
-                soffice_cmd,
-                "--headless",
-                "--nologo",
-                "--nodefault",
-                "--norestore",
-                "--nofirststartwizard",
-                "--convert-to",
-                "pdf:writer_pdf_Export",
-                "--outdir",
-                str(tmpdir_path),
-                str(docx_path),
-            ]
-            result = subprocess.run(cmd, capture_output=True, timeout=90)
-            if result.returncode == 0 and pdf_path.exists():
-                return pdf_path.read_bytes()
-            logger.error(
-                "LibreOffice falhou na conversão do ZIP: rc=%s",
-                result.returncode,
-            )
-    except Exception as exc:
-        logger.error("Erro ao converter DOCX para PDF (ZIP): %s", exc)
-
-    return None
-
-
-def _find_optional_annexes(files, used_ids):
-    optional = []
-    for arquivo in files:
-        if arquivo.id in used_ids:
-            continue
-        name_norm = _normalize_text(arquivo.nome or arquivo.arquivo.name or '')
-        if name_norm.startswith('anexo'):
-            optional.append(arquivo)
-    return optional
+def _find_optional_annexes(indice, padroes, files, used_ids):
+    found_ids = set()
+    for padrao in padroes:
+        if padrao.categoria == combo_padroes.ANEXO:
+            found_ids.update(arquivo.id for arquivo in indice.buscar(padrao, ignorar=used_ids))
+    return [arquivo for arquivo in files if arquivo.id in found_ids]
 
 
 def _get_continuous_annexes(tipo):
@@ -414,148 +605,73 @@ def _build_continuous_entries(continuous_annexes):
     return entries
 
 
-def _find_extrato(files, used_ids):
-    prefix = '05 - extrato de titularidade'
-    target = _normalize_text(prefix)
-    candidates = []
-    for arquivo in files:
-        if arquivo.id in used_ids:
-            continue
-        name_norm = _normalize_text(arquivo.nome or arquivo.arquivo.name or '')
-        if not name_norm.startswith(target):
-            continue
-        pdf_score = _normalize_text(_get_file_display_name(arquivo)).endswith('.pdf')
-        timestamp = arquivo.criado_em.timestamp() if arquivo.criado_em else 0
-        candidates.append((arquivo, pdf_score, timestamp))
-    if not candidates:
+def _find_best(indice, padrao, used_ids, contrato=''):
+    encontrados = indice.buscar(padrao, contrato=contrato, ignorar=used_ids)
+    if not encontrados:
         return None
-    candidates.sort(key=lambda item: (-int(item[1]), -item[2]))
-    return candidates[0][0]
+    used_ids.add(encontrados[0].id)
+    return encontrados[0]
 
 
-def _collect_contract_files(contracts, files, used_ids, missing):
+def _collect_fixed_files(indice, padroes, used_ids, missing):
+    results = []
+    for padrao in padroes:
+        if padrao.categoria != combo_padroes.FIXO:
+            continue
+        label = padrao.rotulo_para()
+        arquivo = _find_best(indice, padrao, used_ids)
+        if arquivo:
+            results.append({
+                'key': padrao.chave,
+                'arquivo': arquivo,
+                'label': label,
+                'preview': _build_file_preview(arquivo),
+            })
+        elif padrao.obrigatorio:
+            missing.append(label)
+    return results
+
+
+def _collect_contract_files(indice, padroes, contracts, used_ids, missing):
+    contract_padroes = [p for p in padroes if p.categoria == combo_padroes.CONTRATO]
     results = []
     for contrato in contracts:
         entry = {
             'contrato': contrato,
             'files': {},
             'preview': {},
-            'labels': {
-                'a06': f"06 - {contrato} - Contrato",
-                'a07': f"07 - {contrato} - Relatório",
-                'a08': f"08 - {contrato} - Saldo Devedor (ou Cálculo)",
-                'a09': f"09 - {contrato} - TED",
-            }
+            'labels': {padrao.chave: padrao.rotulo_para(contrato) for padrao in contract_padroes},
         }
-        a06 = _find_by_contract_and_keywords(
-            files,
-            contrato,
-            ['contrato', 'termo de ades', 'termo de adesao'],
-            used_ids=used_ids
-        )
-        if a06:
-            entry['files']['a06'] = a06
-            entry['preview']['a06'] = _build_file_preview(a06, entry['labels']['a06'])
-            used_ids.add(a06.id)
-        else:
-            missing.append(entry['labels']['a06'])
-
-        a07 = _find_by_contract_and_keywords(
-            files,
-            contrato,
-            ['relatorio', 'relatório'],
-            used_ids=used_ids
-        )
-        if a07:
-            entry['files']['a07'] = a07
-            entry['preview']['a07'] = _build_file_preview(a07, entry['labels']['a07'])
-            used_ids.add(a07.id)
-        else:
-            missing.append(entry['labels']['a07'])
-
-        a08 = _find_by_contract_and_keywords(
-            files,
-            contrato,
-            ['calculo de saldo devedor', 'cálculo de saldo devedor', 'saldo devedor'],
-            used_ids=used_ids
-        )
-        if not a08:
-            a08 = _find_by_contract_and_keywords(
-                files,
-                contrato,
-                [],
-                keywords_all=['saldo', 'b6'],
-                used_ids=used_ids
-            )
-        if a08:
-            entry['files']['a08'] = a08
-            entry['preview']['a08'] = _build_file_preview(a08, entry['labels']['a08'])
-            used_ids.add(a08.id)
-        else:
-            missing.append(entry['labels']['a08'])
-
-        a09 = _find_by_contract_and_keywords(
-            files,
-            contrato,
-            ['ted'],
-            used_ids=used_ids
-        )
-        if a09:
-            entry['files']['a09'] = a09
-            entry['preview']['a09'] = _build_file_preview(a09, entry['labels']['a09'])
-            used_ids.add(a09.id)
-        else:
-            missing.append(entry['labels']['a09'])
-
+        for padrao in contract_padroes:
+            label = entry['labels'][padrao.chave]
+            arquivo = _find_best(indice, padrao, used_ids, contrato=contrato)
+            if arquivo:
+                entry['files'][padrao.chave] = arquivo
+                entry['preview'][padrao.chave] = _build_file_preview(arquivo, label)
+            elif padrao.obrigatorio:
+                missing.append(label)
         results.append(entry)
     return results
 
 
-def _find_by_contract_and_keywords(files, contract, keywords_any=None, keywords_all=None, used_ids=None):
-    candidates = []
-    contract_norm = _normalize_text(contract)
-    keywords_any_norm = [_normalize_text(kw) for kw in (keywords_any or []) if kw]
-    keywords_all_norm = [_normalize_text(kw) for kw in (keywords_all or []) if kw]
-
-    for arquivo in files:
-        if arquivo.id in (used_ids or set()):
-            continue
-        name_norm = _normalize_text(arquivo.nome or arquivo.arquivo.name or '')
-        if contract_norm and contract_norm not in name_norm:
-            continue
-        if keywords_all_norm and not all(kw in name_norm for kw in keywords_all_norm):
-            continue
-        if keywords_any_norm and not any(kw in name_norm for kw in keywords_any_norm):
-            continue
-        pdf_score = _get_file_display_name(arquivo).lower().endswith('.pdf')
-        match_score = sum(1 for kw in keywords_any_norm if kw in name_norm)
-        timestamp = arquivo.criado_em.timestamp() if arquivo.criado_em else 0
-        candidates.append((arquivo, pdf_score, match_score, timestamp))
-    if not candidates:
-        return None
-    candidates.sort(key=lambda item: (-int(item[1]), -item[2], -item[3]))
-    return candidates[0][0]
-
-
-def _build_zip_entries(base_file, continuous_entries, extrato, per_contract):
+def _build_zip_entries(base_file, continuous_entries, fixed, per_contract):
     entries = [{'arquivo': base_file, 'label': None}]
     for annex_entry in continuous_entries:
         entries.append({
             'arquivo': annex_entry['arquivo'],
             'label': annex_entry['label']
         })
-    if extrato:
-        entries.append({'arquivo': extrato, 'label': "05 - Extrato de Titularidade"})
+    for fixed_entry in fixed:
+        entries.append({'arquivo': fixed_entry['arquivo'], 'label': fixed_entry['label']})
     for contract_entry in per_contract:
-        for key in ['a06', 'a07', 'a08', 'a09']:
+        for key, label in contract_entry['labels'].items():
             arquivo = contract_entry['files'].get(key)
-            label = contract_entry['labels'][key]
             if arquivo:
                 entries.append({'arquivo': arquivo, 'label': label})
     return entries
 
 
-def _build_preview_found(base_file, continuous_entries, extrato, per_contract):
+def _build_preview_found(base_file, continuous_entries, fixed, per_contract):
     entries = []
     if base_file:
         entries.append({
@@ -569,14 +685,14 @@ def _build_preview_found(base_file, continuous_entries, extrato, per_contract):
             'arquivo_id': _entry_id(annex_entry['arquivo']),
             'name': _get_file_display_name(annex_entry['arquivo'])
         })
-    if extrato:
+    for fixed_entry in fixed:
         entries.append({
-            'label': "05 - Extrato de Titularidade",
-            'arquivo_id': extrato.id,
-            'name': _get_file_display_name(extrato)
+            'label': fixed_entry['label'],
+            'arquivo_id': fixed_entry['arquivo'].id,
+            'name': _get_file_display_name(fixed_entry['arquivo'])
         })
     for contract_entry in per_contract:
-        for key in ['a06', 'a07', 'a08', 'a09']:
+        for key in contract_entry['labels']:
             preview = contract_entry['preview'].get(key)
             if preview:
                 entries.append({
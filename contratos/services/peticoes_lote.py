@@ -0,0 +1,282 @@
+"""
+Geração de petições (monitória, cobrança ou habilitação) para vários processos
+numa única GeracaoDocumento do tipo `lote_peticoes`.
+
+Os dados dos processos (análise, polo passivo, contratos) vêm de poucas
+consultas em lote; o DOCX de cada processo é montado com o template em cache
+(modelos_documento) e as etapas de I/O — conversão para PDF e extrato de
+titularidade no NowLex — rodam num pool limitado de threads enquanto os
+próximos DOCX são montados. Cada processo tem seu resultado (arquivos gerados
+ou erro) em `resultado['itens']`; a falha de um não interrompe o lote.
+"""
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Prefetch
+
+from contratos.models import Contrato, GeracaoDocumento, Parte, ProcessoArquivo, ProcessoJudicial
+from contratos.services import classificacao_arquivos, conversao_pdf, geracao_documentos
+from contratos.services.geracao_documentos import GeracaoErro
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TAREFAS_PARALELAS = 4
+DEFAULT_MAX_PROCESSOS = 500
+
+TIPO_DOCUMENTO = {
+    GeracaoDocumento.TIPO_MONITORIA: classificacao_arquivos.TIPO_MONITORIA_INICIAL,
+    GeracaoDocumento.TIPO_COBRANCA: classificacao_arquivos.TIPO_COBRANCA_JUDICIAL,
+    GeracaoDocumento.TIPO_HABILITACAO: classificacao_arquivos.TIPO_HABILITACAO,
+}
+
+
+def _setting_int(nome: str, default: int) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def get_tarefas_paralelas() -> int:
+    return _setting_int('GERACAO_LOTE_TAREFAS_PARALELAS', DEFAULT_TAREFAS_PARALELAS)
+
+
+def get_max_processos() -> int:
+    return _setting_int('GERACAO_LOTE_MAX_PROCESSOS', DEFAULT_MAX_PROCESSOS)
+
+
+def enfileirar_lote(tipo: str, processo_ids, converter_pdf: bool = True, emitir_extrato: bool = True, usuario=None):
+    """Valida e enfileira o lote; retorna (geracao, criada) como geracao_documentos.enfileirar."""
+    if tipo not in GeracaoDocumento.TIPOS_PETICAO:
+        raise ValueError(f'Tipo de petição inválido: {tipo}')
+    processo_ids = sorted({int(pk) for pk in processo_ids})
+    if not processo_ids:
+        raise ValueError('Nenhum processo selecionado.')
+    if len(processo_ids) > get_max_processos():
+        raise ValueError(f'Selecione no máximo {get_max_processos()} processos por lote.')
+    parametros = {
+        'tipo': tipo,
+        'processo_ids': processo_ids,
+        'converter_pdf': bool(converter_pdf),
+        'emitir_extrato': bool(emitir_extrato) and tipo != GeracaoDocumento.TIPO_HABILITACAO,
+    }
+    return geracao_documentos.enfileirar(GeracaoDocumento.TIPO_LOTE_PETICOES, None, parametros, usuario=usuario)
+
+
+@dataclass
+class _Item:
+    processo: ProcessoJudicial
+    polo_passivo: Optional[Parte] = None
+    contratos: List[Contrato] = field(default_factory=list)
+    resultado: dict = field(default_factory=dict)
+
+
+def _carregar_itens(tipo: str, processo_ids: List[int]) -> List[_Item]:
+    processos = (
+        ProcessoJudicial.objects.filter(pk__in=processo_ids)
+        .select_related('analise_processo')
+        .prefetch_related(
+            Prefetch(
+                'partes_processuais',
+                queryset=Parte.objects.filter(tipo_polo='PASSIVO').order_by('pk'),
+                to_attr='polos_passivos_lote',
+            ),
+            'contratos',
+        )
+    )
+    from contratos.views import _parse_contract_ids
+    por_id = {processo.pk: processo for processo in processos}
+
+    def _ids_da_analise(processo):
+        analise = getattr(processo, 'analise_processo', None)
+        respostas = getattr(analise, 'respostas', None) or {}
+        return respostas.get('contratos_para_monitoria', []) or []
+
+    # Na monitória os contratos da análise não são filtrados pelo processo (como na view).
+    contratos_monitoria: Dict[int, Contrato] = {}
+    if tipo == GeracaoDocumento.TIPO_MONITORIA:
+        todos_ids = set()
+        for processo in por_id.values():
+            todos_ids.update(_parse_contract_ids(_ids_da_analise(processo)))
+        contratos_monitoria = {
+            contrato.pk: contrato
+            for contrato in Contrato.objects.filter(id__in=todos_ids).select_related('processo')
+        }
+
+    itens = []
+    for processo_id in processo_ids:
+        processo = por_id.get(processo_id)
+        if processo is None:
+            itens.append(_Item(processo=None, resultado={'processo_id': processo_id}))
+            continue
+        item = _Item(processo=processo, resultado={'processo_id': processo_id, 'cnj': processo.cnj or ''})
+        item.polo_passivo = processo.polos_passivos_lote[0] if processo.polos_passivos_lote else None
+        if tipo == GeracaoDocumento.TIPO_MONITORIA:
+            item.contratos = [
+                contratos_monitoria[pk] for pk in sorted(_parse_contract_ids(_ids_da_analise(processo)))
+                if pk in contratos_monitoria
+            ]
+        elif tipo == GeracaoDocumento.TIPO_COBRANCA:
+            ids_analise = {str(pk) for pk in _ids_da_analise(processo)}
+            item.contratos = [
+                contrato for contrato in sorted(processo.contratos.all(), key=lambda c: c.pk)
+                if not ids_analise or str(contrato.pk) in ids_analise
+            ]
+        itens.append(item)
+    return itens
+
+
+def _montar_docx(tipo: str, item: _Item):
+    """(docx_bytes, nome_base) do item; GeracaoErro com a mesma mensagem das views."""
+    from contratos import views
+    if item.processo is None:
+        raise GeracaoErro('Processo Judicial não encontrado.')
+    if item.polo_passivo is None:
+        raise GeracaoErro('Polo passivo não encontrado para este processo.')
+    processo, polo_passivo = item.processo, item.polo_passivo
+    try:
+        if tipo == GeracaoDocumento.TIPO_MONITORIA:
+            if not item.contratos:
+                raise GeracaoErro('Nenhum contrato selecionado para monitória na análise deste processo.')
+            return (
+                views._build_docx_bytes_common(processo, polo_passivo, item.contratos),
+                views._build_monitoria_base_filename(polo_passivo, item.contratos),
+            )
+        if tipo == GeracaoDocumento.TIPO_COBRANCA:
+            if not item.contratos:
+                raise GeracaoErro('Nenhum contrato disponível para gerar a cobrança judicial.')
+            if not polo_passivo.endereco:
+                raise GeracaoErro('Endereço da parte passiva não informado.')
+            return (
+                views._build_cobranca_docx_bytes(processo, polo_passivo, item.contratos),
+                views._build_cobranca_base_filename(polo_passivo, item.contratos),
+            )
+        missing_fields = views._collect_missing_habilitacao_fields(processo, polo_passivo)
+        if missing_fields:
+            raise GeracaoErro(views._mensagem_habilitacao_incompleta(missing_fields))
+        return (
+            views._build_habilitacao_docx_bytes(processo, polo_passivo),
+            views._build_habilitacao_base_filename(polo_passivo, processo),
+        )
+    except FileNotFoundError as exc:
+        raise GeracaoErro(str(exc))
+
+
+def _rotulo(item: _Item) -> str:
+    return f"Processo {item.resultado.get('cnj') or item.resultado.get('processo_id')}"
+
+
+def _tarefa_io(funcao, *args, **kwargs):
+    # Roda nas threads do pool: a conexão de banco aberta aqui é fechada ao fim.
+    try:
+        return funcao(*args, **kwargs)
+    finally:
+        connection.close()
+
+
+def _emitir_extrato(item: _Item, usuario):
+    from contratos import views
+    return views.generate_extrato_titularidade(
+        processo=item.processo,
+        cpf_value=item.polo_passivo.documento,
+        contratos=item.contratos,
+        parte_name=item.polo_passivo.nome,
+        usuario=usuario,
+    )
+
+
+def _concluir_item(tipo: str, item: _Item, docx_bytes: bytes, nome_base: str, futuro_pdf, futuro_extrato, usuario):
+    from contratos import views
+    arquivo_docx = views._salvar_docx_gerado(
+        item.processo, docx_bytes, f'{nome_base}.docx', usuario, TIPO_DOCUMENTO[tipo]
+    )
+    item.resultado['docx_arquivo_id'] = arquivo_docx.pk
+    if futuro_pdf is not None:
+        pdf_bytes = futuro_pdf.result()
+        if pdf_bytes:
+            arquivo_pdf = ProcessoArquivo(
+                processo=item.processo,
+                nome=f'{nome_base}.pdf',
+                enviado_por=usuario if usuario and usuario.is_authenticated else None,
+                tipo_documento=TIPO_DOCUMENTO[tipo],
+            )
+            arquivo_pdf.arquivo.save(f'{nome_base}.pdf', ContentFile(pdf_bytes), save=True)
+            item.resultado['pdf_arquivo_id'] = arquivo_pdf.pk
+        else:
+            item.resultado['aviso'] = 'PDF não gerado; o DOCX foi salvo em Arquivos.'
+    if futuro_extrato is not None:
+        extrato = futuro_extrato.result() or {}
+        item.resultado['extrato_ok'] = bool(extrato.get('ok'))
+        if extrato.get('error'):
+            item.resultado['extrato_erro'] = extrato['error']
+    item.resultado['status'] = 'ok'
+
+
+def executar_lote(geracao: GeracaoDocumento, progresso) -> dict:
+    parametros = geracao.parametros or {}
+    tipo = parametros.get('tipo')
+    if tipo not in GeracaoDocumento.TIPOS_PETICAO:
+        raise GeracaoErro('Tipo de petição inválido para o lote.')
+    processo_ids = [int(pk) for pk in parametros.get('processo_ids') or []]
+    usuario = geracao.criado_por
+
+    progresso('Carregando os processos', total=len(processo_ids) + 1)
+    itens = _carregar_itens(tipo, processo_ids)
+    workers = get_tarefas_paralelas()
+    pendentes = deque()
+
+    def _finalizar(pendente):
+        item, docx_bytes, nome_base, futuro_pdf, futuro_extrato = pendente
+        try:
+            _concluir_item(tipo, item, docx_bytes, nome_base, futuro_pdf, futuro_extrato, usuario)
+        except GeracaoErro as exc:
+            item.resultado.update(status='erro', erro=str(exc))
+        except Exception as exc:
+            logger.exception('Lote %s: falha no processo %s', geracao.pk, item.resultado.get('processo_id'))
+            item.resultado.update(status='erro', erro=f'Erro ao gerar o documento: {exc}')
+        progresso(_rotulo(item))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'lote-peticoes-{geracao.pk}') as pool:
+        for item in itens:
+            try:
+                docx_bytes, nome_base = _montar_docx(tipo, item)
+            except GeracaoErro as exc:
+                item.resultado.update(status='erro', erro=str(exc))
+                progresso(_rotulo(item))
+                continue
+            except Exception as exc:
+                logger.exception('Lote %s: falha ao montar o DOCX do processo %s', geracao.pk, item.processo.pk)
+                item.resultado.update(status='erro', erro=f'Erro ao gerar o documento: {exc}')
+                progresso(_rotulo(item))
+                continue
+            futuro_pdf = (
+                pool.submit(_tarefa_io, conversao_pdf.converter_docx_para_pdf, docx_bytes)
+                if parametros.get('converter_pdf') else None
+            )
+            futuro_extrato = (
+                pool.submit(_tarefa_io, _emitir_extrato, item, usuario)
+                if parametros.get('emitir_extrato') and tipo != GeracaoDocumento.TIPO_HABILITACAO else None
+            )
+            pendentes.append((item, docx_bytes, nome_base, futuro_pdf, futuro_extrato))
+            # Limita quantos DOCX montados ficam em memória à espera do pool.
+            while len(pendentes) >= workers * 2:
+                _finalizar(pendentes.popleft())
+        while pendentes:
+            _finalizar(pendentes.popleft())
+
+    resultados = [item.resultado for item in itens]
+    sucesso = sum(1 for resultado in resultados if resultado.get('status') == 'ok')
+    return {
+        'status': 'success',
+        'message': f'{sucesso} de {len(resultados)} petição(ões) gerada(s) - Salvas em Arquivos.',
+        'sucesso': sucesso,
+        'falhas': len(resultados) - sucesso,
+        'itens': resultados,
+    }
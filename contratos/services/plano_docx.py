@@ -0,0 +1,177 @@
+"""
+Plano de renderização dos placeholders ([CAMPO]) de um template DOCX.
+
+A compilação roda uma vez por versão do modelo (ver modelos_documento):
+percorre os parágrafos do corpo, tabelas, cabeçalhos e rodapés, junta num só
+run os placeholders que o Word quebrou em vários runs e registra, para cada
+run com placeholder, o caminho do elemento XML dentro da part e os segmentos
+do texto (literal / placeholder). Gerar um documento passa a ser trocar o
+texto desses runs numa cópia do template, sem varrer o documento nem fazer
+um replace por campo.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from docx.oxml.ns import qn
+
+# '[E]/[H]' vem antes do placeholder simples para ser reconhecido inteiro.
+PLACEHOLDER_RE = re.compile(r'\[E\]/\[H\]|\[[^\[\]\r\n]{1,80}\]')
+_SIMPLES_RE = re.compile(r'\[[^\[\]\r\n]{1,80}\]')
+
+_PARTES_RENDERIZADAS = ('/word/document.xml', '/word/header', '/word/footer')
+
+# (texto literal, placeholder ou None)
+Segmento = Tuple[str, Optional[str]]
+
+
+@dataclass(frozen=True)
+class AlvoRun:
+    parte: str
+    caminho: Tuple[int, ...]
+    segmentos: Tuple[Segmento, ...]
+
+
+@dataclass
+class PlanoDocx:
+    alvos: List[AlvoRun] = field(default_factory=list)
+
+    @property
+    def placeholders(self) -> List[str]:
+        vistos = {}
+        for alvo in self.alvos:
+            for _, token in alvo.segmentos:
+                if token:
+                    vistos.setdefault(token, None)
+        return list(vistos)
+
+    def vincular(self, document) -> 'DocumentoRenderizavel':
+        """
+        Resolve os caminhos numa cópia do template. Deve ser chamado antes de
+        qualquer alteração estrutural (ex.: remover parágrafos), que mudaria os
+        índices.
+        """
+        raizes = _raizes_das_partes(document)
+        runs = []
+        for alvo in self.alvos:
+            elemento = raizes.get(alvo.parte)
+            if elemento is None:
+                continue
+            for indice in alvo.caminho:
+                elemento = elemento[indice]
+            runs.append((elemento, alvo.segmentos))
+        return DocumentoRenderizavel(document, runs)
+
+
+class DocumentoRenderizavel:
+    def __init__(self, document, runs):
+        self.document = document
+        self._runs = runs
+
+    def renderizar(self, valores: Dict[str, str]):
+        """
+        Substitui os placeholders pelos valores (chaves no formato '[CAMPO]').
+        Placeholders sem valor ficam como estão, como no replace campo a campo.
+        """
+        for elemento, segmentos in self._runs:
+            partes = []
+            alterado = False
+            for literal, token in segmentos:
+                if token is None:
+                    partes.append(literal)
+                    continue
+                valor = _valor(token, valores)
+                alterado = alterado or valor != token
+                partes.append(valor)
+            # Runs só com marcadores de estilo ([n], [a]...) ficam intactos.
+            if alterado:
+                elemento.text = ''.join(partes)
+
+
+def _valor(token: str, valores: Dict[str, str]) -> str:
+    if token in valores:
+        return valores[token]
+    return _SIMPLES_RE.sub(lambda m: valores.get(m.group(0), m.group(0)), token)
+
+
+def _raizes_das_partes(document) -> Dict[str, object]:
+    raizes = {}
+    for parte in document.part.package.iter_parts():
+        nome = str(parte.partname)
+        elemento = getattr(parte, '_element', None)
+        if elemento is not None and nome.startswith(_PARTES_RENDERIZADAS):
+            raizes[nome] = elemento
+    return raizes
+
+
+def _caminho(raiz, elemento) -> Tuple[int, ...]:
+    indices = []
+    while elemento is not raiz:
+        pai = elemento.getparent()
+        indices.append(pai.index(elemento))
+        elemento = pai
+    return tuple(reversed(indices))
+
+
+def _runs_do_paragrafo(p):
+    # Mesmo critério de paragraph.runs: só os w:r filhos diretos do parágrafo.
+    return [filho for filho in p if filho.tag == qn('w:r')]
+
+
+def _normalizar_paragrafo(p) -> List[object]:
+    """Junta no primeiro run cada placeholder quebrado entre runs; devolve os runs."""
+    runs = _runs_do_paragrafo(p)
+    textos = [run.text for run in runs]
+    texto = ''.join(textos)
+    if '[' not in texto:
+        return runs
+    for match in PLACEHOLDER_RE.finditer(texto):
+        # O texto completo do parágrafo não muda, só a distribuição entre os runs.
+        inicios = []
+        posicao = 0
+        for parte in textos:
+            inicios.append(posicao)
+            posicao += len(parte)
+        primeiro = max(i for i, inicio in enumerate(inicios) if inicio <= match.start() and textos[i])
+        ultimo = max(i for i, inicio in enumerate(inicios) if inicio < match.end() and textos[i])
+        if primeiro == ultimo:
+            continue
+        fim_no_ultimo = match.end() - inicios[ultimo]
+        textos[primeiro] = textos[primeiro] + ''.join(textos[primeiro + 1:ultimo]) + textos[ultimo][:fim_no_ultimo]
+        for i in range(primeiro + 1, ultimo):
+            textos[i] = ''
+        textos[ultimo] = textos[ultimo][fim_no_ultimo:]
+        for i in range(primeiro, ultimo + 1):
+            if runs[i].text != textos[i]:
+                runs[i].text = textos[i]
+    return runs
+
+
+def _segmentos(texto: str) -> Tuple[Segmento, ...]:
+    segmentos = []
+    ultimo = 0
+    for match in PLACEHOLDER_RE.finditer(texto):
+        if match.start() > ultimo:
+            segmentos.append((texto[ultimo:match.start()], None))
+        segmentos.append(('', match.group(0)))
+        ultimo = match.end()
+    if ultimo < len(texto):
+        segmentos.append((texto[ultimo:], None))
+    return tuple(segmentos)
+
+
+def compilar(document) -> PlanoDocx:
+    """
+    Normaliza o template (altera `document`) e devolve o plano. O texto dos
+    parágrafos não muda, então quem usa o template sem o plano vê o mesmo
+    conteúdo.
+    """
+    plano = PlanoDocx()
+    for nome, raiz in sorted(_raizes_das_partes(document).items()):
+        for p in raiz.iter(qn('w:p')):
+            for run in _normalizar_paragrafo(p):
+                texto = run.text
+                if '[' not in texto or not PLACEHOLDER_RE.search(texto):
+                    continue
+                plano.alvos.append(AlvoRun(nome, _caminho(raiz, run), _segmentos(texto)))
+    return plano
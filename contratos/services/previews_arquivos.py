@@ -0,0 +1,238 @@
+"""
+Miniaturas (PNG da primeira página) e contagem de páginas dos PDFs e DOCX de
+Arquivos do processo.
+
+A geração roda fora do request: num pool limitado de threads do próprio
+processo (ARQUIVOS_PREVIEW_WORKERS) logo após o commit do arquivo
+(ARQUIVOS_PREVIEW_EM_THREAD) e/ou no comando `gerar_previews_arquivos`. O PNG fica ao lado do original, em
+`<pasta do arquivo>/previews/<hash_conteudo>.png`, então arquivos com o mesmo
+conteúdo na pasta compartilham a miniatura e trocar o arquivo gera outra.
+`preview_hash` guarda o hash para o qual a miniatura foi gerada: enquanto for
+diferente de `hash_conteudo`, ela está pendente. Como o pendente fica no
+próprio registro, o que estava na fila quando o processo reiniciou volta a ser
+agendado na próxima vez que a miniatura for pedida (ou pelo comando).
+
+DOCX passam pela conversão com cache por conteúdo (conversao_pdf) sem a
+aproximação local, que daria uma contagem de páginas errada.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from contratos.models import ProcessoArquivo
+from contratos.services import conversao_pdf, hash_arquivos
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LARGURA = 160
+DEFAULT_MAX_MB = 50
+DEFAULT_WORKERS = 2
+# Páginas muito compridas (extratos contínuos) são cortadas nesta proporção.
+ALTURA_MAXIMA_PROPORCAO = 3
+EXTENSOES = ('.pdf', '.docx')
+
+_executor = None
+_em_andamento = set()
+_lock = threading.Lock()
+
+
+def _setting_int(nome: str, default: int) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def get_largura() -> int:
+    return _setting_int('ARQUIVOS_PREVIEW_LARGURA', DEFAULT_LARGURA)
+
+
+def get_max_bytes() -> int:
+    return _setting_int('ARQUIVOS_PREVIEW_MAX_MB', DEFAULT_MAX_MB) * 1024 * 1024
+
+
+def get_workers() -> int:
+    return _setting_int('ARQUIVOS_PREVIEW_WORKERS', DEFAULT_WORKERS)
+
+
+def executar_em_thread() -> bool:
+    return bool(getattr(settings, 'ARQUIVOS_PREVIEW_EM_THREAD', True))
+
+
+def disponivel() -> bool:
+    try:
+        import pymupdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _extensao(arquivo: ProcessoArquivo) -> str:
+    return posixpath.splitext(arquivo.arquivo.name or '')[1].lower()
+
+
+def elegivel(arquivo: ProcessoArquivo) -> bool:
+    return bool(arquivo.arquivo) and _extensao(arquivo) in EXTENSOES
+
+
+def pendente(arquivo: ProcessoArquivo) -> bool:
+    if not elegivel(arquivo):
+        return False
+    return not arquivo.hash_conteudo or arquivo.preview_hash != arquivo.hash_conteudo
+
+
+def pronta(arquivo: ProcessoArquivo) -> bool:
+    return (
+        arquivo.preview_status == ProcessoArquivo.PREVIEW_PRONTO
+        and bool(arquivo.hash_conteudo)
+        and arquivo.preview_hash == arquivo.hash_conteudo
+    )
+
+
+def caminho(arquivo: ProcessoArquivo, hash_conteudo: str = '') -> str:
+    pasta = posixpath.dirname(arquivo.arquivo.name or '')
+    return posixpath.join(pasta, 'previews', f'{hash_conteudo or arquivo.hash_conteudo}.png')
+
+
+def renderizar(pdf_bytes: bytes, largura: Optional[int] = None) -> Tuple[Optional[bytes], Optional[int]]:
+    """(PNG da primeira página, quantidade de páginas); (None, None) se ilegível."""
+    import pymupdf
+
+    largura = largura or get_largura()
+    with pymupdf.open(stream=pdf_bytes, filetype='pdf') as documento:
+        if documento.needs_pass and not documento.authenticate(''):
+            return None, None
+        paginas = documento.page_count
+        if not paginas:
+            return None, 0
+        pagina = documento.load_page(0)
+        retangulo = pagina.rect
+        if retangulo.width <= 0 or retangulo.height <= 0:
+            return None, paginas
+        escala = largura / retangulo.width
+        recorte = pymupdf.Rect(
+            retangulo.x0,
+            retangulo.y0,
+            retangulo.x1,
+            retangulo.y0 + min(retangulo.height, retangulo.width * ALTURA_MAXIMA_PROPORCAO),
+        )
+        imagem = pagina.get_pixmap(matrix=pymupdf.Matrix(escala, escala), clip=recorte, alpha=False)
+        return imagem.tobytes('png'), paginas
+
+
+def _ler_como_pdf(arquivo: ProcessoArquivo) -> Optional[bytes]:
+    storage = arquivo.arquivo.storage
+    if storage.size(arquivo.arquivo.name) > get_max_bytes():
+        return None
+    with storage.open(arquivo.arquivo.name, 'rb') as origem:
+        conteudo = origem.read()
+    if _extensao(arquivo) == '.docx':
+        return conversao_pdf.converter_docx_para_pdf(conteudo, permitir_fallback=False)
+    return conteudo
+
+
+def _reaproveitar(arquivo: ProcessoArquivo, destino: str) -> Optional[ProcessoArquivo]:
+    """Outro arquivo da mesma pasta com o mesmo conteúdo e miniatura pronta."""
+    pasta = posixpath.dirname(arquivo.arquivo.name or '')
+    candidatos = ProcessoArquivo.objects.filter(
+        processo_id=arquivo.processo_id,
+        hash_conteudo=arquivo.hash_conteudo,
+        preview_hash=arquivo.hash_conteudo,
+        preview_status=ProcessoArquivo.PREVIEW_PRONTO,
+    ).exclude(pk=arquivo.pk).only('pk', 'arquivo', 'paginas')
+    for outro in candidatos:
+        if posixpath.dirname(outro.arquivo.name or '') == pasta:
+            return outro if arquivo.arquivo.storage.exists(destino) else None
+    return None
+
+
+def gerar(arquivo: ProcessoArquivo, refazer: bool = False) -> str:
+    """
+    Gera a miniatura e a contagem de páginas e grava o resultado no arquivo.
+    Retorna o preview_status final ('' se o arquivo não pôde nem ser lido).
+    """
+    if not elegivel(arquivo):
+        return ''
+    hash_arquivos.preencher([arquivo])
+    hash_conteudo = arquivo.hash_conteudo
+    if not hash_conteudo:
+        return ''
+    if not refazer and not pendente(arquivo):
+        return arquivo.preview_status
+
+    destino = caminho(arquivo)
+    storage = arquivo.arquivo.storage
+    status = ProcessoArquivo.PREVIEW_INDISPONIVEL
+    paginas = None
+    outro = None if refazer else _reaproveitar(arquivo, destino)
+    if outro is not None:
+        status, paginas = ProcessoArquivo.PREVIEW_PRONTO, outro.paginas
+    else:
+        try:
+            pdf_bytes = _ler_como_pdf(arquivo)
+            png = None
+            if pdf_bytes:
+                png, paginas = renderizar(pdf_bytes)
+            if png:
+                if storage.exists(destino):
+                    storage.delete(destino)
+                storage.save(destino, ContentFile(png))
+                status = ProcessoArquivo.PREVIEW_PRONTO
+        except Exception as exc:
+            logger.warning("Miniatura de arquivo: falha ao gerar %s: %s", arquivo.arquivo.name, exc)
+
+    # UPDATE direto: o save() dispararia o post_save que agenda outra geração.
+    ProcessoArquivo.objects.filter(pk=arquivo.pk, hash_conteudo=hash_conteudo).update(
+        paginas=paginas,
+        preview_status=status,
+        preview_hash=hash_conteudo,
+    )
+    arquivo.paginas = paginas
+    arquivo.preview_status = status
+    arquivo.preview_hash = hash_conteudo
+    return status
+
+
+def agendar(arquivo: ProcessoArquivo):
+    """Põe a miniatura na fila do pool após o commit, se estiver pendente."""
+    if not executar_em_thread() or not arquivo.pk or not pendente(arquivo):
+        return
+    transaction.on_commit(lambda: _enfileirar(arquivo.pk))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_workers(), thread_name_prefix='preview-arquivo')
+        return _executor
+
+
+def _enfileirar(arquivo_id: int):
+    executor = _get_executor()
+    with _lock:
+        if arquivo_id in _em_andamento:
+            return
+        _em_andamento.add(arquivo_id)
+    executor.submit(_gerar_em_thread, arquivo_id)
+
+
+def _gerar_em_thread(arquivo_id: int):
+    close_old_connections()
+    try:
+        arquivo = ProcessoArquivo.objects.filter(pk=arquivo_id).first()
+        if arquivo is not None and disponivel():
+            gerar(arquivo)
+    except Exception:
+        logger.exception("Miniatura de arquivo: erro inesperado no arquivo %s", arquivo_id)
+    finally:
+        with _lock:
+            _em_andamento.discard(arquivo_id)
+        close_old_connections()
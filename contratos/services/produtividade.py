@@ -0,0 +1,161 @@
+import datetime
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from contratos.models import Prazo, ProdutividadeDiaria, ProdutividadeRollupEstado, Tarefa
+
+DEFAULT_MARGEM_DIAS = 1
+
+# métrica -> (modelo, campo de data/hora, campo do usuário, campo da carteira, filtro)
+FONTES = {
+    ProdutividadeDiaria.METRICA_TAREFAS: (
+        Tarefa, 'concluido_em', 'concluido_por_id', 'processo__carteira_id', {'concluida': True},
+    ),
+    ProdutividadeDiaria.METRICA_PRAZOS: (
+        Prazo, 'concluido_em', 'concluido_por_id', 'processo__carteira_id', {'concluido': True},
+    ),
+    ProdutividadeDiaria.METRICA_TAREFAS_RESPONSAVEL: (
+        Tarefa, 'concluido_em', 'responsavel_id', 'processo__carteira_id', {'concluida': True},
+    ),
+    ProdutividadeDiaria.METRICA_PRAZOS_RESPONSAVEL: (
+        Prazo, 'concluido_em', 'responsavel_id', 'processo__carteira_id', {'concluido': True},
+    ),
+    ProdutividadeDiaria.METRICA_ACOES: (
+        LogEntry, 'action_time', 'user_id', None, {},
+    ),
+}
+
+
+def get_margem_dias() -> int:
+    try:
+        value = int(getattr(settings, 'PRODUTIVIDADE_ROLLUP_MARGEM_DIAS', DEFAULT_MARGEM_DIAS))
+    except (TypeError, ValueError):
+        return DEFAULT_MARGEM_DIAS
+    return value if value >= 0 else DEFAULT_MARGEM_DIAS
+
+
+def _inicio_do_dia(dia: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+
+def _estado() -> ProdutividadeRollupEstado:
+    estado = ProdutividadeRollupEstado.objects.order_by('pk').first()
+    if estado is None:
+        estado = ProdutividadeRollupEstado.objects.create()
+    return estado
+
+
+def _agregar(metrica: str, inicio=None, fim=None, sem_data=False, usuario_ids=None) -> List[dict]:
+    """Agrupa os eventos da métrica por (dia local, usuário, carteira) em uma consulta."""
+    modelo, campo_data, campo_usuario, campo_carteira, filtro = FONTES[metrica]
+    queryset = modelo.objects.filter(**filtro)
+    if sem_data:
+        queryset = queryset.filter(**{f'{campo_data}__isnull': True})
+    else:
+        queryset = queryset.filter(**{f'{campo_data}__isnull': False})
+        if inicio is not None:
+            queryset = queryset.filter(**{f'{campo_data}__gte': inicio})
+        if fim is not None:
+            queryset = queryset.filter(**{f'{campo_data}__lt': fim})
+    if usuario_ids is not None:
+        queryset = queryset.filter(**{f'{campo_usuario}__in': list(usuario_ids)})
+    agrupamento = {'usuario_id': F(campo_usuario)}
+    if campo_carteira:
+        agrupamento['carteira_id'] = F(campo_carteira)
+    if not sem_data:
+        agrupamento['dia'] = TruncDate(campo_data)
+    rows = queryset.values(**agrupamento).annotate(quantidade=Count('pk')).order_by()
+    return [
+        {
+            'data': None if sem_data else row['dia'],
+            'usuario_id': row['usuario_id'],
+            'carteira_id': row.get('carteira_id'),
+            'metrica': metrica,
+            'quantidade': int(row['quantidade']),
+        }
+        for row in rows
+    ]
+
+
+def atualizar_rollup(completo: bool = False, agora=None) -> dict:
+    """
+    Consolida os eventos desde a última execução. Os dias a partir do dia da
+    marca anterior (menos a margem) são recalculados por inteiro, o que também
+    corrige conclusões desfeitas logo depois; dias mais antigos só mudam com
+    `completo=True`.
+    """
+    agora = agora or timezone.now()
+    inicio_execucao = time.monotonic()
+    with transaction.atomic():
+        estado = ProdutividadeRollupEstado.objects.select_for_update().get(pk=_estado().pk)
+        if completo or estado.processado_ate is None:
+            dia_inicio = None
+            ProdutividadeDiaria.objects.all().delete()
+        else:
+            dia_inicio = timezone.localdate(estado.processado_ate) - datetime.timedelta(days=get_margem_dias())
+            ProdutividadeDiaria.objects.filter(data__gte=dia_inicio).delete()
+            ProdutividadeDiaria.objects.filter(data__isnull=True).delete()
+
+        inicio = _inicio_do_dia(dia_inicio) if dia_inicio else None
+        novas = []
+        for metrica in FONTES:
+            agregadas = _agregar(metrica, inicio=inicio, fim=agora)
+            if metrica != ProdutividadeDiaria.METRICA_ACOES:
+                agregadas += _agregar(metrica, sem_data=True)
+            novas.extend(ProdutividadeDiaria(**linha) for linha in agregadas)
+        ProdutividadeDiaria.objects.bulk_create(novas, batch_size=1000)
+
+        estado.processado_ate = agora
+        estado.duracao_ms = int((time.monotonic() - inicio_execucao) * 1000)
+        estado.save(update_fields=['processado_ate', 'duracao_ms', 'atualizado_em'])
+    return {'desde': dia_inicio, 'ate': agora, 'linhas': len(novas)}
+
+
+def linhas(metricas: Iterable[str], usuario_ids=None, desde: Optional[datetime.date] = None) -> List[dict]:
+    """
+    Linhas (data, usuario_id, carteira_id, metrica, quantidade) combinando o
+    rollup consolidado com os eventos ainda não consolidados, agregados na hora.
+    """
+    metricas = [metrica for metrica in metricas if metrica in FONTES]
+    estado = ProdutividadeRollupEstado.objects.order_by('pk').first()
+    processado_ate = estado.processado_ate if estado else None
+    usuario_ids = list(usuario_ids) if usuario_ids is not None else None
+
+    resultado = []
+    if processado_ate is not None:
+        corte = timezone.localdate(processado_ate)
+        consolidadas = ProdutividadeDiaria.objects.filter(metrica__in=metricas)
+        consolidadas = consolidadas.exclude(data__gte=corte)
+        if desde is not None:
+            consolidadas = consolidadas.filter(data__gte=desde)
+        if usuario_ids is not None:
+            consolidadas = consolidadas.filter(usuario_id__in=usuario_ids)
+        resultado.extend(
+            consolidadas.values('data', 'usuario_id', 'carteira_id', 'metrica', 'quantidade')
+        )
+        inicio = _inicio_do_dia(max(corte, desde) if desde else corte)
+    else:
+        inicio = _inicio_do_dia(desde) if desde else None
+
+    for metrica in metricas:
+        resultado.extend(_agregar(metrica, inicio=inicio, usuario_ids=usuario_ids))
+        if processado_ate is None and desde is None and metrica != ProdutividadeDiaria.METRICA_ACOES:
+            resultado.extend(_agregar(metrica, sem_data=True, usuario_ids=usuario_ids))
+    return resultado
+
+
+def totais_por_usuario(metricas: Iterable[str], usuario_ids=None, desde=None) -> Dict[int, Dict[str, int]]:
+    """{usuario_id: {metrica: quantidade}} somando todos os dias (e carteiras)."""
+    totais: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for linha in linhas(metricas, usuario_ids=usuario_ids, desde=desde):
+        if linha['usuario_id']:
+            totais[linha['usuario_id']][linha['metrica']] += int(linha['quantidade'])
+    return totais
@@ -0,0 +1,340 @@
+"""
+Upload direto para o storage dos arquivos do processo, sem passar o conteúdo
+pelo worker do Django.
+
+O fluxo tem duas etapas:
+
+1. `iniciar` valida nome/tamanho, escolhe a chave em `processos/{id}/pasta/`
+   e devolve a URL e os campos de um POST multipart, mais um token assinado
+   com processo, chave, tamanho e usuário;
+2. o navegador envia o arquivo para essa URL e chama `confirmar` com o token,
+   que confere tamanho e assinatura do conteúdo (primeiros bytes) no storage
+   e cria o ProcessoArquivo apontando para a chave, sem copiar nada.
+
+No S3 a URL é um presigned POST (o bucket precisa de CORS para a origem do
+sistema); no armazenamento local o `BackendLocal` recebe o POST num endpoint
+da própria API com o mesmo formato, o que mantém o protocolo testável sem S3.
+O hash do conteúdo fica para quem precisar dele depois (hash_arquivos).
+"""
+import logging
+import os
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from contratos.models import ProcessoArquivo, processo_arquivo_upload_path
+from contratos.services import entrega_arquivos
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'contratos.uploads_diretos'
+DEFAULT_MAX_MB = 500
+DEFAULT_EXPIRA_SECONDS = 900
+# O token vale mais que a URL de envio: um arquivo grande pode terminar de
+# subir perto do fim do prazo e ainda precisa ser confirmado.
+VALIDADE_TOKEN_FATOR = 4
+CABECALHO_BYTES = 1024
+NOME_MAX_CARACTERES = 150
+
+_ZIP = (b'PK\x03\x04',)
+_OLE = (b'\xd0\xcf\x11\xe0',)
+# extensão -> (Content-Type, assinaturas aceitas no início do arquivo; vazio = texto livre)
+TIPOS_PERMITIDOS = {
+    '.pdf': ('application/pdf', (b'%PDF',)),
+    '.docx': ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', _ZIP),
+    '.xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', _ZIP),
+    '.odt': ('application/vnd.oasis.opendocument.text', _ZIP),
+    '.zip': ('application/zip', _ZIP + (b'PK\x05\x06',)),
+    '.doc': ('application/msword', _OLE),
+    '.xls': ('application/vnd.ms-excel', _OLE),
+    '.png': ('image/png', (b'\x89PNG\r\n\x1a\n',)),
+    '.jpg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    '.jpeg': ('image/jpeg', (b'\xff\xd8\xff',)),
+    '.txt': ('text/plain', ()),
+    '.csv': ('text/csv', ()),
+}
+
+
+class UploadInvalido(Exception):
+    """Pedido ou arquivo recusado; a mensagem vai para o usuário."""
+
+
+def _setting_int(nome: str, default: int) -> int:
+    try:
+        value = int(getattr(settings, nome, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+def ativo() -> bool:
+    return bool(getattr(settings, 'UPLOAD_DIRETO_ATIVO', True))
+
+
+def get_max_bytes() -> int:
+    return _setting_int('UPLOAD_DIRETO_MAX_MB', DEFAULT_MAX_MB) * 1024 * 1024
+
+
+def get_expira_seconds() -> int:
+    return _setting_int('UPLOAD_DIRETO_EXPIRA_SECONDS', DEFAULT_EXPIRA_SECONDS)
+
+
+def _storage_s3(storage) -> bool:
+    try:
+        from storages.backends.s3 import S3Storage
+    except ImportError:
+        return False
+    return isinstance(storage, S3Storage)
+
+
+class BackendS3:
+    """Presigned POST do S3: o bucket aplica tamanho exato e Content-Type."""
+
+    nome = 's3'
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _chave_bucket(self, chave: str) -> str:
+        from storages.utils import clean_name
+
+        return self.storage._normalize_name(clean_name(chave))
+
+    def preparar(self, chave: str, content_type: str, tamanho: int, token: str) -> dict:
+        campos = {'Content-Type': content_type}
+        condicoes = [{'Content-Type': content_type}, ['content-length-range', tamanho, tamanho]]
+        acl = getattr(self.storage, 'default_acl', None)
+        if acl:
+            campos['acl'] = acl
+            condicoes.append({'acl': acl})
+        presigned = self.storage.connection.meta.client.generate_presigned_post(
+            Bucket=self.storage.bucket_name,
+            Key=self._chave_bucket(chave),
+            Fields=campos,
+            Conditions=condicoes,
+            ExpiresIn=get_expira_seconds(),
+        )
+        return {'url': presigned['url'], 'fields': presigned['fields']}
+
+    def copiar(self, origem: str, destino: str):
+        self.storage.connection.meta.client.copy_object(
+            Bucket=self.storage.bucket_name,
+            Key=self._chave_bucket(destino),
+            CopySource={'Bucket': self.storage.bucket_name, 'Key': self._chave_bucket(origem)},
+        )
+
+
+class BackendLocal:
+    """Mesmo protocolo num endpoint da API, gravando no storage configurado."""
+
+    nome = 'local'
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def preparar(self, chave: str, content_type: str, tamanho: int, token: str) -> dict:
+        return {'url': reverse('api_root:upload_direto_local'), 'fields': {'token': token}}
+
+    def receber(self, chave: str, arquivo, tamanho: int):
+        if arquivo.size != tamanho:
+            raise UploadInvalido("O arquivo enviado não tem o tamanho informado.")
+        if self.storage.exists(chave):
+            raise UploadInvalido("Este upload já foi enviado.")
+        gravado = self.storage.save(chave, arquivo)
+        if gravado != chave:
+            self.storage.delete(gravado)
+            raise UploadInvalido("Não foi possível gravar o arquivo na chave reservada.")
+
+    def copiar(self, origem: str, destino: str):
+        with self.storage.open(origem, 'rb') as conteudo:
+            self.storage.save(destino, conteudo)
+
+
+def get_backend():
+    """UPLOAD_DIRETO_BACKEND ('s3' ou 'local'); vazio usa S3 quando o storage é S3."""
+    storage = default_storage
+    escolhido = str(getattr(settings, 'UPLOAD_DIRETO_BACKEND', '') or '').strip().lower()
+    if escolhido != 'local' and _storage_s3(storage):
+        return BackendS3(storage)
+    return BackendLocal(storage)
+
+
+def gerar_chave(processo_id: int, nome: str) -> str:
+    try:
+        valido = get_valid_filename(os.path.basename(nome or ''))
+    except SuspiciousFileOperation:
+        valido = 'arquivo'
+    base, extensao = os.path.splitext(valido)
+    filename = f"{base[:NOME_MAX_CARACTERES]}_{secrets.token_hex(4)}{extensao.lower()}"
+    return processo_arquivo_upload_path(ProcessoArquivo(processo_id=processo_id), filename)
+
+
+def _tipo(nome: str):
+    extensao = os.path.splitext(nome or '')[1].lower()
+    tipo = TIPOS_PERMITIDOS.get(extensao)
+    if tipo is None:
+        permitidas = ', '.join(sorted(TIPOS_PERMITIDOS))
+        raise UploadInvalido(f"Tipo de arquivo não permitido. Extensões aceitas: {permitidas}.")
+    return extensao, tipo
+
+
+def iniciar(processo, nome: str, tamanho, usuario) -> dict:
+    """Reserva a chave e devolve {token, chave, backend, url, fields, expira_em}."""
+    if not ativo():
+        raise UploadInvalido("Upload direto desativado.")
+    nome = os.path.basename(str(nome or '').strip())
+    if not nome:
+        raise UploadInvalido("Informe o nome do arquivo.")
+    _, (content_type, _) = _tipo(nome)
+    try:
+        tamanho = int(tamanho)
+    except (TypeError, ValueError):
+        raise UploadInvalido("Informe o tamanho do arquivo.")
+    max_bytes = get_max_bytes()
+    if tamanho <= 0:
+        raise UploadInvalido("O arquivo está vazio.")
+    if tamanho > max_bytes:
+        raise UploadInvalido(f"O arquivo passa do limite de {max_bytes // (1024 * 1024)} MB.")
+
+    chave = gerar_chave(processo.pk, nome)
+    token = signing.dumps(
+        {'p': processo.pk, 'k': chave, 'n': nome[:255], 't': tamanho, 'u': usuario.pk},
+        salt=TOKEN_SALT,
+    )
+    backend = get_backend()
+    destino = backend.preparar(chave, content_type, tamanho, token)
+    return {
+        'token': token,
+        'chave': chave,
+        'backend': backend.nome,
+        'url': destino['url'],
+        'fields': destino['fields'],
+        'expira_em': (timezone.now() + timedelta(seconds=get_expira_seconds())).isoformat(),
+    }
+
+
+def ler_token(token: str, usuario) -> dict:
+    try:
+        dados = signing.loads(
+            str(token or ''),
+            salt=TOKEN_SALT,
+            max_age=get_expira_seconds() * VALIDADE_TOKEN_FATOR,
+        )
+    except signing.SignatureExpired:
+        raise UploadInvalido("Upload expirado; envie o arquivo novamente.")
+    except signing.BadSignature:
+        raise UploadInvalido("Token de upload inválido.")
+    if dados.get('u') != usuario.pk:
+        raise UploadInvalido("Token de upload de outro usuário.")
+    return dados
+
+
+def receber_local(token: str, arquivo, usuario):
+    """Etapa de envio do BackendLocal (o equivalente ao POST no bucket)."""
+    backend = get_backend()
+    if not isinstance(backend, BackendLocal):
+        raise UploadInvalido("O upload direto deste ambiente é feito no S3.")
+    dados = ler_token(token, usuario)
+    if arquivo is None:
+        raise UploadInvalido("Nenhum arquivo enviado.")
+    backend.receber(dados['k'], arquivo, dados['t'])
+
+
+def _descartar(chave: str):
+    try:
+        default_storage.delete(chave)
+    except Exception as exc:
+        logger.warning("Upload direto: não foi possível remover %s: %s", chave, exc)
+
+
+def _validar_conteudo(dados: dict, field_file):
+    try:
+        aberto = entrega_arquivos.abrir(field_file)
+    except FileNotFoundError:
+        raise UploadInvalido("Arquivo não encontrado no armazenamento; envie novamente.")
+    if aberto.tamanho != dados['t']:
+        aberto.fechar()
+        _descartar(dados['k'])
+        raise UploadInvalido("O arquivo enviado não tem o tamanho informado.")
+    leitura = aberto.ler(0, min(CABECALHO_BYTES, aberto.tamanho) - 1)
+    try:
+        cabecalho = leitura.read()
+    finally:
+        leitura.close()
+    extensao, (_, assinaturas) = _tipo(dados['n'])
+    # PDFs podem ter lixo antes do %PDF; os demais formatos começam na assinatura.
+    if extensao == '.pdf':
+        confere = any(assinatura in cabecalho for assinatura in assinaturas)
+    else:
+        confere = not assinaturas or any(cabecalho.startswith(assinatura) for assinatura in assinaturas)
+    if not confere:
+        _descartar(dados['k'])
+        raise UploadInvalido("O conteúdo do arquivo não corresponde à extensão.")
+
+
+def _completar_vinculos(arquivo: ProcessoArquivo, vinculos: dict) -> ProcessoArquivo:
+    """Grava os vínculos que o arquivo ainda não tem; recusa os que divergem dos gravados."""
+    novos = {}
+    for campo, valor in vinculos.items():
+        valor_id = getattr(valor, 'pk', valor)
+        atual = getattr(arquivo, f'{campo}_id')
+        if valor_id is None or atual == valor_id:
+            continue
+        if atual is not None:
+            raise UploadInvalido("Este upload já foi confirmado em outro registro.")
+        novos[campo] = valor
+    for campo, valor in novos.items():
+        setattr(arquivo, campo, valor)
+    if novos:
+        arquivo.save(update_fields=list(novos))
+    return arquivo
+
+
+def confirmar(token: str, usuario, processo, nome: str = '', **vinculos) -> ProcessoArquivo:
+    """
+    Valida o arquivo enviado e cria o ProcessoArquivo (tarefa, mensagem, prazo
+    etc. vão em `vinculos`). Confirmar de novo o mesmo token devolve o registro
+    já criado com os vínculos que faltavam; vínculo diferente do já gravado é
+    recusado.
+    """
+    dados = ler_token(token, usuario)
+    if processo is None or processo.pk != dados['p']:
+        raise UploadInvalido("O upload foi reservado para outro processo.")
+    existente = ProcessoArquivo.objects.filter(processo_id=dados['p'], arquivo=dados['k']).first()
+    if existente is not None:
+        return _completar_vinculos(existente, vinculos)
+
+    arquivo = ProcessoArquivo(
+        processo_id=dados['p'],
+        nome=(str(nome or '').strip() or dados['n'])[:255],
+        enviado_por=usuario,
+        **vinculos,
+    )
+    # Atribuir o nome da chave não reenvia o conteúdo: o FieldFile já está no storage.
+    arquivo.arquivo.name = dados['k']
+    _validar_conteudo(dados, arquivo.arquivo)
+    arquivo.save()
+    return arquivo
+
+
+def copiar(origem: ProcessoArquivo, processo, usuario, **vinculos) -> ProcessoArquivo:
+    """Cópia no storage de um arquivo confirmado para outro processo (criação em lote)."""
+    chave = gerar_chave(processo.pk, origem.nome or os.path.basename(origem.arquivo.name))
+    get_backend().copiar(origem.arquivo.name, chave)
+    arquivo = ProcessoArquivo(
+        processo=processo,
+        nome=origem.nome,
+        enviado_por=usuario,
+        hash_conteudo=origem.hash_conteudo,
+        **vinculos,
+    )
+    arquivo.arquivo.name = chave
+    arquivo.save()
+    return arquivo
@@ -7697,6 +7697,35 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
          * ======================================================= */
 
         // Event listener para o botão, que agora é criado dinamicamente
+        // As views de geração respondem 202 com a URL de status da fila; o
+        // resultado final tem o mesmo formato da resposta síncrona antiga.
+        function aguardarGeracaoDocumento(resposta) {
+            return new Promise(function (resolve, reject) {
+                if (!resposta || resposta.status !== 'queued' || !resposta.status_url) {
+                    resolve(resposta);
+                    return;
+                }
+                const consultar = function () {
+                    $.get(resposta.status_url)
+                        .done(function (geracao) {
+                            if (!geracao.finalizado) {
+                                setTimeout(consultar, 1500);
+                                return;
+                            }
+                            if (geracao.status === 'erro') {
+                                reject(new Error(geracao.erro || 'Falha ao gerar o documento.'));
+                                return;
+                            }
+                            resolve(geracao.resultado || {});
+                        })
+                        .fail(function () {
+                            reject(new Error('Não foi possível consultar o andamento da geração.'));
+                        });
+                };
+                consultar();
+            });
+        }
+
         $(document).on('click', '#id_gerar_monitoria_btn', function (e) {
             e.preventDefault();
 
@@ -7723,6 +7752,13 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
             const csrftoken = $('input[name="csrfmiddlewaretoken"]').val();
             const url = `/contratos/processo/${currentProcessoId}/gerar-monitoria/`;
 
+            const finalizar = function () {
+                stopCountdown();
+                $('#id_gerar_monitoria_btn')
+                    .prop('disabled', false)
+                    .text('Gerar Petição Monitória');
+            };
+
             $.ajax({
                 url: url,
                 method: 'POST',
@@ -7738,7 +7774,8 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                         .text('Gerando...');
                     startCountdown(5);
                 },
-                success: function (data) {
+                success: function (resposta) {
+                    aguardarGeracaoDocumento(resposta).then(function (data) {
                     const msg = data && data.message ? data.message : 'Operação concluída.';
                     let details = [];
                     if (data && data.monitoria) {
@@ -7776,6 +7813,9 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                     window.location.reload();
                 };
                 showCffSystemDialog(successLines.join('\n'), 'success', handleReload);
+                    }).catch(function (err) {
+                        alert(err.message);
+                    }).finally(finalizar);
                 },
                 error: function (xhr, status, error) {
                     let errorMessage =
@@ -7787,12 +7827,7 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                     }
                     alert(errorMessage);
                     console.error('Erro na geração da petição:', status, error, xhr);
-                },
-                complete: function () {
-                    stopCountdown();
-                    $('#id_gerar_monitoria_btn')
-                        .prop('disabled', false)
-                        .text('Gerar Petição Monitória');
+                    finalizar();
                 }
             });
         });
@@ -7832,6 +7867,13 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
             const csrftoken = $('input[name="csrfmiddlewaretoken"]').val();
             const url = `/contratos/processo/${currentProcessoId}/gerar-cobranca-judicial/`;
 
+            const finalizar = function () {
+                stopCountdown();
+                $('#id_gerar_cobranca_btn')
+                    .prop('disabled', false)
+                    .text('Petição Cobrança Judicial (PDF)');
+            };
+
             $.ajax({
                 url: url,
                 method: 'POST',
@@ -7847,7 +7889,8 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                         .text('Gerando cobrança...');
                     startCountdown(5);
                 },
-                success: function (data) {
+                success: function (resposta) {
+                    aguardarGeracaoDocumento(resposta).then(function (data) {
                 const successLines = [];
                 if (data && data.cobranca) {
                     if (data.cobranca.ok) {
@@ -7881,6 +7924,9 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                     window.location.reload();
                 };
                 showCffSystemDialog(successLines.join('\n'), 'success', handleReload);
+                    }).catch(function (err) {
+                        alert(err.message);
+                    }).finally(finalizar);
                 },
                 error: function (xhr, status, error) {
                     let errorMessage = 'Erro ao gerar petição de cobrança. Tente novamente.';
@@ -7891,12 +7937,7 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                     }
                     alert(errorMessage);
                     console.error('Erro na geração da cobrança judicial:', status, error, xhr);
-                },
-                complete: function () {
-                    stopCountdown();
-                    $('#id_gerar_cobranca_btn')
-                        .prop('disabled', false)
-                        .text('Petição Cobrança Judicial (PDF)');
+                    finalizar();
                 }
             });
         });
@@ -7912,6 +7953,13 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
             const csrftoken = $('input[name="csrfmiddlewaretoken"]').val();
             const url = `/contratos/processo/${currentProcessoId}/gerar-habilitacao/`;
 
+            const finalizar = function () {
+                stopCountdown();
+                $('#id_gerar_habilitacao_btn')
+                    .prop('disabled', false)
+                    .text('Gerar Petição de Habilitação (PDF)');
+            };
+
             $.ajax({
                 url: url,
                 method: 'POST',
@@ -7926,7 +7974,8 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                         .text('Gerando habilitação...');
                     startCountdown(5);
                 },
-                success: function (data) {
+                success: function (resposta) {
+                    aguardarGeracaoDocumento(resposta).then(function (data) {
                     const lines = [];
                     if (data && data.habilitacao) {
                         if (data.habilitacao.ok) {
@@ -7947,6 +7996,9 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                         window.location.reload();
                     };
                     showCffSystemDialog(lines.join('\n'), 'success', handleReload);
+                    }).catch(function (err) {
+                        showCffSystemDialog(err.message, 'warning');
+                    }).finally(finalizar);
                 },
                 error: function (xhr, status, error) {
                     let errorMessage = 'Erro ao gerar petição de habilitação. Tente novamente.';
@@ -7957,12 +8009,7 @@ function renderMonitoriaContractSelector(question, $container, currentResponses,
                     }
                     showCffSystemDialog(errorMessage, 'warning');
                     console.error('Erro na geração da habilitação:', status, error, xhr);
-                },
-                complete: function () {
-                    stopCountdown();
-                    $('#id_gerar_habilitacao_btn')
-                        .prop('disabled', false)
-                        .text('Gerar Petição de Habilitação (PDF)');
+                    finalizar();
                 }
             });
         });
@@ -46,6 +46,7 @@
 
     const getPreviewApiUrl = () => window.__tipos_peticao_preview_url || '';
     const getGenerateApiUrl = () => window.__tipos_peticao_generate_url || '';
+    const getGeneratePdfApiUrl = () => window.__tipos_peticao_pdf_url || '';
     const getCsrfToken = () => {
         const match = document.cookie.match(/csrftoken=([^;]+)/);
         if (match) {
@@ -625,6 +626,7 @@
                 <div class="preview-actions">
                     <button type="button" class="button" id="documento-peticoes-modal-voltar">Voltar</button>
                     <button type="button" class="button" id="documento-peticoes-modal-prosseguir">Prosseguir mesmo assim</button>
+                    <button type="button" class="button" id="documento-peticoes-modal-gerar-pdf">Gerar PDF único</button>
                     <button type="button" class="button button-primary" id="documento-peticoes-modal-gerar">Gerar ZIP</button>
                 </div>
                 <p class="documento-peticoes-custom-alert" id="documento-peticoes-modal-result" style="display:none"></p>
@@ -635,6 +637,7 @@
         const voltarBtn = overlay.querySelector('#documento-peticoes-modal-voltar');
         const prosseguirBtn = overlay.querySelector('#documento-peticoes-modal-prosseguir');
         const gerarBtn = overlay.querySelector('#documento-peticoes-modal-gerar');
+        const gerarPdfBtn = overlay.querySelector('#documento-peticoes-modal-gerar-pdf');
         const modal = {
             overlayEl: overlay,
             zipNameEl: overlay.querySelector('#documento-peticoes-modal-zipname'),
@@ -644,7 +647,8 @@
             optionalPanel: overlay.querySelector('#documento-peticoes-modal-optional'),
             optionalList: overlay.querySelector('#documento-peticoes-modal-optional-list'),
             resultEl: overlay.querySelector('#documento-peticoes-modal-result'),
-            gerarBtn
+            gerarBtn,
+            gerarPdfBtn
         };
         const closeOverlay = () => overlay.classList.remove('open');
         closeBtn.addEventListener('click', closeOverlay);
@@ -659,6 +663,12 @@
             }
             runGenerate();
         });
+        gerarPdfBtn.addEventListener('click', () => {
+            if (!currentPreview) {
+                return;
+            }
+            runGenerate('pdf');
+        });
         overlay.addEventListener('click', (event) => {
             if (event.target === overlay) {
                 closeOverlay();
@@ -709,6 +719,7 @@
         modal.resultEl.style.display = 'none';
         modal.resultEl.textContent = '';
         modal.gerarBtn.dataset.allowed = '1';
+        modal.gerarPdfBtn.style.display = getGeneratePdfApiUrl() ? '' : 'none';
         modal.overlayEl.classList.add('open');
         currentPreview = {
             ...preview,
@@ -740,6 +751,27 @@
         link.remove();
     };
 
+    // A geração do ZIP roda na fila do servidor: a view responde 202 com a URL de status.
+    const waitForGeracao = async (statusUrl, onProgress) => {
+        while (true) {
+            const response = await fetch(statusUrl, { credentials: 'same-origin' });
+            if (!response.ok) {
+                throw new Error('Não foi possível consultar o andamento da geração.');
+            }
+            const geracao = await response.json();
+            if (geracao.finalizado) {
+                if (geracao.status === 'erro') {
+                    throw new Error(geracao.erro || 'Falha na geração.');
+                }
+                return geracao.resultado || {};
+            }
+            if (onProgress) {
+                onProgress(geracao);
+            }
+            await new Promise((resolve) => setTimeout(resolve, 1500));
+        }
+    };
+
     const createSummaryCard = () => {
         if (summaryCardInstance) {
             return summaryCardInstance;
@@ -864,14 +896,17 @@
         }
     }
 
-    async function runGenerate() {
-        const generateApiUrl = getGenerateApiUrl();
+    // formato 'zip' (padrão) ou 'pdf': PDF único com a petição e os anexos, com marcadores.
+    async function runGenerate(formato = 'zip') {
+        const isPdf = formato === 'pdf';
+        const produto = isPdf ? 'o PDF' : 'o ZIP';
+        const generateApiUrl = isPdf ? getGeneratePdfApiUrl() : getGenerateApiUrl();
         if (!generateApiUrl) {
             setStatus('URL de geração não está configurada.', 'error');
             return;
         }
         if (!currentPreview || !currentPreview.tipoId) {
-            setStatus('Gere um preview antes de tentar gerar o ZIP.', 'error');
+            setStatus(`Gere um preview antes de tentar gerar ${produto}.`, 'error');
             return;
         }
         if (!selectedBaseId) {
@@ -882,6 +917,7 @@
         modal.resultEl.style.display = 'none';
         modal.resultEl.textContent = '';
         modal.gerarBtn.disabled = true;
+        modal.gerarPdfBtn.disabled = true;
         try {
             const response = await fetch(generateApiUrl, {
                 method: 'POST',
@@ -898,22 +934,30 @@
             });
             const data = await response.json();
             if (!response.ok || !data.ok) {
-                throw new Error(data.error || 'Falha ao gerar o ZIP.');
+                throw new Error(data.error || `Falha ao gerar ${produto}.`);
+            }
+            let result = data.result;
+            if (data.status === 'queued' && data.status_url) {
+                setStatus(`Gerando ${produto}...`, 'info');
+                result = await waitForGeracao(data.status_url, (geracao) => {
+                    setStatus(`Gerando ${produto}... ${geracao.percentual}%`, 'info');
+                });
             }
-            setStatus('ZIP criado e download iniciado.', 'success');
-            if (data.result?.url) {
-                triggerDownload(data.result.url, data.result?.zip_name);
+            setStatus(isPdf ? 'PDF criado e download iniciado.' : 'ZIP criado e download iniciado.', 'success');
+            if (result?.url) {
+                triggerDownload(result.url, isPdf ? result?.pdf_name : result?.zip_name);
             }
             closePreviewModal();
             setTimeout(() => {
                 window.location.reload();
             }, 800);
         } catch (err) {
-            modal.resultEl.textContent = err.message || 'Erro ao gerar o ZIP.';
+            modal.resultEl.textContent = err.message || `Erro ao gerar ${produto}.`;
             modal.resultEl.style.display = 'block';
-            setStatus(err.message || 'Erro ao gerar o ZIP.', 'error');
+            setStatus(err.message || `Erro ao gerar ${produto}.`, 'error');
         } finally {
             modal.gerarBtn.disabled = false;
+            modal.gerarPdfBtn.disabled = false;
         }
     }
 
@@ -1,8 +1,46 @@
-window.addEventListener('DOMContentLoaded', () => {
-    const chartDataElement = document.getElementById('chart_data_script');
-    if (!chartDataElement) return;
+window.addEventListener('DOMContentLoaded', async () => {
+    const sectionsElement = document.getElementById('kpi_sections_script');
+    if (!sectionsElement) return;
+
+    let sectionUrls = {};
+    try {
+        sectionUrls = JSON.parse(sectionsElement.textContent || '{}') || {};
+    } catch (error) {
+        console.error('[carteira-kpi] erro ao parsear seções:', error);
+        return;
+    }
+    const wait = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+    const fetchKpiSection = async (secao) => {
+        const url = String(sectionUrls[secao] || '').trim();
+        if (!url) return null;
+        for (let attempt = 0; attempt < 30; attempt += 1) {
+            // O servidor responde com ETag e "no-cache": o navegador revalida
+            // com If-None-Match e seções inalteradas voltam como 304.
+            const response = await fetch(url, {
+                credentials: 'same-origin',
+                headers: { Accept: 'application/json' },
+            });
+            if (response.status === 202) {
+                const retryAfter = Number(response.headers.get('Retry-After') || 2);
+                await wait(Math.max(retryAfter, 1) * 1000);
+                continue;
+            }
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const body = await response.json();
+            return (body && body.dados && typeof body.dados === 'object') ? body.dados : {};
+        }
+        throw new Error('seção ainda em cálculo');
+    };
+    // Todas as seções são pedidas de uma vez; cada bloco abaixo espera só a
+    // sua, então a primeira pintura depende da seção mais rápida.
+    const sectionRequests = {};
+    Object.keys(sectionUrls).forEach((secao) => {
+        sectionRequests[secao] = fetchKpiSection(secao).catch((error) => {
+            console.error(`[carteira-kpi] erro ao carregar seção "${secao}":`, error);
+            return null;
+        });
+    });
 
-    const chartData = JSON.parse(chartDataElement.textContent || '[]');
     const fallbackHexPalette = [
         '#FFC107', '#2196F3', '#673AB7', '#4CAF50', '#F44336', '#00BCD4',
         '#FF9800', '#8BC34A', '#795548', '#9C27B0',
@@ -30,11 +68,6 @@ window.addEventListener('DOMContentLoaded', () => {
         return normalizeHex(item?.cor_grafico, fallback);
     };
 
-    const labels = chartData.map((c) => c.nome);
-    const processCounts = chartData.map((c) => Number(c.total_processos || 0));
-    const valuations = chartData.map((c) => Number(c.valor_total || 0));
-    const carteiraBaseColors = chartData.map((item, index) => resolveCarteiraColor(item, index));
-
     const changelist = document.getElementById('changelist');
     if (!changelist) return;
 
@@ -51,11 +84,11 @@ window.addEventListener('DOMContentLoaded', () => {
     chartContainer.style.clear = 'both';
     chartContainer.style.marginTop = '16px';
     chartContainer.innerHTML = `
-        <div class="chart-wrapper" style="width: 45%; min-width: 340px;">
+        <div class="chart-wrapper carteira-kpi-skeleton" style="width: 45%; min-width: 340px;">
             <h3>Distribuição de Processos por Carteira</h3>
             <canvas id="processCountChart"></canvas>
         </div>
-        <div class="chart-wrapper" style="width: 45%; min-width: 340px;">
+        <div class="chart-wrapper carteira-kpi-skeleton" style="width: 45%; min-width: 340px;">
             <h3>Valuation por Carteira (R$)</h3>
             <canvas id="valuationChart"></canvas>
         </div>
@@ -67,6 +100,63 @@ window.addEventListener('DOMContentLoaded', () => {
         changelist.appendChild(chartContainer);
     }
 
+    if (!document.getElementById('carteira-kpi-skeleton-style')) {
+        const skeletonStyle = document.createElement('style');
+        skeletonStyle.id = 'carteira-kpi-skeleton-style';
+        skeletonStyle.textContent = `
+            @keyframes carteiraKpiPulse { 0%, 100% { opacity: 1; } 50% { opacity: 0.45; } }
+            .carteira-kpi-skeleton { animation: carteiraKpiPulse 1.4s ease-in-out infinite; }
+            .carteira-kpi-skeleton-block {
+                width: 100%; box-sizing: border-box; padding: 16px; margin-top: 22px;
+                border: 1px solid #d9e1ea; border-radius: 10px; background: #fff;
+            }
+            .carteira-kpi-skeleton-bar { height: 12px; margin-top: 10px; border-radius: 6px; background: #e7edf4; }
+        `;
+        document.head.appendChild(skeletonStyle);
+    }
+    // Placeholders das seções ainda em carregamento, substituídos pelo painel real.
+    const skeletonSlots = {};
+    const createSkeletonSlot = (slot, title, bars) => {
+        const block = document.createElement('div');
+        block.className = 'carteira-kpi-skeleton carteira-kpi-skeleton-block';
+        block.innerHTML = `
+            <h3 style="margin:0; color:#8a99ab;">${title}</h3>
+            ${'<div class="carteira-kpi-skeleton-bar"></div>'.repeat(bars)}
+        `;
+        chartContainer.appendChild(block);
+        skeletonSlots[slot] = block;
+    };
+    const placeSection = (slot, section) => {
+        const skeleton = skeletonSlots[slot];
+        delete skeletonSlots[slot];
+        if (skeleton && skeleton.parentNode) {
+            skeleton.replaceWith(section);
+        } else {
+            chartContainer.appendChild(section);
+        }
+    };
+    const clearSkeletons = () => {
+        chartContainer.querySelectorAll('.chart-wrapper.carteira-kpi-skeleton').forEach((wrapper) => {
+            wrapper.classList.remove('carteira-kpi-skeleton');
+        });
+        Object.keys(skeletonSlots).forEach((slot) => {
+            skeletonSlots[slot].remove();
+            delete skeletonSlots[slot];
+        });
+    };
+    createSkeletonSlot('intersecoes', 'Interseção de Cadastros/CPFs entre Carteiras', 3);
+    createSkeletonSlot('kpi', 'KPIs da Análise por Carteira x Tipo', 6);
+
+    const chartSection = (await sectionRequests.graficos) || {};
+    const chartData = Array.isArray(chartSection.carteiras) ? chartSection.carteiras : [];
+    const labels = chartData.map((c) => c.nome);
+    const processCounts = chartData.map((c) => Number(c.total_processos || 0));
+    const valuations = chartData.map((c) => Number(c.valor_total || 0));
+    const carteiraBaseColors = chartData.map((item, index) => resolveCarteiraColor(item, index));
+    chartContainer.querySelectorAll('.chart-wrapper.carteira-kpi-skeleton').forEach((wrapper) => {
+        wrapper.classList.remove('carteira-kpi-skeleton');
+    });
+
     const ctx1 = document.getElementById('processCountChart')?.getContext('2d');
     if (ctx1) {
         new Chart(ctx1, {
@@ -123,14 +213,15 @@ window.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    const intersectionsElement = document.getElementById('intersection_data_script');
-    if (!intersectionsElement) return;
-    const intersectionData = JSON.parse(intersectionsElement.textContent || '{}');
+    const intersectionData = (await sectionRequests.intersecoes) || {};
     const carteiras = Array.isArray(intersectionData.carteiras) ? intersectionData.carteiras : [];
     const pairs = Array.isArray(intersectionData.pairs) ? intersectionData.pairs : [];
     const totalUniqueCpfs = Number(intersectionData.total_unique_cpfs || 0);
     const processChangelistUrl = String(intersectionData.process_changelist_url || '').trim();
-    if (!carteiras.length) return;
+    if (!carteiras.length) {
+        clearSkeletons();
+        return;
+    }
 
     const clamp = (value, min, max) => Math.min(max, Math.max(min, value));
     const escapeHtml = (value) => String(value ?? '')
@@ -564,12 +655,15 @@ window.addEventListener('DOMContentLoaded', () => {
         <div class="carteira-intersection-diagram" style="width:100%; overflow:auto; border:1px solid #e7edf4; border-radius:8px; padding:8px; box-sizing:border-box;"></div>
         <div class="carteira-intersection-table-wrap" style="margin-top:12px;"></div>
     `;
-    chartContainer.appendChild(section);
+    placeSection('intersecoes', section);
     attachPrintButtonToPanel(section, 'Intersecao de Cadastros e CPFs');
 
     const diagramWrap = section.querySelector('.carteira-intersection-diagram');
     const tableWrap = section.querySelector('.carteira-intersection-table-wrap');
-    if (!diagramWrap || !tableWrap) return;
+    if (!diagramWrap || !tableWrap) {
+        clearSkeletons();
+        return;
+    }
 
     const maxCpf = Math.max(...carteiras.map((c) => Number(c.cpf_total || 0)), 1);
     const radii = carteiras.map((carteira) => {
@@ -914,16 +1008,10 @@ window.addEventListener('DOMContentLoaded', () => {
         `;
     }
 
-    const kpiDataElement = document.getElementById('kpi_data_script');
-    if (!kpiDataElement) return;
-
-    let kpiData = {};
-    try {
-        kpiData = JSON.parse(kpiDataElement.textContent || '{}');
-    } catch (error) {
-        console.error('[carteira-kpi] erro ao parsear dados:', error);
-        return;
-    }
+    const kpiParts = await Promise.all(
+        ['analises', 'peticoes', 'prioridade', 'produtividade', 'presenca'].map((secao) => sectionRequests[secao]),
+    );
+    const kpiData = Object.assign({}, ...kpiParts.filter((part) => part && typeof part === 'object'));
 
     const kpiBuckets = (kpiData && typeof kpiData === 'object' && kpiData.buckets) ? kpiData.buckets : {};
     const kpiUfOptions = Array.isArray(kpiData.ufs) ? kpiData.ufs : [];
@@ -963,7 +1051,10 @@ window.addEventListener('DOMContentLoaded', () => {
     const onlinePresenceKpi = (kpiData && typeof kpiData === 'object' && kpiData.online_presence_kpi)
         ? kpiData.online_presence_kpi
         : {};
-    if (!kpiUfOptions.length || !Object.keys(kpiBuckets).length) return;
+    if (!kpiUfOptions.length || !Object.keys(kpiBuckets).length) {
+        clearSkeletons();
+        return;
+    }
 
     const kpiSection = document.createElement('section');
     kpiSection.style.marginTop = '22px';
@@ -983,14 +1074,17 @@ window.addEventListener('DOMContentLoaded', () => {
         <div class="carteira-kpi-table-wrap" style="overflow:auto;"></div>
         <div class="carteira-kpi-questions-wrap" style="margin-top:10px;"></div>
     `;
-    chartContainer.appendChild(kpiSection);
+    placeSection('kpi', kpiSection);
     attachPrintButtonToPanel(kpiSection, 'KPIs da Analise por Carteira e Tipo');
 
     const ufSelect = kpiSection.querySelector('.carteira-kpi-uf');
     const summaryWrap = kpiSection.querySelector('.carteira-kpi-summary');
     const tableWrapKpi = kpiSection.querySelector('.carteira-kpi-table-wrap');
     const questionsWrap = kpiSection.querySelector('.carteira-kpi-questions-wrap');
-    if (!ufSelect || !summaryWrap || !tableWrapKpi || !questionsWrap) return;
+    if (!ufSelect || !summaryWrap || !tableWrapKpi || !questionsWrap) {
+        clearSkeletons();
+        return;
+    }
 
     const kpiCharts = [];
     const destroyKpiCharts = () => {
@@ -610,6 +610,24 @@
             }
         };
 
+        // A view enfileira a geração (202) e devolve a URL de status da fila.
+        const aguardarGeracao = async (statusUrl) => {
+            while (true) {
+                const response = await fetch(statusUrl, { credentials: 'same-origin' });
+                if (!response.ok) {
+                    throw new Error('Não foi possível consultar o andamento da geração.');
+                }
+                const geracao = await response.json();
+                if (geracao.finalizado) {
+                    if (geracao.status === 'erro') {
+                        throw new Error(geracao.erro || 'Falha ao gerar ZIP');
+                    }
+                    return geracao.resultado || {};
+                }
+                await new Promise((resolve) => setTimeout(resolve, 1500));
+            }
+        };
+
         const gerarZip = async (preview) => {
             if (!generateUrl) {
                 showMessage('URL de geração não configurada.', 'error');
@@ -638,7 +656,13 @@
                 if (!response.ok || !data.ok) {
                     throw new Error(data.error || 'Falha ao gerar ZIP');
                 }
-                modal.resultEl.textContent = `ZIP criado: ${data.result?.zip_name || 'arquivo'} — <a target="_blank" href="${data.result?.url}">Baixar</a>`;
+                let result = data.result;
+                if (data.status === 'queued' && data.status_url) {
+                    modal.resultEl.textContent = 'Gerando o ZIP...';
+                    modal.resultEl.style.display = 'block';
+                    result = await aguardarGeracao(data.status_url);
+                }
+                modal.resultEl.textContent = `ZIP criado: ${result?.zip_name || 'arquivo'} — <a target="_blank" href="${result?.url}">Baixar</a>`;
                 modal.resultEl.style.display = 'block';
             } catch (err) {
                 modal.resultEl.textContent = err.message || 'Erro ao gerar o ZIP.';
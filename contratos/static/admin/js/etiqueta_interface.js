@@ -255,13 +255,48 @@ function waitForJQuery() {
                 data: JSON.stringify({ ids: bulkProcessIds, etiqueta_id: etiquetaId, action }),
                 contentType: 'application/json',
                 beforeSend: xhr => xhr.setRequestHeader("X-CSRFToken", csrftoken),
-                success: () => {
+                success: data => {
+                    if (data && data.status === 'queued' && data.status_url) {
+                        pollOperacaoLote(data.status_url);
+                        return;
+                    }
                     fetchDataBulk();
                 },
                 error: () => alert('Ocorreu um erro ao atualizar a etiqueta.')
             });
         }
 
+        // Seleções grandes são processadas em segundo plano; acompanha o progresso.
+        function pollOperacaoLote(statusUrl) {
+            const statusEl = modal.find('#etiqueta-bulk-progress');
+            const progressEl = statusEl.length
+                ? statusEl
+                : $('<div id="etiqueta-bulk-progress" style="margin: 6px 0; font-size: 12px; color: #555;"></div>')
+                    .insertBefore(etiquetaListContainer);
+            progressEl.text('Aplicando em segundo plano...').show();
+            etiquetaListContainer.find('.etiqueta-checkbox').prop('disabled', true);
+
+            const tick = () => {
+                $.get(statusUrl, function(op) {
+                    if (!op.finalizado) {
+                        progressEl.text(`Aplicando em segundo plano... ${op.processados}/${op.total} (${op.percentual}%)`);
+                        setTimeout(tick, 1500);
+                        return;
+                    }
+                    if (op.status === 'erro') {
+                        progressEl.text('Falha ao aplicar a etiqueta: ' + (op.erro || 'erro desconhecido.'));
+                    } else {
+                        progressEl.hide();
+                    }
+                    fetchDataBulk();
+                }).fail(() => {
+                    progressEl.text('Não foi possível consultar o progresso da operação.');
+                    etiquetaListContainer.find('.etiqueta-checkbox').prop('disabled', false);
+                });
+            };
+            tick();
+        }
+
         function handleEtiquetaChange(etiquetaId, action) {
             if (isBulkMode) {
                 handleEtiquetaChangeBulk(etiquetaId, action);
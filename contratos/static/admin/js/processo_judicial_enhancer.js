@@ -1224,6 +1224,37 @@ document.addEventListener('DOMContentLoaded', function() {
         return cookieValue;
     }
     const csrftoken = getCookie('csrftoken');
+
+    // Upload direto para o storage (/api/uploads/): reserva a chave, envia o
+    // arquivo para a URL devolvida (presigned POST do S3 ou endpoint local) e
+    // retorna o token a confirmar. null = usar o envio multipart de sempre.
+    const enviarUploadDireto = async (alvo, file) => {
+        if (!file) return null;
+        try {
+            const inicio = await fetch('/api/uploads/', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrftoken || '' },
+                credentials: 'same-origin',
+                body: JSON.stringify({ ...alvo, nome: file.name, tamanho: file.size }),
+            });
+            if (!inicio.ok) return null;
+            const destino = await inicio.json();
+            const envio = new FormData();
+            Object.entries(destino.fields || {}).forEach(([campo, valor]) => envio.append(campo, valor));
+            envio.append('file', file);
+            const local = destino.backend === 'local';
+            const resposta = await fetch(destino.url, {
+                method: 'POST',
+                headers: local ? { 'X-CSRFToken': csrftoken || '' } : {},
+                credentials: local ? 'same-origin' : 'omit',
+                body: envio,
+            });
+            return resposta.ok ? destino.token : null;
+        } catch (error) {
+            return null;
+        }
+    };
+    window.enviarUploadDireto = enviarUploadDireto;
     const AGENDA_PAGE_SIZE = 200;
     const AGENDA_SUPERVISION_STATUS_SEQUENCE = ['pendente', 'pre_aprovado', 'aprovado', 'reprovado'];
     const AGENDA_SUPERVISION_STATUS_LABELS = {
@@ -1576,11 +1607,21 @@ document.addEventListener('DOMContentLoaded', function() {
         return panel;
     };
 
-    const renderMinhasAcoes = (panel, items) => {
+    const renderMinhasAcoesResumo = (body, resumo) => {
+        if (!resumo) return;
+        const summary = document.createElement('p');
+        summary.className = 'minhas-acoes-panel__summary';
+        summary.textContent = `Últimos ${resumo.dias || 7} dias: ${resumo.acoes || 0} ações · `
+            + `${resumo.tarefas || 0} tarefas · ${resumo.prazos || 0} prazos concluídos`;
+        body.prepend(summary);
+    };
+
+    const renderMinhasAcoes = (panel, items, resumo) => {
         const body = panel.querySelector('.minhas-acoes-panel__body');
         if (!body) return;
         if (!items.length) {
             body.innerHTML = '<p class="minhas-acoes-panel__empty">Nenhuma ação recente.</p>';
+            renderMinhasAcoesResumo(body, resumo);
             return;
         }
         const list = document.createElement('div');
@@ -1611,6 +1652,7 @@ document.addEventListener('DOMContentLoaded', function() {
         });
         body.innerHTML = '';
         body.appendChild(list);
+        renderMinhasAcoesResumo(body, resumo);
     };
 
     const loadMinhasAcoes = (panel) => {
@@ -1621,7 +1663,7 @@ document.addEventListener('DOMContentLoaded', function() {
         fetch('/admin/minhas-acoes/')
             .then((response) => response.json())
             .then((data) => {
-                renderMinhasAcoes(panel, Array.isArray(data.items) ? data.items : []);
+                renderMinhasAcoes(panel, Array.isArray(data.items) ? data.items : [], data.resumo);
             })
             .catch(() => {
                 if (body) {
@@ -6250,13 +6292,19 @@ document.addEventListener('DOMContentLoaded', function() {
                 concluida,
                 comentario_texto: commentPayload.text || '',
             };
+            const submitBtn = modal.querySelector('.agenda-form-modal__submit');
+            if (submitBtn) submitBtn.disabled = true;
+            const anexoToken = processIds.length
+                ? await enviarUploadDireto({ processo_id: processIds[0] }, commentPayload.file)
+                : null;
             const formData = new FormData();
+            if (anexoToken) {
+                payload.upload_token = anexoToken;
+            }
             formData.append('payload', JSON.stringify(payload));
-            if (commentPayload.file) {
+            if (commentPayload.file && !anexoToken) {
                 formData.append('arquivo', commentPayload.file);
             }
-            const submitBtn = modal.querySelector('.agenda-form-modal__submit');
-            if (submitBtn) submitBtn.disabled = true;
             try {
                 const response = await fetch('/api/tarefas/bulk/', {
                     method: 'POST',
@@ -6315,13 +6363,19 @@ document.addEventListener('DOMContentLoaded', function() {
             concluido,
             comentario_texto: commentPayload.text || '',
         };
+        const submitBtn = modal.querySelector('.agenda-form-modal__submit');
+        if (submitBtn) submitBtn.disabled = true;
+        const anexoToken = processIds.length
+            ? await enviarUploadDireto({ processo_id: processIds[0] }, commentPayload.file)
+            : null;
         const formData = new FormData();
+        if (anexoToken) {
+            payload.upload_token = anexoToken;
+        }
         formData.append('payload', JSON.stringify(payload));
-        if (commentPayload.file) {
+        if (commentPayload.file && !anexoToken) {
             formData.append('arquivo', commentPayload.file);
         }
-        const submitBtn = modal.querySelector('.agenda-form-modal__submit');
-        if (submitBtn) submitBtn.disabled = true;
         try {
             const response = await fetch('/api/prazos/bulk/', {
                 method: 'POST',
@@ -7086,7 +7140,8 @@ document.addEventListener('DOMContentLoaded', function() {
         const formData = new FormData();
         formData.append('texto', texto || '');
         if (arquivo) {
-            formData.append('arquivo', arquivo);
+            const uploadToken = await enviarUploadDireto({ tarefa_id: tarefaId }, arquivo);
+            formData.append(uploadToken ? 'upload_token' : 'arquivo', uploadToken || arquivo);
         }
 
         const response = await fetch(`/api/tarefas/${tarefaId}/comentarios/`, {
@@ -7130,7 +7185,8 @@ document.addEventListener('DOMContentLoaded', function() {
         const formData = new FormData();
         formData.append('texto', texto || '');
         if (arquivo) {
-            formData.append('arquivo', arquivo);
+            const uploadToken = await enviarUploadDireto({ prazo_id: prazoId }, arquivo);
+            formData.append(uploadToken ? 'upload_token' : 'arquivo', uploadToken || arquivo);
         }
 
         const response = await fetch(`/api/prazos/${prazoId}/comentarios/`, {
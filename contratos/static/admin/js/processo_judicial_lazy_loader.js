@@ -2,10 +2,10 @@
     'use strict';
 
     const STATIC_BASE = window.__static_url || '/static/';
-    const CACHE_BUST = '20260217c';
+    const CACHE_BUST = '20261019a';
     const scriptRegistry = {
         analise: `${STATIC_BASE}admin/js/analise_processo_arvore.js?v=${CACHE_BUST}`,
-        arquivos: `${STATIC_BASE}admin/js/arquivos_peticoes_tab.js`,
+        arquivos: `${STATIC_BASE}admin/js/arquivos_peticoes_tab.js?v=${CACHE_BUST}`,
         tarefas: `${STATIC_BASE}admin/js/tarefas_prazos_interface.js`,
         pickr: 'https://cdn.jsdelivr.net/npm/@simonwep/pickr/dist/pickr.min.js',
     };
@@ -1,3 +1,2397 @@
-from django.test import TestCase
+import json
+import re
+import unicodedata
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+from zipfile import ZipFile
 
-# Create your tests here.
+import httpx
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Prefetch, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from contratos import models as kpi_models
+from contratos.models import (
+    AnaliseProcesso, Carteira, CarteiraCpf, CarteiraStats, CarteiraUsuarioAcesso, ComboDocumentoPattern, Contrato, DocumentoModelo, Etiqueta, GeracaoDocumento, KpiSnapshot, OperacaoLote, Parte, Prazo, ProcessoArquivo,
+    ProcessoJudicial, ProdutividadeDiaria, StatusProcessual, Tarefa, TipoAnaliseObjetiva, TipoPeticao,
+)
+from contratos.services import (
+    classificacao_arquivos,
+    combo_padroes,
+    conversao_pdf,
+    geracao_documentos,
+    integracoes_http,
+    kpi_queries,
+    kpi_snapshots,
+    libreoffice_pool,
+    modelos_documento,
+    operacoes_lote,
+    peticao_combo,
+    peticoes_lote,
+    plano_docx,
+    previews_arquivos,
+    produtividade,
+    uploads_diretos,
+)
+
+
+class KpiQueriesEquivalenceTests(TestCase):
+    """O dashboard montado a partir das consultas agregadas, conferido nos mesmos dados."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user_a = User.objects.create_user('ana', first_name='Ana')
+        cls.user_b = User.objects.create_user('bruno')
+        cls.carteira_a = Carteira.objects.create(nome='Carteira A')
+        cls.carteira_b = Carteira.objects.create(nome='Carteira B')
+        cls.carteira_c = Carteira.objects.create(nome='Carteira C')
+        ativo = StatusProcessual.objects.create(nome='Ativo')
+        arquivado = StatusProcessual.objects.create(nome='Arquivado')
+
+        cls.p1 = ProcessoJudicial.objects.create(
+            cnj='0000001', carteira=cls.carteira_a, status=ativo,
+            valor_causa=Decimal('100.50'), soma_contratos=Decimal('80.00'),
+        )
+        cls.p2 = ProcessoJudicial.objects.create(
+            cnj='0000002', carteira=cls.carteira_a, status=arquivado, valor_causa=Decimal('10.00'),
+        )
+        cls.p3 = ProcessoJudicial.objects.create(cnj='0000003', carteira=cls.carteira_b, status=ativo)
+        cls.p4 = ProcessoJudicial.objects.create(cnj='0000004')
+        cls.p5 = ProcessoJudicial.objects.create(cnj='0000005')
+        # p1 também está vinculado a B; p5 só pertence a C pelo vínculo.
+        cls.p1.carteiras_vinculadas.add(cls.carteira_a, cls.carteira_b)
+        cls.p5.carteiras_vinculadas.add(cls.carteira_c)
+
+        arquivos = [
+            (cls.p1, 'Monitória Inicial - João.docx', 'processos/1/monitoria_inicial.docx'),
+            (cls.p1, 'MONITÓRIA_INICIAL.pdf', 'processos/1/x.pdf'),
+            (cls.p1, 'Habilitação', 'processos/1/habilitacao.pdf'),
+            (cls.p2, '', 'processos/2/cobranca-judicial.pdf'),
+            (cls.p2, 'Cobrança  Judicial e Habilitação', 'processos/2/y.pdf'),
+            (cls.p3, 'procuração.pdf', 'processos/3/procuracao.pdf'),
+            (cls.p3, 'HABILITAÇÃO.pdf', 'processos/3/z.pdf'),
+            (cls.p4, 'Monitoria inicial.pdf', 'processos/4/m.pdf'),
+            (cls.p5, 'monitoria', 'inicial/processos/5/w.pdf'),
+        ]
+        for processo, nome, caminho in arquivos:
+            ProcessoArquivo.objects.create(processo=processo, nome=nome, arquivo=caminho)
+
+        hoje = timezone.localdate()
+        agora = timezone.now()
+        Tarefa.objects.create(processo=cls.p1, descricao='t1', data=hoje - timedelta(days=1), responsavel=cls.user_a)
+        Tarefa.objects.create(processo=cls.p1, descricao='t2', data=hoje, responsavel=cls.user_a)
+        Tarefa.objects.create(processo=cls.p3, descricao='t3', data=hoje, responsavel=cls.user_b)
+        Tarefa.objects.create(descricao='t4', data=hoje - timedelta(days=3))
+        Tarefa.objects.create(processo=cls.p2, descricao='t5', data=hoje, responsavel=cls.user_a, concluida=True)
+        Prazo.objects.create(processo=cls.p2, titulo='p1', data_limite=agora - timedelta(hours=2), responsavel=cls.user_b)
+        Prazo.objects.create(processo=cls.p4, titulo='p2', data_limite=agora + timedelta(days=2), responsavel=cls.user_b)
+        Prazo.objects.create(processo=cls.p3, titulo='p3', data_limite=agora, responsavel=cls.user_a, concluido=True)
+
+        AnaliseProcesso.objects.create(
+            processo_judicial=cls.p1,
+            respostas={
+                'saved_processos_vinculados': [
+                    {'analysis_type': {'id': 7}},
+                    {'analysis_type': {'id': 7}, 'carteira_id': cls.carteira_b.pk},
+                    {'analysis_type': {'id': 'x'}},
+                ],
+                'processos_vinculados': [{'analysis_type': {'id': 99}}],
+            },
+        )
+        AnaliseProcesso.objects.create(
+            processo_judicial=cls.p5,
+            respostas={'processos_vinculados': [{'analysis_type': {'id': 7}}, 'inválido']},
+        )
+        prioridade = Etiqueta.objects.create(nome='Prioridade 1', cor_fundo='#f5c242', cor_fonte='#3e2a00')
+        cls.p1.etiquetas.add(prioridade)
+        cls.p4.etiquetas.add(prioridade)
+
+    def _kpi_data(self):
+        from django.contrib import admin
+
+        return admin.site._registry[Carteira]._build_carteira_kpi_data(None)
+
+    def test_classificacao_na_criacao_igual_a_heuristica(self):
+        esperado = {
+            arquivo.pk: classificacao_arquivos.classificar_peca(arquivo.nome, arquivo.arquivo.name)
+            for arquivo in ProcessoArquivo.objects.all()
+        }
+        obtido = dict(kpi_queries.arquivos_classificados_queryset().values_list('id', 'tipo_peca'))
+        self.assertEqual(obtido, {pk: tipo for pk, tipo in esperado.items() if tipo})
+
+    def test_classificacao_de_zip_extrato_e_tipo_explicito(self):
+        zip_combo = ProcessoArquivo.objects.create(
+            processo=self.p1, nome='SP - PROTOCOLO - MONITÓRIA INICIAL - 123 - João.zip',
+        )
+        extrato = ProcessoArquivo.objects.create(
+            processo=self.p1, nome='05 - Extrato de Titularidade - 123 - João.pdf', arquivo='processos/1/e.pdf',
+        )
+        explicito = ProcessoArquivo.objects.create(
+            processo=self.p1, nome='peca.docx', arquivo='processos/1/peca.docx',
+            tipo_documento=classificacao_arquivos.TIPO_HABILITACAO,
+        )
+        outro = ProcessoArquivo.objects.create(processo=self.p1, nome='rg.pdf', arquivo='processos/1/rg.pdf')
+        self.assertEqual(zip_combo.tipo_documento, classificacao_arquivos.TIPO_COMBO_ZIP)
+        self.assertEqual(extrato.tipo_documento, classificacao_arquivos.TIPO_EXTRATO_TITULARIDADE)
+        self.assertEqual(explicito.tipo_documento, classificacao_arquivos.TIPO_HABILITACAO)
+        self.assertEqual(outro.tipo_documento, classificacao_arquivos.TIPO_OUTRO)
+
+        ProcessoArquivo.objects.filter(pk=outro.pk).update(tipo_documento='')
+        call_command('classificar_arquivos', stdout=StringIO())
+        outro.refresh_from_db()
+        self.assertEqual(outro.tipo_documento, classificacao_arquivos.TIPO_OUTRO)
+
+    def test_peticoes_no_dashboard(self):
+        dados = self._kpi_data()
+        self.assertEqual(
+            [
+                (item['carteira_nome'], item['pieces'], item['processos'], item['total_pieces'], item['total_processos'])
+                for item in dados['peticao_by_carteira']
+            ],
+            [
+                (
+                    'Carteira A',
+                    {'monitoria_inicial': 2, 'cobranca_judicial': 2, 'habilitacao': 1},
+                    {'monitoria_inicial': 1, 'cobranca_judicial': 1, 'habilitacao': 1},
+                    5, 2,
+                ),
+                (
+                    'Carteira B',
+                    {'monitoria_inicial': 2, 'cobranca_judicial': 0, 'habilitacao': 2},
+                    {'monitoria_inicial': 1, 'cobranca_judicial': 0, 'habilitacao': 2},
+                    4, 2,
+                ),
+                (
+                    'Carteira C',
+                    {'monitoria_inicial': 1, 'cobranca_judicial': 0, 'habilitacao': 0},
+                    {'monitoria_inicial': 1, 'cobranca_judicial': 0, 'habilitacao': 0},
+                    1, 1,
+                ),
+            ],
+        )
+        # p4 não tem carteira e fica fora dos totais.
+        self.assertEqual(
+            [(item['slug'], item['pieces'], item['processos']) for item in dados['peticao_totals']],
+            [('monitoria_inicial', 3, 2), ('cobranca_judicial', 2, 1), ('habilitacao', 2, 2)],
+        )
+        filtrado = kpi_queries.run('peticoes_por_tipo', carteira_ids=[self.carteira_c.pk])
+        self.assertEqual([row['carteira_id'] for row in filtrado], [self.carteira_c.pk])
+
+    def test_pendencias_no_dashboard(self):
+        produtividade_kpi = self._kpi_data()['productivity_kpi']
+        self.assertEqual(produtividade_kpi['pending'], {'tarefas': 4, 'prazos': 2, 'total': 6})
+        pendentes = {
+            usuario['user_label']: (usuario['pending'], usuario['carteiras'])
+            for usuario in produtividade_kpi['users']
+        }
+        self.assertEqual(
+            pendentes['Ana'],
+            ({'tarefas': 2, 'prazos': 0, 'total': 2}, [{'nome': 'Carteira A', 'eventos': 2}]),
+        )
+        self.assertEqual(pendentes['bruno'][0], {'tarefas': 1, 'prazos': 2, 'total': 3})
+        self.assertEqual(pendentes['Sem usuário'][0], {'tarefas': 1, 'prazos': 0, 'total': 1})
+
+        obtido = {
+            (row['responsavel_id'], row['carteira_id']): (
+                row['tarefas_abertas'], row['tarefas_vencidas'], row['prazos_abertos'], row['prazos_vencidos'],
+            )
+            for row in kpi_queries.run('pendencias_por_responsavel')
+        }
+        self.assertEqual(
+            obtido,
+            {
+                (self.user_a.pk, self.carteira_a.pk): (2, 1, 0, 0),
+                (self.user_b.pk, self.carteira_b.pk): (1, 0, 0, 0),
+                (self.user_b.pk, self.carteira_a.pk): (0, 0, 1, 1),
+                (self.user_b.pk, None): (0, 0, 1, 0),
+                (None, None): (1, 1, 0, 0),
+            },
+        )
+
+    def test_prioridade_e_analises_no_dashboard(self):
+        dados = self._kpi_data()
+        prioridade = dados['priority_kpi']
+        self.assertEqual(prioridade['totals'], {'processos': 2, 'analisados': 0, 'pendentes': 2})
+        self.assertEqual(
+            [(item['carteira_nome'], item['totals']['processos']) for item in prioridade['by_carteira']],
+            [('Carteira A', 1), ('Carteira B', 1), ('Sem carteira', 1)],
+        )
+        todas = dados['buckets']['ALL']
+        self.assertEqual((todas['cards_total'], todas['processos_total']), (4, 2))
+        self.assertEqual(
+            [(combo['carteira_nome'], combo['cards'], combo['processos']) for combo in todas['combos']],
+            [('Carteira A', 2, 1), ('Carteira B', 1, 1), ('Carteira C', 1, 1)],
+        )
+
+    def _membros(self):
+        membros = {}
+        for processo in ProcessoJudicial.objects.prefetch_related('carteiras_vinculadas'):
+            ids = {carteira.pk for carteira in processo.carteiras_vinculadas.all()}
+            if processo.carteira_id:
+                ids.add(processo.carteira_id)
+            membros[processo.pk] = ids
+        return membros
+
+    def test_peticoes_sql_igual_a_python(self):
+        membros = self._membros()
+        esperado = {}
+        totais = {}
+        for arquivo in ProcessoArquivo.objects.all():
+            tipo = classificacao_arquivos.classificar_peca(arquivo.nome, arquivo.arquivo.name)
+            carteiras = membros.get(arquivo.processo_id, set())
+            if not tipo or not carteiras:
+                continue
+            for carteira_id in carteiras:
+                bucket = esperado.setdefault((carteira_id, tipo), {'pecas': 0, 'processos': set()})
+                bucket['pecas'] += 1
+                bucket['processos'].add(arquivo.processo_id)
+            total = totais.setdefault(tipo, {'pecas': 0, 'processos': set()})
+            total['pecas'] += 1
+            total['processos'].add(arquivo.processo_id)
+
+        obtido = {
+            (row['carteira_id'], row['tipo']): (row['pecas'], row['processos'])
+            for row in kpi_queries.run('peticoes_por_tipo')
+        }
+        self.assertEqual(
+            obtido,
+            {chave: (item['pecas'], len(item['processos'])) for chave, item in esperado.items()},
+        )
+        obtido_totais = {row['tipo']: (row['pecas'], row['processos']) for row in kpi_queries.run('peticoes_totais')}
+        self.assertEqual(
+            obtido_totais,
+            {tipo: (item['pecas'], len(item['processos'])) for tipo, item in totais.items()},
+        )
+        processos_por_carteira = {}
+        for (carteira_id, _), item in esperado.items():
+            processos_por_carteira.setdefault(carteira_id, set()).update(item['processos'])
+        self.assertEqual(
+            {row['carteira_id']: row['processos'] for row in kpi_queries.run('peticoes_processos_por_carteira')},
+            {carteira_id: len(processos) for carteira_id, processos in processos_por_carteira.items()},
+        )
+
+    def test_status_e_valores_sql_igual_a_python(self):
+        membros = self._membros()
+        processos = {p.pk: p for p in ProcessoJudicial.objects.select_related('status')}
+        for carteira_ids in (None, [self.carteira_a.pk]):
+            status_esperado = {}
+            valores_esperados = {}
+            for processo_id, carteiras in membros.items():
+                processo = processos[processo_id]
+                for carteira_id in carteiras:
+                    if carteira_ids is not None and carteira_id not in carteira_ids:
+                        continue
+                    chave = (carteira_id, processo.status_id, processo.status.nome if processo.status else 'Sem classe')
+                    status_esperado[chave] = status_esperado.get(chave, 0) + 1
+                    valores = valores_esperados.setdefault(carteira_id, [0, Decimal('0.00'), Decimal('0.00')])
+                    valores[0] += 1
+                    valores[1] += processo.valor_causa or 0
+                    valores[2] += processo.soma_contratos or 0
+
+            self.assertEqual(
+                {
+                    (row['carteira_id'], row['status_id'], row['status_nome']): row['processos']
+                    for row in kpi_queries.run('processos_por_status', carteira_ids=carteira_ids)
+                },
+                status_esperado,
+            )
+            self.assertEqual(
+                {
+                    row['carteira_id']: [row['processos'], row['valor_causa_total'], row['soma_contratos_total']]
+                    for row in kpi_queries.run('valores_por_carteira', carteira_ids=carteira_ids)
+                },
+                valores_esperados,
+            )
+
+    def test_pendencias_sql_igual_a_python(self):
+        agora = timezone.now()
+        hoje = timezone.localdate(agora)
+        esperado = {}
+        for tarefa in Tarefa.objects.filter(concluida=False).select_related('processo'):
+            chave = (tarefa.responsavel_id, tarefa.processo.carteira_id if tarefa.processo else None)
+            item = esperado.setdefault(chave, [0, 0, 0, 0])
+            item[0] += 1
+            item[1] += int(tarefa.data < hoje)
+        for prazo in Prazo.objects.filter(concluido=False).select_related('processo'):
+            chave = (prazo.responsavel_id, prazo.processo.carteira_id if prazo.processo else None)
+            item = esperado.setdefault(chave, [0, 0, 0, 0])
+            item[2] += 1
+            item[3] += int(prazo.data_limite < agora)
+
+        obtido = {
+            (row['responsavel_id'], row['carteira_id']): [
+                row['tarefas_abertas'], row['tarefas_vencidas'], row['prazos_abertos'], row['prazos_vencidos'],
+            ]
+            for row in kpi_queries.run('pendencias_por_responsavel', agora=agora)
+        }
+        self.assertEqual(obtido, esperado)
+
+    def test_consulta_desconhecida(self):
+        with self.assertRaises(KeyError):
+            kpi_queries.run('nao_existe')
+
+
+class KpiAnalisesEquivalenceTests(TestCase):
+    """
+    Consultas de análise e prioridade contra a agregação em Python que o
+    dashboard fazia antes delas (laço por processo e por card), nos mesmos dados.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ana = User.objects.create_user('ana', first_name='Ana')
+        cls.bruno = User.objects.create_user('bruno')
+        cls.carteira_a = Carteira.objects.create(nome='Carteira A')
+        cls.carteira_b = Carteira.objects.create(nome='Carteira B')
+        cls.passivas = Carteira.objects.create(nome='Passivas')
+        cls.tipo_monitoria, _ = TipoAnaliseObjetiva.objects.get_or_create(
+            slug='novas-monitorias', defaults={'nome': 'Novas Monitórias'},
+        )
+        cls.tipo_passivas = TipoAnaliseObjetiva.objects.create(nome='Passivas', slug='passivas')
+
+        cls.p1 = ProcessoJudicial.objects.create(cnj='0000101', carteira=cls.carteira_a, uf='sp')
+        cls.p2 = ProcessoJudicial.objects.create(cnj='0000102')
+        cls.p2.carteiras_vinculadas.add(cls.carteira_b, cls.carteira_a)
+        cls.p3 = ProcessoJudicial.objects.create(cnj='0000103', carteira=cls.carteira_b, uf='MG')
+        cls.p4 = ProcessoJudicial.objects.create(cnj='0000104', uf='RJ')
+        cls.p5 = ProcessoJudicial.objects.create(cnj='0000105', carteira=cls.carteira_a, uf='SP')
+        cls.p6 = ProcessoJudicial.objects.create(cnj='0000106', carteira=cls.carteira_b, uf='BA')
+
+        for processo, documento in (
+            (cls.p1, '123.456.789-01'), (cls.p1, ' 123456789-01'), (cls.p1, '987.654.321-00'),
+            (cls.p2, '123.456.789-01'), (cls.p3, '11.222.333/0001-44'), (cls.p4, '--'),
+        ):
+            Parte.objects.create(
+                processo=processo, tipo_polo='PASSIVO', nome='Réu', tipo_pessoa='PF', documento=documento,
+            )
+        Parte.objects.create(processo=cls.p3, tipo_polo='ATIVO', nome='Autor', tipo_pessoa='PJ', documento='555')
+
+        analises = {
+            cls.p1: {
+                'saved_processos_vinculados': [
+                    {
+                        'analysis_type': {'id': cls.tipo_monitoria.pk, 'slug': 'novas-monitorias'},
+                        'analysis_author': 'ana',
+                        'saved_at': '2026-03-01T01:30:00Z',
+                        'tipo_de_acao_respostas': {
+                            'propor_monitoria': 'Sim',
+                            'habilitacao': 'Habilitar crédito',
+                            'julgamento': '  Procedente ',
+                            'ativar_botao_monitoria': 'SIM',
+                            'contratos_para_monitoria': ['1'],
+                        },
+                    },
+                    {
+                        'analysis_type': {'slug': 'passivas'},
+                        'observacoes': '---',
+                        'updated_at': '2026-03-02T10:00:00',
+                        'tipo_de_acao_respostas': {'cumprimento_de_sentenca': 'Iniciar CS', 'procedencia': 'PROCEDENTE'},
+                    },
+                    {
+                        'analysis_type': {'id': 'x'},
+                        'carteira_id': str(cls.carteira_b.pk),
+                        'observacoes': 'ok',
+                        'saved_at': 'ontem',
+                        'tipo_de_acao_respostas': {'propor_monitoria': 'não', 'repropor_monitoria': ' SIM ', 'habilitacao': '---'},
+                    },
+                    'inválido',
+                    {},
+                ],
+                'processos_vinculados': [{'analysis_type': {'id': cls.tipo_passivas.pk}}],
+            },
+            cls.p2: {
+                'processos_vinculados': [
+                    {
+                        'analysis_type': {'id': cls.tipo_passivas.pk},
+                        'observacoes': {'texto': ['', ' x ']},
+                        'tipo_de_acao_respostas': {
+                            'cumprimento_de_sentenca': 'nao', 'habilitacao': 'Não  habilitar', 'procedencia': 'procedente',
+                        },
+                    },
+                ],
+            },
+            cls.p3: {
+                'saved_processos_vinculados': [],
+                'processos_vinculados': [
+                    {
+                        'carteira_id': 0,
+                        'analysis_author': 'Fulano',
+                        'saved_at': '2026-03-05T23:30:00-03:00',
+                        'tipo_de_acao_respostas': {'tipo_de_acao': 'Monitória', 'outro': 'Valor  Livre', 'vazio': ' '},
+                    },
+                    {
+                        'analysis_author': 'fulano',
+                        'tipo_de_acao_respostas': {'tipo_de_acao': 'Monitória', 'outro': 'valor livre', 'flag': True},
+                    },
+                ],
+            },
+            cls.p4: {
+                'saved_processos_vinculados': [
+                    {'analysis_type': {'nome': 'Passivas'}, 'tipo_de_acao_respostas': {'procedencia': 'Improcedente'}},
+                    {'analysis_type': {'id': cls.tipo_monitoria.pk}, 'observacoes': 'sem carteira'},
+                ],
+            },
+            cls.p5: {},
+            cls.p6: {'saved_processos_vinculados': ['x']},
+        }
+        for processo, respostas in analises.items():
+            AnaliseProcesso.objects.create(processo_judicial=processo, respostas=respostas)
+        AnaliseProcesso.objects.filter(processo_judicial=cls.p1).update(
+            updated_by=cls.bruno, updated_at=datetime(2026, 3, 3, 2, 0, tzinfo=dt_timezone.utc),
+        )
+        AnaliseProcesso.objects.filter(processo_judicial=cls.p2).update(updated_by=cls.bruno)
+
+        cls.prioridade_1 = Etiqueta.objects.create(nome='Prioridade 1', cor_fundo='#f5c242', cor_fonte='#3e2a00')
+        cls.prioridade_2 = Etiqueta.objects.create(nome='Prioridade 2', cor_fundo='#F5C242', cor_fonte='#3E2A00')
+        outra = Etiqueta.objects.create(nome='Outra')
+        cls.p1.etiquetas.add(cls.prioridade_1, cls.prioridade_2)
+        cls.p2.etiquetas.add(cls.prioridade_1)
+        cls.p4.etiquetas.add(cls.prioridade_2, outra)
+        cls.p6.etiquetas.add(cls.prioridade_1)
+        cls.p5.etiquetas.add(outra)
+
+    # --- agregação em Python anterior às consultas ---
+
+    @staticmethod
+    def _safe_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _clean_text(value):
+        return "" if value is None else str(value).strip()
+
+    def _normalize_answer(self, value):
+        text = self._clean_text(value).lower()
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+        return re.sub(r"\s+", " ", text).strip()
+
+    @staticmethod
+    def _cards(respostas):
+        if not isinstance(respostas, dict):
+            return []
+        for chave in ("saved_processos_vinculados", "processos_vinculados"):
+            cards = respostas.get(chave)
+            if isinstance(cards, list) and cards:
+                return cards
+        return []
+
+    def _is_filled(self, value):
+        if value is None:
+            return False
+        if isinstance(value, str):
+            return value.strip() not in {"", "---", "-", "—"}
+        if isinstance(value, dict):
+            return any(self._is_filled(item) for item in value.values())
+        if isinstance(value, (list, tuple, set)):
+            return any(self._is_filled(item) for item in value)
+        return True
+
+    def _card_has_content(self, card):
+        if self._is_filled(card.get("observacoes")):
+            return True
+        respostas_obj = card.get("tipo_de_acao_respostas")
+        return isinstance(respostas_obj, dict) and any(self._is_filled(v) for v in respostas_obj.values())
+
+    @staticmethod
+    def _local_date(value):
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+            except ValueError:
+                return None
+        elif not isinstance(value, datetime):
+            return None
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.get_default_timezone())
+        return timezone.localtime(value).date()
+
+    def _resolver(self, analysis_type, respostas_obj):
+        """Heurística de tipo do teste: (grupo, carteira fixa)."""
+        tipo_id = self._safe_int(analysis_type.get("id"))
+        texto = " ".join(
+            self._normalize_answer(item)
+            for item in (analysis_type.get("slug"), analysis_type.get("nome"), respostas_obj.get("tipo_de_acao"))
+        )
+        passiva = tipo_id == self.tipo_passivas.pk or (
+            tipo_id != self.tipo_monitoria.pk and ("passiv" in texto or "procedencia" in respostas_obj)
+        )
+        return (1, self.passivas.pk) if passiva else (0, None)
+
+    def _python(self, carteira_filtro=None):
+        passivas_id = self.passivas.pk
+        processos = (
+            ProcessoJudicial.objects.filter(analise_processo__isnull=False)
+            .select_related("analise_processo")
+            .prefetch_related(Prefetch("carteiras_vinculadas", queryset=Carteira.objects.only("id")))
+            .order_by("pk")
+        )
+        if carteira_filtro and carteira_filtro != passivas_id:
+            processos = processos.filter(
+                Q(carteira_id=carteira_filtro) | Q(carteiras_vinculadas__id=carteira_filtro)
+            ).distinct()
+        cpf_by_processo = {}
+        for processo_id, documento in Parte.objects.filter(tipo_polo="PASSIVO").values_list("processo_id", "documento"):
+            digits = re.sub(r"\D", "", documento or "")
+            if digits:
+                cpf_by_processo.setdefault(processo_id, set()).add(digits)
+
+        ufs, totais, combos, respostas, produtividade = set(), {}, {}, {}, {}
+        for processo in processos:
+            analise = processo.analise_processo
+            cards = self._cards(analise.respostas)
+            if not cards:
+                continue
+            vinc_ids = [carteira.id for carteira in processo.carteiras_vinculadas.all()]
+            carteira_default = processo.carteira_id or (vinc_ids[0] if vinc_ids else None)
+            uf_code = self._clean_text(processo.uf).upper() or "SEM_UF"
+            ufs.add(uf_code)
+            cpfs = cpf_by_processo.get(processo.pk, set())
+            for card in cards:
+                if not isinstance(card, dict):
+                    continue
+                analysis_type = card.get("analysis_type") if isinstance(card.get("analysis_type"), dict) else {}
+                respostas_obj = card.get("tipo_de_acao_respostas")
+                if not isinstance(respostas_obj, dict):
+                    respostas_obj = {}
+                grupo, carteira_fixa = self._resolver(analysis_type, respostas_obj)
+                carteira_id = self._safe_int(card.get("carteira_id")) or carteira_fixa or carteira_default
+                if not carteira_id or (carteira_filtro and carteira_id != carteira_filtro):
+                    continue
+                if self._card_has_content(card):
+                    dia = (
+                        self._local_date(card.get("saved_at"))
+                        or self._local_date(card.get("updated_at"))
+                        or self._local_date(analise.updated_at)
+                    )
+                    chave = (self._clean_text(card.get("analysis_author")), analise.updated_by_id, dia, carteira_id)
+                    produtividade[chave] = produtividade.get(chave, 0) + 1
+
+                propor = self._normalize_answer(respostas_obj.get("propor_monitoria"))
+                repropor = self._normalize_answer(respostas_obj.get("repropor_monitoria"))
+                cumprimento = self._normalize_answer(respostas_obj.get("cumprimento_de_sentenca"))
+                habilitacao = self._normalize_answer(respostas_obj.get("habilitacao"))
+                sim, nao = {"sim", "s", "yes", "y"}, {"nao", "n", "no"}
+                kpis = {
+                    "propor_monitoria_sim": propor in sim,
+                    "propor_monitoria_nao": propor in nao,
+                    "repropor_monitoria_sim": repropor in sim,
+                    "repropor_monitoria_nao": repropor in nao,
+                    "recomendou_monitoria": propor in sim or repropor in sim,
+                    "cumprimento_sentenca_sim": cumprimento in sim,
+                    "cumprimento_sentenca_nao": cumprimento in nao,
+                    "cumprimento_sentenca_iniciar_cs": cumprimento in {
+                        "iniciar cs", "iniciar c.s.", "iniciar cumprimento de sentenca",
+                    },
+                    "habilitar_sim": habilitacao.startswith("habilitar"),
+                    "habilitar_nao": habilitacao.startswith("nao habilitar"),
+                }
+                for nivel in (uf_code, None):
+                    total = totais.setdefault(nivel, [0, set(), set()])
+                    total[0] += 1
+                    total[1].add(processo.pk)
+                    total[2].update(cpfs)
+                    combo = combos.setdefault(
+                        (nivel, carteira_id, grupo), [0, set(), set(), dict.fromkeys(kpis, 0)],
+                    )
+                    combo[0] += 1
+                    combo[1].add(processo.pk)
+                    combo[2].update(cpfs)
+                    for nome, marcado in kpis.items():
+                        combo[3][nome] += int(marcado)
+                    for chave, valor in respostas_obj.items():
+                        if chave in kpi_queries.RESPOSTAS_TECNICAS:
+                            continue
+                        texto = self._clean_text(valor)
+                        if not texto or texto == "---":
+                            continue
+                        resposta = self._normalize_answer(texto) or texto
+                        item = respostas.setdefault((nivel, carteira_id, grupo, chave, resposta), [texto, 0])
+                        item[1] += 1
+        return {
+            "ufs": ufs,
+            "totais": {nivel: (item[0], len(item[1]), len(item[2])) for nivel, item in totais.items()},
+            "combos": {
+                chave: (item[0], len(item[1]), len(item[2]), item[3]) for chave, item in combos.items()
+            },
+            "respostas": {chave: tuple(item) for chave, item in respostas.items()},
+            "produtividade": produtividade,
+        }
+
+    def _prioridades_python(self, tag_ids, carteira_filtro=None):
+        processos = (
+            ProcessoJudicial.objects.filter(etiquetas__id__in=tag_ids)
+            .distinct()
+            .select_related("analise_processo")
+            .prefetch_related(
+                Prefetch("etiquetas", queryset=Etiqueta.objects.filter(id__in=tag_ids)),
+                "carteiras_vinculadas",
+            )
+        )
+        if carteira_filtro:
+            processos = processos.filter(Q(carteira_id=carteira_filtro) | Q(carteiras_vinculadas__id=carteira_filtro))
+        contagens = {}
+
+        def _contar(chave, analisado):
+            item = contagens.setdefault(chave, [0, 0])
+            item[0] += 1
+            item[1] += int(analisado)
+
+        for processo in processos:
+            uf_code = self._clean_text(processo.uf).upper() or "SEM_UF"
+            analise = getattr(processo, "analise_processo", None)
+            cards = self._cards(getattr(analise, "respostas", None))
+            analisado = any(self._card_has_content(card) for card in cards if isinstance(card, dict))
+            carteira_ids = {carteira.id for carteira in processo.carteiras_vinculadas.all()}
+            if processo.carteira_id:
+                carteira_ids.add(processo.carteira_id)
+            carteira_ids = [carteira_filtro] if carteira_filtro else (sorted(carteira_ids) or [0])
+            tags = {tag.id for tag in processo.etiquetas.all()}
+            _contar((None, uf_code, None), analisado)
+            for carteira_id in carteira_ids:
+                _contar((carteira_id, uf_code, None), analisado)
+            for tag_id in tags:
+                _contar((None, uf_code, tag_id), analisado)
+                for carteira_id in carteira_ids:
+                    _contar((carteira_id, uf_code, tag_id), analisado)
+        return {chave: tuple(item) for chave, item in contagens.items()}
+
+    # --- consultas ---
+
+    def _tipos(self):
+        return {
+            row["assinatura"]: self._resolver(
+                row["analysis_type"] if isinstance(row["analysis_type"], dict) else {}, row["respostas"],
+            )
+            for row in kpi_queries.run("analises_assinaturas")
+        }
+
+    def _sql(self, carteira_filtro=None):
+        params = {
+            "tipos": self._tipos(),
+            "carteira_ids": [carteira_filtro] if carteira_filtro else None,
+            "passivas_carteira_id": self.passivas.pk,
+        }
+        ufs = kpi_queries.run(
+            "analises_ufs", carteira_ids=params["carteira_ids"], passivas_carteira_id=self.passivas.pk,
+        )
+        return {
+            "ufs": {row["uf"] for row in ufs},
+            "totais": {
+                row["uf"]: (row["cards"], row["processos"], row["cpfs"])
+                for row in kpi_queries.run("analises_totais", **params)
+            },
+            "combos": {
+                (row["uf"], row["carteira_id"], row["grupo"]): (row["cards"], row["processos"], row["cpfs"], row["kpis"])
+                for row in kpi_queries.run("analises_por_tipo", **params)
+            },
+            "respostas": {
+                (row["uf"], row["carteira_id"], row["grupo"], row["chave"], row["resposta"]): (row["valor"], row["cards"])
+                for row in kpi_queries.run("analises_respostas", **params)
+            },
+            "produtividade": {
+                (row["autor"], row["usuario_id"], row["data"], row["carteira_id"]): row["analises"]
+                for row in kpi_queries.run("analises_produtividade", **params)
+            },
+        }
+
+    def test_analises_sql_igual_a_python(self):
+        for carteira_filtro in (None, self.carteira_a.pk, self.carteira_b.pk, self.passivas.pk):
+            with self.subTest(carteira=carteira_filtro):
+                esperado = self._python(carteira_filtro)
+                obtido = self._sql(carteira_filtro)
+                for parte in esperado:
+                    self.assertEqual(obtido[parte], esperado[parte], parte)
+        # O fixture exercita os casos que importam.
+        esperado = self._python()
+        self.assertIn((None, self.carteira_b.pk, 0), esperado["combos"])
+        self.assertIn((None, self.passivas.pk, 1), esperado["combos"])
+        self.assertIn(("ana", self.bruno.pk, date(2026, 2, 28), self.carteira_a.pk), esperado["produtividade"])
+        self.assertIn(("", self.bruno.pk, date(2026, 3, 2), self.carteira_b.pk), esperado["produtividade"])
+        self.assertEqual(esperado["respostas"][(None, self.carteira_b.pk, 0, "outro", "valor livre")], ("Valor  Livre", 2))
+        self.assertEqual(esperado["respostas"][(None, self.carteira_b.pk, 0, "flag", "true")], ("True", 1))
+
+    def test_prioridades_sql_igual_a_python(self):
+        tag_ids = [self.prioridade_1.pk, self.prioridade_2.pk]
+        for carteira_filtro in (None, self.carteira_a.pk, self.carteira_b.pk):
+            with self.subTest(carteira=carteira_filtro):
+                obtido = {
+                    (row["carteira_id"], row["uf"], row["etiqueta_id"]): (row["processos"], row["analisados"])
+                    for row in kpi_queries.run(
+                        "prioridades_por_uf",
+                        etiqueta_ids=tag_ids,
+                        carteira_ids=[carteira_filtro] if carteira_filtro else None,
+                    )
+                }
+                self.assertEqual(obtido, self._prioridades_python(tag_ids, carteira_filtro))
+
+    def test_dashboard_usa_as_consultas(self):
+        from django.contrib import admin
+
+        dados = admin.site._registry[Carteira]._build_carteira_kpi_data(None)
+        self.assertEqual([uf["code"] for uf in dados["ufs"]], ["ALL", "BA", "MG", "RJ", "SEM_UF", "SP"])
+        combo = next(
+            item for item in dados["buckets"]["ALL"]["combos"]
+            if item["carteira_nome"] == "Carteira B" and item["tipo_slug"] == "novas-monitorias"
+        )
+        self.assertEqual((combo["cards"], combo["processos"], combo["cpfs"]), (3, 2, 3))
+        pergunta = next(item for item in combo["questions"] if item["chave"] == "outro")
+        self.assertEqual(
+            [(resposta["valor"], resposta["count"], resposta["by_uf"]) for resposta in pergunta["answers"]],
+            [
+                ("Valor  Livre", 2, [{"uf": "MG", "count": 2, "pct": 100.0}]),
+                ("Sem resposta", 1, [{"uf": "SP", "count": 1, "pct": 100.0}]),
+            ],
+        )
+        prioridade = dados["priority_kpi"]
+        self.assertEqual(prioridade["totals"], {"processos": 4, "analisados": 3, "pendentes": 1})
+        self.assertEqual(
+            [(item["carteira_nome"], item["totals"]["processos"]) for item in prioridade["by_carteira"]],
+            [("Carteira A", 2), ("Carteira B", 2), ("Sem carteira", 1)],
+        )
+        analises = {
+            usuario["user_label"]: usuario["totals"]["analises"] for usuario in dados["productivity_kpi"]["users"]
+        }
+        self.assertEqual(analises, {"Ana": 1, "bruno": 3, "Fulano": 2, "Sem usuário": 1})
+
+
+class ProdutividadeRollupTests(TestCase):
+    """O rollup (consolidado + eventos após a marca) deve bater com a contagem direta."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('carla')
+        self.outro = User.objects.create_user('davi')
+        self.carteira = Carteira.objects.create(nome='Carteira P')
+        self.processo = ProcessoJudicial.objects.create(cnj='0000010', carteira=self.carteira)
+        self.agora = timezone.now()
+        self._tarefa(self.agora - timedelta(days=10), self.user)
+        self._tarefa(self.agora - timedelta(days=2), self.outro)
+        self._tarefa(None, self.user)
+        Prazo.objects.create(
+            processo=self.processo, titulo='p', data_limite=self.agora, responsavel=self.outro,
+            concluido=True, concluido_em=self.agora - timedelta(days=1), concluido_por=self.user,
+        )
+
+    def _tarefa(self, concluido_em, concluido_por, processo=None):
+        return Tarefa.objects.create(
+            processo=processo or self.processo, descricao='t', data=date.today(), responsavel=self.outro,
+            concluida=True, concluido_em=concluido_em, concluido_por=concluido_por,
+        )
+
+    def _esperado(self):
+        esperado = {}
+        for modelo, metrica, filtro in (
+            (Tarefa, ProdutividadeDiaria.METRICA_TAREFAS, {'concluida': True}),
+            (Prazo, ProdutividadeDiaria.METRICA_PRAZOS, {'concluido': True}),
+        ):
+            for item in modelo.objects.filter(**filtro).select_related('processo'):
+                dia = timezone.localdate(item.concluido_em) if item.concluido_em else None
+                chave = (dia, item.concluido_por_id, item.processo.carteira_id if item.processo else None, metrica)
+                esperado[chave] = esperado.get(chave, 0) + 1
+        return esperado
+
+    def _obtido(self):
+        obtido = {}
+        metricas = (ProdutividadeDiaria.METRICA_TAREFAS, ProdutividadeDiaria.METRICA_PRAZOS)
+        for linha in produtividade.linhas(metricas):
+            chave = (linha['data'], linha['usuario_id'], linha['carteira_id'], linha['metrica'])
+            obtido[chave] = obtido.get(chave, 0) + linha['quantidade']
+        return obtido
+
+    def test_sem_rollup_agrega_ao_vivo(self):
+        self.assertEqual(self._obtido(), self._esperado())
+
+    def test_incremental_igual_ao_completo(self):
+        produtividade.atualizar_rollup(agora=self.agora)
+        self.assertEqual(self._obtido(), self._esperado())
+
+        self._tarefa(timezone.now(), self.outro)
+        self.assertEqual(self._obtido(), self._esperado())
+
+        # Conclusão desfeita dentro da margem recalculada.
+        Prazo.objects.update(concluido=False, concluido_em=None)
+        produtividade.atualizar_rollup(agora=timezone.now() + timedelta(days=1))
+        self.assertEqual(self._obtido(), self._esperado())
+
+        incremental = sorted(
+            ProdutividadeDiaria.objects.values_list('data', 'usuario_id', 'carteira_id', 'metrica', 'quantidade'),
+            key=str,
+        )
+        produtividade.atualizar_rollup(completo=True, agora=timezone.now() + timedelta(days=1))
+        completo = sorted(
+            ProdutividadeDiaria.objects.values_list('data', 'usuario_id', 'carteira_id', 'metrica', 'quantidade'),
+            key=str,
+        )
+        self.assertEqual(incremental, completo)
+
+    def test_totais_por_usuario(self):
+        produtividade.atualizar_rollup(agora=self.agora)
+        totais = produtividade.totais_por_usuario(
+            (ProdutividadeDiaria.METRICA_TAREFAS_RESPONSAVEL, ProdutividadeDiaria.METRICA_PRAZOS_RESPONSAVEL),
+            usuario_ids=[self.outro.pk],
+        )
+        self.assertEqual(
+            dict(totais[self.outro.pk]),
+            {
+                ProdutividadeDiaria.METRICA_TAREFAS_RESPONSAVEL: 3,
+                ProdutividadeDiaria.METRICA_PRAZOS_RESPONSAVEL: 1,
+            },
+        )
+
+
+class KpiSecaoViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        with cls.captureOnCommitCallbacks(execute=True):
+            carteira = Carteira.objects.create(nome='Carteira A')
+            processo = ProcessoJudicial.objects.create(cnj='0000001', valor_causa=Decimal('10.00'))
+            processo.carteiras_vinculadas.add(carteira)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _get(self, secao, **extra):
+        url = reverse('admin:contratos_carteira_kpi_section', args=[secao])
+        return self.client.get(url, secure=True, **extra)
+
+    def test_secao_com_etag_e_304(self):
+        response = self._get('graficos')
+        self.assertEqual(response.status_code, 200)
+        carteiras = response.json()['dados']['carteiras']
+        self.assertEqual(
+            [(c['nome'], c['total_processos'], Decimal(c['valor_total'])) for c in carteiras],
+            [('Carteira A', 1, Decimal('10.00'))],
+        )
+        etag = response['ETag']
+
+        response = self._get('graficos', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Alterações nos dados só mudam a seção depois do recálculo do snapshot.
+        from contratos.services import kpi_snapshots
+        kpi_snapshots.atualizar_snapshot('graficos', force=True)
+        response = self._get('graficos', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_secoes_do_dashboard_recortam_o_snapshot(self):
+        dados = self._get('prioridade').json()['dados']
+        self.assertEqual(list(dados), ['priority_kpi'])
+        self.assertTrue(dados['priority_kpi']['can_configure_global_default'])
+        dados = self._get('presenca').json()['dados']
+        self.assertEqual(list(dados), ['online_presence_kpi'])
+        self.assertEqual(self._get('inexistente').status_code, 404)
+
+
+class KpiSnapshotsTests(TestCase):
+    """Snapshots por carteira: recorte do payload, invalidação seletiva e recálculo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.carteira_a = Carteira.objects.create(nome='Carteira A')
+        cls.carteira_b = Carteira.objects.create(nome='Carteira B')
+        cls.pa = ProcessoJudicial.objects.create(cnj='0000001', carteira=cls.carteira_a, uf='SP')
+        cls.pb = ProcessoJudicial.objects.create(cnj='0000002', carteira=cls.carteira_b, uf='RJ')
+        for processo in (cls.pa, cls.pb):
+            AnaliseProcesso.objects.create(
+                processo_judicial=processo,
+                respostas={'saved_processos_vinculados': [{'observacoes': 'ok', 'tipo_de_acao_respostas': {}}]},
+            )
+        ProcessoArquivo.objects.create(processo=cls.pa, nome='Monitória Inicial.pdf', arquivo='processos/1/m.pdf')
+
+    def _snapshots_atualizados(self):
+        snapshots = {
+            chave: kpi_snapshots.atualizar_snapshot(KpiSnapshot.ESCOPO_DASHBOARD, carteira_id, force=True)
+            for chave, carteira_id in (('geral', None), ('a', self.carteira_a.pk), ('b', self.carteira_b.pk))
+        }
+        KpiSnapshot.objects.update(desatualizado=False)
+        # Sem commit de verdade no TestCase, a marcação acumulada até aqui
+        # (setUpTestData, KpiGlobalConfig criado no cálculo) nunca seria aplicada.
+        kpi_models._kpi_snapshot_pendente.__dict__.clear()
+        return snapshots
+
+    def _desatualizados(self):
+        return {
+            snapshot.carteira_id: snapshot.desatualizado
+            for snapshot in KpiSnapshot.objects.filter(escopo=KpiSnapshot.ESCOPO_DASHBOARD)
+        }
+
+    def test_snapshot_por_carteira_recorta_o_dashboard(self):
+        snapshots = self._snapshots_atualizados()
+        geral = snapshots['geral'].payload
+        payload_a = snapshots['a'].payload
+        payload_b = snapshots['b'].payload
+        self.assertEqual(geral['buckets']['ALL']['cards_total'], 2)
+        self.assertEqual(
+            [combo['carteira_id'] for combo in payload_a['buckets']['ALL']['combos']], [self.carteira_a.pk]
+        )
+        self.assertEqual([uf['code'] for uf in payload_b['ufs']], ['ALL', 'RJ'])
+        monitoria = {item['slug']: item['pieces'] for item in payload_a['peticao_totals']}['monitoria_inicial']
+        self.assertEqual(monitoria, 1)
+        self.assertEqual(
+            {item['slug']: item['pieces'] for item in payload_b['peticao_totals']}['monitoria_inicial'], 0
+        )
+        with self.assertRaises(ValueError):
+            kpi_snapshots.calcular_payload(KpiSnapshot.ESCOPO_GRAFICOS, self.carteira_a.pk)
+
+    def test_alteracao_marca_so_as_carteiras_tocadas(self):
+        self._snapshots_atualizados()
+        a, b = self.carteira_a.pk, self.carteira_b.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            Tarefa.objects.create(processo=self.pa, descricao='t', data=timezone.localdate())
+        self.assertEqual(self._desatualizados(), {None: True, a: True, b: False})
+
+        KpiSnapshot.objects.update(desatualizado=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pa.carteira = self.carteira_b
+            self.pa.save()
+        self.assertEqual(self._desatualizados(), {None: True, a: True, b: True})
+
+        KpiSnapshot.objects.update(desatualizado=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            Etiqueta.objects.create(nome='Urgente')
+        self.assertEqual(self._desatualizados(), {None: True, a: True, b: True})
+
+    def test_operacao_em_lote_marca_carteira_anterior_e_nova(self):
+        self._snapshots_atualizados()
+        with self.captureOnCommitCallbacks(execute=True):
+            operacoes_lote.aplicar_carteira([self.pb.pk], self.carteira_a.pk)
+        self.assertEqual(
+            self._desatualizados(), {None: True, self.carteira_a.pk: True, self.carteira_b.pk: True}
+        )
+
+    @override_settings(KPI_SNAPSHOT_EM_THREAD=True)
+    def test_recalculo_em_segundo_plano_usa_a_fila_e_deduplica(self):
+        snapshot = self._snapshots_atualizados()['a']
+        KpiSnapshot.objects.filter(pk=snapshot.pk).update(desatualizado=True)
+        snapshot.refresh_from_db()
+        executor = mock.Mock()
+        with mock.patch.object(kpi_snapshots, '_get_executor', return_value=executor):
+            self.assertTrue(kpi_snapshots.agendar_atualizacao(snapshot))
+            self.assertFalse(kpi_snapshots.agendar_atualizacao(snapshot))
+        self.assertEqual(executor.submit.call_count, 1)
+
+        funcao, *args = executor.submit.call_args.args
+        # Executada aqui na thread do teste: não pode fechar a conexão da transação do TestCase.
+        with mock.patch.object(kpi_snapshots, 'close_old_connections'):
+            funcao(*args)
+        snapshot.refresh_from_db()
+        self.assertFalse(snapshot.desatualizado)
+        self.assertIsNone(snapshot.atualizando_desde)
+        with mock.patch.object(kpi_snapshots, '_get_executor', return_value=executor):
+            self.assertTrue(kpi_snapshots.agendar_atualizacao(snapshot))
+        kpi_snapshots._agendados.clear()
+
+        with override_settings(KPI_SNAPSHOT_EM_THREAD=False), \
+                mock.patch.object(kpi_snapshots, '_get_executor') as get_executor:
+            self.assertFalse(kpi_snapshots.agendar_atualizacao(snapshot))
+        get_executor.assert_not_called()
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_dashboard_e_secoes_da_carteira(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:contratos_carteira_changelist'), {'kpi_carteira': self.carteira_a.pk}, secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['kpi_carteira'], self.carteira_a)
+        self.assertTrue(response.context['kpi_secoes']['analises'].endswith(f'?carteira={self.carteira_a.pk}'))
+        self.assertNotIn('?', response.context['kpi_secoes']['graficos'])
+
+        response = self.client.get(response.context['kpi_secoes']['analises'], secure=True)
+        self.assertEqual(response.status_code, 200)
+        combos = response.json()['dados']['buckets']['ALL']['combos']
+        self.assertEqual([combo['carteira_id'] for combo in combos], [self.carteira_a.pk])
+        self.assertTrue(
+            KpiSnapshot.objects.filter(escopo=KpiSnapshot.ESCOPO_DASHBOARD, carteira=self.carteira_a).exists()
+        )
+
+
+class CarteiraStatsTests(TestCase):
+    """As estatísticas mantidas devem bater com o recálculo a partir da origem."""
+
+    def _assert_em_dia(self):
+        esperado = CarteiraStats.calcular()
+        atual = {
+            stats.carteira_id: {campo: getattr(stats, campo) for campo in CarteiraStats.CAMPOS_TOTAIS}
+            for stats in CarteiraStats.objects.all()
+        }
+        self.assertEqual(atual, esperado)
+
+    def test_signals_mantem_estatisticas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            carteira_a = Carteira.objects.create(nome='A')
+            carteira_b = Carteira.objects.create(nome='B')
+        self._assert_em_dia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            p1 = ProcessoJudicial.objects.create(
+                cnj='1', carteira=carteira_a, valor_causa=Decimal('100.00'), soma_contratos=Decimal('40.00'),
+            )
+            p1.carteiras_vinculadas.add(carteira_a, carteira_b)
+            p2 = ProcessoJudicial.objects.create(cnj='2', carteira=carteira_b, valor_causa=Decimal('5.50'))
+            p2.carteiras_vinculadas.add(carteira_b)
+            Parte.objects.create(processo=p1, tipo_polo='PASSIVO', nome='X', documento='111.111.111-11')
+            Parte.objects.create(processo=p2, tipo_polo='PASSIVO', nome='Y', documento='11111111111')
+        self._assert_em_dia()
+        stats_b = CarteiraStats.objects.get(carteira=carteira_b)
+        self.assertEqual(
+            (stats_b.processos_principal, stats_b.processos_vinculados, stats_b.valor_causa_total, stats_b.cpfs_distintos),
+            (1, 2, Decimal('105.50'), 1),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            p1.carteira = carteira_b
+            p1.valor_causa = Decimal('1.00')
+            p1.save()
+        self._assert_em_dia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            carteira_b.processos_multicarteira.remove(p2)
+            p1.carteiras_vinculadas.clear()
+        self._assert_em_dia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            operacoes_lote.aplicar_carteira([p1.pk, p2.pk], carteira_a.pk)
+        self._assert_em_dia()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            p2.delete()
+        self._assert_em_dia()
+
+    def test_alteracoes_aplicam_deltas_na_transacao(self):
+        carteira_a = Carteira.objects.create(nome='A')
+        carteira_b = Carteira.objects.create(nome='B')
+        processo = ProcessoJudicial.objects.create(cnj='1', carteira=carteira_a, valor_causa=Decimal('10.00'))
+        processo.carteiras_vinculadas.add(carteira_a)
+        carteira_b.processos_multicarteira.add(processo)
+        carteira_b.processos_multicarteira.remove(processo, ProcessoJudicial.objects.create(cnj='2'))
+        processo.carteira = carteira_b
+        processo.valor_causa = Decimal('12.50')
+        processo.soma_contratos = Decimal('3.00')
+        # Sem recálculo: só deltas, antes de qualquer on_commit.
+        with mock.patch.object(CarteiraStats, 'calcular', side_effect=AssertionError), \
+                self.captureOnCommitCallbacks(execute=False):
+            processo.save()
+        self._assert_em_dia()
+        self.assertEqual(
+            CarteiraStats.objects.filter(carteira=carteira_a).values_list(
+                'processos_principal', 'processos_vinculados', 'valor_causa_total', 'soma_contratos_total',
+            ).get(),
+            (0, 1, Decimal('12.50'), Decimal('3.00')),
+        )
+
+    def test_save_sem_mudanca_nao_toca_estatisticas(self):
+        carteira = Carteira.objects.create(nome='A')
+        processo = ProcessoJudicial.objects.create(cnj='1', carteira=carteira, valor_causa=Decimal('10.00'))
+        processo.refresh_from_db()
+        processo.valor_causa = '10.00'
+        processo.cnj = '2'
+        with CaptureQueriesContext(connection) as queries:
+            processo.save()
+            processo.save(update_fields=['cnj'])
+        self.assertFalse([q['sql'] for q in queries if 'carteirastats' in q['sql'].lower()])
+
+    def test_reconciliacao_corrige_divergencias(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            carteira = Carteira.objects.create(nome='A')
+            processo = ProcessoJudicial.objects.create(cnj='1', valor_causa=Decimal('10.00'))
+            processo.carteiras_vinculadas.add(carteira)
+        CarteiraStats.objects.filter(carteira=carteira).update(processos_vinculados=7, valor_causa_total=0)
+
+        out = StringIO()
+        call_command('reconciliar_carteira_stats', '--dry-run', stdout=out)
+        self.assertIn('processos_vinculados 7 → 1', out.getvalue())
+        self.assertEqual(CarteiraStats.objects.get(carteira=carteira).processos_vinculados, 7)
+
+        call_command('reconciliar_carteira_stats', stdout=StringIO())
+        self._assert_em_dia()
+
+
+class ConversaoPdfCacheTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+
+    def test_reaproveita_conversao_pelo_conteudo(self):
+        pdf = b'%PDF-1.4 convertido'
+        with mock.patch.object(conversao_pdf, '_converter', return_value=(pdf, 'gotenberg')) as converter:
+            self.assertEqual(conversao_pdf.converter_docx_para_pdf(b'docx A'), pdf)
+            self.assertEqual(conversao_pdf.converter_docx_para_pdf(b'docx A', permitir_fallback=False), pdf)
+            conversao_pdf.converter_docx_para_pdf(b'docx B')
+        self.assertEqual(converter.call_count, 2)
+        self.assertEqual(conversao_pdf.metadados_cache(b'docx A')['conversor'], 'gotenberg')
+
+        totais = conversao_pdf.estatisticas()
+        self.assertEqual((totais['acertos'], totais['conversoes'], totais['falhas']), (1, 2, 0))
+        self.assertAlmostEqual(totais['taxa_acerto'], 1 / 3, places=3)
+
+        with override_settings(DOCX_PDF_CONVERSOR_VERSAO='2'):
+            with mock.patch.object(conversao_pdf, '_converter', return_value=(pdf, 'gotenberg')) as converter:
+                conversao_pdf.converter_docx_para_pdf(b'docx A')
+            converter.assert_called_once()
+
+    def test_fallback_python_nao_entra_no_cache(self):
+        with mock.patch.object(conversao_pdf, '_converter', return_value=(b'%PDF-aprox', 'reportlab')) as converter:
+            conversao_pdf.converter_docx_para_pdf(b'docx C')
+            conversao_pdf.converter_docx_para_pdf(b'docx C')
+        self.assertEqual(converter.call_count, 2)
+        self.assertIsNone(conversao_pdf.metadados_cache(b'docx C'))
+
+
+class LibreOfficePoolTests(TestCase):
+    def _pool(self, **kwargs):
+        opcoes = dict(tamanho=1, max_conversoes=2, fila_max=0, timeout=5, unoserver_cmd='unoserver', unoconvert_cmd='unoconvert')
+        opcoes.update(kwargs)
+        pool = libreoffice_pool.PoolLibreOffice(**opcoes)
+        self.addCleanup(pool.encerrar)
+        return pool
+
+    def test_recicla_instancia_apos_limite_de_conversoes(self):
+        pool = self._pool()
+        resultado = mock.Mock(returncode=0, stdout=b'%PDF-1.4 ok', stderr=b'')
+        with mock.patch.object(libreoffice_pool._Instancia, 'saudavel', return_value=True), \
+                mock.patch.object(libreoffice_pool._Instancia, 'parar') as parar, \
+                mock.patch.object(libreoffice_pool.subprocess, 'run', return_value=resultado):
+            for _ in range(3):
+                self.assertEqual(pool.converter(b'docx'), b'%PDF-1.4 ok')
+        parar.assert_called_once()
+
+    def test_recusa_pedidos_acima_da_fila(self):
+        pool = self._pool()
+        self.assertTrue(pool._vagas.acquire(blocking=False))
+        with self.assertRaises(libreoffice_pool.FilaCheia):
+            pool.converter(b'docx')
+
+    def test_desabilitado_por_padrao(self):
+        with override_settings(LIBREOFFICE_POOL_SIZE=0), \
+                mock.patch.object(libreoffice_pool, '_pool', None), \
+                mock.patch.object(libreoffice_pool, '_pool_indisponivel', False):
+            self.assertFalse(libreoffice_pool.habilitado())
+            self.assertIsNone(libreoffice_pool.converter(b'docx'))
+
+
+@override_settings(GERACAO_DOCUMENTOS_EM_THREAD=False)
+class GeracaoDocumentoFilaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gera', password='x')
+        cls.processo = ProcessoJudicial.objects.create(cnj='0000009')
+        AnaliseProcesso.objects.create(processo_judicial=cls.processo, respostas={})
+        Parte.objects.create(processo=cls.processo, tipo_polo='PASSIVO', nome='Maria', documento='11111111111')
+        cls.contrato = Contrato.objects.create(processo=cls.processo, numero_contrato='123')
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.client.force_login(self.user)
+
+    def _pedir_monitoria(self):
+        url = reverse('contratos:generate_monitoria_petition', args=[self.processo.pk])
+        return self.client.post(url, {'contratos_para_monitoria': f'["{self.contrato.pk}"]'}, secure=True)
+
+    def test_enfileira_deduplica_e_executa(self):
+        primeira = self._pedir_monitoria()
+        self.assertEqual(primeira.status_code, 202)
+        segunda = self._pedir_monitoria()
+        self.assertEqual(segunda.json()['geracao']['id'], primeira.json()['geracao']['id'])
+        self.assertEqual(GeracaoDocumento.objects.count(), 1)
+        self.assertFalse(ProcessoArquivo.objects.filter(processo=self.processo).exists())
+
+        from contratos import views
+        with mock.patch.object(views, '_build_docx_bytes_common', return_value=b'docx'), \
+                mock.patch.object(views, 'generate_extrato_titularidade', return_value={'ok': False, 'error': 'x'}):
+            self.assertEqual(geracao_documentos.executar_pendentes(), 1)
+
+        status = self.client.get(primeira.json()['status_url'], secure=True).json()
+        self.assertEqual((status['status'], status['percentual']), ('concluido', 100))
+        self.assertEqual(status['resultado']['monitoria']['pdf_pending'], True)
+        arquivo = ProcessoArquivo.objects.get(processo=self.processo)
+        self.assertEqual(arquivo.tipo_documento, classificacao_arquivos.TIPO_MONITORIA_INICIAL)
+        self.assertEqual(arquivo.enviado_por, self.user)
+
+        # Concluída a geração, um novo pedido igual volta a ser enfileirado.
+        self.assertNotEqual(self._pedir_monitoria().json()['geracao']['id'], status['id'])
+
+    def test_lote_gera_cada_processo_e_reporta_falhas(self):
+        AnaliseProcesso.objects.filter(processo_judicial=self.processo).update(
+            respostas={'contratos_para_monitoria': [self.contrato.pk]}
+        )
+        sem_polo = ProcessoJudicial.objects.create(cnj='0000010')
+        geracao, _ = peticoes_lote.enfileirar_lote(
+            GeracaoDocumento.TIPO_MONITORIA, [sem_polo.pk, self.processo.pk], usuario=self.user
+        )
+
+        from contratos import views
+        with mock.patch.object(views, '_build_docx_bytes_common', return_value=b'docx'), \
+                mock.patch.object(conversao_pdf, 'converter_docx_para_pdf', return_value=b'%PDF-1.4') as converter, \
+                mock.patch.object(views, 'generate_extrato_titularidade', return_value={'ok': True}):
+            geracao = geracao_documentos.executar_geracao(geracao.pk)
+
+        self.assertEqual(geracao.status, GeracaoDocumento.STATUS_CONCLUIDO)
+        self.assertEqual((geracao.resultado['sucesso'], geracao.resultado['falhas']), (1, 1))
+        ok, erro = geracao.resultado['itens']
+        self.assertEqual((ok['processo_id'], ok['status'], ok['extrato_ok']), (self.processo.pk, 'ok', True))
+        self.assertEqual((erro['processo_id'], erro['status']), (sem_polo.pk, 'erro'))
+        self.assertIn('Polo passivo', erro['erro'])
+        converter.assert_called_once_with(b'docx')
+        arquivos = ProcessoArquivo.objects.filter(processo=self.processo).order_by('pk')
+        self.assertEqual([a.pk for a in arquivos], [ok['docx_arquivo_id'], ok['pdf_arquivo_id']])
+        self.assertTrue(arquivos[1].nome.endswith('.pdf'))
+
+    def test_falha_esperada_vira_erro_da_geracao(self):
+        geracao, criada = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, {'contrato_ids': []}, usuario=self.user
+        )
+        self.assertTrue(criada)
+        geracao = geracao_documentos.executar_geracao(geracao.pk)
+        self.assertEqual(geracao.status, GeracaoDocumento.STATUS_ERRO)
+        self.assertIn('Nenhum contrato', geracao.erro)
+        self.assertIsNone(geracao_documentos.executar_geracao(geracao.pk))
+
+    def test_geracao_travada_expira_e_pedido_e_reenfileirado(self):
+        parametros = {'contrato_ids': [self.contrato.pk]}
+        antiga, _ = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, parametros, usuario=self.user
+        )
+        GeracaoDocumento.objects.filter(pk=antiga.pk).update(
+            status=GeracaoDocumento.STATUS_EXECUTANDO, atualizado_em=timezone.now() - timedelta(minutes=5),
+        )
+        # Ainda dentro do prazo: o pedido igual continua deduplicado.
+        mesma, criada = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, parametros, usuario=self.user
+        )
+        self.assertEqual((mesma.pk, criada), (antiga.pk, False))
+
+        GeracaoDocumento.objects.filter(pk=antiga.pk).update(atualizado_em=timezone.now() - timedelta(minutes=31))
+        nova, criada = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, parametros, usuario=self.user
+        )
+        self.assertTrue(criada)
+        self.assertEqual(nova.status, GeracaoDocumento.STATUS_PENDENTE)
+        antiga.refresh_from_db()
+        self.assertEqual(antiga.status, GeracaoDocumento.STATUS_ERRO)
+        self.assertIn('sem atividade', antiga.erro)
+        self.assertIsNotNone(antiga.finalizado_em)
+
+    def test_geracao_expirada_durante_a_execucao_descarta_resultado(self):
+        parametros = {'contrato_ids': [self.contrato.pk]}
+        antiga, _ = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, parametros, usuario=self.user
+        )
+
+        def executor_lento(geracao, progresso):
+            progresso('Gerando', total=1)
+            # Enquanto isso, outro processo a considera travada e reenfileira o pedido.
+            GeracaoDocumento.objects.filter(pk=geracao.pk).update(
+                atualizado_em=timezone.now() - timedelta(minutes=31),
+            )
+            self.assertEqual(len(geracao_documentos.retomar_travadas()), 1)
+            progresso('Finalizando')
+            return {'ok': True}
+
+        with mock.patch.object(geracao_documentos, '_executor', return_value=executor_lento):
+            self.assertIsNone(geracao_documentos.executar_geracao(antiga.pk))
+
+        antiga.refresh_from_db()
+        self.assertEqual(antiga.status, GeracaoDocumento.STATUS_ERRO)
+        self.assertIn('sem atividade', antiga.erro)
+        self.assertEqual((antiga.resultado, antiga.etapa), ({}, 'Gerando'))
+        nova = GeracaoDocumento.objects.exclude(pk=antiga.pk).get()
+        self.assertEqual(nova.status, GeracaoDocumento.STATUS_PENDENTE)
+
+    def test_worker_reenfileira_geracoes_travadas(self):
+        antiga, _ = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, {'contrato_ids': [self.contrato.pk]}, usuario=self.user
+        )
+        GeracaoDocumento.objects.filter(pk=antiga.pk).update(
+            status=GeracaoDocumento.STATUS_EXECUTANDO, iniciado_em=timezone.now() - timedelta(hours=2),
+        )
+        out = StringIO()
+        with mock.patch.object(geracao_documentos, '_executor', return_value=lambda geracao, progresso: {'ok': True}):
+            call_command('processar_geracoes_documentos', stdout=out)
+        self.assertIn('1 geração(ões) travada(s) reenfileirada(s)', out.getvalue())
+        antiga.refresh_from_db()
+        nova = GeracaoDocumento.objects.exclude(pk=antiga.pk).get()
+        self.assertEqual(antiga.status, GeracaoDocumento.STATUS_ERRO)
+        self.assertEqual((nova.status, nova.criado_por, nova.parametros), (
+            GeracaoDocumento.STATUS_CONCLUIDO, self.user, {'contrato_ids': [self.contrato.pk]},
+        ))
+
+    def test_status_so_para_quem_pediu_ou_enxerga_o_processo(self):
+        geracao, _ = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_MONITORIA, self.processo.pk, {'contrato_ids': []}, usuario=self.user
+        )
+        lote, _ = geracao_documentos.enfileirar(
+            GeracaoDocumento.TIPO_LOTE_PETICOES, None, {'processo_ids': [self.processo.pk]}, usuario=self.user
+        )
+        url = lambda g: reverse('contratos:geracao_documento_status', args=[g.pk])  # noqa: E731
+        self.assertEqual(self.client.get(url(geracao), secure=True).status_code, 200)
+        self.assertEqual(self.client.get(url(lote), secure=True).status_code, 200)
+
+        outro = User.objects.create_user('outro', password='x')
+        self.client.force_login(outro)
+        # Sem carteiras restritas, enxerga o processo mas não o lote alheio.
+        self.assertEqual(self.client.get(url(geracao), secure=True).status_code, 200)
+        self.assertEqual(self.client.get(url(lote), secure=True).status_code, 404)
+        CarteiraUsuarioAcesso.objects.create(usuario=outro, carteira=Carteira.objects.create(nome='Outra'))
+        self.assertEqual(self.client.get(url(geracao), secure=True).status_code, 404)
+
+
+@override_settings(INTEGRACOES_HTTP_FALHAS_PARA_ABRIR=2, INTEGRACOES_HTTP_MAX_TENTATIVAS=3)
+class IntegracoesHttpTests(TestCase):
+    def _cliente(self, respostas):
+        chamadas = []
+
+        def responder(request):
+            chamadas.append(request)
+            return respostas.pop(0) if respostas else httpx.Response(200, json={'ok': True})
+
+        servico = integracoes_http.ServicoHttp('teste', 'TESTE_API_BASE', 'https://api.teste')
+        cliente = integracoes_http.ClienteIntegracao(
+            servico, transport=httpx.MockTransport(responder), espera_base=0
+        )
+        self.addCleanup(cliente.fechar)
+        return cliente, chamadas
+
+    def test_repete_get_em_falha_transitoria(self):
+        cliente, chamadas = self._cliente([httpx.Response(503), httpx.Response(200, json={'ok': True})])
+        response = cliente.get('/recurso')
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual(str(chamadas[0].url), 'https://api.teste/recurso')
+        resumo = cliente.metricas.resumo()
+        self.assertEqual((resumo['requisicoes'], resumo['erros'], resumo['novas_tentativas']), (1, 0, 1))
+
+    def test_post_nao_repete_e_4xx_nao_abre_circuito(self):
+        cliente, chamadas = self._cliente([httpx.Response(503), httpx.Response(404), httpx.Response(404)])
+        self.assertEqual(cliente.post('/criar').status_code, 503)
+        self.assertEqual(len(chamadas), 1)
+        cliente.get('/a')
+        cliente.get('/b')
+        self.assertEqual(cliente.circuito.estado, 'fechado')
+
+    def test_circuito_abre_apos_falhas_seguidas(self):
+        cliente, chamadas = self._cliente([httpx.Response(500), httpx.Response(500)])
+        cliente.get('/x')
+        cliente.get('/x')
+        with self.assertRaises(integracoes_http.CircuitoAberto):
+            cliente.get('/x')
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(cliente.metricas.resumo()['recusadas_circuito_aberto'], 1)
+
+        # Passado o intervalo, uma chamada de teste bem-sucedida fecha o circuito.
+        cliente.circuito.aberto_ate = 0
+        self.assertEqual(cliente.get('/x').status_code, 200)
+        self.assertEqual(cliente.circuito.estado, 'fechado')
+
+    def test_segue_redirecionamentos(self):
+        cliente, chamadas = self._cliente([
+            httpx.Response(302, headers={'Location': 'https://api.teste/novo'}),
+            httpx.Response(200, json={'ok': True}),
+        ])
+        response = cliente.get('/antigo')
+        self.assertEqual(response.json(), {'ok': True})
+        self.assertEqual([str(chamada.url) for chamada in chamadas], ['https://api.teste/antigo', 'https://api.teste/novo'])
+
+    def test_gotenberg_tenta_de_novo_em_qualquer_falha(self):
+        pdf = b'%PDF-1.4' + b'x' * 2000
+        for primeira in (httpx.Response(500), httpx.Response(200, content=b'%PDF-curto'), httpx.Response(400)):
+            with self.subTest(status=primeira.status_code):
+                cliente, chamadas = self._cliente([primeira, httpx.Response(200, content=pdf)])
+                with mock.patch.object(integracoes_http, 'cliente', return_value=cliente), \
+                        mock.patch.object(conversao_pdf, '_converter_libreoffice') as libreoffice:
+                    self.assertEqual(
+                        conversao_pdf._converter(b'docx', permitir_fallback=False),
+                        (pdf, conversao_pdf.CONVERSOR_GOTENBERG),
+                    )
+                self.assertEqual(len(chamadas), 2)
+                libreoffice.assert_not_called()
+
+
+class ComboZipStreamingTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }, COMBO_ZIP_LEITURAS_PARALELAS=2)
+        storages.enable()
+        self.addCleanup(storages.disable)
+
+    def _arquivo(self, caminho, conteudo=None):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        if conteudo is not None:
+            caminho = default_storage.save(caminho, ContentFile(conteudo))
+        return ProcessoArquivo(arquivo=caminho).arquivo
+
+    def test_escreve_entradas_em_ordem_e_pula_ilegiveis(self):
+        grande = bytes(range(256)) * 20000
+        fontes = [
+            ('01 - base.pdf', b'%PDF-base'),
+            ('02 - extrato.pdf', self._arquivo('processos/1/extrato.pdf', grande)),
+            ('03 - ausente.pdf', self._arquivo('processos/1/nao-existe.pdf')),
+            ('04 - anexo.pdf', self._arquivo('processos/1/anexo.pdf', b'anexo')),
+        ]
+        etapas = []
+        saida = BytesIO()
+        peticao_combo._escrever_zip(saida, fontes, lambda etapa, total=None: etapas.append((etapa, total)))
+
+        with ZipFile(saida) as zip_file:
+            self.assertEqual(zip_file.namelist(), ['01 - base.pdf', '02 - extrato.pdf', '04 - anexo.pdf'])
+            self.assertEqual(zip_file.read('02 - extrato.pdf'), grande)
+        self.assertEqual(etapas[0], ('Adicionando 01 - base.pdf', 5))
+        self.assertEqual(len(etapas), 4)
+
+
+class ComboPadroesTests(TestCase):
+    def setUp(self):
+        combo_padroes.limpar_cache()
+        self.addCleanup(combo_padroes.limpar_cache)
+        self.tipo = TipoPeticao.objects.create(nome='Monitória')
+        self.processo = ProcessoJudicial.objects.create(cnj='0000100', uf='SP')
+
+    def _arquivo(self, nome):
+        return ProcessoArquivo.objects.create(
+            processo=self.processo, nome=nome, arquivo=f'processos/{self.processo.pk}/pasta/{nome}',
+        )
+
+    def test_indexa_nome_no_save(self):
+        arquivo = self._arquivo('08 - Cálculo Saldo_Devedor 1234.567-89 e 445566.pdf')
+        self.assertEqual(arquivo.nome_tokens, '08 calculo saldo devedor 1234 567 89 e 445566 pdf')
+        self.assertEqual(arquivo.contratos_nome, ' 123456789 445566 ')
+        arquivo.nome = 'TED 987654.pdf'
+        arquivo.save(update_fields=['nome'])
+        arquivo.refresh_from_db()
+        self.assertEqual((arquivo.nome_tokens, arquivo.contratos_nome), ('ted 987654 pdf', ' 987654 '))
+
+    def test_padroes_padrao_montam_combo(self):
+        base = self._arquivo('01 - Monitória 123456.docx')
+        self._arquivo('05 - Extrato de Titularidade.docx')
+        extrato = self._arquivo('05 - Extrato de Titularidade.pdf')
+        contrato = self._arquivo('Termo de Adesão 123456.pdf')
+        self._arquivo('Relatório 1234567.pdf')
+        ted = self._arquivo('TED 123456.pdf')
+        anexo = self._arquivo('Anexo procuração.pdf')
+
+        preview = peticao_combo.build_preview(self.tipo.pk, base.pk)
+
+        self.assertEqual(preview['contracts'], ['123456'])
+        self.assertEqual(preview['file05']['id'], extrato.pk)
+        self.assertEqual(preview['per_contract'][0]['a06']['id'], contrato.pk)
+        self.assertEqual(preview['per_contract'][0]['a09']['id'], ted.pk)
+        self.assertIsNone(preview['per_contract'][0]['a07'])
+        self.assertEqual(preview['missing'], [
+            '07 - 123456 - Relatório', '08 - 123456 - Saldo Devedor (ou Cálculo)',
+        ])
+        self.assertEqual([item['id'] for item in preview['optional']], [anexo.pk])
+
+    def test_padroes_cadastrados_e_recompilados_na_alteracao(self):
+        base = self._arquivo('01 - Monitória 123456.docx')
+        saldo = self._arquivo('Planilha Saldo B6 123456.pdf')
+        padrao = ComboDocumentoPattern.objects.create(
+            tipo_peticao=self.tipo, categoria=ComboDocumentoPattern.CATEGORIA_CONTRATO,
+            label_template='03 - xxxxxxxxx - Saldo', keywords=['saldo + b6'],
+        )
+        ComboDocumentoPattern.objects.create(
+            tipo_peticao=self.tipo, categoria=ComboDocumentoPattern.CATEGORIA_FIXO, ordem=1,
+            label_template='02 - Procuração', keywords=['^procuracao'], obrigatorio=False,
+        )
+
+        preview = peticao_combo.build_preview(self.tipo.pk, base.pk)
+        self.assertEqual(preview['missing'], [])
+        self.assertEqual(
+            [item['label'] for item in preview['found']],
+            ['01 - Monitória 123456.docx', '03 - 123456 - Saldo'],
+        )
+        self.assertEqual(preview['found'][1]['arquivo_id'], saldo.pk)
+
+        padrao.keywords = ['saldo devedor']
+        padrao.save()
+        preview = peticao_combo.build_preview(self.tipo.pk, base.pk)
+        self.assertEqual(preview['missing'], ['03 - 123456 - Saldo'])
+
+    def test_contrato_curto_casa_palavra_inteira(self):
+        Contrato.objects.create(processo=self.processo, numero_contrato='1234')
+        base = self._arquivo('01 - Monitória.docx')
+        ted = self._arquivo('TED 1234.pdf')
+        self._arquivo('Relatório 12345.pdf')
+        self._arquivo('Termo de Adesão 981234.pdf')
+
+        preview = peticao_combo.build_preview(self.tipo.pk, base.pk)
+
+        self.assertEqual(preview['contracts'], ['1234'])
+        self.assertEqual(preview['per_contract'][0]['a09']['id'], ted.pk)
+        self.assertIsNone(preview['per_contract'][0]['a06'])
+        self.assertIsNone(preview['per_contract'][0]['a07'])
+
+
+class ComboManifestoTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        cache.clear()
+        self.tipo = TipoPeticao.objects.create(nome='Monitória')
+        self.processo = ProcessoJudicial.objects.create(cnj='0000200')
+
+    def _upload(self, nome, conteudo):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return ProcessoArquivo.objects.create(
+            processo=self.processo, nome=nome, arquivo=SimpleUploadedFile(nome, conteudo),
+        )
+
+    def test_hash_calculado_no_upload(self):
+        import hashlib
+        arquivo = self._upload('Contrato 123456.pdf', b'contrato')
+        self.assertEqual(arquivo.hash_conteudo, hashlib.sha256(b'contrato').hexdigest())
+        with arquivo.arquivo.open('rb') as handle:
+            self.assertEqual(handle.read(), b'contrato')
+
+    def test_preview_em_cache_ate_mudar_arquivos(self):
+        base = self._upload('01 - Monitória 123456.pdf', b'base')
+        with mock.patch.object(peticao_combo, '_montar_preview', wraps=peticao_combo._montar_preview) as montar:
+            primeiro = peticao_combo.build_preview(self.tipo.pk, base.pk)
+            self.assertEqual(peticao_combo.build_preview(self.tipo.pk, base.pk), primeiro)
+            self.assertEqual(montar.call_count, 1)
+            self._upload('TED 123456.pdf', b'ted')
+            segundo = peticao_combo.build_preview(self.tipo.pk, base.pk)
+        self.assertEqual(montar.call_count, 2)
+        self.assertNotIn('09 - 123456 - TED', segundo['missing'])
+
+    def test_zip_reaproveitado_com_mesmo_manifesto(self):
+        base = self._upload('01 - Monitória 123456.pdf', b'base')
+        contrato = self._upload('Contrato 123456.pdf', b'contrato v1')
+        # Hash ausente (arquivo antigo) é calculado lendo do storage.
+        ProcessoArquivo.objects.filter(pk=contrato.pk).update(hash_conteudo='')
+
+        primeiro = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+        segundo = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+        self.assertFalse(primeiro['reutilizado'])
+        self.assertTrue(segundo['reutilizado'])
+        self.assertEqual(segundo['arquivo_id'], primeiro['arquivo_id'])
+        self.assertEqual(segundo['entries'], primeiro['entries'])
+        self.assertEqual(self.processo.zips_peticao.count(), 1)
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        contrato.refresh_from_db()
+        contrato.arquivo = SimpleUploadedFile('Contrato 123456.pdf', b'contrato v2')
+        contrato.save()
+        terceiro = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+        self.assertFalse(terceiro['reutilizado'])
+        self.assertNotEqual(terceiro['arquivo_id'], primeiro['arquivo_id'])
+
+        # ZIP apagado dos Arquivos não é mais reaproveitado.
+        ProcessoArquivo.objects.filter(pk=terceiro['arquivo_id']).delete()
+        self.assertFalse(peticao_combo.generate_zip(self.tipo.pk, base.pk)['reutilizado'])
+
+    def test_zip_sem_conversao_do_docx_nao_e_reaproveitado(self):
+        base = self._upload('01 - Monitória 123456.docx', b'docx base')
+        with mock.patch.object(conversao_pdf, 'converter_docx_para_pdf', return_value=None):
+            primeiro = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+            segundo = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+        self.assertFalse(primeiro['reutilizado'])
+        self.assertFalse(segundo['reutilizado'])
+        self.assertEqual(primeiro['entries'][0]['name'], '01 - Monitória 123456.docx')
+        self.assertEqual(set(self.processo.zips_peticao.values_list('manifesto_hash', flat=True)), {''})
+
+        # Com o conversor de volta, o ZIP convertido é gerado e passa a ser reaproveitado.
+        with mock.patch.object(conversao_pdf, 'converter_docx_para_pdf', return_value=b'%PDF-1.4 base'):
+            terceiro = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+            quarto = peticao_combo.generate_zip(self.tipo.pk, base.pk)
+        self.assertFalse(terceiro['reutilizado'])
+        self.assertEqual(terceiro['entries'][0]['name'], '01 - Monitória 123456.pdf')
+        self.assertTrue(quarto['reutilizado'])
+        self.assertEqual(quarto['arquivo_id'], terceiro['arquivo_id'])
+
+
+class ComboPdfUnicoTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.tipo = TipoPeticao.objects.create(nome='Monitória')
+        self.processo = ProcessoJudicial.objects.create(cnj='0000300', uf='SP')
+
+    @staticmethod
+    def _pdf(paginas):
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for _ in range(paginas):
+            writer.add_blank_page(width=200, height=200)
+        buffer = BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    def _upload(self, nome, conteudo):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return ProcessoArquivo.objects.create(
+            processo=self.processo, nome=nome, arquivo=SimpleUploadedFile(nome, conteudo),
+        )
+
+    def test_junta_base_e_anexos_com_marcadores(self):
+        from pypdf import PdfReader
+        base = self._upload('01 - Monitória 123456.docx', b'docx')
+        self._upload('Contrato 123456.pdf', self._pdf(2))
+        anexo = self._upload('Anexo procuração.pdf', self._pdf(1))
+        quebrado = self._upload('Anexo quebrado.pdf', b'nao e pdf')
+
+        with mock.patch.object(conversao_pdf, 'converter_docx_para_pdf', return_value=self._pdf(1)) as converter:
+            resultado = peticao_combo.generate_pdf(self.tipo.pk, base.pk, [anexo.pk, quebrado.pk])
+
+        converter.assert_called_once_with(b'docx', permitir_fallback=False)
+        self.assertEqual(resultado['paginas'], 4)
+        self.assertEqual(resultado['ignorados'], ['Anexo quebrado'])
+        gerado = ProcessoArquivo.objects.get(pk=resultado['arquivo_id'])
+        self.assertEqual(gerado.tipo_documento, classificacao_arquivos.TIPO_COMBO_PDF)
+        self.assertTrue(gerado.nome.endswith('.pdf'))
+        with gerado.arquivo.open('rb') as handle:
+            reader = PdfReader(BytesIO(handle.read()))
+        self.assertEqual(len(reader.pages), 4)
+        self.assertEqual(
+            [(item.title, reader.get_destination_page_number(item)) for item in reader.outline],
+            [('01 - Monitória 123456', 0), ('06 - 123456 - Contrato', 1), ('Anexo procuração', 3)],
+        )
+
+    @override_settings(PDF_MONTAGEM_MAX_PAGINAS=2)
+    def test_limite_de_paginas(self):
+        base = self._upload('01 - Monitória 123456.pdf', self._pdf(1))
+        self._upload('Contrato 123456.pdf', self._pdf(2))
+        with self.assertRaises(geracao_documentos.GeracaoErro):
+            peticao_combo.generate_pdf(self.tipo.pk, base.pk)
+        self.assertFalse(ProcessoArquivo.objects.filter(tipo_documento=classificacao_arquivos.TIPO_COMBO_PDF).exists())
+
+
+class ModelosDocumentoCacheTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        cache_dir = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(cache_dir.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }, DOCUMENTO_MODELO_CACHE_DIR=cache_dir.name)
+        storages.enable()
+        self.addCleanup(storages.disable)
+        modelos_documento.limpar_cache()
+        self.addCleanup(modelos_documento.limpar_cache)
+
+    def _docx(self, texto):
+        from docx import Document
+        documento = Document()
+        documento.add_paragraph(texto)
+        buffer = BytesIO()
+        documento.save(buffer)
+        return buffer.getvalue()
+
+    def _enviar(self, modelo, texto):
+        from django.core.files.base import ContentFile
+        modelo.arquivo.save('monitoria.docx', ContentFile(self._docx(texto)))
+
+    def test_copias_independentes_e_invalidacao_no_reenvio(self):
+        modelo = DocumentoModelo(slug=DocumentoModelo.SlugChoices.MONITORIA_INICIAL, nome='Monitória')
+        self._enviar(modelo, 'versão 1')
+
+        primeiro = modelos_documento.obter_documento(modelo)
+        primeiro.paragraphs[0].text = 'alterado'
+        modelo.arquivo.storage.delete(modelo.arquivo.name)
+
+        # Memória e depois disco local atendem sem o arquivo no storage.
+        self.assertEqual(modelos_documento.obter_documento(modelo).paragraphs[0].text, 'versão 1')
+        modelos_documento.limpar_cache()
+        self.assertEqual(modelos_documento.obter_documento(modelo).paragraphs[0].text, 'versão 1')
+
+        self._enviar(modelo, 'versão 2')
+        self.assertEqual(modelos_documento.obter_documento(modelo).paragraphs[0].text, 'versão 2')
+
+
+class PlanoDocxTests(TestCase):
+    def _template(self):
+        from docx import Document
+        documento = Document()
+        paragrafo = documento.add_paragraph('Réu: [PARTE ')
+        paragrafo.add_run('CONTR').bold = True
+        paragrafo.add_run('ÁRIA], CPF [CPF] [n]x[n] [DESCONHECIDO]')
+        documento.add_table(rows=1, cols=1).cell(0, 0).text = 'Foro: [E]/[H] - [E]'
+        documento.sections[0].header.paragraphs[0].text = 'Estado: [UF]'
+        return documento
+
+    def test_renderiza_como_a_varredura_campo_a_campo(self):
+        from contratos import views
+        dados = {'PARTE CONTRÁRIA': 'FULANO', 'CPF': '123', 'E': 'Rua', 'E_FORO': 'Vara', 'H_FORO': 'SP', 'UF': 'SP'}
+        esperado = self._template()
+        views._replace_placeholders_in_container(esperado, dados)
+        views._replace_placeholders_in_container(esperado.sections[0].header, dados)
+
+        template = self._template()
+        plano = plano_docx.compilar(template)
+        self.assertEqual(plano.placeholders[:3], ['[PARTE CONTRÁRIA]', '[CPF]', '[n]'])
+
+        renderizado = plano.vincular(modelos_documento.copiar_documento(template))
+        renderizado.renderizar(views._placeholder_values(dados))
+        documento = renderizado.document
+
+        self.assertEqual(documento.paragraphs[0].text, esperado.paragraphs[0].text)
+        self.assertEqual(documento.paragraphs[0].text, 'Réu: FULANO, CPF 123 [n]x[n] [DESCONHECIDO]')
+        self.assertEqual(documento.tables[0].cell(0, 0).text, 'Foro: Vara/SP - Rua')
+        self.assertEqual(documento.sections[0].header.paragraphs[0].text, 'Estado: SP')
+        # O template compilado continua com os placeholders para a próxima geração.
+        self.assertIn('[PARTE CONTRÁRIA]', template.paragraphs[0].text)
+
+
+class ProxyArquivoStreamingTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        from django.core.files.base import ContentFile
+        self.conteudo = b'%PDF-1.4 ' + bytes(range(256)) * 10
+        processo = ProcessoJudicial.objects.create(cnj='0000011')
+        self.arquivo = ProcessoArquivo(processo=processo, nome='peticao.pdf')
+        self.arquivo.arquivo.save('peticao.pdf', ContentFile(self.conteudo), save=True)
+        self.url = reverse('contratos:proxy_arquivo_view', args=[self.arquivo.pk])
+        self.client.force_login(User.objects.create_user('leitor', password='x'))
+
+    def test_streaming_range_e_etag(self):
+        inteiro = self.client.get(self.url, secure=True)
+        self.assertEqual(inteiro.status_code, 200)
+        self.assertTrue(inteiro.streaming)
+        self.assertEqual(b''.join(inteiro.streaming_content), self.conteudo)
+        self.assertEqual(inteiro['Content-Type'], 'application/pdf')
+        self.assertEqual(inteiro['Accept-Ranges'], 'bytes')
+        etag = inteiro['ETag']
+
+        self.assertEqual(self.client.get(self.url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        parcial = self.client.get(self.url, secure=True, HTTP_RANGE='bytes=4-9')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 4-9/{len(self.conteudo)}')
+        self.assertEqual(b''.join(parcial.streaming_content), self.conteudo[4:10])
+
+        final = self.client.get(self.url, secure=True, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(final.streaming_content), self.conteudo[-5:])
+
+        # If-Range com outra versão: arquivo inteiro.
+        self.assertEqual(self.client.get(self.url, secure=True, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"x"').status_code, 200)
+
+        fora = self.client.get(self.url, secure=True, HTTP_RANGE=f'bytes={len(self.conteudo)}-')
+        self.assertEqual((fora.status_code, fora['Content-Range']), (416, f'bytes */{len(self.conteudo)}'))
+
+
+class PreviewsArquivosTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.processo = ProcessoJudicial.objects.create(cnj='0000400')
+        self.client.force_login(User.objects.create_user('leitor', password='x'))
+
+    @staticmethod
+    def _pdf(paginas):
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for _ in range(paginas):
+            writer.add_blank_page(width=200, height=300)
+        buffer = BytesIO()
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    def _upload(self, nome, conteudo):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return ProcessoArquivo.objects.create(
+            processo=self.processo, nome=nome, arquivo=SimpleUploadedFile(nome, conteudo),
+        )
+
+    def test_upload_agenda_e_gera_miniatura_ao_lado_do_original(self):
+        with mock.patch.object(previews_arquivos, '_enfileirar') as enfileirar:
+            with self.captureOnCommitCallbacks(execute=True):
+                arquivo = self._upload('Contrato 123456.pdf', self._pdf(3))
+                self._upload('Planilha.xlsx', b'xlsx')
+        enfileirar.assert_called_once_with(arquivo.pk)
+
+        self.assertEqual(previews_arquivos.gerar(arquivo), ProcessoArquivo.PREVIEW_PRONTO)
+        arquivo.refresh_from_db()
+        self.assertEqual((arquivo.paginas, arquivo.preview_hash), (3, arquivo.hash_conteudo))
+        caminho = previews_arquivos.caminho(arquivo)
+        self.assertEqual(caminho, f'processos/{self.processo.pk}/pasta/previews/{arquivo.hash_conteudo}.png')
+        with arquivo.arquivo.storage.open(caminho, 'rb') as handle:
+            png = handle.read()
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(int.from_bytes(png[16:20], 'big'), previews_arquivos.DEFAULT_LARGURA)
+
+        # Mesmo conteúdo na pasta: reaproveita a miniatura sem renderizar de novo.
+        copia = self._upload('Contrato 123456 (cópia).pdf', self._pdf(3))
+        with mock.patch.object(previews_arquivos, 'renderizar') as renderizar:
+            self.assertEqual(previews_arquivos.gerar(copia), ProcessoArquivo.PREVIEW_PRONTO)
+        renderizar.assert_not_called()
+        self.assertEqual(copia.paginas, 3)
+
+    def test_view_serve_miniatura_com_etag_e_agenda_pendentes(self):
+        arquivo = self._upload('Contrato 123456.pdf', self._pdf(1))
+        url = reverse('contratos:arquivo_preview', args=[arquivo.pk])
+        with mock.patch.object(previews_arquivos, 'agendar') as agendar:
+            self.assertEqual(self.client.get(url, secure=True).status_code, 404)
+        agendar.assert_called_once()
+
+        previews_arquivos.gerar(arquivo)
+        resposta = self.client.get(f'{url}?v=1', secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta['Content-Type'], 'image/png')
+        self.assertIn('immutable', resposta['Cache-Control'])
+        self.assertTrue(b''.join(resposta.streaming_content).startswith(b'\x89PNG'))
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 304)
+
+    def test_fila_usa_pool_limitado_sem_duplicar_arquivo(self):
+        executor = mock.Mock()
+        with mock.patch.object(previews_arquivos, '_get_executor', return_value=executor), \
+                mock.patch.object(previews_arquivos, '_em_andamento', set()):
+            previews_arquivos._enfileirar(1)
+            previews_arquivos._enfileirar(1)
+            previews_arquivos._enfileirar(2)
+        self.assertEqual(
+            executor.submit.call_args_list,
+            [mock.call(previews_arquivos._gerar_em_thread, 1), mock.call(previews_arquivos._gerar_em_thread, 2)],
+        )
+
+    def test_pdf_ilegivel_fica_indisponivel(self):
+        arquivo = self._upload('Anexo quebrado.pdf', b'nao e pdf')
+        self.assertEqual(previews_arquivos.gerar(arquivo), ProcessoArquivo.PREVIEW_INDISPONIVEL)
+        self.assertFalse(previews_arquivos.pendente(arquivo))
+        self.assertIsNone(arquivo.paginas)
+
+
+class UploadDiretoTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storages = override_settings(STORAGES={
+            'default': {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': media.name},
+            },
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        })
+        storages.enable()
+        self.addCleanup(storages.disable)
+        self.processo = ProcessoJudicial.objects.create(cnj='0000500')
+        self.usuario = User.objects.create_user('enviador', password='x')
+        self.client.force_login(self.usuario)
+
+    def _enviar(self, nome, conteudo, **alvo):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        alvo = alvo or {'processo_id': self.processo.pk}
+        inicio = self.client.post(
+            reverse('api_root:upload_direto'),
+            {**alvo, 'nome': nome, 'tamanho': len(conteudo)},
+            content_type='application/json',
+            secure=True,
+        )
+        self.assertEqual(inicio.status_code, 201, inicio.content)
+        destino = inicio.json()
+        envio = self.client.post(
+            destino['url'], {**destino['fields'], 'file': SimpleUploadedFile(nome, conteudo)}, secure=True,
+        )
+        self.assertEqual(envio.status_code, 204, envio.content)
+        return destino
+
+    def _confirmar(self, token, **extra):
+        return self.client.post(
+            reverse('api_root:upload_direto_confirmar'),
+            {'token': token, **extra},
+            content_type='application/json',
+            secure=True,
+        )
+
+    def test_fluxo_local_cria_arquivo_na_chave_reservada(self):
+        conteudo = b'%PDF-1.4 digitalizacao'
+        destino = self._enviar('Digitalização 01.pdf', conteudo)
+        self.assertEqual(destino['backend'], uploads_diretos.BackendLocal.nome)
+        self.assertTrue(destino['chave'].startswith(f'processos/{self.processo.pk}/pasta/Digitalização_01_'))
+
+        resposta = self._confirmar(destino['token'])
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        arquivo = ProcessoArquivo.objects.get(pk=resposta.json()['id'])
+        self.assertEqual(
+            (arquivo.processo_id, arquivo.nome, arquivo.arquivo.name, arquivo.enviado_por_id),
+            (self.processo.pk, 'Digitalização 01.pdf', destino['chave'], self.usuario.pk),
+        )
+        with arquivo.arquivo.open('rb') as handle:
+            self.assertEqual(handle.read(), conteudo)
+
+        # Confirmar de novo não duplica; reenviar para a mesma chave é recusado.
+        self.assertEqual(self._confirmar(destino['token']).json()['id'], arquivo.pk)
+        self.assertEqual(ProcessoArquivo.objects.filter(processo=self.processo).count(), 1)
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        repetido = self.client.post(
+            destino['url'], {**destino['fields'], 'file': SimpleUploadedFile('x.pdf', conteudo)}, secure=True,
+        )
+        self.assertEqual(repetido.status_code, 400)
+
+    def test_recusa_tipo_tamanho_e_conteudo_divergentes(self):
+        recusado = self.client.post(
+            reverse('api_root:upload_direto'),
+            {'processo_id': self.processo.pk, 'nome': 'script.exe', 'tamanho': 10},
+            content_type='application/json',
+            secure=True,
+        )
+        self.assertEqual(recusado.status_code, 400)
+
+        with override_settings(UPLOAD_DIRETO_MAX_MB=1):
+            grande = self.client.post(
+                reverse('api_root:upload_direto'),
+                {'processo_id': self.processo.pk, 'nome': 'scan.pdf', 'tamanho': 2 * 1024 * 1024},
+                content_type='application/json',
+                secure=True,
+            )
+        self.assertEqual(grande.status_code, 400)
+
+        destino = self._enviar('contrato.pdf', b'PK\x03\x04 zip renomeado')
+        resposta = self._confirmar(destino['token'])
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(ProcessoArquivo.objects.exists())
+        from django.core.files.storage import default_storage
+        self.assertFalse(default_storage.exists(destino['chave']))
+
+        outro = User.objects.create_user('outro', password='x')
+        destino = self._enviar('contrato.pdf', b'%PDF-1.4')
+        self.client.force_login(outro)
+        self.assertEqual(self._confirmar(destino['token']).status_code, 400)
+
+    def test_comentario_recusa_tarefa_sem_processo(self):
+        tarefa = Tarefa.objects.create(descricao='sem processo', data=date.today())
+        destino = self._enviar('Petição.pdf', b'%PDF-1.4 anexo')
+        resposta = self.client.post(
+            reverse('api_root:tarefa_comentarios', args=[tarefa.pk]),
+            {'texto': 'segue', 'upload_token': destino['token']},
+            secure=True,
+        )
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(tarefa.mensagens.exists())
+        self.assertFalse(ProcessoArquivo.objects.exists())
+
+    def test_confirmar_de_novo_completa_ou_recusa_vinculos(self):
+        destino = self._enviar('Petição.pdf', b'%PDF-1.4 anexo')
+        arquivo = uploads_diretos.confirmar(destino['token'], self.usuario, processo=self.processo)
+        self.assertIsNone(arquivo.tarefa_id)
+
+        tarefa = Tarefa.objects.create(processo=self.processo, descricao='t', data=date.today())
+        mesmo = uploads_diretos.confirmar(destino['token'], self.usuario, processo=self.processo, tarefa=tarefa)
+        self.assertEqual(mesmo.pk, arquivo.pk)
+        arquivo.refresh_from_db()
+        self.assertEqual(arquivo.tarefa_id, tarefa.pk)
+
+        outra = Tarefa.objects.create(processo=self.processo, descricao='outra', data=date.today())
+        with self.assertRaises(uploads_diretos.UploadInvalido):
+            uploads_diretos.confirmar(destino['token'], self.usuario, processo=self.processo, tarefa=outra)
+        with self.assertRaises(uploads_diretos.UploadInvalido):
+            uploads_diretos.confirmar(destino['token'], self.usuario, processo=None)
+
+        # Reenviar o comentário com o mesmo upload não cria outra mensagem.
+        resposta = self.client.post(
+            reverse('api_root:tarefa_comentarios', args=[outra.pk]),
+            {'texto': 'segue', 'upload_token': destino['token']},
+            secure=True,
+        )
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(outra.mensagens.exists())
+
+    def test_comentario_e_tarefas_em_lote_usam_o_upload(self):
+        tarefa = Tarefa.objects.create(processo=self.processo, descricao='t', data=date.today())
+        destino = self._enviar('Petição.pdf', b'%PDF-1.4 anexo', tarefa_id=tarefa.pk)
+        resposta = self.client.post(
+            reverse('api_root:tarefa_comentarios', args=[tarefa.pk]),
+            {'texto': 'segue', 'upload_token': destino['token']},
+            secure=True,
+        )
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        self.assertEqual([anexo['nome'] for anexo in resposta.json()['anexos']], ['Petição.pdf'])
+
+        segundo = ProcessoJudicial.objects.create(cnj='0000501')
+        destino = self._enviar('Procuração.pdf', b'%PDF-1.4 procuracao')
+        resposta = self.client.post(reverse('api_root:tarefa_bulk_create'), {'payload': json.dumps({
+            'processo_ids': [self.processo.pk, segundo.pk],
+            'descricao': 'Juntar procuração',
+            'data': date.today().isoformat(),
+            'upload_token': destino['token'],
+        })}, secure=True)
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        anexos = ProcessoArquivo.objects.filter(nome='Procuração.pdf').order_by('processo_id')
+        self.assertEqual([a.processo_id for a in anexos], [self.processo.pk, segundo.pk])
+        self.assertTrue(all(a.mensagem_id and a.tarefa_id for a in anexos))
+        self.assertEqual(anexos[0].arquivo.name, destino['chave'])
+        self.assertTrue(anexos[1].arquivo.name.startswith(f'processos/{segundo.pk}/pasta/'))
+        with anexos[1].arquivo.open('rb') as handle:
+            self.assertEqual(handle.read(), b'%PDF-1.4 procuracao')
+
+    def test_backend_s3_gera_presigned_post_com_tamanho_exato(self):
+        import base64
+        from storages.backends.s3 import S3Storage
+        storage = S3Storage(
+            bucket_name='nowlex-teste', access_key='chave', secret_key='segredo', region_name='us-east-1', location='media',
+        )
+        destino = uploads_diretos.BackendS3(storage).preparar(
+            f'processos/{self.processo.pk}/pasta/scan_ab12.pdf', 'application/pdf', 1234, 'token',
+        )
+        self.assertIn('nowlex-teste', destino['url'])
+        self.assertEqual(destino['fields']['key'], f'media/processos/{self.processo.pk}/pasta/scan_ab12.pdf')
+        politica = json.loads(base64.b64decode(destino['fields']['policy']))
+        self.assertIn(['content-length-range', 1234, 1234], politica['conditions'])
+        self.assertIn({'Content-Type': 'application/pdf'}, politica['conditions'])
+
+
+class UltimaEdicaoTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_superuser('editor', 'editor@example.com', 'x')
+        self.processo = ProcessoJudicial.objects.create(cnj='0000600')
+        self.outro = ProcessoJudicial.objects.create(cnj='0000601')
+        self.client.force_login(self.usuario)
+
+    def test_api_registra_edicao_so_no_processo_alterado(self):
+        tarefa = Tarefa.objects.create(processo=self.processo, descricao='t', data=date.today())
+        resposta = self.client.post(
+            reverse('api_root:tarefa_comentarios', args=[tarefa.pk]), {'texto': 'ok'}, secure=True,
+        )
+        self.assertEqual(resposta.status_code, 201)
+        self.processo.refresh_from_db()
+        self.outro.refresh_from_db()
+        self.assertIsNotNone(self.processo.ultima_edicao_em)
+        self.assertEqual(self.processo.ultima_edicao_por, self.usuario)
+        self.assertIsNone(self.outro.ultima_edicao_em)
+        self.assertIsNone(self.outro.ultima_edicao_por)
+
+    def test_admin_registra_edicao_ao_alterar(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        from types import SimpleNamespace
+
+        model_admin = site._registry[ProcessoJudicial]
+        request = RequestFactory().post('/')
+        request.user = self.usuario
+        form = SimpleNamespace(cleaned_data={}, data=request.POST)
+        self.processo.vara = 'Vara nova'
+        model_admin.save_model(request, self.processo, form, change=True)
+
+        self.processo.refresh_from_db()
+        self.outro.refresh_from_db()
+        self.assertEqual(self.processo.vara, 'Vara nova')
+        self.assertIsNotNone(self.processo.ultima_edicao_em)
+        self.assertEqual(self.processo.ultima_edicao_por, self.usuario)
+        self.assertIsNone(self.outro.ultima_edicao_em)
+
+        # Criação não conta como edição.
+        novo = ProcessoJudicial(cnj='0000602')
+        model_admin.save_model(request, novo, form, change=False)
+        novo.refresh_from_db()
+        self.assertIsNone(novo.ultima_edicao_em)
+
+
+class CarteiraCpfSignalsTests(TestCase):
+    def setUp(self):
+        self.carteira_a = Carteira.objects.create(nome='A')
+        self.carteira_b = Carteira.objects.create(nome='B')
+        self.p1 = ProcessoJudicial.objects.create(cnj='0000700', carteira=self.carteira_a)
+        self.p2 = ProcessoJudicial.objects.create(cnj='0000701', carteira=self.carteira_b)
+
+    def _linhas(self):
+        return set(CarteiraCpf.objects.values_list('cpf', 'carteira_id', 'processo_id'))
+
+    def test_criar_mover_e_apagar_parte(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            parte = Parte.objects.create(processo=self.p1, tipo_polo='PASSIVO', nome='X', documento='111.222.333-44')
+        self.assertEqual(self._linhas(), {('11122233344', self.carteira_a.pk, self.p1.pk)})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parte.processo = self.p2
+            parte.save()
+        self.assertEqual(self._linhas(), {('11122233344', self.carteira_b.pk, self.p2.pk)})
+        self.assertEqual(CarteiraStats.objects.get(carteira=self.carteira_a).cpfs_distintos, 0)
+        self.assertEqual(CarteiraStats.objects.get(carteira=self.carteira_b).cpfs_distintos, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            parte.delete()
+        self.assertEqual(self._linhas(), set())
+        self.assertEqual(CarteiraStats.objects.get(carteira=self.carteira_b).cpfs_distintos, 0)
+
+    def test_processo_muda_de_carteira(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Parte.objects.create(processo=self.p1, tipo_polo='PASSIVO', nome='X', documento='11122233344')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p1.carteira = self.carteira_b
+            self.p1.save(update_fields=['carteira'])
+        self.assertEqual(self._linhas(), {('11122233344', self.carteira_b.pk, self.p1.pk)})
+        self.assertEqual(CarteiraStats.objects.get(carteira=self.carteira_a).cpfs_distintos, 0)
+        self.assertEqual(CarteiraStats.objects.get(carteira=self.carteira_b).cpfs_distintos, 1)
+
+
+class ProcessoKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_superuser('lista', 'lista@example.com', 'x')
+        self.client.force_login(self.usuario)
+        valores = [Decimal('10.00'), Decimal('20.00'), Decimal('10.00'), None, Decimal('10.00'), Decimal('5.00')]
+        self.processos = [
+            ProcessoJudicial.objects.create(cnj=f'0000{800 + indice}', valor_causa=valor)
+            for indice, valor in enumerate(valores)
+        ]
+
+    def _percorrer(self, **params):
+        url = reverse('api_root:processo_list')
+        params.setdefault('page_size', 2)
+        ids, paginas = [], 0
+        while True:
+            resposta = self.client.get(url, params, secure=True)
+            self.assertEqual(resposta.status_code, 200)
+            dados = resposta.json()
+            ids.extend(item['id'] for item in dados['results'])
+            paginas += 1
+            if not dados['has_more']:
+                self.assertIsNone(dados['next'])
+                self.assertIsNone(dados['next_cursor'])
+                return ids, paginas
+            params['cursor'] = dados['next_cursor']
+
+    def _esperado(self, descending):
+        com_valor = [p for p in self.processos if p.valor_causa is not None]
+        com_valor.sort(key=lambda p: (p.valor_causa, p.pk), reverse=descending)
+        nulos = sorted((p for p in self.processos if p.valor_causa is None), key=lambda p: p.pk, reverse=descending)
+        return [p.pk for p in com_valor + nulos]
+
+    def test_cursor_percorre_empates_sem_repetir(self):
+        ids, paginas = self._percorrer(ordering='valor_causa')
+        self.assertEqual(ids, self._esperado(descending=False))
+        self.assertEqual(paginas, 3)
+
+        ids, _ = self._percorrer(ordering='-valor_causa', page_size=4)
+        self.assertEqual(ids, self._esperado(descending=True))
+
+        ids, _ = self._percorrer()
+        self.assertEqual(ids, sorted(p.pk for p in self.processos))
+
+    def test_ultima_pagina_exata(self):
+        ids, paginas = self._percorrer(page_size=3)
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(paginas, 2)
+
+    def test_cursor_invalido(self):
+        url = reverse('api_root:processo_list')
+        resposta = self.client.get(url, {'cursor': 'lixo'}, secure=True)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('cursor', resposta.json())
+
+        primeira = self.client.get(url, {'page_size': 2, 'ordering': 'valor_causa'}, secure=True).json()
+        resposta = self.client.get(url, {'cursor': primeira['next_cursor'], 'ordering': 'cnj'}, secure=True)
+        self.assertEqual(resposta.status_code, 400)
+
+        resposta = self.client.get(url, {'ordering': 'inexistente'}, secure=True)
+        self.assertEqual(resposta.status_code, 400)
+
+
+@override_settings(OPERACAO_LOTE_CHUNK_SIZE=2)
+class OperacoesLoteTests(TestCase):
+    def setUp(self):
+        self.carteira = Carteira.objects.create(nome='Destino')
+        self.etiqueta = Etiqueta.objects.create(nome='Lote')
+        self.processos = [ProcessoJudicial.objects.create(cnj=f'0000{900 + i}') for i in range(5)]
+        self.ids = [p.pk for p in self.processos]
+
+    def _criar(self, tipo, parametros):
+        with mock.patch.object(operacoes_lote, '_iniciar_thread'):
+            with self.captureOnCommitCallbacks(execute=True):
+                return operacoes_lote.criar_operacao(tipo, self.ids + ['x', self.ids[0]], parametros)
+
+    def test_executa_operacao_de_carteira(self):
+        operacao = self._criar(OperacaoLote.TIPO_CARTEIRA, {'carteira_id': self.carteira.pk})
+        self.assertEqual((operacao.total, operacao.processo_ids), (5, self.ids))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resultado = operacoes_lote.executar_operacao(operacao.pk)
+        self.assertEqual(resultado.status, OperacaoLote.STATUS_CONCLUIDO)
+        self.assertEqual(resultado.processados, 5)
+        self.assertIsNotNone(resultado.atualizado_em)
+        self.assertEqual(
+            ProcessoJudicial.objects.filter(pk__in=self.ids, carteira=self.carteira).count(), 5,
+        )
+        self.assertEqual(self.carteira.processos_multicarteira.count(), 5)
+        # Reexecutar uma operação já reservada não faz nada.
+        self.assertIsNone(operacoes_lote.executar_operacao(operacao.pk))
+
+    def test_progresso_por_bloco(self):
+        chamadas = []
+        operacoes_lote.adicionar_etiqueta(self.ids, self.etiqueta.pk, progresso=chamadas.append)
+        self.assertEqual(chamadas, [2, 2, 1])
+        self.assertEqual(self.etiqueta.processojudicial_set.count(), 5)
+
+        chamadas = []
+        removidos = operacoes_lote.remover_etiqueta(self.ids[:3], self.etiqueta.pk, progresso=chamadas.append)
+        self.assertEqual((removidos, chamadas), (3, [2, 1]))
+
+    def test_erro_fica_registrado(self):
+        operacao = self._criar(OperacaoLote.TIPO_ETIQUETA_ADICIONAR, {})
+        resultado = operacoes_lote.executar_operacao(operacao.pk)
+        self.assertEqual(resultado.status, OperacaoLote.STATUS_ERRO)
+        self.assertIn('etiqueta_id', resultado.erro)
+        self.assertIsNotNone(resultado.finalizado_em)
+
+    def test_retoma_operacao_orfa(self):
+        operacao = self._criar(OperacaoLote.TIPO_ETIQUETA_ADICIONAR, {'etiqueta_id': self.etiqueta.pk})
+        recente = self._criar(OperacaoLote.TIPO_ETIQUETA_ADICIONAR, {'etiqueta_id': self.etiqueta.pk})
+        antigo = timezone.now() - timedelta(hours=2)
+        OperacaoLote.objects.filter(pk=operacao.pk).update(
+            status=OperacaoLote.STATUS_EXECUTANDO, iniciado_em=antigo, atualizado_em=antigo, processados=2,
+        )
+        OperacaoLote.objects.filter(pk=recente.pk).update(
+            status=OperacaoLote.STATUS_EXECUTANDO, iniciado_em=antigo, atualizado_em=timezone.now(),
+        )
+
+        # Uma nova operação criada retoma a órfã numa thread.
+        with mock.patch.object(operacoes_lote, '_iniciar_thread') as iniciar:
+            with self.captureOnCommitCallbacks(execute=True):
+                nova = operacoes_lote.criar_operacao(OperacaoLote.TIPO_ETIQUETA_REMOVER, [], {})
+        self.assertEqual(
+            sorted(chamada.args[0] for chamada in iniciar.call_args_list), [operacao.pk, nova.pk],
+        )
+        OperacaoLote.objects.filter(pk=nova.pk).delete()
+        operacao.refresh_from_db()
+        self.assertEqual((operacao.status, operacao.processados), (OperacaoLote.STATUS_PENDENTE, 0))
+        self.assertEqual(OperacaoLote.objects.get(pk=recente.pk).status, OperacaoLote.STATUS_EXECUTANDO)
+
+        OperacaoLote.objects.filter(pk=operacao.pk).update(
+            status=OperacaoLote.STATUS_EXECUTANDO, atualizado_em=antigo,
+        )
+        out = StringIO()
+        call_command('processar_operacoes_lote', stdout=out)
+        self.assertIn('1 operação(ões) travada(s) reenfileirada(s).', out.getvalue())
+        operacao.refresh_from_db()
+        self.assertEqual((operacao.status, operacao.processados), (OperacaoLote.STATUS_CONCLUIDO, 5))
+
+
+class ExportacaoProcessosTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_superuser('exporta', 'exporta@example.com', 'x')
+        self.client.force_login(self.usuario)
+        self.carteira = Carteira.objects.create(nome='Exportada')
+        outra = Carteira.objects.create(nome='Outra')
+        self.baixo = ProcessoJudicial.objects.create(cnj='0001000', uf='SP', carteira=self.carteira, valor_causa=Decimal('10.00'))
+        self.alto = ProcessoJudicial.objects.create(cnj='0001001', uf='RJ', carteira=self.carteira, valor_causa=Decimal('500.00'))
+        self.medio = ProcessoJudicial.objects.create(cnj='0001002', uf='MG', valor_causa=Decimal('70.00'))
+        self.medio.carteiras_vinculadas.add(self.carteira)
+        ProcessoJudicial.objects.create(cnj='0001003', carteira=outra, valor_causa=Decimal('999.00'))
+        # A changelist esconde por padrão processos sem contrato não prescrito.
+        for processo in ProcessoJudicial.objects.all():
+            Parte.objects.create(processo=processo, tipo_polo='ATIVO', nome='Banco')
+            Contrato.objects.create(processo=processo, numero_contrato=f'C{processo.pk}', valor_total_devido=Decimal('3.00'))
+        Parte.objects.create(processo=self.alto, tipo_polo='PASSIVO', nome='Maria', documento='123')
+        Contrato.objects.create(processo=self.alto, numero_contrato='C0', valor_total_devido=Decimal('4.50'))
+
+    def _exportar(self, **params):
+        resposta = self.client.get(
+            reverse('admin:processo_exportar', args=['csv']), params, secure=True,
+        )
+        self.assertEqual(resposta.status_code, 200)
+        conteudo = b''.join(resposta.streaming_content).decode('utf-8')
+        self.assertTrue(conteudo.startswith('﻿'))
+        return [linha.split(';') for linha in conteudo[1:].splitlines()]
+
+    def test_respeita_filtros_e_ordem_da_changelist(self):
+        from contratos.services import exportacao_processos
+
+        linhas = self._exportar(carteira=self.carteira.pk, valor_causa_order='desc')
+        cabecalho = [label for _key, label in exportacao_processos.COLUMNS]
+        self.assertEqual(linhas[0], cabecalho)
+        coluna = {key: indice for indice, (key, _label) in enumerate(exportacao_processos.COLUMNS)}
+        self.assertEqual(
+            [linha[coluna['cnj']] for linha in linhas[1:]],
+            [self.alto.cnj, self.medio.cnj, self.baixo.cnj],
+        )
+        alto = linhas[1]
+        self.assertEqual(alto[coluna['carteira']], 'Exportada')
+        self.assertEqual(alto[coluna['valor_causa']], '500,00')
+        self.assertEqual(alto[coluna['polo_passivo']], 'Maria')
+        self.assertEqual(alto[coluna['polo_ativo']], 'Banco')
+        self.assertEqual(alto[coluna['contratos_qtd']], '2')
+        self.assertEqual(alto[coluna['contratos_valor_total_devido']], '7,50')
+
+        linhas = self._exportar(carteira=self.carteira.pk, valor_causa_order='asc')
+        self.assertEqual(
+            [linha[coluna['cnj']] for linha in linhas[1:]],
+            [self.baixo.cnj, self.medio.cnj, self.alto.cnj],
+        )
+
+        # Sem ordenação escolhida, a mesma ordem padrão da changelist.
+        linhas = self._exportar(uf='SP,MG')
+        self.assertEqual([linha[coluna['cnj']] for linha in linhas[1:]], [self.medio.cnj, self.baixo.cnj])
@@ -13,9 +13,12 @@ urlpatterns = [
     path('processo/<int:processo_id>/gerar-monitoria/', views.generate_monitoria_petition, name='generate_monitoria_petition'),
     path('processo/<int:processo_id>/gerar-cobranca-judicial/', views.generate_cobranca_judicial_petition, name='generate_cobranca_judicial_petition'),
     path('processo/<int:processo_id>/gerar-habilitacao/', views.generate_habilitacao_petition, name='generate_habilitacao_petition'),
+    path('geracoes/<int:geracao_id>/', views.geracao_documento_status, name='geracao_documento_status'),
+    path('integracoes/metricas/', views.integracoes_metricas_view, name='integracoes_metricas'),
     path('processo/<int:processo_id>/gerar-monitoria-docx/', views.generate_monitoria_docx_download, name='generate_monitoria_docx'),
     path('processo/<int:processo_id>/download-monitoria-pdf/', views.download_monitoria_pdf, name='download_monitoria_pdf'),
     path('arquivo/<int:arquivo_id>/view/', views.proxy_arquivo_view, name='proxy_arquivo_view'),
+    path('arquivo/<int:arquivo_id>/preview/', views.arquivo_preview_view, name='arquivo_preview'),
     path('arquivo/<int:arquivo_id>/convert-to-pdf/', views.convert_docx_to_pdf_download, name='convert_docx_to_pdf'),
     path('arquivo/<int:arquivo_id>/convert-to-docx/', views.convert_pdf_to_docx_download, name='convert_pdf_to_docx'),
     path('api/', include('contratos.api.urls', namespace='contratos_api')),
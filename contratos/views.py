@@ -1,13 +1,18 @@
 # contratos/views.py
 
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, HttpResponseNotModified, HttpResponseRedirect, Http404
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.http import require_POST, require_GET
 from .models import (
     ProcessoJudicial, StatusProcessual, QuestaoAnalise,
-    OpcaoResposta, Contrato, ProcessoArquivo, DocumentoModelo, TipoAnaliseObjetiva
+    OpcaoResposta, Contrato, ProcessoArquivo, DocumentoModelo, TipoAnaliseObjetiva, GeracaoDocumento
 )
 from .permissoes import filter_processos_queryset_for_user
+from .services import (
+    classificacao_arquivos, conversao_pdf, entrega_arquivos, geracao_documentos, integracoes_http, modelos_documento,
+    previews_arquivos,
+)
+from .services.geracao_documentos import GeracaoErro
 from .integracoes_escavador.api import buscar_processo_por_cnj
 from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, ROUND_CEILING
 from django.db.models import Max
@@ -15,9 +20,10 @@ from django.db import transaction
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
+from django.utils.http import http_date, parse_etags, quote_etag
 import re
 import logging
-import requests
+import httpx
 from urllib.parse import quote
 from contratos.data.decision_tree_config import DECISION_TREE_CONFIG # <--- Nova importação
 import copy # Para cópia profunda do dicionário
@@ -25,9 +31,7 @@ import json
 import time
 import tempfile
 from pathlib import Path
-import subprocess
 import threading
-import shutil
 
 # Imports para geração de DOCX
 from docx import Document
@@ -166,9 +170,9 @@ def _call_nowlex_extrato(cpf_digits, contract_numbers):
         raise RuntimeError('Chave NOWLEX_JUDICIAL_API_KEY não configurada.')
     included = ','.join(contract_numbers)
     params = quote(included, safe=',')
-    url = f"https://erp-api.nowlex.com/api/judicial/cpf/{cpf_digits}/pdf?include_contracts={params}"
-    response = requests.get(url, headers={'X-API-Key': api_key}, timeout=60)
-    if not response.ok:
+    url = f"/api/judicial/cpf/{cpf_digits}/pdf?include_contracts={params}"
+    response = integracoes_http.cliente('nowlex_erp').get(url, headers={'X-API-Key': api_key})
+    if not response.is_success:
         raise RuntimeError(f"Status {response.status_code}: {response.text}")
     if not response.content:
         raise RuntimeError("Resposta da API sem conteúdo.")
@@ -203,6 +207,7 @@ def generate_extrato_titularidade(processo, cpf_value, contratos, parte_name, us
         processo=processo,
         nome=filename,
         enviado_por=usuario if usuario and usuario.is_authenticated else None,
+        tipo_documento=classificacao_arquivos.TIPO_EXTRATO_TITULARIDADE,
     )
     arquivo.arquivo.save(filename, pdf_file, save=True)
     return {'ok': True, 'pdf_url': arquivo.arquivo.url}
@@ -440,28 +445,45 @@ def _apply_placeholder_styles(document):
                 _set_run_shading(run, highlight_fill)
 
 
-def _load_template_document(slug, fallback_path=None):
-    """Carrega template do banco de dados (S3 em produção)."""
+def _get_template_modelo(slug):
     template = DocumentoModelo.objects.filter(slug=slug).first()
     if not template:
         label = dict(DocumentoModelo.SlugChoices.choices).get(slug, '')
         if label:
             template = DocumentoModelo.objects.filter(nome__iexact=label).order_by('-atualizado_em').first()
-    if template:
-        try:
-            with template.arquivo.open('rb') as handle:
-                data = BytesIO(handle.read())
-            data.seek(0)
-            return Document(data)
-        except (ValueError, FileNotFoundError) as e:
-            raise FileNotFoundError(
-                f"Arquivo do template '{slug}' não encontrado no S3. "
-                f"Verifique se o arquivo foi enviado corretamente. Erro: {e}"
-            )
-    raise FileNotFoundError(
-        f"Template de documento não encontrado (slug={slug}). "
-        "Cadastre o arquivo via Admin > Documentos Modelo."
-    )
+    if not template:
+        raise FileNotFoundError(
+            f"Template de documento não encontrado (slug={slug}). "
+            "Cadastre o arquivo via Admin > Documentos Modelo."
+        )
+    return template
+
+
+def _load_template(slug, loader):
+    template = _get_template_modelo(slug)
+    try:
+        return loader(template)
+    except (ValueError, FileNotFoundError) as e:
+        raise FileNotFoundError(
+            f"Arquivo do template '{slug}' não encontrado no S3. "
+            f"Verifique se o arquivo foi enviado corretamente. Erro: {e}"
+        )
+
+
+def _load_template_document(slug, fallback_path=None):
+    """Carrega template do banco de dados (S3 em produção), via cache de modelos."""
+    return _load_template(slug, modelos_documento.obter_documento)
+
+
+def _load_compiled_template(slug):
+    """Como _load_template_document, já com o plano de placeholders do modelo vinculado."""
+    return _load_template(slug, modelos_documento.obter_renderizavel)
+
+
+def _placeholder_values(dados):
+    valores = {f'[{key}]': str(value) for key, value in dados.items()}
+    valores['[E]/[H]'] = f"{dados.get('E_FORO', '')}/{dados.get('H_FORO', '')}"
+    return valores
 
 
 def _calculate_monitoria_installments(amount, target=Decimal('500'), max_installments=10):
@@ -541,7 +563,8 @@ def _build_docx_bytes_common(processo, polo_passivo, contratos_monitoria):
         'July', 'julho').replace('August', 'agosto').replace('September', 'setembro').replace(
         'October', 'outubro').replace('November', 'novembro').replace('December', 'dezembro')
 
-    document = _load_template_document(DocumentoModelo.SlugChoices.MONITORIA_INICIAL, None)
+    template = _load_compiled_template(DocumentoModelo.SlugChoices.MONITORIA_INICIAL)
+    document = template.document
 
     show_parcelamento = valor_custas_iniciais >= Decimal('1000')
 
@@ -559,10 +582,7 @@ def _build_docx_bytes_common(processo, polo_passivo, contratos_monitoria):
             "Seja deferido o parcelamento das custas iniciais"
         )
 
-    _replace_placeholders_in_container(document, dados)
-    for section in document.sections:
-        _replace_placeholders_in_container(section.header, dados)
-        _replace_placeholders_in_container(section.footer, dados)
+    template.renderizar(_placeholder_values(dados))
 
     _apply_placeholder_styles(document)
     _bold_keywords_in_document(document, ['EXCELENTÍSSIMO(A)'])
@@ -610,291 +630,6 @@ def _build_habilitacao_base_filename(polo_passivo, processo):
     return _sanitize_filename(base)
 
 
-def _convert_docx_to_pdf_bytes(docx_bytes):
-    """
-    Converte DOCX para PDF.
-    Prioriza Gotenberg (serviço com LibreOffice embutido).
-    Se não disponível, tenta LibreOffice local (soffice/libreoffice).
-    Como fallback, usa mammoth + xhtml2pdf (100% Python).
-    Último recurso: reportlab direto do DOCX (texto/tabelas).
-    """
-    # Tenta Gotenberg primeiro (serviço Docker com LibreOffice)
-    gotenberg_url = getattr(settings, 'GOTENBERG_URL', os.environ.get('GOTENBERG_URL', ''))
-
-    def _convert_with_gotenberg():
-        if not gotenberg_url:
-            return None
-        try:
-            logger.info("Tentando conversão via Gotenberg: %s", gotenberg_url)
-            files = {'files': ('document.docx', docx_bytes, 'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}
-            response = requests.post(
-                f"{gotenberg_url}/forms/libreoffice/convert",
-                files=files,
-                timeout=120
-            )
-            if response.status_code == 200 and response.content:
-                pdf_size = len(response.content)
-                logger.info("Gotenberg: conversão bem-sucedida (PDF: %d bytes)", pdf_size)
-
-                # Valida se é um PDF válido (começa com %PDF-)
-                if response.content[:5] == b'%PDF-':
-                    # Verifica se não está muito pequeno (possível erro)
-                    if pdf_size > 1000:  # PDFs válidos geralmente têm mais de 1KB
-                        return response.content
-                    else:
-                        logger.warning("Gotenberg: PDF muito pequeno (%d bytes), pode estar corrompido", pdf_size)
-                else:
-                    logger.warning("Gotenberg: Conteúdo retornado não é um PDF válido")
-            else:
-                logger.warning("Gotenberg falhou: status=%s", response.status_code)
-        except requests.Timeout:
-            logger.warning("Gotenberg timeout após 120s")
-        except Exception as exc:
-            logger.warning("Erro ao usar Gotenberg: %s", exc)
-        return None
-
-    # Tenta Gotenberg primeiro
-    if gotenberg_url:
-        gotenberg_pdf = _convert_with_gotenberg()
-        if gotenberg_pdf:
-            return gotenberg_pdf
-
-    def _find_soffice():
-        # Lista expandida de localizações possíveis do LibreOffice
-        candidates = [
-            "soffice",
-            "/usr/bin/soffice",
-            "libreoffice",
-            "/usr/bin/libreoffice",
-            "/opt/libreoffice/program/soffice",
-            "/usr/lib/libreoffice/program/soffice",
-            "/snap/bin/libreoffice",
-        ]
-        for candidate in candidates:
-            if shutil.which(candidate):
-                logger.info("LibreOffice encontrado em: %s", candidate)
-                return candidate
-        # Log de diagnóstico se não encontrar
-        logger.error("LibreOffice não encontrado. Tentou: %s", ", ".join(candidates))
-        logger.error("PATH atual: %s", os.environ.get('PATH', 'N/A'))
-        return None
-
-    gotenberg_pdf = _convert_with_gotenberg()
-    if gotenberg_pdf:
-        return gotenberg_pdf
-
-    # Tenta LibreOffice local
-    soffice_cmd = _find_soffice()
-    if soffice_cmd:
-        logger.info("LibreOffice encontrado em: %s", soffice_cmd)
-        try:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                tmpdir_path = Path(tmpdir)
-                docx_path = tmpdir_path / "input.docx"
-                pdf_path = tmpdir_path / "input.pdf"
-                docx_path.write_bytes(docx_bytes)
-                cmd = [
-                    soffice_cmd,
-                    "--headless",
-                    "--nologo",
-                    "--nodefault",
-                    "--norestore",
-                    "--nofirststartwizard",
-                    "--convert-to",
-                    "pdf:writer_pdf_Export",
-                    "--outdir",
-                    str(tmpdir_path),
-                    str(docx_path),
-                ]
-                logger.info("Executando LibreOffice: %s", ' '.join(cmd))
-                result = subprocess.run(cmd, capture_output=True, timeout=90)
-                if result.returncode == 0 and pdf_path.exists():
-                    logger.info("LibreOffice: conversão bem-sucedida")
-                    return pdf_path.read_bytes()
-                logger.warning(
-                    "LibreOffice falhou, tentando fallback: rc=%s stdout=%s stderr=%s",
-                    result.returncode,
-                    result.stdout.decode('utf-8', errors='ignore')[:200],
-                    result.stderr.decode('utf-8', errors='ignore')[:200],
-                )
-        except Exception as exc:
-            logger.warning("Erro com LibreOffice, tentando fallback: %s", exc, exc_info=True)
-    else:
-        logger.warning("LibreOffice não encontrado, usando fallback Python")
-
-    # Fallback: mammoth + xhtml2pdf (100% Python, sem dependências externas)
-    try:
-        import mammoth
-        from xhtml2pdf import pisa
-
-        # Converte DOCX para HTML usando mammoth
-        docx_io = BytesIO(docx_bytes)
-        result = mammoth.convert_to_html(docx_io)
-        html_content = result.value
-
-        # Adiciona CSS para melhor formatação do PDF
-        html_with_style = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <style>
-                @page {{
-                    size: A4;
-                    margin: 2cm;
-                }}
-                body {{
-                    font-family: 'Times New Roman', Times, serif;
-                    font-size: 12pt;
-                    line-height: 1.5;
-                    color: #000;
-                }}
-                p {{
-                    margin: 0 0 10pt 0;
-                    text-align: justify;
-                }}
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 10pt 0;
-                }}
-                td, th {{
-                    border: 1px solid #000;
-                    padding: 5pt;
-                }}
-                h1 {{ font-size: 14pt; font-weight: bold; margin: 12pt 0 6pt 0; }}
-                h2 {{ font-size: 13pt; font-weight: bold; margin: 10pt 0 5pt 0; }}
-                h3 {{ font-size: 12pt; font-weight: bold; margin: 8pt 0 4pt 0; }}
-                strong, b {{ font-weight: bold; }}
-                em, i {{ font-style: italic; }}
-                u {{ text-decoration: underline; }}
-            </style>
-        </head>
-        <body>
-            {html_content}
-        </body>
-        </html>
-        """
-
-        # Converte HTML para PDF usando xhtml2pdf
-        pdf_io = BytesIO()
-        pisa_status = pisa.CreatePDF(html_with_style, dest=pdf_io, encoding='UTF-8')
-
-        if pisa_status.err:
-            logger.error("Erro ao converter HTML para PDF com xhtml2pdf: %s", pisa_status.err)
-            return None
-
-        pdf_io.seek(0)
-        return pdf_io.read()
-
-    except ImportError as e:
-        logger.error("Bibliotecas mammoth/xhtml2pdf não instaladas: %s", e)
-    except Exception as exc:
-        logger.error("Erro ao converter DOCX para PDF (fallback): %s", exc, exc_info=True)
-        # continua para o fallback de reportlab
-
-    # Fallback final: renderização simples com reportlab (texto/tabelas)
-    try:
-        from docx import Document
-        from docx.table import Table as DocxTable
-        from docx.text.paragraph import Paragraph as DocxParagraph
-        from reportlab.lib import colors
-        from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT, TA_RIGHT
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
-        from reportlab.lib.units import cm
-        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
-        import html as html_lib
-
-        def iter_block_items(parent):
-            for child in parent.element.body.iterchildren():
-                if child.tag.endswith('}p'):
-                    yield DocxParagraph(child, parent)
-                elif child.tag.endswith('}tbl'):
-                    yield DocxTable(child, parent)
-
-        def run_to_markup(run):
-            text = html_lib.escape(run.text or '').replace('\n', '<br/>')
-            if not text:
-                return ''
-            if run.bold:
-                text = f"<b>{text}</b>"
-            if run.italic:
-                text = f"<i>{text}</i>"
-            if run.underline:
-                text = f"<u>{text}</u>"
-            return text
-
-        alignment_map = {
-            None: TA_LEFT,
-            0: TA_LEFT,
-            1: TA_CENTER,
-            2: TA_RIGHT,
-            3: TA_JUSTIFY,
-        }
-
-        styles = getSampleStyleSheet()
-        base_style = ParagraphStyle(
-            'DocxBase',
-            parent=styles['Normal'],
-            fontName='Times-Roman',
-            fontSize=12,
-            leading=15,
-            spaceAfter=6,
-        )
-
-        doc = Document(BytesIO(docx_bytes))
-        buffer = BytesIO()
-        pdf = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            leftMargin=2 * cm,
-            rightMargin=2 * cm,
-            topMargin=2 * cm,
-            bottomMargin=2 * cm,
-        )
-        flowables = []
-
-        for block in iter_block_items(doc):
-            if isinstance(block, DocxParagraph):
-                paragraph_text = ''.join(run_to_markup(run) for run in block.runs).strip()
-                if not paragraph_text:
-                    flowables.append(Spacer(1, 8))
-                    continue
-                style = ParagraphStyle(
-                    'DocxParagraph',
-                    parent=base_style,
-                    alignment=alignment_map.get(block.alignment, TA_LEFT),
-                )
-                flowables.append(Paragraph(paragraph_text, style))
-            elif isinstance(block, DocxTable):
-                table_data = []
-                for row in block.rows:
-                    row_cells = []
-                    for cell in row.cells:
-                        cell_text = html_lib.escape(cell.text or '').replace('\n', '<br/>')
-                        row_cells.append(Paragraph(cell_text, base_style))
-                    table_data.append(row_cells)
-                if table_data:
-                    table = Table(table_data, hAlign='LEFT')
-                    table.setStyle(TableStyle([
-                        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                    ]))
-                    flowables.append(table)
-                    flowables.append(Spacer(1, 8))
-
-        if not flowables:
-            return None
-
-        pdf.build(flowables)
-        buffer.seek(0)
-        return buffer.read()
-    except Exception as exc:
-        logger.error("Erro ao converter DOCX para PDF (reportlab): %s", exc, exc_info=True)
-        return None
-
-
 def _build_cobranca_docx_bytes(processo, polo_passivo, contratos):
     contratos = sorted(contratos, key=lambda c: (c.numero_contrato or '', c.id))
     dados = {
@@ -919,27 +654,15 @@ def _build_cobranca_docx_bytes(processo, polo_passivo, contratos):
     dados['VALOR DA CAUSA POR EXTENSO'] = valor_extenso
     dados['DATA DE HOJE'] = datetime.now().strftime("%d/%m/%Y")
 
-    document = _load_template_document(DocumentoModelo.SlugChoices.COBRANCA_JUDICIAL, None)
+    template = _load_compiled_template(DocumentoModelo.SlugChoices.COBRANCA_JUDICIAL)
+    document = template.document
     for section in document.sections:
         try:
             section.footer_distance = Cm(1.5)
         except Exception:
             pass
 
-    for p in document.paragraphs:
-        for key, value in dados.items():
-            if key == 'E_FORO' and '[E]/[H]' in p.text:
-                p.text = p.text.replace('[E]/[H]', f"{dados.get('E_FORO', '')}/{dados.get('H_FORO', '')}")
-            p.text = p.text.replace(f'[{key}]', str(value))
-
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    for key, value in dados.items():
-                        if key == 'E_FORO' and '[E]/[H]' in p.text:
-                            p.text = p.text.replace('[E]/[H]', f"{dados.get('E_FORO', '')}/{dados.get('H_FORO', '')}")
-                        p.text = p.text.replace(f'[{key}]', str(value))
+    template.renderizar(_placeholder_values(dados))
 
     _apply_placeholder_styles(document)
     _bold_keywords_in_document(document, ['EXCELENTÍSSIMO(A)'])
@@ -1072,10 +795,10 @@ def _fetch_extrato_titularidade(processo, polo_passivo, contratos, user):
         return None
 
     include_param = quote(','.join(contratos_numeros))
-    url = f'https://erp-api.nowlex.com/api/judicial/cpf/{cpf_digits}/pdf?include_contracts={include_param}'
+    url = f'/api/judicial/cpf/{cpf_digits}/pdf?include_contracts={include_param}'
     headers = {'X-API-Key': api_key}
     try:
-        response = requests.get(url, headers=headers, timeout=20)
+        response = integracoes_http.cliente('nowlex_erp').get(url, headers=headers, timeout=20)
         response.raise_for_status()
         contratos_label = _formatar_lista_contratos(contratos) or 'contratos'
         nome_parte = _extrair_primeiros_nomes(polo_passivo.nome or '', 2) or 'parte'
@@ -1085,10 +808,11 @@ def _fetch_extrato_titularidade(processo, polo_passivo, contratos, user):
             processo=processo,
             nome=file_name,
             enviado_por=user if user and user.is_authenticated else None,
+            tipo_documento=classificacao_arquivos.TIPO_EXTRATO_TITULARIDADE,
         )
         arquivo_extrato.arquivo.save(_sanitize_filename(file_name), ContentFile(response.content), save=True)
         return arquivo_extrato.arquivo.url
-    except requests.RequestException as exc:
+    except httpx.HTTPError as exc:
         logger.warning("Erro ao buscar extrato de titularidade: %s", exc)
     except Exception as exc:
         logger.warning("Erro ao salvar extrato de titularidade: %s", exc, exc_info=True)
@@ -1596,6 +1320,43 @@ def number_to_words_pt_br(num, feminine=False, include_currency=True, capitalize
 
     return inteiro_phrase.capitalize() if capitalize_first else inteiro_phrase
 
+def _resposta_geracao_enfileirada(geracao, message):
+    return JsonResponse(
+        {
+            "status": "queued",
+            "message": message,
+            "geracao": geracao_documentos.serializar_geracao(geracao),
+            "status_url": reverse('contratos:geracao_documento_status', args=[geracao.pk]),
+        },
+        status=202,
+    )
+
+
+def _carregar_processo_geracao(geracao):
+    processo = geracao.processo
+    if processo is None:
+        raise GeracaoErro("Processo Judicial não encontrado.")
+    polo_passivo = processo.partes_processuais.filter(tipo_polo='PASSIVO').first()
+    if not polo_passivo:
+        raise GeracaoErro("Polo passivo não encontrado para este processo.")
+    return processo, polo_passivo
+
+
+def _salvar_docx_gerado(processo, docx_bytes, docx_name, usuario, tipo_documento):
+    try:
+        arquivo_docx = ProcessoArquivo(
+            processo=processo,
+            nome=docx_name,
+            enviado_por=usuario if usuario and usuario.is_authenticated else None,
+            tipo_documento=tipo_documento,
+        )
+        arquivo_docx.arquivo.save(docx_name, ContentFile(docx_bytes), save=True)
+        return arquivo_docx
+    except Exception as exc:
+        logger.error("Erro ao salvar DOCX gerado (%s): %s", tipo_documento, exc, exc_info=True)
+        raise GeracaoErro("Falha ao salvar o DOCX/PDF gerado nos Arquivos.")
+
+
 @login_required
 @require_POST
 def generate_monitoria_petition(request, processo_id=None):
@@ -1635,72 +1396,66 @@ def generate_monitoria_petition(request, processo_id=None):
 
     contratos_para_monitoria_ids = _parse_contract_ids(contratos_para_monitoria_ids)
 
-    contratos_monitoria_qs = Contrato.objects.filter(id__in=contratos_para_monitoria_ids).select_related('processo')
-    contratos_monitoria = list(contratos_monitoria_qs)
+    contrato_ids = sorted(
+        Contrato.objects.filter(id__in=contratos_para_monitoria_ids).values_list('id', flat=True)
+    )
+    if not contrato_ids:
+        return HttpResponse("Nenhum contrato selecionado para monitória na análise deste processo.", status=404)
+
+    geracao, _ = geracao_documentos.enfileirar(
+        GeracaoDocumento.TIPO_MONITORIA,
+        processo.pk,
+        {'contrato_ids': contrato_ids},
+        usuario=request.user,
+    )
+    return _resposta_geracao_enfileirada(geracao, "Petição monitória em geração.")
 
+
+def executar_geracao_monitoria(geracao, progresso):
+    processo, polo_passivo = _carregar_processo_geracao(geracao)
+    contratos_monitoria = list(
+        Contrato.objects.filter(id__in=geracao.parametros.get('contrato_ids') or []).select_related('processo')
+    )
     if not contratos_monitoria:
-        return HttpResponse("Nenhum contrato selecionado para monitória na análise deste processo.", status=404)
+        raise GeracaoErro("Nenhum contrato selecionado para monitória na análise deste processo.")
+    usuario = geracao.criado_por
 
+    progresso("Montando o DOCX da monitória", total=3)
     try:
         docx_bytes = _build_docx_bytes_common(processo, polo_passivo, contratos_monitoria)
-        base_filename = _build_monitoria_base_filename(polo_passivo, contratos_monitoria)
+    except FileNotFoundError as fe:
+        raise GeracaoErro(str(fe))
+    base_filename = _build_monitoria_base_filename(polo_passivo, contratos_monitoria)
 
-        monitoria_info = {}
-        docx_url = ''
-        arquivo_pdf = None
-        arquivo_docx = None
+    progresso("Salvando em Arquivos")
+    arquivo_docx = _salvar_docx_gerado(
+        processo, docx_bytes, f"{base_filename}.docx", usuario, classificacao_arquivos.TIPO_MONITORIA_INICIAL
+    )
+    docx_url = arquivo_docx.arquivo.url
 
-        try:
-            docx_name = f"{base_filename}.docx"
-            docx_file = ContentFile(docx_bytes)
-            arquivo_docx = ProcessoArquivo(
-                processo=processo,
-                nome=docx_name,
-                enviado_por=request.user if request.user.is_authenticated else None,
-            )
-            arquivo_docx.arquivo.save(docx_name, docx_file, save=True)
-            docx_url = arquivo_docx.arquivo.url
-        except Exception as exc:
-            logger.error("Erro ao salvar DOCX da monitória: %s", exc, exc_info=True)
-            docx_url = ''
-
-        if not docx_url:
-            return HttpResponse("Falha ao salvar o DOCX/PDF gerado nos Arquivos.", status=500)
-
-        monitoria_info = {
-            "ok": False,
-            "pdf_url": '',
-            "pdf_pending": True,
-            "docx_download_url": docx_url or request.build_absolute_uri(
-                reverse('contratos:generate_monitoria_docx', kwargs={'processo_id': processo_id_int})
-            ),
-        }
+    monitoria_info = {
+        "ok": False,
+        "pdf_url": '',
+        "pdf_pending": True,
+        "docx_download_url": docx_url,
+    }
 
-        extrato_result = generate_extrato_titularidade(
-            processo=processo,
-            cpf_value=polo_passivo.documento,
-            contratos=contratos_monitoria,
-            parte_name=polo_passivo.nome,
-            usuario=request.user if request.user.is_authenticated else None
-        )
-        # Usa o arquivo PDF se existir, senão usa o DOCX para obter o dest_path
-        if arquivo_docx:
-            dest_path = os.path.dirname(arquivo_docx.arquivo.name or '')
-        else:
-            dest_path = ''
-
-        response_payload = {
-            "status": "success",
-            "message": "Petição gerada - Salva em Arquivos.",
-            "monitoria": monitoria_info,
-            "extrato": extrato_result,
-            "dest_path": dest_path,
-        }
-        return JsonResponse(response_payload)
+    progresso("Emitindo o extrato de titularidade")
+    extrato_result = generate_extrato_titularidade(
+        processo=processo,
+        cpf_value=polo_passivo.documento,
+        contratos=contratos_monitoria,
+        parte_name=polo_passivo.nome,
+        usuario=usuario
+    )
 
-    except Exception as e:
-        logger.error(f"Erro ao gerar a petição para o processo {processo_id}: {e}", exc_info=True)
-        return HttpResponse(f"Erro ao gerar a petição: {e}", status=500)
+    return {
+        "status": "success",
+        "message": "Petição gerada - Salva em Arquivos.",
+        "monitoria": monitoria_info,
+        "extrato": extrato_result,
+        "dest_path": os.path.dirname(arquivo_docx.arquivo.name or ''),
+    }
 
 
 @login_required
@@ -1742,56 +1497,58 @@ def generate_cobranca_judicial_petition(request, processo_id=None):
         if fallback_ids:
             contratos_queryset = contratos_queryset.filter(id__in=fallback_ids)
 
-    contratos_lista = list(contratos_queryset)
-    if not contratos_lista:
+    contrato_ids = sorted(contratos_queryset.values_list('id', flat=True))
+    if not contrato_ids:
         return HttpResponse("Nenhum contrato disponível para gerar a cobrança judicial.", status=404)
 
     if not polo_passivo.endereco:
         return HttpResponse("Endereço da parte passiva não informado.", status=400)
 
-    extrato_result = None
-    try:
-        docx_bytes = _build_cobranca_docx_bytes(processo, polo_passivo, contratos_lista)
-        base_filename = _build_cobranca_base_filename(polo_passivo, contratos_lista)
-        docx_url = ''
+    geracao, _ = geracao_documentos.enfileirar(
+        GeracaoDocumento.TIPO_COBRANCA,
+        processo.pk,
+        {'contrato_ids': contrato_ids},
+        usuario=request.user,
+    )
+    return _resposta_geracao_enfileirada(geracao, "Petição de cobrança em geração.")
 
-        docx_saved = False
-        try:
-            docx_name = f"{base_filename}.docx"
-            docx_file = ContentFile(docx_bytes)
-            arquivo_docx = ProcessoArquivo(
-                processo=processo,
-                nome=docx_name,
-                enviado_por=request.user if request.user.is_authenticated else None,
-            )
-            arquivo_docx.arquivo.save(docx_name, docx_file, save=True)
-            docx_url = arquivo_docx.arquivo.url
-            docx_saved = True
-        except Exception as exc:
-            logger.error("Erro ao salvar DOCX da cobrança judicial: %s", exc, exc_info=True)
 
-        if not docx_saved:
-            return HttpResponse("Falha ao salvar o DOCX/PDF gerado nos Arquivos.", status=500)
+def executar_geracao_cobranca(geracao, progresso):
+    processo, polo_passivo = _carregar_processo_geracao(geracao)
+    contratos_lista = list(processo.contratos.filter(id__in=geracao.parametros.get('contrato_ids') or []))
+    if not contratos_lista:
+        raise GeracaoErro("Nenhum contrato disponível para gerar a cobrança judicial.")
+    if not polo_passivo.endereco:
+        raise GeracaoErro("Endereço da parte passiva não informado.")
+    usuario = geracao.criado_por
+
+    progresso("Montando o DOCX da cobrança", total=3)
+    try:
+        docx_bytes = _build_cobranca_docx_bytes(processo, polo_passivo, contratos_lista)
     except FileNotFoundError as fe:
         logger.error("Template de cobrança não encontrado: %s", fe)
-        return HttpResponse(str(fe), status=500)
-    except Exception as exc:
-        logger.error(f"Erro ao gerar petição de cobrança para o processo {processo_id}: {exc}", exc_info=True)
-        return HttpResponse(f"Erro ao gerar a petição de cobrança: {exc}", status=500)
+        raise GeracaoErro(str(fe))
+    base_filename = _build_cobranca_base_filename(polo_passivo, contratos_lista)
+
+    progresso("Salvando em Arquivos")
+    arquivo_docx = _salvar_docx_gerado(
+        processo, docx_bytes, f"{base_filename}.docx", usuario, classificacao_arquivos.TIPO_COBRANCA_JUDICIAL
+    )
 
+    progresso("Emitindo o extrato de titularidade")
     extrato_result = generate_extrato_titularidade(
         processo=processo,
         cpf_value=polo_passivo.documento,
         contratos=contratos_lista,
         parte_name=polo_passivo.nome,
-        usuario=request.user if request.user.is_authenticated else None
+        usuario=usuario
     )
 
     cobranca_info = {
         "ok": False,
         "pdf_url": '',
         "pdf_pending": True,
-        "docx_url": docx_url,
+        "docx_url": arquivo_docx.arquivo.url,
     }
 
     response_payload = {
@@ -1806,7 +1563,15 @@ def generate_cobranca_judicial_petition(request, processo_id=None):
             response_payload["extrato_url"] = pdf_url_extrato
         response_payload["message"] += " Extrato de titularidade salvo."
 
-    return JsonResponse(response_payload)
+    return response_payload
+
+
+def _mensagem_habilitacao_incompleta(missing_fields):
+    return (
+        'Não foi possível gerar a habilitação porque faltam os seguintes dados no cadastro (aba Partes): '
+        + '; '.join(missing_fields)
+        + '.'
+    )
 
 
 @login_required
@@ -1833,54 +1598,68 @@ def generate_habilitacao_petition(request, processo_id=None):
 
     missing_fields = _collect_missing_habilitacao_fields(processo, polo_passivo)
     if missing_fields:
-        message = (
-            'Não foi possível gerar a habilitação porque faltam os seguintes dados no cadastro (aba Partes): '
-            + '; '.join(missing_fields)
-            + '.'
-        )
-        return JsonResponse({'message': message}, status=422)
+        return JsonResponse({'message': _mensagem_habilitacao_incompleta(missing_fields)}, status=422)
 
-    try:
-        docx_bytes = _build_habilitacao_docx_bytes(processo, polo_passivo)
-        base_filename = _build_habilitacao_base_filename(polo_passivo, processo)
-        docx_url = ''
+    geracao, _ = geracao_documentos.enfileirar(
+        GeracaoDocumento.TIPO_HABILITACAO,
+        processo.pk,
+        usuario=request.user,
+    )
+    return _resposta_geracao_enfileirada(geracao, "Petição de habilitação em geração.")
 
-        docx_saved = False
-        try:
-            docx_name = f"{base_filename}.docx"
-            docx_file = ContentFile(docx_bytes)
-            arquivo_docx = ProcessoArquivo(
-                processo=processo,
-                nome=docx_name,
-                enviado_por=request.user if request.user.is_authenticated else None,
-            )
-            arquivo_docx.arquivo.save(docx_name, docx_file, save=True)
-            docx_url = arquivo_docx.arquivo.url
-            docx_saved = True
-        except Exception as exc:
-            logger.error("Erro ao salvar DOCX da habilitação: %s", exc, exc_info=True)
 
-        if not docx_saved:
-            return HttpResponse("Falha ao salvar o DOCX/PDF gerado nos Arquivos.", status=500)
+def executar_geracao_habilitacao(geracao, progresso):
+    processo, polo_passivo = _carregar_processo_geracao(geracao)
+    missing_fields = _collect_missing_habilitacao_fields(processo, polo_passivo)
+    if missing_fields:
+        raise GeracaoErro(_mensagem_habilitacao_incompleta(missing_fields))
+
+    progresso("Montando o DOCX da habilitação", total=2)
+    try:
+        docx_bytes = _build_habilitacao_docx_bytes(processo, polo_passivo)
     except FileNotFoundError as fe:
         logger.error("Template de habilitação não encontrado: %s", fe)
-        return HttpResponse(str(fe), status=500)
-    except Exception as exc:
-        logger.error(f"Erro ao gerar petição de habilitação para o processo {processo_id}: {exc}", exc_info=True)
-        return HttpResponse(f"Erro ao gerar a petição de habilitação: {exc}", status=500)
+        raise GeracaoErro(str(fe))
+    base_filename = _build_habilitacao_base_filename(polo_passivo, processo)
+
+    progresso("Salvando em Arquivos")
+    arquivo_docx = _salvar_docx_gerado(
+        processo, docx_bytes, f"{base_filename}.docx", geracao.criado_por, classificacao_arquivos.TIPO_HABILITACAO
+    )
 
     habilitacao_info = {
         "ok": False,
         "pdf_url": '',
         "pdf_pending": True,
-        "docx_url": docx_url,
+        "docx_url": arquivo_docx.arquivo.url,
     }
 
-    return JsonResponse({
+    return {
         "status": "success",
         "message": "Petição de habilitação gerada - Salva em Arquivos.",
         "habilitacao": habilitacao_info,
-    })
+    }
+
+
+@login_required
+@require_GET
+def geracao_documento_status(request, geracao_id):
+    geracao = get_object_or_404(GeracaoDocumento, pk=geracao_id)
+    # O resultado traz links dos arquivos gerados: só quem pediu ou quem enxerga
+    # o processo (o mesmo pedido de outro usuário reaproveita a geração).
+    if not (request.user.is_superuser or geracao.criado_por_id == request.user.pk):
+        if geracao.processo_id is None or not filter_processos_queryset_for_user(
+            ProcessoJudicial.objects.filter(pk=geracao.processo_id), request.user
+        ).exists():
+            raise Http404('Geração não encontrada.')
+    return JsonResponse(geracao_documentos.serializar_geracao(geracao))
+
+
+@staff_member_required
+@require_GET
+def integracoes_metricas_view(request):
+    """Latência, erros e estado do circuito das integrações HTTP deste processo."""
+    return JsonResponse({'servicos': integracoes_http.metricas()})
 
 
 @login_required
@@ -1976,12 +1755,47 @@ def download_monitoria_pdf(request, processo_id=None):
         return HttpResponse("Erro ao preparar download do PDF.", status=500)
 
 
+def _content_type_arquivo(arquivo_name):
+    arquivo_name = (arquivo_name or '').lower()
+    if arquivo_name.endswith('.pdf'):
+        return 'application/pdf'
+    if arquivo_name.endswith('.docx'):
+        return 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    if arquivo_name.endswith('.doc'):
+        return 'application/msword'
+    if arquivo_name.endswith('.png'):
+        return 'image/png'
+    if arquivo_name.endswith('.jpg') or arquivo_name.endswith('.jpeg'):
+        return 'image/jpeg'
+    return 'application/octet-stream'
+
+
+def _headers_proxy_arquivo(response, aberto):
+    response['ETag'] = aberto.etag
+    if aberto.modificado_em:
+        response['Last-Modified'] = http_date(aberto.modificado_em.timestamp())
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Cache-Control'] = 'private, max-age=3600'
+    # Headers CORS para permitir PDF.js carregar o PDF (em partes, via Range)
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+    response['Access-Control-Allow-Headers'] = 'Range, If-None-Match, If-Range'
+    response['Access-Control-Expose-Headers'] = 'Accept-Ranges, Content-Length, Content-Range, ETag'
+    return response
+
+
 @login_required
 @require_GET
 def proxy_arquivo_view(request, arquivo_id):
     """
     Proxy para servir arquivos do S3 com Content-Disposition: inline
     permitindo visualização no iframe em vez de forçar download.
+
+    O conteúdo é enviado em streaming, com suporte a Range (o visualizador de
+    PDF busca só as páginas exibidas) e If-None-Match. Com
+    ARQUIVOS_PROXY_REDIRECIONAR_S3 o navegador é redirecionado para uma URL
+    assinada de curta duração no S3.
     """
     try:
         arquivo = get_object_or_404(ProcessoArquivo, pk=arquivo_id)
@@ -1991,44 +1805,82 @@ def proxy_arquivo_view(request, arquivo_id):
     if not arquivo.arquivo:
         return HttpResponse("Arquivo sem conteúdo.", status=404)
 
+    content_type = _content_type_arquivo(arquivo.arquivo.name)
     try:
-        # Lê o arquivo do S3
-        arquivo.arquivo.open('rb')
-        file_content = arquivo.arquivo.read()
-        arquivo.arquivo.close()
+        if entrega_arquivos.redirecionar_s3():
+            url = entrega_arquivos.url_assinada(arquivo.arquivo, content_type)
+            if url:
+                return HttpResponseRedirect(url)
+
+        aberto = entrega_arquivos.abrir(arquivo.arquivo)
+    except FileNotFoundError:
+        return HttpResponse("Arquivo não encontrado no armazenamento.", status=404)
+    except Exception as exc:
+        logger.error("Erro ao servir arquivo via proxy: %s", exc, exc_info=True)
+        return HttpResponse("Erro ao carregar arquivo.", status=500)
 
-        # Determina o content-type baseado na extensão
-        arquivo_name = arquivo.arquivo.name.lower()
-        if arquivo_name.endswith('.pdf'):
-            content_type = 'application/pdf'
-        elif arquivo_name.endswith('.docx'):
-            content_type = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        elif arquivo_name.endswith('.doc'):
-            content_type = 'application/msword'
-        elif arquivo_name.endswith('.png'):
-            content_type = 'image/png'
-        elif arquivo_name.endswith('.jpg') or arquivo_name.endswith('.jpeg'):
-            content_type = 'image/jpeg'
-        else:
-            content_type = 'application/octet-stream'
+    try:
+        if aberto.etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            aberto.fechar()
+            return _headers_proxy_arquivo(HttpResponseNotModified(), aberto)
 
+        faixa = None
+        if_range = request.META.get('HTTP_IF_RANGE', '')
+        if not if_range or if_range == aberto.etag:
+            try:
+                faixa = entrega_arquivos.intervalo(request.META.get('HTTP_RANGE', ''), aberto.tamanho)
+            except entrega_arquivos.IntervaloInvalido:
+                aberto.fechar()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{aberto.tamanho}'
+                return _headers_proxy_arquivo(response, aberto)
+
+        inicio, fim = faixa or (0, aberto.tamanho - 1)
+        response = FileResponse(aberto.ler(inicio, fim), content_type=content_type)
+        if faixa:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {inicio}-{fim}/{aberto.tamanho}'
+        response['Content-Length'] = max(fim - inicio + 1, 0)
         # Retorna com headers corretos para visualização inline
-        response = HttpResponse(file_content, content_type=content_type)
         response['Content-Disposition'] = 'inline'
-        response['Content-Length'] = len(file_content)
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['Cache-Control'] = 'private, max-age=3600'
-        # Headers CORS para permitir PDF.js carregar o PDF
-        response['Access-Control-Allow-Origin'] = '*'
-        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Range'
-        return response
+        return _headers_proxy_arquivo(response, aberto)
 
     except Exception as exc:
+        aberto.fechar()
         logger.error("Erro ao servir arquivo via proxy: %s", exc, exc_info=True)
         return HttpResponse("Erro ao carregar arquivo.", status=500)
 
 
+@login_required
+@require_GET
+def arquivo_preview_view(request, arquivo_id):
+    """
+    Miniatura PNG da primeira página do arquivo. Enquanto ela não existe a
+    resposta é 404 e a geração é agendada (services/previews_arquivos.py); o
+    ETag é o hash do conteúdo, então a URL com `?v=<hash>` pode ficar em cache.
+    """
+    arquivo = get_object_or_404(ProcessoArquivo, pk=arquivo_id)
+    if not previews_arquivos.pronta(arquivo):
+        previews_arquivos.agendar(arquivo)
+        return HttpResponse("Miniatura indisponível.", status=404)
+
+    etag = quote_etag(arquivo.preview_hash)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            conteudo = arquivo.arquivo.storage.open(previews_arquivos.caminho(arquivo), 'rb')
+        except FileNotFoundError:
+            # Miniatura removida do storage: volta a ficar pendente.
+            ProcessoArquivo.objects.filter(pk=arquivo.pk).update(preview_hash='')
+            return HttpResponse("Miniatura indisponível.", status=404)
+        response = FileResponse(conteudo, content_type='image/png')
+    response['ETag'] = etag
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Cache-Control'] = 'private, max-age=604800, immutable' if request.GET.get('v') else 'private, no-cache'
+    return response
+
+
 @login_required
 @require_GET
 def convert_docx_to_pdf_download(request, arquivo_id):
@@ -2143,7 +1995,7 @@ def convert_docx_to_pdf_download(request, arquivo_id):
         return HttpResponse("Erro ao ler arquivo DOCX.", status=500)
 
     logger.info("Iniciando conversão DOCX para PDF (tamanho: %d bytes)", len(docx_bytes))
-    pdf_bytes = _convert_docx_to_pdf_bytes(docx_bytes)
+    pdf_bytes = conversao_pdf.converter_docx_para_pdf(docx_bytes)
     if not pdf_bytes:
         logger.error("Conversão falhou: pdf_bytes é None ou vazio")
         return HttpResponse(
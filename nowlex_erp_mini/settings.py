@@ -206,6 +206,15 @@ NOWLEX_CALC_DATA_CORRENTE_MES = os.getenv("NOWLEX_CALC_DATA_CORRENTE_MES")
 NOWLEX_CALC_DATA_CORRENTE_ANO = os.getenv("NOWLEX_CALC_DATA_CORRENTE_ANO")
 NOWLEX_CALC_INDICE = os.getenv("NOWLEX_CALC_INDICE")
 NOWLEX_CALC_OBSERVATIONS = os.getenv("NOWLEX_CALC_OBSERVATIONS")
+
+# Cliente HTTP das integrações (services/integracoes_http.py): base URLs dos
+# serviços sem setting próprio, tentativas em falhas transitórias e circuit breaker.
+ESCAVADOR_API_BASE = os.getenv("ESCAVADOR_API_BASE", "https://api.escavador.com/api/v2")
+NOWLEX_ERP_API_BASE = os.getenv("NOWLEX_ERP_API_BASE", "https://erp-api.nowlex.com")
+ENDERECOS_API_BASE = os.getenv("ENDERECOS_API_BASE", "https://nowlex-mini-erp-api.onrender.com")
+INTEGRACOES_HTTP_MAX_TENTATIVAS = _env_positive_int("INTEGRACOES_HTTP_MAX_TENTATIVAS", 3)
+INTEGRACOES_HTTP_FALHAS_PARA_ABRIR = _env_positive_int("INTEGRACOES_HTTP_FALHAS_PARA_ABRIR", 5)
+INTEGRACOES_HTTP_CIRCUITO_ABERTO_SECONDS = _env_positive_int("INTEGRACOES_HTTP_CIRCUITO_ABERTO_SECONDS", 30)
 ONLINE_PRESENCE_REDIS_URL = os.getenv("ONLINE_PRESENCE_REDIS_URL", os.getenv("REDIS_URL", "")).strip()
 ONLINE_PRESENCE_HEARTBEAT_SECONDS = _env_positive_int("ONLINE_PRESENCE_HEARTBEAT_SECONDS", 15)
 ONLINE_PRESENCE_TTL_SECONDS = _env_positive_int("ONLINE_PRESENCE_TTL_SECONDS", 60)
@@ -215,8 +224,64 @@ ONLINE_PRESENCE_IDLE_SECONDS = _env_positive_int("ONLINE_PRESENCE_IDLE_SECONDS",
 if ONLINE_PRESENCE_IDLE_SECONDS < ONLINE_PRESENCE_HEARTBEAT_SECONDS:
     ONLINE_PRESENCE_IDLE_SECONDS = ONLINE_PRESENCE_HEARTBEAT_SECONDS
 
+# Operações em lote do admin (carteira/etiquetas): acima deste número de processos
+# a alteração roda em segundo plano com progresso.
+OPERACAO_LOTE_ASYNC_THRESHOLD = _env_positive_int("OPERACAO_LOTE_ASYNC_THRESHOLD", 500)
+OPERACAO_LOTE_CHUNK_SIZE = _env_positive_int("OPERACAO_LOTE_CHUNK_SIZE", 1000)
+# Operações "executando" sem atividade há mais que isso são retomadas (a thread
+# morreu num reinício): na próxima operação criada ou por processar_operacoes_lote.
+OPERACAO_LOTE_TIMEOUT_MINUTES = _env_positive_int("OPERACAO_LOTE_TIMEOUT_MINUTES", 30)
+
+# Fila de geração de petições/ZIPs (GeracaoDocumento): com True a geração também
+# roda numa thread do processo web logo após o commit; com False só o comando
+# processar_geracoes_documentos (worker) executa a fila.
+# É o modo usado em produção no Render (render.yaml não tem serviço worker).
+GERACAO_DOCUMENTOS_EM_THREAD = os.getenv("GERACAO_DOCUMENTOS_EM_THREAD", "True").lower() in ("true", "1", "yes")
+# Gerações "executando" sem atividade há mais que isso são dadas como erro e
+# enfileiradas de novo: no próximo pedido igual ou por processar_geracoes_documentos.
+GERACAO_DOCUMENTOS_TIMEOUT_MINUTES = _env_positive_int("GERACAO_DOCUMENTOS_TIMEOUT_MINUTES", 30)
+# Petições em lote (services/peticoes_lote.py): conversões para PDF/extratos em
+# paralelo e limite de processos por lote.
+GERACAO_LOTE_TAREFAS_PARALELAS = _env_positive_int("GERACAO_LOTE_TAREFAS_PARALELAS", 4)
+GERACAO_LOTE_MAX_PROCESSOS = _env_positive_int("GERACAO_LOTE_MAX_PROCESSOS", 500)
+# Montagem do ZIP de combo: quantos arquivos são lidos do storage em paralelo.
+COMBO_ZIP_LEITURAS_PARALELAS = _env_positive_int("COMBO_ZIP_LEITURAS_PARALELAS", 4)
+# Preview do combo em cache: a chave já inclui a versão dos arquivos e padrões,
+# o tempo só limita quanto versões antigas ocupam.
+COMBO_PREVIEW_CACHE_SECONDS = _env_positive_int("COMBO_PREVIEW_CACHE_SECONDS", 600)
+# PDF único do combo (services/montagem_pdf.py): tetos de páginas e de bytes
+# somados das entradas, que limitam a memória usada pela junção.
+PDF_MONTAGEM_MAX_PAGINAS = _env_positive_int("PDF_MONTAGEM_MAX_PAGINAS", 1500)
+PDF_MONTAGEM_MAX_MB = _env_positive_int("PDF_MONTAGEM_MAX_MB", 200)
+# Cache local dos DOCX de DocumentoModelo (services/modelos_documento.py); vazio
+# usa um diretório no tempdir do sistema.
+DOCUMENTO_MODELO_CACHE_DIR = os.getenv("DOCUMENTO_MODELO_CACHE_DIR", "").strip()
+
+# Snapshots de KPI do dashboard de carteiras: idade máxima antes de recalcular
+# em segundo plano (além da marcação feita pelos signals).
+KPI_SNAPSHOT_MAX_AGE_SECONDS = _env_positive_int("KPI_SNAPSHOT_MAX_AGE_SECONDS", 900)
+# Recálculo pedido pelas visitas num worker do próprio processo web. Desligado,
+# só o comando `atualizar_kpi_snapshots --loop` recalcula.
+KPI_SNAPSHOT_EM_THREAD = os.getenv("KPI_SNAPSHOT_EM_THREAD", "True").lower() in ("true", "1", "yes")
+
+# Rollup diário de produtividade (comando atualizar_produtividade): quantos dias
+# antes da última marca são recalculados a cada execução incremental.
+PRODUTIVIDADE_ROLLUP_MARGEM_DIAS = _env_positive_int("PRODUTIVIDADE_ROLLUP_MARGEM_DIAS", 1)
+
 # Gotenberg - Serviço de conversão de documentos (DOCX -> PDF)
 GOTENBERG_URL = os.getenv("GOTENBERG_URL", "")
+# Versão do conversor na chave do cache de DOCX -> PDF (services/conversao_pdf.py);
+# altere para descartar os PDFs já convertidos (ex.: troca de fontes no Gotenberg).
+DOCX_PDF_CONVERSOR_VERSAO = os.getenv("DOCX_PDF_CONVERSOR_VERSAO", "1")
+# Pool de LibreOffice headless (unoserver) para a conversão local sem Gotenberg.
+# 0 desabilita e mantém o soffice avulso por documento. O pool é por processo.
+LIBREOFFICE_POOL_SIZE = int(os.getenv("LIBREOFFICE_POOL_SIZE", "0") or 0)
+LIBREOFFICE_POOL_MAX_CONVERSOES = _env_positive_int("LIBREOFFICE_POOL_MAX_CONVERSOES", 200)
+LIBREOFFICE_POOL_FILA_MAX = _env_positive_int("LIBREOFFICE_POOL_FILA_MAX", 20)
+LIBREOFFICE_POOL_TIMEOUT_SECONDS = _env_positive_int("LIBREOFFICE_POOL_TIMEOUT_SECONDS", 90)
+LIBREOFFICE_POOL_UNOSERVER_CMD = os.getenv("LIBREOFFICE_POOL_UNOSERVER_CMD", "unoserver")
+LIBREOFFICE_POOL_UNOCONVERT_CMD = os.getenv("LIBREOFFICE_POOL_UNOCONVERT_CMD", "unoconvert")
+LIBREOFFICE_POOL_SOFFICE_CMD = os.getenv("LIBREOFFICE_POOL_SOFFICE_CMD", "")
 
 # Arquivos enviados (uploads)
 # Configuração do AWS S3 para armazenamento de arquivos
@@ -233,6 +298,26 @@ AWS_S3_FILE_OVERWRITE = False
 AWS_QUERYSTRING_AUTH = True  # Gera URLs assinadas automaticamente (protegido)
 AWS_QUERYSTRING_EXPIRE = 5600  # URLs válidas por 5 hora (renovam automaticamente) - teste
 
+# Proxy de visualização de arquivos: com True redireciona para uma URL assinada
+# do S3 (exige CORS no bucket para o PDF.js) em vez de passar o arquivo pelo worker.
+ARQUIVOS_PROXY_REDIRECIONAR_S3 = os.getenv("ARQUIVOS_PROXY_REDIRECIONAR_S3", "False").lower() in ("true", "1", "yes")
+ARQUIVOS_PROXY_URL_EXPIRA_SECONDS = _env_positive_int("ARQUIVOS_PROXY_URL_EXPIRA_SECONDS", 300)
+# Miniaturas da primeira página dos PDFs/DOCX de Arquivos (services/previews_arquivos.py):
+# largura do PNG em pixels, tamanho máximo do arquivo lido e threads do pool que
+# as gera no processo web. Com ARQUIVOS_PREVIEW_EM_THREAD=False só o comando
+# gerar_previews_arquivos as gera.
+ARQUIVOS_PREVIEW_LARGURA = _env_positive_int("ARQUIVOS_PREVIEW_LARGURA", 160)
+ARQUIVOS_PREVIEW_MAX_MB = _env_positive_int("ARQUIVOS_PREVIEW_MAX_MB", 50)
+ARQUIVOS_PREVIEW_WORKERS = _env_positive_int("ARQUIVOS_PREVIEW_WORKERS", 2)
+ARQUIVOS_PREVIEW_EM_THREAD = os.getenv("ARQUIVOS_PREVIEW_EM_THREAD", "True").lower() in ("true", "1", "yes")
+# Upload direto para o storage (services/uploads_diretos.py): com S3 o navegador
+# envia para um presigned POST (exige CORS no bucket para POST da origem do
+# sistema); UPLOAD_DIRETO_BACKEND=local força o endpoint da própria API.
+UPLOAD_DIRETO_ATIVO = os.getenv("UPLOAD_DIRETO_ATIVO", "True").lower() in ("true", "1", "yes")
+UPLOAD_DIRETO_BACKEND = os.getenv("UPLOAD_DIRETO_BACKEND", "").strip().lower()
+UPLOAD_DIRETO_MAX_MB = _env_positive_int("UPLOAD_DIRETO_MAX_MB", 500)
+UPLOAD_DIRETO_EXPIRA_SECONDS = _env_positive_int("UPLOAD_DIRETO_EXPIRA_SECONDS", 900)
+
 # Usa S3 em produção se as credenciais estiverem configuradas, senão usa armazenamento local
 if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and AWS_STORAGE_BUCKET_NAME:
     STORAGES = {
@@ -307,6 +392,13 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # O httpx registra cada requisição em INFO; latência e falhas já são
+        # medidas por services/integracoes_http.py.
+        'httpx': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
 
@@ -1,7 +1,15 @@
+from datetime import timedelta
+
 from django.contrib.admin.models import LogEntry
 from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 from django.urls import reverse
+from django.utils import timezone
+
+from contratos.models import ProdutividadeDiaria
+from contratos.services import produtividade
+
+RESUMO_DIAS = 7
 
 
 @staff_member_required
@@ -34,4 +42,20 @@ def minhas_acoes(request):
             'change_message': entry.get_change_message() if hasattr(entry, 'get_change_message') else '',
             'change_url': change_url,
         })
-    return JsonResponse({'items': items})
+    desde = timezone.localdate() - timedelta(days=RESUMO_DIAS - 1)
+    totais = produtividade.totais_por_usuario(
+        (
+            ProdutividadeDiaria.METRICA_ACOES,
+            ProdutividadeDiaria.METRICA_TAREFAS,
+            ProdutividadeDiaria.METRICA_PRAZOS,
+        ),
+        usuario_ids=[request.user.id],
+        desde=desde,
+    ).get(request.user.id, {})
+    resumo = {
+        'dias': RESUMO_DIAS,
+        'acoes': totais.get(ProdutividadeDiaria.METRICA_ACOES, 0),
+        'tarefas': totais.get(ProdutividadeDiaria.METRICA_TAREFAS, 0),
+        'prazos': totais.get(ProdutividadeDiaria.METRICA_PRAZOS, 0),
+    }
+    return JsonResponse({'items': items, 'resumo': resumo})